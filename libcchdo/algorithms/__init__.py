@@ -1,3 +1,81 @@
 """
 Collections of algorithms to calculate values from other values.
 """
+from contextlib import contextmanager
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+from libcchdo import config
+
+
+# Engines for the seawater equation of state.
+# array - NumPy float64 over whole series (see libcchdo.algorithms.eos)
+# decimal - Decimal one sample at a time (libcchdo.algorithms.depth and volume)
+EOS_ENGINES = ['array', 'decimal']
+
+
+def _check_eos_engine(engine):
+    if engine not in EOS_ENGINES:
+        raise ValueError(
+            u'Unknown equation of state engine {0!r}. Expected one of '
+            '{1!r}'.format(engine, EOS_ENGINES))
+    if engine == 'array':
+        import libcchdo.algorithms.eos
+
+
+def _configured_eos_engine():
+    """Return the equation of state engine given in the configuration.
+
+    The engine may be set with [algorithms] eos_engine in the configuration
+    file or the environment variable LIBCCHDO_ALGORITHMS_EOS_ENGINE. Without
+    numpy the decimal engine is used.
+
+    """
+    try:
+        engine = config.get_option('algorithms', 'eos_engine')
+    except config.ConfigError:
+        engine = 'array'
+    try:
+        _check_eos_engine(engine)
+    except ImportError, err:
+        log.debug(u'Using decimal equation of state. {0}'.format(err))
+        return 'decimal'
+    except ValueError, err:
+        log.error(u'Using decimal equation of state. {0}'.format(err))
+        return 'decimal'
+    return engine
+
+
+_eos_engine = _configured_eos_engine()
+
+
+def get_eos_engine():
+    """Return the equation of state engine."""
+    return _eos_engine
+
+
+def set_eos_engine(engine):
+    """Set the equation of state engine.
+
+    Raises:
+        ValueError - engine is not one of EOS_ENGINES
+        ImportError - the array engine was requested without numpy
+
+    """
+    global _eos_engine
+    _check_eos_engine(engine)
+    _eos_engine = engine
+
+
+@contextmanager
+def eos_engine(engine):
+    """Use the given equation of state engine inside the context."""
+    saved = get_eos_engine()
+    set_eos_engine(engine)
+    try:
+        yield
+    finally:
+        set_eos_engine(saved)
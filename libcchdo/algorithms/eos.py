@@ -0,0 +1,266 @@
+"""Vectorized seawater equation of state.
+
+The functions in libcchdo.algorithms.depth and libcchdo.algorithms.volume
+calculate one sample at a time with Decimals. The functions here take whole
+series of salinity, temperature and pressure at once and calculate in float64
+with NumPy.
+
+Inputs may be scalars, sequences with None for missing values, ValueArrays,
+NumPy arrays with NaN for missing values or NumPy masked arrays. Results are
+float64 masked arrays that are masked wherever an input was missing or the
+result is undefined.
+
+The Decimal functions remain the reference implementation. Choose between them
+with libcchdo.algorithms.set_eos_engine().
+
+"""
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+try:
+    import numpy as np
+except ImportError, e:
+    raise ImportError('%s\n%s' % (e,
+        ("Please install numpy to use the array equation of state. "
+         "(pip install numpy)")))
+
+from libcchdo.fns import Decimal
+from libcchdo.model.storage import float64, masked
+
+
+def to_decimals(values):
+    """Return a list of Decimals with None where values are missing."""
+    return [None if vvv is None else Decimal(repr(vvv))
+            for vvv in masked(values).tolist()]
+
+
+def _polyn(x, coeffs):
+    """Calculate coeffs[0] + coeffs[1] * x + ... with Horner's method."""
+    result = coeffs[-1]
+    for coef in coeffs[-2::-1]:
+        result = result * x + coef
+    return result
+
+
+def _result(values):
+    result = np.ma.masked_invalid(values, copy=False)
+    if result.ndim == 0:
+        return result[()]
+    return result
+
+
+def grav_ocean_surface_wrt_latitude(latitude):
+    """Gravity at the ocean surface (m/sec^2).
+
+    Like depth.grav_ocean_surface_wrt_latitude, the sine is taken of the
+    latitude as given.
+
+    """
+    sin2 = np.sin(float64(latitude)) ** 2
+    return _result(9.780318 * (1 + 5.2788e-3 * sin2 + 2.35e-5 * sin2 ** 2))
+
+
+# Correction for gravity as pressure increases
+# (closer to center of Earth)
+DGRAV_DPRES = 2.184e-6
+
+
+def depth(grav, p, rho):
+    """Calculate depth by integration of insitu density.
+
+    See depth.depth. Unlike depth.depth, two element series are integrated like
+    any other series.
+
+    Args:
+        grav: local gravity (m/sec^2) @ 0.0 db
+        p: pressure series (decibars)
+        rho: insitu density series (kg/m^3)
+
+    Returns:
+        depth - depth series (meters)
+
+    """
+    grav = float(grav)
+    p = np.atleast_1d(float64(p))
+    rho = np.atleast_1d(float64(rho))
+    assert len(p) == len(rho), \
+        ("The number of series intervals must be the same.\n"
+         "pressure {0} != density {1}").format(len(p), len(rho))
+    if len(p) == 0:
+        return _result(np.empty(0))
+
+    depths = np.empty(len(p))
+    # If the integration starts from > 15 db, calculate depth relative to
+    # starting place. Otherwise, calculate from surface.
+    if p[0] > 15.0:
+        depths[0] = 0
+    else:
+        depths[0] = p[0] / (rho[0] * 10000 * (grav + DGRAV_DPRES * p[0]))
+
+    steps = np.diff(p) / ((rho[1:] + rho[:-1]) * 5000 * \
+        (grav + DGRAV_DPRES * p[1:])) * 1e8
+    depths[1:] = depths[0] + np.cumsum(steps)
+    return _result(depths)
+
+
+_E = (19652.21, 148.4206, -2.327105, 1.360477e-2, -5.155288e-5)
+_F = (54.6746, -0.603459, 1.09987e-2, -6.1670e-5)
+_G = (7.944e-2, 1.6483e-2, -5.3009e-4)
+_H = (3.239908, 1.43713e-3, 1.16092e-4, -5.77905e-7)
+_I = (2.2838e-3, -1.0981e-5, -1.6078e-6)
+_J0 = 1.91075e-4
+_K = (8.50935e-5, -6.12293e-6, 5.2787e-8)
+_M = (-9.9348e-7, 2.0816e-8, 9.1697e-10)
+
+
+def _secant_bulk_modulus(s, t, p, s15):
+    kst0 = _polyn(t, _E) + _polyn(t, _F) * s + _polyn(t, _G) * s15
+    a = _polyn(t, _H) + _polyn(t, _I) * s + _J0 * s15
+    b = _polyn(t, _K) + _polyn(t, _M) * s
+    return kst0 + (a + b * p) * p
+
+
+def secant_bulk_modulus(salinity, temperature, pressure):
+    """Calculate the secant bulk modulus of sea water.
+
+    Obtained from EOS80 according to Fofonoff Millard 1983 pg 15
+
+    Args:
+        salinity: [PSS-78]
+        temperature: [degrees Celsius IPTS-68]
+        pressure: pressure (bars)
+
+    """
+    s = float64(salinity)
+    with np.errstate(invalid='ignore'):
+        return _result(_secant_bulk_modulus(
+            s, float64(temperature), float64(pressure), np.sqrt(s ** 3)))
+
+
+_A = (999.842594, 6.793952e-2, -9.095290e-3, 1.001685e-4, -1.120083e-6,
+      6.536332e-9)
+_B = (8.24493e-1, -4.0899e-3, 7.6438e-5, -8.2467e-7, 5.3875e-9)
+_C = (-5.72466e-3, 1.0227e-4, -1.6546e-6)
+_D0 = 4.8314e-4
+
+
+def _density_surface(s, t, s15):
+    # UNESCO 44 page - 17 - equation (14)
+    return _polyn(t, _A) + _polyn(t, _B) * s + _polyn(t, _C) * s15 + \
+           _D0 * s ** 2
+
+
+def density(salinity, temperature, pressure):
+    """Calculate insitu density (kg/m^3).
+
+    The algorithm is given on page -15- of UNESCO 44 as equation (7). Pressure
+    is given in decibars.
+
+    """
+    s = float64(salinity)
+    t = float64(temperature)
+    bars = float64(pressure) / 10
+    with np.errstate(invalid='ignore'):
+        s15 = np.sqrt(s ** 3)
+        return _result(_density_surface(s, t, s15) / \
+            (1 - bars / _secant_bulk_modulus(s, t, bars, s15)))
+
+
+def depth_unesco(pres, lat):
+    """Depth (meters) from pressure (decibars) using Saunders and Fofonoff's
+    method.
+
+    See depth.depth_unesco.
+    Checkvalue: depth = 9712.653 M for P=10000 decibars, latitude=30 deg
+
+    """
+    pres = float64(pres)
+    x = np.sin(float64(lat) / 57.29578) ** 2
+    gr = 9.780318 * (1.0 + (5.2788e-3 + 2.36e-5 * x) * x) + 1.092e-6 * pres
+    return _result(
+        (((-1.82e-15 * pres + 2.279e-10) * pres - 2.2512e-5) * pres + \
+         9.72659) * pres / gr)
+
+
+def _adiabatic_lapse_rate(s1, t, p):
+    """Adiabatic temperature gradient (deg C/decibar).
+
+    s1 is salinity - 35.
+
+    """
+    return ((_polyn(t, (-4.6206e-13, 1.8676e-14, -2.1687e-16)) * p +
+             _polyn(t, (-1.1351e-10, 2.7759e-12)) * s1 +
+             _polyn(t, (1.8741e-8, -6.7795e-10, 8.733e-12, -5.4481e-14))) * p +
+            _polyn(t, (1.8932e-6, -4.2393e-8)) * s1 +
+            _polyn(t, (3.5803e-5, 8.5258e-6, -6.836e-8, 6.6228e-10)))
+
+
+def potential_temperature(p, t, s, rp):
+    """Calculate potential temperature for an arbitrary reference pressure.
+
+    Fofonoff's Runge-Kutta integration of the adiabatic lapse rate as given in
+    UNESCO 44.
+
+    Checkvalue: theta = 36.89073 C for s=40 (PSS-78), t=40 deg C,
+                p=10000 decibars, rp=0 decibars
+
+    Args:
+        p - pressure in decibars
+        t - temperature in celsius degrees
+        s - salinity PSS 78
+        rp - reference pressure in decibars
+             (0.0 for standard potential temperature)
+
+    """
+    p = float64(p)
+    t = float64(t)
+    s1 = float64(s) - 35.0
+
+    h = float64(rp) - p
+    x = h * _adiabatic_lapse_rate(s1, t, p)
+    t = t + 0.5 * x
+    q = x
+    p = p + 0.5 * h
+    x = h * _adiabatic_lapse_rate(s1, t, p)
+    t = t + 0.29289322 * (x - q)
+    q = 0.58578644 * x + 0.121320344 * q
+    x = h * _adiabatic_lapse_rate(s1, t, p)
+    t = t + 1.707106781 * (x - q)
+    q = 3.414213562 * x - 4.121320344 * q
+    p = p + 0.5 * h
+    x = h * _adiabatic_lapse_rate(s1, t, p)
+    return _result(t + (x - 2.0 * q) / 6.0)
+
+
+def sigma_r(refprs, press, temp, salty):
+    """Calculate density using international equation of state
+
+    See volume.sigma_r.
+
+    Args:
+        refprs -- reference pressure
+                  refprs = 0. : sigma theta
+                  refprs = press: sigma z
+        press  -- pressure in decibars
+        temp   -- temperature in celsius degrees
+        salty  -- salinity PSS 78
+
+    Return:
+        kg/m*3 - 1000.0
+
+    """
+    refprs = float64(refprs)
+    salty = float64(salty)
+    potemp = np.ma.filled(
+        potential_temperature(press, temp, salty, refprs), np.nan)
+
+    s15 = np.abs(salty) ** 1.5
+    sigma = _density_surface(salty, potemp, s15)
+
+    # reference pressure in bars
+    bars = refprs * 0.1
+    kstp = _secant_bulk_modulus(salty, potemp, bars, s15)
+    return _result(sigma / (1.0 - bars / kstp) - 1000.0)
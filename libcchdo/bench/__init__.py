@@ -0,0 +1,271 @@
+"""Benchmarks of reading, writing and processing cruise data.
+
+Benchmarks run on synthetic data (see libcchdo.bench.synthetic) written to a
+temporary directory in each of the main formats. The scale and seed of the data
+are recorded with the timings so that results written by write_results on one
+commit can be compared with those of another by compare.
+
+A benchmark is a setup function registered with the benchmark decorator. Setup
+is given the Inputs and returns a callable. Only the callable is timed and setup
+is run again before each repeat so the callable is free to change what it was
+given::
+
+    @benchmark('read/btl.ex')
+    def read_btlex(inputs):
+        path = inputs.path('btl.ex')
+        def run():
+            with open(path) as fff:
+                read_arbitrary(fff, 'btl.ex')
+        return run
+
+Example::
+
+    results = run(['read/*'], Scale(casts=10))
+    write_results(results, open('before.json', 'w'))
+
+"""
+import json
+import os
+import os.path
+import platform
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from fnmatch import fnmatchcase
+from shutil import rmtree
+from subprocess import check_output, PIPE, CalledProcessError
+from tempfile import mkdtemp
+from timeit import default_timer
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+from libcchdo.bench.synthetic import Scale
+
+
+# Bump when the results format changes.
+RESULTS_VERSION = 1
+
+
+# Timings are only reported as changed when they differ by more than this.
+COMPARE_TOLERANCE = 0.1
+
+
+BENCHMARKS = OrderedDict()
+
+
+class Skip(Exception):
+    """Raised by setup when a benchmark cannot run on the inputs."""
+
+
+def benchmark(name):
+    """Register a benchmark setup function under name."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _load_cases():
+    # The cases register themselves on import.
+    import libcchdo.bench.cases
+
+
+def select(patterns=None):
+    """Return the names of the benchmarks that match any of the glob patterns.
+
+    All benchmarks are selected if there are no patterns.
+
+    """
+    _load_cases()
+    if not patterns:
+        return BENCHMARKS.keys()
+    return [name for name in BENCHMARKS
+            if any(fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+class Inputs(object):
+    """Synthetic input files and data at one scale.
+
+    Files are written on first use with the writers of this tree and removed
+    by close.
+
+    """
+
+    # Format short name, file name
+    FILES = OrderedDict([
+        ('btl.ex', 'synthetic_hy1.csv'),
+        ('btl.woce', 'synthetic_hy.txt'),
+        ('btl.zip.nc', 'synthetic_nc_hyd.zip'),
+        ('ctd.zip.ex', 'synthetic_ct1.zip'),
+        ('ctd.zip.nc', 'synthetic_nc_ctd.zip'),
+        ('sum.woce', 'synthetic_su.txt'),
+    ])
+
+    def __init__(self, scale=None, seed=0):
+        self.scale = scale or Scale()
+        self.seed = seed
+        self.directory = mkdtemp(prefix='libcchdo_bench')
+        self._paths = {}
+
+    def data(self, file_type):
+        """Return new synthetic data to write as file_type."""
+        from libcchdo.bench import synthetic
+        if file_type.startswith('btl'):
+            return synthetic.bottle_file(self.scale, self.seed)
+        elif file_type.startswith('ctd'):
+            return synthetic.ctd_collection(self.scale, self.seed)
+        elif file_type.startswith('sum'):
+            return synthetic.summary_file(self.scale, self.seed)
+        raise ValueError(u'No synthetic data for {0}'.format(file_type))
+
+    def path(self, file_type):
+        """Return the path of the synthetic file of file_type."""
+        try:
+            return self._paths[file_type]
+        except KeyError:
+            pass
+        from libcchdo.formats.formats import all_formats
+        path = os.path.join(self.directory, self.FILES[file_type])
+        with open(path, 'wb') as fff:
+            all_formats[file_type].write(self.data(file_type), fff)
+        self._paths[file_type] = path
+        return path
+
+    def read(self, file_type):
+        """Return the synthetic file of file_type as read."""
+        from libcchdo.formats.formats import read_arbitrary
+        with open(self.path(file_type)) as fff:
+            return read_arbitrary(fff, file_type)
+
+    def close(self):
+        rmtree(self.directory, ignore_errors=True)
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def time_benchmark(setup, inputs, repeat=3):
+    """Return the wall times of repeat runs of the benchmark."""
+    times = []
+    for _ in range(repeat):
+        func = setup(inputs)
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+    return times
+
+
+def _revision():
+    """Return the git commit of the source tree, if there is one."""
+    try:
+        return check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def environment():
+    """Return what the timings depend on besides the code."""
+    from libcchdo import __version__
+    from libcchdo.algorithms import get_eos_engine
+    from libcchdo.model.datafile import get_column_storage
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return OrderedDict([
+        ('libcchdo', __version__.strip()),
+        ('revision', _revision()),
+        ('python', sys.version.split()[0]),
+        ('numpy', numpy_version),
+        ('platform', platform.platform()),
+        ('column_storage', get_column_storage()),
+        ('eos_engine', get_eos_engine()),
+    ])
+
+
+def run(patterns=None, scale=None, repeat=3, seed=0):
+    """Run the benchmarks that match patterns and return the results."""
+    scale = scale or Scale()
+    names = select(patterns)
+    results = OrderedDict([
+        ('version', RESULTS_VERSION),
+        ('created', datetime.utcnow().isoformat()),
+        ('environment', environment()),
+        ('scale', scale.to_dict()),
+        ('seed', seed),
+        ('repeat', repeat),
+        ('benchmarks', OrderedDict()),
+    ])
+    inputs = Inputs(scale, seed)
+    try:
+        for name in names:
+            try:
+                times = time_benchmark(BENCHMARKS[name], inputs, repeat)
+            except Skip, err:
+                log.info(u'Skipped {0}: {1}'.format(name, err))
+                results['benchmarks'][name] = OrderedDict([
+                    ('skipped', unicode(err))])
+                continue
+            log.info(u'{0}: {1:.4f}s'.format(name, min(times)))
+            results['benchmarks'][name] = OrderedDict([
+                ('min', min(times)),
+                ('median', _median(times)),
+                ('times', times),
+            ])
+    finally:
+        inputs.close()
+    return results
+
+
+def write_results(results, fileobj):
+    json.dump(results, fileobj, indent=1)
+    fileobj.write('\n')
+
+
+def load_results(fileobj):
+    results = json.load(fileobj, object_pairs_hook=OrderedDict)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(
+            u'Unable to compare with results version {0!r}'.format(
+                results.get('version')))
+    return results
+
+
+def compare(baseline, results, tolerance=COMPARE_TOLERANCE):
+    """Compare the minimum times of the benchmarks that both results have.
+
+    Returns:
+        a list of (name, baseline time, time, ratio, change) where change is
+        'slower', 'faster' or '' when the ratio is within tolerance of 1
+
+    """
+    if dict(baseline['scale']) != dict(results['scale']) or \
+            baseline['seed'] != results['seed']:
+        log.warn(u'The results were run at different scales.')
+    comparisons = []
+    for name, result in results['benchmarks'].items():
+        try:
+            before = baseline['benchmarks'][name]['min']
+            after = result['min']
+        except KeyError:
+            continue
+        ratio = after / before if before else float('inf')
+        if ratio > 1 + tolerance:
+            change = 'slower'
+        elif ratio < 1 - tolerance:
+            change = 'faster'
+        else:
+            change = ''
+        comparisons.append((name, before, after, ratio, change))
+    return comparisons
@@ -0,0 +1,180 @@
+"""The benchmarks run by libcchdo.bench.
+
+Names are grouped by what they exercise: read/ and write/ for each format,
+exchange/ for the row-wise and bulk Exchange data sections, merge/, process/
+for DataFile operations and units/ for unit conversions.
+
+"""
+from random import Random
+from tempfile import TemporaryFile
+
+from libcchdo.bench import benchmark, Inputs, Skip
+from libcchdo.fns import Decimal
+
+
+def _register_read(file_type):
+    @benchmark('read/{0}'.format(file_type))
+    def read(inputs):
+        from libcchdo.formats.formats import read_arbitrary
+        path = inputs.path(file_type)
+        def run():
+            with open(path) as fff:
+                read_arbitrary(fff, file_type)
+        return run
+
+
+def _register_write(file_type):
+    @benchmark('write/{0}'.format(file_type))
+    def write(inputs):
+        from libcchdo.formats.formats import all_formats
+        dfile = inputs.data(file_type)
+        format_module = all_formats[file_type]
+        def run():
+            with TemporaryFile() as fff:
+                format_module.write(dfile, fff)
+        return run
+
+
+for file_type in Inputs.FILES:
+    _register_read(file_type)
+    _register_write(file_type)
+
+
+def _read_exchange_data(path, bulk):
+    """Return a DataFile with the data section of the bottle Exchange file."""
+    from libcchdo.formats import exchange
+    from libcchdo.model.datafile import DataFile
+    dfile = DataFile()
+    with open(path) as fff:
+        exchange.read_identifier_line(dfile, fff, 'BOTTLE')
+        line = exchange.read_comments(dfile, fff)
+        columns = [xxx.strip() for xxx in line.split(',')]
+        # Units
+        fff.readline()
+        dfile.create_columns(columns)
+        exchange.read_data(dfile, fff, columns, bulk=bulk)
+    return dfile
+
+
+def _register_exchange(bulk):
+    suffix = '' if bulk else '_rowwise'
+
+    @benchmark('exchange/read_data{0}'.format(suffix))
+    def read_data(inputs):
+        path = inputs.path('btl.ex')
+        def run():
+            _read_exchange_data(path, bulk)
+        return run
+
+    @benchmark('exchange/write_data{0}'.format(suffix))
+    def write_data(inputs):
+        from libcchdo.formats import exchange
+        dfile = _read_exchange_data(inputs.path('btl.ex'), True)
+        def run():
+            with TemporaryFile() as fff:
+                exchange.write_data(dfile, fff, bulk=bulk)
+        return run
+
+
+for bulk in (True, False):
+    _register_exchange(bulk)
+
+
+def _require(dfile, name):
+    """Return the column name of dfile or skip if there is none."""
+    try:
+        return dfile[name]
+    except KeyError:
+        raise Skip(u'{0} is not in the synthetic data'.format(name))
+
+
+def _perturb(column):
+    """Change the values of the column so that there is something to merge."""
+    increment = Decimal('0.1')
+    column.values = [
+        None if value is None else value + increment
+        for value in column.values]
+
+
+@benchmark('merge/merge_datafiles')
+def merge_bottle(inputs):
+    from libcchdo.merge import determine_bottle_keys, merge_datafiles
+    origin = inputs.read('btl.ex')
+    deriv = inputs.read('btl.ex')
+    _perturb(_require(deriv, 'OXYGEN'))
+    keys = determine_bottle_keys(origin, deriv)
+    def run():
+        merge_datafiles(origin, deriv, keys, ['OXYGEN'])
+    return run
+
+
+@benchmark('merge/merge_collections')
+def merge_ctd(inputs):
+    from libcchdo.merge import (
+        determine_ctd_keys, merge_collections, merge_datafiles)
+    origin = inputs.read('ctd.zip.ex')
+    deriv = inputs.read('ctd.zip.ex')
+    for dfile in deriv.files:
+        _perturb(_require(dfile, 'CTDTMP'))
+    def merge(odfile, ddfile):
+        keys = determine_ctd_keys(odfile, ddfile)
+        return merge_datafiles(odfile, ddfile, keys, ['CTDTMP'])
+    def run():
+        merge_collections(origin, deriv, merge)
+    return run
+
+
+@benchmark('process/reorder_file_pressure')
+def reorder_file_pressure(inputs):
+    dfile = inputs.read('btl.ex')
+    # Shuffle the bottles of each cast
+    rng = Random(inputs.seed)
+    order = []
+    bottles = inputs.scale.bottles
+    for start in range(0, len(dfile), bottles):
+        cast = range(start, min(start + bottles, len(dfile)))
+        rng.shuffle(cast)
+        order.extend(cast)
+    dfile = dfile.take(order)
+    def run():
+        dfile.reorder_file_pressure()
+    return run
+
+
+@benchmark('process/split_on_cast')
+def split_on_cast(inputs):
+    from libcchdo.model.convert.datafile_to_datafilecollection import (
+        split_on_cast)
+    dfile = inputs.read('btl.ex')
+    def run():
+        split_on_cast(dfile)
+    return run
+
+
+@benchmark('process/calculate_depths')
+def calculate_depths(inputs):
+    dfc = inputs.read('ctd.zip.ex')
+    def run():
+        for dfile in dfc.files:
+            dfile.calculate_depths()
+    return run
+
+
+@benchmark('units/milliliter_per_liter_to_umol_per_kg')
+def milliliter_per_liter_to_umol_per_kg(inputs):
+    from libcchdo.units import convert
+    dfile = inputs.read('btl.ex')
+    column = _require(dfile, 'OXYGEN')
+    def run():
+        convert.milliliter_per_liter_to_umol_per_kg(dfile, column, True)
+    return run
+
+
+@benchmark('units/mol_per_liter_to_mol_per_kg')
+def mol_per_liter_to_mol_per_kg(inputs):
+    from libcchdo.units import convert
+    dfile = inputs.read('btl.ex')
+    column = _require(dfile, 'SILCAT')
+    def run():
+        convert.mol_per_liter_to_mol_per_kg(dfile, column)
+    return run
@@ -0,0 +1,216 @@
+"""Deterministic synthetic cruise data for benchmarks.
+
+A cruise is a line of stations with one cast each. Every profile is a smooth
+function of pressure with a little noise and about FILL_FRACTION of the measured
+values are missing and flagged 9. All randomness comes from a random.Random
+seeded with seed so the same scale and seed always give the same data.
+
+"""
+import math
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from random import Random
+
+from libcchdo.fns import Decimal
+from libcchdo.model.datafile import (
+    DataFile, DataFileCollection, SummaryFile, Column)
+
+
+EXPOCODE = '33SY20000101'
+
+
+SECT_ID = 'SYN'
+
+
+STAMP = '20000101SYNBENCH'
+
+
+START = datetime(2000, 1, 1)
+
+
+FILL_FRACTION = 0.05
+
+
+# Measured parameters in the order they are added to files: mnemonic, units,
+# decimal places, surface value, deep value
+BOTTLE_PARAMETERS = [
+    ('CTDTMP', 'ITS-90', 4, 25.0, 1.5),
+    ('CTDSAL', 'PSS-78', 4, 35.5, 34.7),
+    ('CTDOXY', 'UMOL/KG', 1, 210.0, 240.0),
+    ('SALNTY', 'PSS-78', 4, 35.5, 34.7),
+    ('OXYGEN', 'UMOL/KG', 1, 210.0, 240.0),
+    ('SILCAT', 'UMOL/KG', 2, 1.0, 120.0),
+    ('NITRAT', 'UMOL/KG', 2, 0.1, 35.0),
+    ('NITRIT', 'UMOL/KG', 2, 0.2, 0.01),
+    ('PHSPHT', 'UMOL/KG', 2, 0.1, 2.4),
+    ('CFC-11', 'PMOL/KG', 3, 2.5, 0.01),
+    ('CFC-12', 'PMOL/KG', 3, 1.3, 0.005),
+    ('SF6', 'FMOL/KG', 4, 1.5, 0.01),
+    ('TCARBN', 'UMOL/KG', 1, 2000.0, 2300.0),
+    ('ALKALI', 'UMOL/KG', 1, 2300.0, 2400.0),
+    ('TRITUM', 'TU', 3, 0.8, 0.05),
+    ('DELC14', '/MILLE', 1, 50.0, -200.0),
+    ('DOC', 'UMOL/KG', 2, 70.0, 40.0),
+    ('TDN', 'UMOL/KG', 2, 5.0, 35.0),
+]
+
+
+CTD_PARAMETERS = BOTTLE_PARAMETERS[:3]
+
+
+class Scale(object):
+    """The size of a synthetic cruise.
+
+    casts - the number of stations, each with one cast
+    bottles - the number of bottles on each cast
+    levels - the number of CTD levels on each cast, 2 dbar apart
+    parameters - the number of measured bottle parameters, at most
+        len(BOTTLE_PARAMETERS). CTD casts have at most len(CTD_PARAMETERS).
+
+    """
+
+    def __init__(self, casts=20, bottles=36, levels=1000, parameters=12):
+        if not 0 < parameters <= len(BOTTLE_PARAMETERS):
+            raise ValueError(
+                u'parameters must be between 1 and {0}'.format(
+                    len(BOTTLE_PARAMETERS)))
+        if casts < 1 or bottles < 1 or levels < 1:
+            raise ValueError(u'casts, bottles and levels must be positive')
+        self.casts = casts
+        self.bottles = bottles
+        self.levels = levels
+        self.parameters = parameters
+
+    def to_dict(self):
+        return OrderedDict([
+            ('casts', self.casts),
+            ('bottles', self.bottles),
+            ('levels', self.levels),
+            ('parameters', self.parameters),
+        ])
+
+
+def _decimal(value, places):
+    return Decimal('{0:.{1}f}'.format(value, places))
+
+
+def _profile_value(rng, pressure, surface, deep):
+    """Return a value that goes from surface to deep with a thermocline."""
+    value = deep + (surface - deep) * math.exp(-pressure / 800.0)
+    return value + (surface - deep) * rng.gauss(0, 0.002)
+
+
+def _measure(rng, column, places, value):
+    if rng.random() < FILL_FRACTION:
+        column.append(None, 9)
+    else:
+        column.append(_decimal(value, places), 2)
+
+
+def _stations(rng, scale):
+    """Return (stnnbr, datetime, latitude, longitude, bottom depth) for each
+    station.
+
+    """
+    stations = []
+    for i in range(scale.casts):
+        stations.append((
+            str(i + 1),
+            START + timedelta(hours=6 * i, minutes=rng.randint(0, 59)),
+            _decimal(-30.0 + 0.5 * i, 4),
+            _decimal(-40.0 + 0.25 * i + rng.uniform(-0.1, 0.1), 4),
+            rng.randint(3000, 5500)))
+    return stations
+
+
+def bottle_file(scale=None, seed=0):
+    """Return a bottle DataFile with scale.bottles rows for each cast."""
+    scale = scale or Scale()
+    rng = Random(seed)
+    dfile = DataFile()
+    dfile.globals['stamp'] = STAMP
+    names = ['EXPOCODE', 'SECT_ID', 'STNNBR', 'CASTNO', 'SAMPNO', 'BTLNBR',
+             'LATITUDE', 'LONGITUDE', 'DEPTH', '_DATETIME', 'CTDPRS']
+    parameters = BOTTLE_PARAMETERS[:scale.parameters]
+    for name in names:
+        dfile[name] = Column(name)
+    for name, units, _, _, _ in parameters:
+        dfile[name] = Column(name, units)
+
+    for stnnbr, dtime, lat, lng, depth in _stations(rng, scale):
+        bottom = depth * 1.01
+        for bottle in range(scale.bottles):
+            sampno = scale.bottles - bottle
+            # Bottles are fired from the bottom up
+            pressure = bottom * (1 - float(bottle) / scale.bottles) - 5
+            for name, value in [
+                    ('EXPOCODE', EXPOCODE), ('SECT_ID', SECT_ID),
+                    ('STNNBR', stnnbr), ('CASTNO', '1'),
+                    ('SAMPNO', str(sampno)), ('LATITUDE', lat),
+                    ('LONGITUDE', lng), ('DEPTH', depth),
+                    ('_DATETIME', dtime)]:
+                dfile[name].append(value)
+            dfile['BTLNBR'].append(str(sampno), 2)
+            dfile['CTDPRS'].append(_decimal(pressure, 1))
+            for name, units, places, surface, deep in parameters:
+                _measure(rng, dfile[name], places,
+                         _profile_value(rng, pressure, surface, deep))
+    return dfile
+
+
+def ctd_collection(scale=None, seed=0):
+    """Return a DataFileCollection of CTD casts with scale.levels rows each."""
+    scale = scale or Scale()
+    rng = Random(seed)
+    dfc = DataFileCollection()
+    parameters = CTD_PARAMETERS[:scale.parameters]
+    for stnnbr, dtime, lat, lng, depth in _stations(rng, scale):
+        dfile = DataFile()
+        dfile.globals.update({
+            'stamp': STAMP,
+            'EXPOCODE': EXPOCODE,
+            'SECT_ID': SECT_ID,
+            'STNNBR': stnnbr,
+            'CASTNO': '1',
+            '_DATETIME': dtime,
+            'LATITUDE': lat,
+            'LONGITUDE': lng,
+            'DEPTH': str(depth),
+        })
+        dfile['CTDPRS'] = Column('CTDPRS', 'DBAR')
+        for name, units, _, _, _ in parameters:
+            dfile[name] = Column(name, units)
+        for level in range(scale.levels):
+            pressure = 2.0 * level
+            dfile['CTDPRS'].append(_decimal(pressure, 1), 2)
+            for name, units, places, surface, deep in parameters:
+                _measure(rng, dfile[name], places,
+                         _profile_value(rng, pressure, surface, deep))
+        dfc.append(dfile)
+    return dfc
+
+
+def summary_file(scale=None, seed=0):
+    """Return a SummaryFile with a bottom and bottle row for each cast."""
+    scale = scale or Scale()
+    rng = Random(seed)
+    sfile = SummaryFile()
+    sfile['_DATETIME'] = Column('_DATETIME')
+    parameters = ','.join(
+        str(iii + 1) for iii in range(min(scale.parameters, 8)))
+    for stnnbr, dtime, lat, lng, depth in _stations(rng, scale):
+        for code in ('BE', 'BO'):
+            for name, value in [
+                    ('EXPOCODE', EXPOCODE), ('SECT_ID', SECT_ID),
+                    ('STNNBR', stnnbr), ('CASTNO', 1), ('_CAST_TYPE', 'ROS'),
+                    ('_DATETIME', dtime), ('_CODE', code),
+                    ('LATITUDE', lat), ('LONGITUDE', lng), ('_NAV', 'GPS'),
+                    ('DEPTH', depth), ('_ABOVE_BOTTOM', 10),
+                    ('_WIRE_OUT', None),
+                    ('_MAX_PRESSURE', int(depth * 1.01)),
+                    ('_NUM_BOTTLES', scale.bottles),
+                    ('_PARAMETERS', parameters), ('_COMMENTS', '')]:
+                sfile[name].append(value)
+    del sfile['DATE']
+    del sfile['TIME']
+    return sfile
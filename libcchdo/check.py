@@ -0,0 +1,406 @@
+"""Check DataFiles for common data problems.
+
+Each rule looks at a whole column at once through its missing value mask and
+flag array instead of one cell at a time. The rows a rule objects to are kept as
+runs of consecutive rows so that a problem with a hundred thousand cells is
+still one Violation. A Report collects the Violations of any number of files
+and can be logged as a short summary or written as JSON.
+
+Rows are counted from 0 at the first data row.
+
+"""
+import json
+from collections import Counter, OrderedDict
+from traceback import format_exc
+from logging import getLogger, ERROR, WARNING, INFO
+
+
+log = getLogger(__name__)
+
+
+try:
+    import numpy as np
+except ImportError, e:
+    raise ImportError('%s\n%s' % (e,
+        ("Please install numpy to check files. (pip install numpy)")))
+
+from libcchdo.model.storage import float64
+from libcchdo.formats import woce
+from libcchdo.parallel import fork_map
+
+
+# Water Quality flags that require fill value
+FLAGS_FILL = [1, 5, 9]
+
+
+NOT_WATER_PARAMETERS = ['BTLNBR']
+
+
+# The number of row ranges shown for each Violation in the summary
+SUMMARY_RANGES = 5
+
+
+LEVELS = {
+    'error': ERROR,
+    'warning': WARNING,
+    'info': INFO,
+}
+
+
+class Violation(object):
+    """A rule that some rows of a column or file do not satisfy."""
+
+    def __init__(self, rule, level, message, ranges, column=None, flag=None):
+        """
+        rule - the name of the rule
+        level - one of LEVELS
+        message - what is wrong
+        ranges - list of inclusive [first, last] row ranges
+        column - the parameter name of the column, if any
+        flag - the flag the rows have, if the rule depends on it
+
+        """
+        self.rule = rule
+        self.level = level
+        self.message = message
+        self.ranges = ranges
+        self.column = column
+        self.flag = flag
+
+    @property
+    def rows(self):
+        """The number of rows in violation."""
+        return sum(last - first + 1 for first, last in self.ranges)
+
+    def to_dict(self):
+        return OrderedDict([
+            ('rule', self.rule),
+            ('level', self.level),
+            ('column', self.column),
+            ('flag', self.flag),
+            ('message', self.message),
+            ('rows', self.rows),
+            ('ranges', self.ranges),
+        ])
+
+    def __repr__(self):
+        return 'Violation({0!r}, {1!r}, {2!r})'.format(
+            self.rule, self.column, self.ranges)
+
+
+def row_ranges(selected):
+    """Return the runs of True in a boolean array as inclusive row ranges."""
+    selected = np.asarray(selected, bool)
+    if not selected.any():
+        return []
+    edges = np.diff(np.concatenate(([0], selected.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return [[int(start), int(end)] for start, end in zip(starts, ends)]
+
+
+def format_ranges(ranges, limit=SUMMARY_RANGES):
+    """Return a short description of row ranges, e.g. '1-4,7 and 3 more'."""
+    parts = []
+    for first, last in ranges[:limit]:
+        if first == last:
+            parts.append(str(first))
+        else:
+            parts.append('{0}-{1}'.format(first, last))
+    desc = ','.join(parts)
+    if len(ranges) > limit:
+        desc += ' and {0} more'.format(len(ranges) - limit)
+    return desc
+
+
+def missing_mask(values):
+    """Return a boolean array that is True where values are missing."""
+    try:
+        return values.mask()
+    except AttributeError:
+        return np.fromiter(
+            (vvv is None for vvv in values), bool, len(values))
+
+
+def blank_mask(values):
+    """Return a boolean array that is True where values are empty strings."""
+    try:
+        if values.is_compact():
+            return np.zeros(len(values), bool)
+    except AttributeError:
+        pass
+    # Comparing every Decimal to '' is slow so look for strings first.
+    vtypes = set(map(type, values))
+    if not any(issubclass(vtype, basestring) for vtype in vtypes):
+        return np.zeros(len(values), bool)
+    return np.fromiter(
+        (isinstance(vvv, basestring) and not vvv for vvv in values), bool,
+        len(values))
+
+
+def _flag_violations(rule, level, column, selected, flags, describe):
+    """Return a Violation for each flag of the selected rows."""
+    violations = []
+    for flag in np.unique(flags[selected]):
+        if np.isnan(flag):
+            continue
+        flag = int(flag)
+        violations.append(Violation(
+            rule, level, describe(flag),
+            row_ranges(selected & (flags == flag)), column, flag))
+    return violations
+
+
+def check_flag_fill_values(column):
+    """Data flagged as not there should be fill values and vice versa."""
+    name = column.parameter.name
+    if not column.flags_woce or name in NOT_WATER_PARAMETERS:
+        return []
+
+    violations = []
+    values = column.values
+    flags = float64(column.flags_woce)
+    if len(flags) != len(values):
+        violations.append(Violation(
+            'flag_count', 'error',
+            u'has different number of values ({0}) and flags ({1})'.format(
+                len(values), len(flags)),
+            [], name))
+    rows = min(len(values), len(flags))
+    missing = missing_mask(values)[:rows]
+    flags = flags[:rows]
+    require_fill = np.in1d(flags, FLAGS_FILL)
+
+    violations.extend(_flag_violations(
+        'data_with_fill_flag', 'warning', name, require_fill & ~missing, flags,
+        lambda flag: u'has data but expected fill value for flag {0}: '
+            '{1!r}'.format(flag, woce.WATER_SAMPLE_FLAGS[flag])))
+    violations.extend(_flag_violations(
+        'fill_without_fill_flag', 'warning', name, missing & ~require_fill,
+        flags,
+        lambda flag: u'has unexpected fill value for flag {0}: '
+            '{1!r}'.format(
+                flag, woce.WATER_SAMPLE_FLAGS.get(flag, 'Unknown flag'))))
+    # Missing flags cannot be described by flag
+    unflagged = missing & np.isnan(flags)
+    if unflagged.any():
+        violations.append(Violation(
+            'fill_without_fill_flag', 'warning',
+            u'has unexpected fill value without a flag',
+            row_ranges(unflagged), name))
+    return violations
+
+
+def check_empty(column):
+    """Columns should not only have fill values."""
+    if len(column.values) and missing_mask(column.values).all():
+        return [Violation(
+            'empty_column', 'info', u'is empty (only has fill values)',
+            [[0, len(column.values) - 1]], column.parameter.name)]
+    return []
+
+
+def check_flag_0(column):
+    """Data should not have flag 0."""
+    if not column.flags_woce:
+        return []
+    selected = float64(column.flags_woce) == 0
+    if not selected.any():
+        return []
+    return [Violation(
+        'flag_0', 'warning', u'has flag 0', row_ranges(selected),
+        column.parameter.name, 0)]
+
+
+def check_blank(column):
+    """Values should not be empty strings."""
+    selected = blank_mask(column.values)
+    if not selected.any():
+        return []
+    return [Violation(
+        'blank_value', 'error', u'has blank values, conversions may fail',
+        row_ranges(selected), column.parameter.name)]
+
+
+COLUMN_RULES = [
+    check_flag_fill_values,
+    check_empty,
+    check_flag_0,
+    check_blank,
+]
+
+
+def check_unique(dfile, names):
+    """The rows should be unique by the values of the named columns."""
+    keys = zip(*[dfile.columns[name].values for name in names])
+    counts = Counter(keys)
+    duplicated = [key for key, count in counts.items() if count > 1]
+    if not duplicated:
+        return []
+    examples = '; '.join(
+        ', '.join('{0}: {1}'.format(*item) for item in zip(names, key))
+        for key in duplicated[:SUMMARY_RANGES])
+    duplicated = set(duplicated)
+    selected = np.fromiter(
+        (key in duplicated for key in keys), bool, len(keys))
+    return [Violation(
+        'non_unique', 'warning',
+        u'Non unique values for columns ({0}), {1} duplicated (e.g. '
+        '{2})'.format(','.join(names), len(duplicated), examples),
+        row_ranges(selected))]
+
+
+def check_datafile(dfile, unique=None):
+    """Check a DataFile and return the Violations found.
+
+    unique - names of columns whose values together should be unique
+
+    """
+    dfile.check_and_replace_parameters(convert=False)
+    violations = []
+    for column in dfile.columns.values():
+        for rule in COLUMN_RULES:
+            violations.extend(rule(column))
+    if unique:
+        violations.extend(check_unique(dfile, unique))
+    return violations
+
+
+class Report(object):
+    """The Violations found in a number of files."""
+
+    def __init__(self):
+        self.files = []
+
+    def add(self, name, violations, rows=0, error=None):
+        """Add the Violations of a file.
+
+        error - the reason the file could not be checked, if it could not
+
+        """
+        self.files.append(OrderedDict([
+            ('name', name),
+            ('rows', rows),
+            ('error', error),
+            ('violations', violations),
+        ]))
+
+    def errors(self):
+        """Return the names of the files that could not be checked."""
+        return [fff['name'] for fff in self.files if fff['error']]
+
+    def totals(self):
+        """Return the number of rows in violation for each rule."""
+        totals = Counter()
+        for fff in self.files:
+            for violation in fff['violations']:
+                totals[violation.rule] += violation.rows
+        return OrderedDict(sorted(totals.items()))
+
+    def log_summary(self, logger=log):
+        """Log one line for each Violation and the totals for each rule."""
+        for fff in self.files:
+            if fff['error']:
+                logger.error(u'Unable to check {0}:\n{1}'.format(
+                    fff['name'], fff['error']))
+                continue
+            for violation in fff['violations']:
+                message = violation.message
+                if violation.column:
+                    message = u'column {0} {1}'.format(
+                        violation.column, message)
+                logger.log(
+                    LEVELS[violation.level],
+                    u'{0}: {1} on {2} row(s) {3}'.format(
+                        fff['name'], message, violation.rows,
+                        format_ranges(violation.ranges)))
+        totals = self.totals()
+        logger.info(u'Checked {0} file(s): {1}'.format(
+            len(self.files),
+            ', '.join('{0} {1} rows'.format(rule, rows)
+                      for rule, rows in totals.items()) or 'no problems'))
+
+    def to_dict(self):
+        files = []
+        for fff in self.files:
+            fff = OrderedDict(fff)
+            fff['violations'] = [vvv.to_dict() for vvv in fff['violations']]
+            files.append(fff)
+        return OrderedDict([('files', files), ('totals', self.totals())])
+
+    def write_json(self, fileobj):
+        json.dump(self.to_dict(), fileobj, indent=1)
+        fileobj.write('\n')
+
+
+def _datafiles(dfile, name):
+    """Return (name, DataFile) for each DataFile in a file that was read."""
+    try:
+        members = dfile.files
+    except AttributeError:
+        return [(name, dfile)]
+    named = []
+    for i, member in enumerate(members):
+        mname = member.globals.get('_FILENAME', i)
+        named.append((u'{0}:{1}'.format(name, mname), member))
+    return named
+
+
+def check_file(fileobj, input_type=None, unique=None):
+    """Read and check a file.
+
+    Returns:
+        a list of (name, Violations, rows, error) for the file or, for
+        collections, each of its members
+
+    """
+    from libcchdo.formats.formats import read_arbitrary
+    name = getattr(fileobj, 'name', repr(fileobj))
+    try:
+        dfile = read_arbitrary(fileobj, input_type)
+    except Exception, err:
+        return [(name, [], 0, format_exc(err))]
+    results = []
+    for dname, member in _datafiles(dfile, name):
+        try:
+            results.append(
+                (dname, check_datafile(member, unique), len(member), None))
+        except Exception, err:
+            results.append((dname, [], len(member), format_exc(err)))
+    return results
+
+
+def _check_path(task):
+    """Check the file at a path in a worker."""
+    from libcchdo.formats.zip import jobs
+    path, input_type, unique = task
+    # Workers cannot have workers of their own.
+    with jobs(1), open(path) as fileobj:
+        return check_file(fileobj, input_type, unique)
+
+
+def check_files(fileobjs, input_type=None, unique=None, jobs=1):
+    """Check files and return a Report.
+
+    jobs - the number of processes to check files with. Files are only checked
+        in parallel if there is more than one and they all have paths.
+
+    """
+    report = Report()
+    paths = [getattr(fileobj, 'name', None) for fileobj in fileobjs]
+    parallel = jobs > 1 and len(fileobjs) > 1 and all(
+        path and not path.startswith('<') for path in paths)
+    if parallel:
+        from libcchdo.db.model.std import parameter_registry
+        # Load the registry once for the workers to share.
+        parameter_registry()
+        results = fork_map(
+            _check_path, [(path, input_type, unique) for path in paths],
+            min(jobs, len(fileobjs)))
+    else:
+        results = [check_file(fileobj, input_type, unique)
+                   for fileobj in fileobjs]
+    for file_results in results:
+        for name, violations, rows, error in file_results:
+            report.add(name, violations, rows, error)
+    return report
@@ -1,7 +1,7 @@
 import sys
 import os.path
 from contextlib import contextmanager, closing
-from threading import Lock
+from threading import Lock, RLock
 from logging import getLogger
 
 
@@ -62,6 +62,7 @@ def _regenerate_database_cache(std_session):
     Base.metadata.drop_all(std_session.get_bind())
     Base.metadata.create_all(std_session.get_bind())
     _populate_library_database_parameters(std_session)
+    invalidate_parameter_registry()
             
 
 def _ensure_database_cache():
@@ -87,6 +88,7 @@ def _ensure_database_cache():
         try:
             if not std_session.query(Parameter).count():
                 _populate_library_database_parameters(std_session)
+                invalidate_parameter_registry()
         except OperationalError, e:
             log.info(
                 u'Database operational error possibly due to schema change.'
@@ -270,7 +272,7 @@ class Unit(Base):
 
     @classmethod
     def find_by_name(cls, name):
-        return session().query(Unit).filter(Unit.name == name).first()
+        return parameter_registry().find_unit(name)
 
 
 S.Index('units_name', Unit.name, unique=True)
@@ -531,16 +533,100 @@ def make_contrived_parameter(name, format=None, units=None, bound_lower=None,
         display_order=display_order)
 
 
+def copy_parameter(parameter):
+    """Return a transient copy of parameter that is safe to change.
+
+    The copy shares the Unit but has its own aliases.
+
+    """
+    copy = Parameter(parameter.name)
+    for attr in ('id', 'full_name', 'name_netcdf', 'description', 'format',
+                 'unit_id', 'units', 'bound_lower', 'bound_upper',
+                 'display_order'):
+        setattr(copy, attr, getattr(parameter, attr))
+    copy.aliases = [ParameterAlias(alias.name) for alias in parameter.aliases]
+    return copy
+
+
+class ParameterRegistry(object):
+    """The Parameters, ParameterAliases and Units in the cache database.
+
+    Everything is loaded with a few queries when the registry is created and
+    looked up in dicts afterwards. The registry never changes; a new one is
+    loaded after the cache database is regenerated.
+
+    The Parameters and Units are detached from any session and shared by
+    everyone that looks them up. Use copy_parameter() to get one that can be
+    changed.
+
+    """
+    def __init__(self, std_session):
+        units = std_session.query(Unit).all()
+        parameters = std_session.query(Parameter).options(
+            S.orm.joinedload(Parameter.units)).all()
+        self._units = dict((unit.name, unit) for unit in units)
+        self._parameters = dict((param.name, param) for param in parameters)
+        self._aliases = {}
+        for param in parameters:
+            for alias in param.aliases:
+                self._aliases[alias.name] = param
+        std_session.expunge_all()
+
+    def __len__(self):
+        return len(self._parameters)
+
+    def find(self, name):
+        """Return the Parameter named name or None."""
+        return self._parameters.get(name)
+
+    def find_by_mnemonic(self, name):
+        """Return the Parameter named name or aliased by name or None."""
+        try:
+            return self._parameters[name]
+        except KeyError:
+            return self._aliases.get(name)
+
+    def is_alias(self, name):
+        return name not in self._parameters and name in self._aliases
+
+    def find_unit(self, name):
+        """Return the Unit named name or None."""
+        return self._units.get(name)
+
+
+_parameter_registry = None
+_parameter_registry_lock = RLock()
+
+
+def parameter_registry():
+    """Return the process-wide ParameterRegistry, loading it if needed."""
+    global _parameter_registry
+    registry = _parameter_registry
+    if registry is not None:
+        return registry
+    with _parameter_registry_lock:
+        if _parameter_registry is None:
+            if check_cache:
+                _ensure_database_cache()
+            with closing(connect.session(connect.cchdo_data())) as std_session:
+                _parameter_registry = ParameterRegistry(std_session)
+            log.debug(u'Loaded {0} parameters into the registry'.format(
+                len(_parameter_registry)))
+        return _parameter_registry
+
+
+def invalidate_parameter_registry():
+    """Discard the ParameterRegistry so that it is reloaded when next used."""
+    global _parameter_registry
+    with _parameter_registry_lock:
+        _parameter_registry = None
+
+
 def find_by_mnemonic(name):
-    parameter = session().query(Parameter).\
-        filter(Parameter.name == name).first()
+    registry = parameter_registry()
+    parameter = registry.find_by_mnemonic(name)
     if not parameter:
-        alias = session().query(ParameterAlias).filter(
-            ParameterAlias.name == name).first()
-        if alias:
-            parameter = alias.parameter
-            log.info("%s is an alias for %s" % (name, parameter))
-        else:
-            parameter = None
-            log.warn("%s is not a recognized parameter" % name)
+        log.warn("%s is not a recognized parameter" % name)
+    elif registry.is_alias(name):
+        log.info("%s is an alias for %s" % (name, parameter))
     return parameter
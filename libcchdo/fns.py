@@ -200,6 +200,52 @@ def in_band_or_none(x, oob=None, tolerance=None):
     return None if out_of_band(*args) else x
 
 
+# Floats are out of band within this distance of the out-of-band value.
+_OOB_TOLERANCE = 0.1
+
+
+# Floats this close to the tolerance boundary are checked again with
+# out_of_band which decides on the Decimal representation.
+_OOB_BOUNDARY = 1e-9
+
+
+def out_of_band_mask(floats, raws, oob=-999.0):
+    """Return a list that is True where the floats are out of band.
+
+    Gives the same as out_of_band(raw, oob) for each of the raws without
+    making Decimals of them.
+
+    Args:
+        floats - the float values of the raws
+        raws - the values as read
+        oob - out-of-band value (default -999.0)
+
+    """
+    mask = []
+    for fff, raw in zip(floats, raws):
+        delta = abs(fff - oob)
+        if abs(delta - _OOB_TOLERANCE) < _OOB_BOUNDARY:
+            mask.append(out_of_band(raw, Decimal(oob)))
+        else:
+            mask.append(delta < _OOB_TOLERANCE)
+    return mask
+
+
+def out_of_band_array(floats, raws, oob=-999.0):
+    """Return a boolean array that is True where the floats are out of band.
+
+    The same as out_of_band_mask for a float64 array of floats.
+
+    """
+    import numpy as np
+    delta = np.abs(floats - oob)
+    mask = delta < _OOB_TOLERANCE
+    for iii in np.flatnonzero(
+            np.abs(delta - _OOB_TOLERANCE) < _OOB_BOUNDARY):
+        mask[iii] = out_of_band(raws[iii], Decimal(oob))
+    return mask
+
+
 def identity_or_oob(x, oob=-999):
     """ Good for filling in lists that have Nones with oob values.
        Args:
@@ -8,12 +8,14 @@ from libcchdo.fns import _decimal
 from libcchdo.model.datafile import Column
 from libcchdo.formats import woce
 from libcchdo.formats.exchange import (
-    FLAG_ENDING_WOCE, FLAG_ENDING_IGOSS,
-    read_identifier_line, read_comments, read_data, write_identifier,
-    write_data, write_flagged_format_parameter_values, FILL_VALUE, END_DATA)
+    FLAG_ENDING_WOCE, FLAG_ENDING_IGOSS, CHUNK_ROWS,
+    read_identifier_line, read_comments, read_columns_and_units, read_data,
+    iter_data, write_identifier, write_data, write_data_chunks,
+    write_flagged_format_parameter_values, FILL_VALUE, END_DATA)
 from libcchdo.formats.formats import (
     get_filename_fnameexts, is_filename_recognized_fnameexts,
     is_file_recognized_fnameexts)
+from libcchdo.timing import timed
 
 
 # TM and LV refer to Trace Metals and Large Volume respectively
@@ -48,20 +50,18 @@ def is_file_recognized(fileobj):
     return is_file_recognized_fnameexts(fileobj, _fname_extensions)
 
 
-def read(self, handle):
-    """ How to read a Bottle Exchange file. """
+def _read_header(self, handle):
+    """Read the identifier, comments, columns and units.
+
+    Returns:
+        the column names
+
+    """
     read_identifier_line(self, handle, 'BOTTLE')
     l = read_comments(self, handle)
 
     # Read columns and units
-    columns = [x.strip() for x in l.strip().split(',')]
-    units = [x.strip() for x in handle.readline().strip().split(',')]
-    
-    # Check columns and units to match length
-    if len(columns) != len(units):
-        raise ValueError(("Expected as many columns as units in file. "
-                          "Found %d columns and %d units.") % (len(columns),
-                                                               len(units)))
+    columns, units = read_columns_and_units(l, handle)
 
     # Check for unique identifer
     identifier = []
@@ -83,9 +83,11 @@ def read(self, handle):
                  "(STNNBR,CASTNO,BTLNBR)"))
 
     self.create_columns(columns, units)
+    return columns
 
-    read_data(self, handle, columns)
 
+def _finish_read(self):
+    """Convert the values that were read to what they are."""
     # Format all data to be what it is
     try:
         self['EXPOCODE'].values = map(str, self['EXPOCODE'].values)
@@ -115,13 +117,43 @@ def read(self, handle):
     self.check_and_replace_parameters()
 
 
-def write(self, handle):
-    """ How to write a Bottle Exchange file. """
+@timed('btl.ex.read')
+def read(self, handle):
+    """ How to read a Bottle Exchange file. """
+    columns = _read_header(self, handle)
+    read_data(self, handle, columns)
+    _finish_read(self)
+
+
+def read_chunks(self, handle, chunk_rows=CHUNK_ROWS):
+    """Read a Bottle Exchange file as a stream of DataFile chunks.
+
+    The identifier, comments, columns and units are read into self right away.
+    The data rows are only read as the returned iterator is consumed. Each
+    chunk holds up to chunk_rows rows read the same way read() would.
+
+    Returns:
+        an iterator of DataFiles
+
+    """
+    columns = _read_header(self, handle)
+
+    def chunks():
+        for chunk in iter_data(self, handle, columns, chunk_rows):
+            _finish_read(chunk)
+            yield chunk
+    return chunks()
+
+
+def _write_header(self, handle):
     write_identifier(self, handle, 'BOTTLE')
     if self.globals['header']:
         handle.write('# Original header:\n')
         handle.write(self.globals['header'].encode('utf8'))
 
+
+def _prepare_to_write(self):
+    """Convert the values to what is written."""
     woce.split_datetime(self)
 
     # Convert all float stnnbr, castno, sampno, btlnbr to ints
@@ -146,6 +178,29 @@ def write(self, handle):
     convert_column_floats_to_ints(self, 'BTLNBR')
     self.check_and_replace_parameters()
 
-    write_data(self, handle)
 
+@timed('btl.ex.write')
+def write(self, handle):
+    """ How to write a Bottle Exchange file. """
+    _write_header(self, handle)
+    _prepare_to_write(self)
+    write_data(self, handle)
     woce.fuse_datetime(self)
+
+
+def write_chunks(self, handle, chunks):
+    """Write a Bottle Exchange file from a stream of DataFile chunks.
+
+    The identifier and header come from self. Only one chunk is in memory at a
+    time. See libcchdo.formats.exchange.write_data_chunks for how the columns
+    are formatted.
+
+    """
+    _write_header(self, handle)
+
+    def prepared():
+        for chunk in chunks:
+            _prepare_to_write(chunk)
+            yield chunk
+            woce.fuse_datetime(chunk)
+    write_data_chunks(prepared(), handle)
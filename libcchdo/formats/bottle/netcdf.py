@@ -1,7 +1,6 @@
 import datetime
 import os
 import re
-import tempfile
 from logging import getLogger
 
 
@@ -11,6 +10,7 @@ log = getLogger(__name__)
 import numpy as np
 
 from libcchdo import fns
+from libcchdo.model.storage import masked
 from libcchdo.util import memoize
 from libcchdo.db.model import std
 from libcchdo.formats import netcdf as nc
@@ -19,6 +19,7 @@ from libcchdo.formats.exchange import FILL_VALUE
 from libcchdo.formats.formats import (
     get_filename_fnameexts, is_filename_recognized_fnameexts,
     is_file_recognized_fnameexts)
+from libcchdo.timing import timed
 
 
 _fname_extensions = ['hy1.nc']
@@ -61,6 +62,15 @@ VARATTRS = frozenset(('time', 'latitude', 'longitude', 'woce_date',
                       'woce_time', 'cast', 'station', ))
 
 
+def _set_rows(seq, vlo, vhi, values):
+    """Set rows vlo to vhi of a column sequence to values."""
+    if len(seq) == vlo:
+        seq.extend(values)
+    else:
+        seq[vlo:vhi] = values
+
+
+@timed('btl.nc.read')
 def read(self, handle):
     """How to read a Bottle NetCDF file."""
     filename = handle.name
@@ -141,17 +151,23 @@ def read(self, handle):
                 continue
 
             self.create_columns((name, ))
-            self[name].values[vlo:vhi] = variable[:].tolist()
-
-            # Quick conversions to uniform data format
-            self[name].values[vlo:vhi] = map(
-                fns.in_band_or_none,
-                self[name].values[vlo:vhi])
+            column = self[name]
+            data = variable[:]
+            if data.dtype.kind in 'fiu':
+                # Quick conversions to uniform data format
+                values = nc.column_sequence(
+                    column, data, nc.missing_mask(data, out_of_band=True))
+            else:
+                values = map(fns.in_band_or_none, data.tolist())
+            _set_rows(column.values, vlo, vhi, values)
 
     # Second pass to put in flags
     for name, variable in qc_vars.items():
         if name in self.columns:
-            self[name].flags_woce[vlo:vhi] = variable[:].tolist()
+            column = self[name]
+            data = variable[:]
+            _set_rows(column.flags_woce, vlo, vhi, nc.column_sequence(
+                column, data, nc.missing_mask(data), flags=True))
         else:
             # The column is probably a global
             pass
@@ -194,55 +210,52 @@ def _create_common_variables(df, nc_file):
 
 def _nc_bottom_depth(df):
     try:
-        depths = filter(None, df['DEPTH'].values)
-        if not depths:
+        depths = masked(df['DEPTH'].values)
+        # Zero depths are as good as missing.
+        depths = np.ma.masked_equal(depths, 0, copy=False)
+        if not depths.count():
             return FILL_VALUE
-        return int(max(depths))
+        return int(depths.max())
     except (KeyError, AttributeError):
         return FILL_VALUE
 
 
+@timed('btl.nc.write')
 def write(self, handle):
     """How to write a Bottle NetCDF file."""
-    temp = tempfile.NamedTemporaryFile()
-    nc_file = nc.Dataset(temp.name, 'w', format='NETCDF3_CLASSIC')
-
-    nc.define_dimensions(nc_file, len(self))
-
-    # Define dataset attributes
-    nc.define_attributes(
-        nc_file, 
-        _lambda_or_unknown(lambda: self['EXPOCODE'][0]),
-        _lambda_or_unknown(lambda: self['SECT_ID'][0]),
-        'WOCE Bottle',
-        _lambda_or_unknown(lambda: nc.simplest_str(self['STNNBR'][0])),
-        _lambda_or_unknown(lambda: nc.simplest_str(self['CASTNO'][0])),
-        _nc_bottom_depth(self),
-        )
-
-    nc.set_original_header(nc_file, self, 'BOTTLE')
-
-    try:
-        bottle_column = self['BTLNBR']
-    except KeyError:
-        bottle_column = self['SAMPNO']
-
-    nc_file.BOTTLE_NUMBERS = ' '.join(
-        map(nc.simplest_str, bottle_column.values))
-    if bottle_column.is_flagged_woce():
-        # Java OceanAtlas 5.0.2 and possibly before requires bottle quality
-        # codes to be shorts.
-        btl_quality_codes = \
-            np.array(bottle_column.flags_woce).astype(np.int16)
-        nc_file.BOTTLE_QUALITY_CODES = btl_quality_codes
-
-    nc_file.WOCE_BOTTLE_FLAG_DESCRIPTION = woce.BOTTLE_FLAG_DESCRIPTION
-    nc_file.WOCE_WATER_SAMPLE_FLAG_DESCRIPTION = \
-        woce.WATER_SAMPLE_FLAG_DESCRIPTION
-
-    nc.create_and_fill_data_variables(self, nc_file)
-    _create_common_variables(self, nc_file)
-
-    nc_file.close()
-    handle.write(temp.read())
-    temp.close()
+    with nc.nc_dataset_to_stream(handle, format='NETCDF3_CLASSIC') as nc_file:
+        nc.define_dimensions(nc_file, len(self))
+
+        # Define dataset attributes
+        nc.define_attributes(
+            nc_file, 
+            _lambda_or_unknown(lambda: self['EXPOCODE'][0]),
+            _lambda_or_unknown(lambda: self['SECT_ID'][0]),
+            'WOCE Bottle',
+            _lambda_or_unknown(lambda: nc.simplest_str(self['STNNBR'][0])),
+            _lambda_or_unknown(lambda: nc.simplest_str(self['CASTNO'][0])),
+            _nc_bottom_depth(self),
+            )
+
+        nc.set_original_header(nc_file, self, 'BOTTLE')
+
+        try:
+            bottle_column = self['BTLNBR']
+        except KeyError:
+            bottle_column = self['SAMPNO']
+
+        nc_file.BOTTLE_NUMBERS = ' '.join(
+            map(nc.simplest_str, bottle_column.values))
+        if bottle_column.is_flagged_woce():
+            # Java OceanAtlas 5.0.2 and possibly before requires bottle quality
+            # codes to be shorts.
+            btl_quality_codes = \
+                np.array(bottle_column.flags_woce).astype(np.int16)
+            nc_file.BOTTLE_QUALITY_CODES = btl_quality_codes
+
+        nc_file.WOCE_BOTTLE_FLAG_DESCRIPTION = woce.BOTTLE_FLAG_DESCRIPTION
+        nc_file.WOCE_WATER_SAMPLE_FLAG_DESCRIPTION = \
+            woce.WATER_SAMPLE_FLAG_DESCRIPTION
+
+        nc.create_and_fill_data_variables(self, nc_file)
+        _create_common_variables(self, nc_file)
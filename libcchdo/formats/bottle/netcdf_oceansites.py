@@ -1,4 +1,4 @@
-from tempfile import NamedTemporaryFile
+from libcchdo.formats import netcdf as nc
 
 from libcchdo.formats.netcdf_oceansites import *
 from libcchdo.formats.formats import (
@@ -44,14 +44,9 @@ def write(self, handle, timeseries=None, timeseries_info={}, version=None):
     """How to write a Bottle NetCDF OceanSITES file.
 
     """
-    # netcdf library wants to write its own files.
-    tmp = NamedTemporaryFile()
     data_type = 'BTL'
-    nc_file = create_oceansites_nc(self, tmp.name, data_type, version)
-    write_columns(self, nc_file)
-    write_timeseries_info_title_and_id(
-        self, nc_file, data_type, timeseries, timeseries_info, version)
-    nc_file.close()
-
-    handle.write(tmp.read())
-    tmp.close()
+    with nc.nc_dataset_to_stream(handle, format='NETCDF3_CLASSIC') as nc_file:
+        define_oceansites_nc(self, nc_file, data_type, version)
+        write_columns(self, nc_file)
+        write_timeseries_info_title_and_id(
+            self, nc_file, data_type, timeseries, timeseries_info, version)
@@ -1,4 +1,6 @@
 from re import compile as re_compile
+from shutil import copyfileobj
+from tempfile import TemporaryFile
 from logging import getLogger
 
 
@@ -56,7 +58,7 @@ def read(self, handle):
     except Exception, e:
         raise ValueError('Malformed WOCE header in WOCE Bottle file: %s' % e)
     # Get stamp
-    stamp = re_compile('EXPOCODE\s*([\w/]+)\s*WHP.?ID\s*([\w/-]+(,[\w/-]+)*)\s*CRUISE DATES\s*(\d{6}) TO (\d{6})\s*(\d{8}\w+)?')
+    stamp = re_compile('EXPOCODE\s*([\w/]+)\s*WHP.?ID\s*([\w/-]+(,[\w/-]+)*)\s*CRUISE DATES\s*(\d{6,8}) TO (\d{6,8})\s*(\d{8}\w+)?')
     m = stamp.match(stamp_line)
     if m:
         self.globals['EXPOCODE'] = m.group(1)
@@ -91,32 +93,33 @@ def read(self, handle):
     self.check_and_replace_parameters()
 
 
-def write(self, handle):
-    """How to write a Bottle WOCE file."""
+def _cruise_dates(datetimes):
+    """Return the first and last of the datetimes as WOCE dates.
 
-    # Look through datetime for begin and end dates
-    datetimes = self.columns["_DATETIME"].values[:]
-    begin_date = 0
-    end_date = 0
-    if any(datetimes):
-        usable_datetimes = filter(None, datetimes)
-        begin_date = min(usable_datetimes)
-        end_date = max(usable_datetimes)
-        begin_date = woce.strftime_woce_date(begin_date)
-        end_date = woce.strftime_woce_date(end_date)
+    Both are 0 if there are no datetimes.
 
-    # ensure the cruise identifier columns are globals
-    if self['EXPOCODE'].is_global():
-        self.globals['EXPOCODE'] = self['EXPOCODE'].values[0]
-    if self['SECT_ID'].is_global():
-        self.globals['SECT_ID'] = self['SECT_ID'].values[0]
+    """
+    if not any(datetimes):
+        return 0, 0
+    usable_datetimes = filter(None, datetimes)
+    begin_date = min(usable_datetimes)
+    end_date = max(usable_datetimes)
+    return (woce.strftime_woce_date(begin_date),
+            woce.strftime_woce_date(end_date))
+
+
+def _set_cruise_identifiers(self, expocodes, sect_ids):
+    """Set the cruise identifier globals from their unique values."""
+    if len(expocodes) == 1:
+        self.globals['EXPOCODE'] = expocodes[0]
+    if len(sect_ids) == 1:
+        self.globals['SECT_ID'] = sect_ids[0]
     else:
-        sect_ids_uniq = uniquify(self['SECT_ID'].values)
-        log.warn(u'Multiple section ids found: {0}'.format(sect_ids_uniq))
-        self.globals['SECT_ID'] = '/'.join(sect_ids_uniq)
+        log.warn(u'Multiple section ids found: {0}'.format(sect_ids))
+        self.globals['SECT_ID'] = '/'.join(sect_ids)
 
-    columns, base_format = woce.columns_and_base_format(self)
 
+def _write_record_1(self, handle, columns, base_format, begin_date, end_date):
     vals = [''] * (len(columns) + 1)
     empty_line = base_format.format(*vals)
     record_len = len(empty_line) - 2
@@ -130,4 +133,75 @@ def write(self, handle):
     record_1 += '\n'
 
     handle.write(record_1)
+
+
+def write(self, handle):
+    """How to write a Bottle WOCE file."""
+
+    # Look through datetime for begin and end dates
+    begin_date, end_date = _cruise_dates(self.columns["_DATETIME"].values)
+
+    # ensure the cruise identifier columns are globals
+    if self['EXPOCODE'].is_global():
+        expocodes = self['EXPOCODE'].values[:1]
+    else:
+        expocodes = []
+    if self['SECT_ID'].is_global():
+        sect_ids = self['SECT_ID'].values[:1]
+    else:
+        sect_ids = uniquify(self['SECT_ID'].values)
+    _set_cruise_identifiers(self, expocodes, sect_ids)
+
+    columns, base_format = woce.columns_and_base_format(self)
+    _write_record_1(self, handle, columns, base_format, begin_date, end_date)
     woce.write_data(self, handle, columns, base_format)
+
+
+def write_chunks(self, handle, chunks):
+    """Write a Bottle WOCE file from a stream of DataFile chunks.
+
+    The stamp comes from self. Only one chunk is in memory at a time. Record 1
+    gives the cruise dates of all the data so the data records are kept in a
+    temporary file until the last chunk has been read.
+
+    Raises:
+        ValueError - there are no chunks or a chunk does not have the columns of
+            the first chunk
+
+    """
+    names = None
+    bounds = []
+    expocodes = []
+    sect_ids = []
+    row_offset = 0
+    with TemporaryFile() as records:
+        for chunk in chunks:
+            usable_datetimes = filter(None, chunk['_DATETIME'].values)
+            if usable_datetimes:
+                bounds.extend([min(usable_datetimes), max(usable_datetimes)])
+            expocodes = uniquify(expocodes + list(chunk['EXPOCODE'].values))
+            sect_ids = uniquify(sect_ids + list(chunk['SECT_ID'].values))
+
+            columns, base_format = woce.columns_and_base_format(chunk)
+            chunk_names = [col.parameter.mnemonic_woce() for col in columns]
+            if names is None:
+                names = chunk_names
+                record_format = base_format
+                record_columns = columns
+                woce.write_data_headers(records, columns, base_format)
+            elif chunk_names != names:
+                raise ValueError(
+                    u'Expected every chunk to have the columns {0!r}. Got '
+                    '{1!r}'.format(names, chunk_names))
+            woce.write_data_rows(
+                chunk, records, columns, base_format, row_offset)
+            row_offset += len(chunk)
+        if names is None:
+            raise ValueError(u'No chunks to write')
+
+        begin_date, end_date = _cruise_dates(bounds)
+        _set_cruise_identifiers(self, expocodes, sect_ids)
+        _write_record_1(
+            self, handle, record_columns, record_format, begin_date, end_date)
+        records.seek(0)
+        copyfileobj(records, handle)
@@ -17,6 +17,7 @@ from libcchdo.formats.exchange import (
 from libcchdo.formats.formats import (
     get_filename_fnameexts, is_filename_recognized_fnameexts,
     is_file_recognized_fnameexts)
+from libcchdo.timing import timed
 
 
 _fname_extensions = ['_ct1.csv', 'ct1.csv']
@@ -73,6 +74,7 @@ REQUIRED_HEADERS = [
     u'LATITUDE', u'LONGITUDE', u'DEPTH', ]
 
 
+@timed('ctd.ex.read')
 def read(self, handle, retain_order=False, header_only=False):
     """How to read a CTD Exchange file.
 
@@ -131,6 +133,7 @@ def read(self, handle, retain_order=False, header_only=False):
     self.check_and_replace_parameters()
 
 
+@timed('ctd.ex.write')
 def write(self, handle):
     """ How to write a CTD Exchange file. """
     pre_write(self)
@@ -1,13 +1,14 @@
 """Handler for CTD NetCDF files"""
 
-from tempfile import NamedTemporaryFile
 from logging import getLogger
 
 
 log = getLogger(__name__)
 
 
-from libcchdo.fns import equal_with_epsilon
+import numpy as np
+
+from libcchdo.model.storage import masked
 from libcchdo.model.datafile import Column
 from libcchdo.formats import woce
 from libcchdo.formats.exchange import FILL_VALUE
@@ -15,6 +16,7 @@ from libcchdo.formats import netcdf as nc
 from libcchdo.formats.formats import (
     get_filename_fnameexts, is_filename_recognized_fnameexts,
     is_file_recognized_fnameexts)
+from libcchdo.timing import timed
 
 
 _fname_extensions = ['ctd.nc']
@@ -63,6 +65,10 @@ NC_CTD_VAR_TO_WOCE_PARAM = {
 }
 
 
+# Old CCHDO CTD netCDF files fill missing salinities with this.
+CTDSAL_FILL_VALUE = -9.99
+
+
 GLOBALS_TO_RENAME_AS = {
     'CAST_NUMBER': 'CASTNO',
     'STATION_NUMBER': 'STNNBR',
@@ -72,6 +78,7 @@ GLOBALS_TO_RENAME_AS = {
 }
 
 
+@timed('ctd.nc.read')
 def read(self, handle):
     '''How to read a CTD NetCDF file.'''
     filename = handle.name
@@ -99,35 +106,45 @@ def read(self, handle):
             if name == 'drop':
                 continue
 
-            self.columns[name] = Column(name)
-            self.columns[name].values = variable[:].tolist()
+            column = Column(name)
+            data = variable[:]
 
             # Do some transformations from NetCDF pecularities to standard data format
             if name in ['STNNBR', 'CASTNO']:
                 # CCHDO NetCDFs have STNNBR and CASTNO as an array of characters.
                 # Collapse them into a string.
-                self.columns[name].values = [''.join(filter(None, self.columns[name].values))]
+                values = [''.join(filter(None, data.tolist()))]
             elif name in ['DATE']:
                 # Translate string date YYYYMMDD to date object
-                string = str(self.columns[name].values[0])
-                self.columns[name].values[0] = '%s%s%s' % \
+                values = data.tolist()
+                string = str(values[0])
+                values[0] = '%s%s%s' % \
                     (string[0:4], string[4:6], string[6:8])
-            if name == 'CTDSAL':
-                self.columns[name].values = map(
-                    lambda x: None if equal_with_epsilon(-9.99, x) \
-                              else x,
-                    self.columns[name].values)
+            elif len(data) <= 1:
+                values = data.tolist()
+            else:
+                mask = nc.missing_mask(data)
+                if name == 'CTDSAL':
+                    with np.errstate(invalid='ignore'):
+                        mask = mask | (np.abs(
+                            np.ma.getdata(data) - CTDSAL_FILL_VALUE) < 1e-6)
+                values = nc.column_sequence(column, data, mask)
 
             # Check for globals
-            if len(self.columns[name].values) <= 1:
+            if len(values) <= 1:
                 # If the column has only one data point it should be in the globals
-                self.globals[name] = self.columns[name].get(0)
-                del self.columns[name]
+                self.globals[name] = values[0] if values else None
+                continue
+            column.values = values
+            self.columns[name] = column
 
     # Second pass to put in flags
     for name, variable in qc_vars.items():
         if name in self.columns:
-            self.columns[name].flags_woce = variable[:].tolist()
+            column = self.columns[name]
+            data = variable[:]
+            column.flags_woce = nc.column_sequence(
+                column, data, nc.missing_mask(data), flags=True)
         else:
             # The column is probably a global
             pass
@@ -165,44 +182,40 @@ def _create_common_variables(df, nc_file, woce_datetime):
         nc_file, latitude, longitude, woce_datetime, stnnbr, castno)
 
 
+@timed('ctd.nc.write')
 def write(self, handle):
     '''How to write a CTD NetCDF file.'''
-    tmp = NamedTemporaryFile()
-    nc_file = nc.Dataset(tmp.name, 'w', format='NETCDF3_CLASSIC')
-
-    nc.define_dimensions(nc_file, len(self))
-
-    # Define dataset attributes
-    nc.define_attributes(
-        nc_file, 
-        self.globals.get('EXPOCODE', nc.UNKNOWN),
-        self.globals.get('SECT_ID', nc.UNKNOWN),
-        'WOCE CTD',
-        self.globals.get('STNNBR', nc.UNKNOWN),
-        self.globals.get('CASTNO', nc.UNKNOWN),
-        int(self.globals.get('DEPTH', FILL_VALUE)),
-        )
-
-    nc.set_original_header(nc_file, self, 'CTD')
-    nc_file.WOCE_CTD_FLAG_DESCRIPTION = woce.CTD_FLAG_DESCRIPTION
-
-    nc.create_and_fill_data_variables(self, nc_file)
-
-    try:
-        self['NUMBER']
-        var_number = nc_file.createVariable(
-            'number_observations', 'i4', ('pressure',))
-        var_number.long_name = 'number_observations'
-        var_number.units = 'integer'
-        var_number.data_min = float(min(self['NUMBER']))
-        var_number.data_max = float(max(self['NUMBER']))
-        var_number.C_format = '%1d'
-        var_number[:] = self['NUMBER']
-    except KeyError:
-        pass
-
-    _create_common_variables(self, nc_file, self.globals['_DATETIME'])
+    with nc.nc_dataset_to_stream(handle, format='NETCDF3_CLASSIC') as nc_file:
+        nc.define_dimensions(nc_file, len(self))
+
+        # Define dataset attributes
+        nc.define_attributes(
+            nc_file, 
+            self.globals.get('EXPOCODE', nc.UNKNOWN),
+            self.globals.get('SECT_ID', nc.UNKNOWN),
+            'WOCE CTD',
+            self.globals.get('STNNBR', nc.UNKNOWN),
+            self.globals.get('CASTNO', nc.UNKNOWN),
+            int(self.globals.get('DEPTH', FILL_VALUE)),
+            )
+
+        nc.set_original_header(nc_file, self, 'CTD')
+        nc_file.WOCE_CTD_FLAG_DESCRIPTION = woce.CTD_FLAG_DESCRIPTION
+
+        nc.create_and_fill_data_variables(self, nc_file)
+
+        try:
+            self['NUMBER']
+            var_number = nc_file.createVariable(
+                'number_observations', 'i4', ('pressure',))
+            var_number.long_name = 'number_observations'
+            var_number.units = 'integer'
+            number = masked(self['NUMBER'].values)
+            var_number.data_min, var_number.data_max = \
+                nc.column_data_range(number)
+            var_number.C_format = '%1d'
+            var_number[:] = number
+        except KeyError:
+            pass
 
-    nc_file.close()
-    handle.write(tmp.read())
-    tmp.close()
+        _create_common_variables(self, nc_file, self.globals['_DATETIME'])
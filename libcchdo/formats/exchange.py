@@ -2,6 +2,7 @@
 
 """
 from re import compile as re_compile, match as re_match
+from itertools import islice, izip
 from logging import getLogger
 
 
@@ -9,10 +10,10 @@ log = getLogger(__name__)
 
 
 from libcchdo.config import stamp as user_stamp
-from libcchdo.fns import Decimal, decimal_to_str, _decimal, out_of_band
-from libcchdo.db.model.std import session
-from libcchdo.db.model.convert import find_parameter
-from libcchdo.model.datafile import Column
+from libcchdo.fns import (
+    Decimal, decimal_to_str, _decimal, out_of_band, out_of_band_mask)
+from libcchdo.db.model.std import parameter_registry
+from libcchdo.model.datafile import Column, DataFile
 from libcchdo.formats.stamped import read_stamp
 
 
@@ -20,6 +21,10 @@ from libcchdo.formats.stamped import read_stamp
 FILL_VALUE = -999.0
 
 
+# The number of data rows in each chunk of a data stream
+CHUNK_ROWS = 10000
+
+
 FLAG_ENDING_WOCE = '_FLAG_W'
 FLAG_ENDING_IGOSS = '_FLAG_I'
 
@@ -103,6 +108,29 @@ def read_comments(dfile, fileobj):
     return line
 
 
+def read_columns_and_units(line, fileobj):
+    """Read the column names and units of an Exchange file.
+
+    line - the column name line, usually the line read_comments returned
+
+    Returns:
+        (columns, units) - lists of the stripped names and units
+
+    Raises:
+        ValueError - if there are not as many units as columns
+
+    """
+    columns = [x.strip() for x in line.strip().split(',')]
+    units = [x.strip() for x in fileobj.readline().strip().split(',')]
+    
+    # Check columns and units to match length
+    if len(columns) != len(units):
+        raise ValueError(("Expected as many columns as units in file. "
+                          "Found %d columns and %d units.") % (len(columns),
+                                                               len(units)))
+    return columns, units
+
+
 def _prepare_to_read_exchange_data(dfile, columns):
     """Return preparatory information about the columns to be read.
 
@@ -120,7 +148,7 @@ def _prepare_to_read_exchange_data(dfile, columns):
 
     """
     infos = []
-    ssesh = session()
+    registry = parameter_registry()
     for column in columns:
         flag_info = None
         if column.endswith(FLAG_ENDING_WOCE):
@@ -143,64 +171,227 @@ def _prepare_to_read_exchange_data(dfile, columns):
             col = getattr(col, flag_info[1])
             infos.append((col, flag_info))
         else:
-            infos.append((col, find_parameter(ssesh, column)))
+            infos.append((col, registry.find(column)))
     return infos
 
 
-def _read_data_row(dfile, row_i, info, raw):
+def _read_cell(row_i, param, raw):
+    """Convert a raw Exchange data cell to its value."""
     raw_value = raw.strip()
-    col, param = info
     # tuple indicates flag column
     if type(param) is tuple:
         try:
-            value = int(raw_value)
+            return int(raw_value)
         except (ValueError, TypeError):
             log.warn(
                 u'Bad {0} flag {1!r} for {2} on data row {3}'.format(
                 param[0], raw_value, param[2], row_i))
-            value = None
-    else:
-        if out_of_band(raw_value):
-            value = None
-        else:
-            if param is None or param.format.endswith('s'):
-                value = raw_value
-            else:
-                try:
-                    value = _decimal(raw_value)
-                except:
-                    value = raw_value
-    col.append(value)
-
-
-def read_data(dfile, fileobj, columns):
-    """Read Exchange data rows."""
-    row_i = 0
-    infos = _prepare_to_read_exchange_data(dfile, columns)
-    l = fileobj.readline().strip()
-    while l:
-        if l.startswith(END_DATA):
+            return None
+    if out_of_band(raw_value):
+        return None
+    if param is None or param.format.endswith('s'):
+        return raw_value
+    try:
+        return _decimal(raw_value)
+    except:
+        return raw_value
+
+
+def _read_data_row(dfile, row_i, info, raw):
+    col, param = info
+    col.append(_read_cell(row_i, param, raw))
+
+
+def _is_string_parameter(param):
+    return param is None or param.format.endswith('s')
+
+
+def _convert_flag_cells(param, raws, row_offset=0):
+    """Convert a column of raw flag cells to ints."""
+    try:
+        return map(int, raws)
+    except (ValueError, TypeError):
+        return [_read_cell(row_offset + row_i, param, raw)
+                for row_i, raw in enumerate(raws)]
+
+
+def _convert_value_cells(column, param, raws, row_offset=0):
+    """Convert a column of raw data cells to values.
+
+    Numeric columns are converted all at once with fill values detected on the
+    whole column. If any cell is not a number, the column is converted cell by
+    cell the same way _read_data_row does.
+
+    Returns:
+        a list of values or, for Columns with array storage, a ValueArray
+
+    """
+    stripped = [raw.strip() for raw in raws]
+    if _is_string_parameter(param):
+        # Only strings with a 9 can be within tolerance of -999.
+        return [None if '9' in raw and out_of_band(raw) else raw
+                for raw in stripped]
+
+    if getattr(column, 'storage', None) == 'array':
+        try:
+            from libcchdo.model.storage import ValueArray
+            return ValueArray.from_data_cells(stripped, FILL_VALUE)
+        except (ValueError, OverflowError):
+            pass
+    try:
+        floats = map(float, stripped)
+    except ValueError:
+        return [_read_cell(row_offset + row_i, param, raw)
+                for row_i, raw in enumerate(raws)]
+    return [None if fill else Decimal(raw)
+            for raw, fill in zip(
+                stripped, out_of_band_mask(floats, stripped, FILL_VALUE))]
+
+
+def _data_lines(fileobj):
+    """Yield stripped data lines up to END_DATA or the first blank line."""
+    line = fileobj.readline().strip()
+    while line and not line.startswith(END_DATA):
+        yield line
+        line = fileobj.readline().strip()
+
+
+def _bulk_data_lines(fileobj):
+    """Return stripped data lines up to END_DATA or the first blank line.
+
+    The whole data section is read at once.
+
+    """
+    lines = []
+    for line in fileobj.read().split('\n'):
+        line = line.strip()
+        if not line or line.startswith(END_DATA):
             break
-        values = l.split(',')
+        lines.append(line)
+    return lines
+
+
+def _column_count_error(fileobj, columns, num_values, data_line):
+    return ValueError(
+        'Expected as many columns as values in file ({0}). Found {1} '
+        'columns and {2} values at data line {3}'.format(
+            fileobj.name, len(columns), num_values, data_line))
+
+
+def _read_data_rowwise(dfile, fileobj, columns, infos, lines, row_offset=0):
+    """Read data lines one row and one cell at a time.
+
+    row_offset - the number of data rows before lines, for messages
+
+    """
+    for row_i, line in enumerate(lines):
+        values = line.split(',')
         
         # Check columns and values to match length
         if len(columns) != len(values):
-            raise ValueError(
-                'Expected as many columns as values in file ({0}). Found {1} '
-                'columns and {2} values at data line {3}'.format(
-                    fileobj.name, len(columns), len(values), len(dfile) + 1))
+            raise _column_count_error(
+                fileobj, columns, len(values), row_offset + len(dfile) + 1)
         for info, raw in zip(infos, values):
-            _read_data_row(dfile, row_i, info, raw)
-        l = fileobj.readline().strip()
-        row_i += 1
+            _read_data_row(dfile, row_offset + row_i, info, raw)
+
+
+def _read_data_columnwise(dfile, fileobj, columns, infos, lines,
+                          row_offset=0):
+    """Read data lines by splitting them once and converting whole columns.
+
+    row_offset - the number of data rows before lines, for messages
+
+    """
+    num_columns = len(columns)
+    for row_i, line in enumerate(lines):
+        num_values = line.count(',') + 1
+        if num_columns != num_values:
+            raise _column_count_error(
+                fileobj, columns, num_values,
+                row_offset + len(dfile) + row_i + 1)
+    if not lines:
+        return
+
+    cells = ','.join(lines).split(',')
+    for jjj, (col, param) in enumerate(infos):
+        raws = cells[jjj::num_columns]
+        if type(param) is tuple:
+            col.extend(_convert_flag_cells(param, raws, row_offset))
+        else:
+            col.values.extend(
+                _convert_value_cells(col, param, raws, row_offset))
+
+
+def _is_columnwise(infos):
+    """Return whether each column has its own destination.
+
+    Reading columnwise requires it.
+
+    """
+    return len(set(id(col) for col, _ in infos)) == len(infos)
+
+
+def read_data(dfile, fileobj, columns, bulk=True):
+    """Read Exchange data rows.
+
+    bulk - read the whole data section at once and convert it column by column.
+        Otherwise, read and convert one row at a time.
+
+    """
+    infos = _prepare_to_read_exchange_data(dfile, columns)
+    if bulk and _is_columnwise(infos):
+        _read_data_columnwise(
+            dfile, fileobj, columns, infos, _bulk_data_lines(fileobj))
+    else:
+        _read_data_rowwise(
+            dfile, fileobj, columns, infos, _data_lines(fileobj))
+
+
+def iter_data(dfile, fileobj, columns, chunk_rows=CHUNK_ROWS, bulk=True):
+    """Yield Exchange data rows in chunks of up to chunk_rows rows.
+
+    Only one chunk of data lines is in memory at a time.
 
+    Each chunk is a new DataFile with a shallow copy of the globals of dfile and
+    a Column for each of the columns. Columns that are missing from dfile are
+    created in it without values. At least one chunk is yielded, even if there
+    are no data rows, so that consumers always see the columns.
 
-def get_flagged_format_parameter_values(dfile):
+    bulk - convert each chunk column by column. Otherwise, convert one row at a
+        time.
+
+    """
+    infos = _prepare_to_read_exchange_data(dfile, columns)
+    columnwise = bulk and _is_columnwise(infos)
+    lines = _data_lines(fileobj)
+    row_offset = 0
+    while True:
+        block = list(islice(lines, chunk_rows))
+        if row_offset and not block:
+            break
+        chunk = dfile.take([])
+        infos = _prepare_to_read_exchange_data(chunk, columns)
+        if columnwise:
+            _read_data_columnwise(
+                chunk, fileobj, columns, infos, block, row_offset)
+        else:
+            _read_data_rowwise(
+                chunk, fileobj, columns, infos, block, row_offset)
+        yield chunk
+        if len(block) < chunk_rows:
+            break
+        row_offset += len(block)
+
+
+def get_flagged_format_parameter_values(dfile, decimal_places=None):
     """Return a list of tuples containing column format specifics.
 
     Said specifics include, format string, max column length, parameter and
     values.
 
+    decimal_places - function that returns the decimal places of a column's
+        values if they are already known. Defaults to Column.decimal_places.
+
     The format string is only really ever used for formatting fill values
     because the data sigfigs should be preserved by Decimal and faithfully
     returned.
@@ -208,6 +399,9 @@ def get_flagged_format_parameter_values(dfile):
     The max column length allows for rjustifying data so it all lines up neatly.
 
     """
+    if decimal_places is None:
+        decimal_places = Column.decimal_places
+
     columns = dfile.sorted_columns()
     flagged_parameter_names = []
     flagged_units = []
@@ -225,7 +419,7 @@ def get_flagged_format_parameter_values(dfile):
         if format_str.endswith('f'):
             parts = format_str[:-1].split('.')
             if len(parts) == 2:
-                col_decplaces = col.decimal_places()
+                col_decplaces = decimal_places(col)
                 if col_decplaces:
                     decplaces = col_decplaces
                 else:
@@ -246,26 +440,150 @@ def get_flagged_format_parameter_values(dfile):
     return flagged_parameter_names, flagged_units, flagged_format_parameter_values
 
 
+def _format_cell(value, format_str, limit, param, i):
+    """Format a single cell for writing.
+
+    This is the reference for how every cell is written.
+
+    """
+    if value is None:
+        value = format_str % FILL_VALUE
+    try:
+        return decimal_to_str(value).rjust(limit)
+    except Exception, err:
+        log.warn(
+            u'Could not format {0} (column {1} row {2:d}): {3}'.format(
+            value, param, i, err))
+        return value
+
+
+def _get_cell(values, param, i):
+    try:
+        return values[i]
+    except IndexError, err:
+        log.error(u'Could not get value of {0} at row {1}'.format(param, i))
+        return None
+
+
+def _plain_strings(values, nrows):
+    """Convert the first nrows values to strings as decimal_to_str would.
+
+    Missing values are None. Values that cannot simply be converted are left as
+    they are.
+
+    Returns:
+        (strings, decimal places) - The decimal places are the same as
+        Column.decimal_places() gives for the values. They are None if they
+        could not be worked out from the strings.
+
+    """
+    try:
+        strings = values.to_strings()
+    except AttributeError:
+        strings = None
+    if strings is not None:
+        return strings, values.decimal_places()
+
+    strings = []
+    append = strings.append
+    decplaces = 0
+    exact = len(values) <= nrows
+    for value in islice(values, nrows):
+        if value is None:
+            append(None)
+        elif type(value) is Decimal:
+            string = str(value)
+            # Exponent notation and special values are left to decimal_to_str
+            if 'E' in string or not string[-1].isdigit():
+                exact = False
+                append(value)
+                continue
+            point = string.find('.')
+            if point >= 0:
+                places = len(string) - point - 1
+                # Zeros do not count towards the decimal places
+                if places > decplaces and string.strip('-0.'):
+                    decplaces = places
+            append(string)
+        else:
+            if value:
+                exact = False
+            append(value)
+    if not exact:
+        decplaces = None
+    return strings, decplaces
+
+
+def _format_column(nrows, format_str, limit, param, strings, values):
+    """Format a whole column of cells for writing.
+
+    strings - the values as given by _plain_strings
+
+    The result is the same as formatting each of the values with _format_cell.
+
+    """
+    fill = (format_str % FILL_VALUE).rjust(limit)
+    cells = []
+    append = cells.append
+    for i, value in enumerate(islice(strings, nrows)):
+        vtype = type(value)
+        if value is None:
+            append(fill)
+        elif vtype is str:
+            append(value.rjust(limit))
+        elif vtype is int:
+            append(str(value).rjust(limit))
+        else:
+            append(_format_cell(value, format_str, limit, param, i))
+    for i in xrange(len(cells), nrows):
+        append(_format_cell(
+            _get_cell(values, param, i), format_str, limit, param, i))
+    return cells
+
+
+# The number of rows joined in memory for each write
+_WRITE_BLOCK_ROWS = 10000
+
+
+def _write_rows(fileobj, nrows, flagged_format_parameter_values, plain):
+    """Write the data rows a whole column at a time.
+
+    plain - a dict from id(values) to the result of _plain_strings for any of
+        the values already converted
+
+    """
+    columns = []
+    for format_str, limit, param, values in flagged_format_parameter_values:
+        try:
+            strings = plain[id(values)][0]
+        except KeyError:
+            strings = _plain_strings(values, nrows)[0]
+        columns.append(
+            _format_column(nrows, format_str, limit, param, strings, values))
+    for start in xrange(0, nrows, _WRITE_BLOCK_ROWS):
+        end = start + _WRITE_BLOCK_ROWS
+        rows = izip(*[cells[start:end] for cells in columns])
+        fileobj.write(''.join([','.join(row) + '\n' for row in rows]))
+
+
 def write_flagged_format_parameter_values(dfile, fileobj,
-                                          flagged_format_parameter_values):
+                                          flagged_format_parameter_values,
+                                          bulk=True):
+    """Write the data rows.
+
+    In bulk, whole columns are formatted at once and rows are written in large
+    blocks. Otherwise each cell is formatted as its row is written. Both give
+    identical output.
+
+    """
+    if bulk:
+        _write_rows(fileobj, len(dfile), flagged_format_parameter_values, {})
+        return
     for i in range(len(dfile)):
         values = []
         for format_str, limit, param, col in flagged_format_parameter_values:
-            try:
-                value = col[i]
-            except IndexError, err:
-                log.error(u'Could not get value of {0} at row {1}'.format(
-                    param, i))
-                value = None
-            if value is None:
-                value = format_str % FILL_VALUE
-            try:
-                values.append(decimal_to_str(value).rjust(limit))
-            except Exception, err:
-                log.warn(
-                    u'Could not format {0} (column {1} row {2:d}): {3}'.format(
-                    value, param, i, err))
-                values.append(value)
+            values.append(_format_cell(
+                _get_cell(col, param, i), format_str, limit, param, i))
         fileobj.write(','.join(values) + '\n')
 
 
@@ -281,15 +599,85 @@ def write_identifier(dfile, fileobj, ftype):
     fileobj.write(u'{0},{1}\n'.format(ftype, stamp))
 
 
-def write_data(dfile, fileobj):
-    """Write columns of data."""
+def write_data(dfile, fileobj, bulk=True):
+    """Write columns of data.
+
+    In bulk, each column's values are converted to strings once and the decimal
+    places for the fill values are worked out from those strings.
+
+    """
+    nrows = len(dfile)
+    plain = {}
+    decimal_places = None
+    if bulk:
+        for col in dfile.columns.values():
+            plain[id(col.values)] = _plain_strings(col.values, nrows)
+
+        def decimal_places(col):
+            decplaces = plain[id(col.values)][1]
+            if decplaces is None:
+                return col.decimal_places()
+            return decplaces
+
     flagged_parameter_names, flagged_units, flagged_format_parameter_values = \
-        get_flagged_format_parameter_values(dfile)
+        get_flagged_format_parameter_values(dfile, decimal_places)
 
     fileobj.write(','.join(flagged_parameter_names) + '\n')
     fileobj.write(','.join(flagged_units) + '\n')
 
-    write_flagged_format_parameter_values(
-        dfile, fileobj, flagged_format_parameter_values)
+    if bulk:
+        _write_rows(fileobj, nrows, flagged_format_parameter_values, plain)
+    else:
+        write_flagged_format_parameter_values(
+            dfile, fileobj, flagged_format_parameter_values, bulk=False)
+
+    fileobj.write(END_DATA + '\n')
+
+
+def write_data_chunks(chunks, fileobj):
+    """Write columns of data from a stream of DataFile chunks.
+
+    Each chunk is written as it arrives so only one chunk needs to be in
+    memory. The column names, units and formats come from the first chunk and
+    every chunk must have the same columns.
+
+    Fill values are formatted with the decimal places found in the first chunk
+    so the output is only the same as write_data's when the later chunks do
+    not have more decimal places.
+
+    Raises:
+        ValueError - a chunk does not have the columns of the first chunk
+
+    """
+    names = None
+    formats = None
+    for chunk in chunks:
+        nrows = len(chunk)
+        plain = {}
+        for col in chunk.columns.values():
+            plain[id(col.values)] = _plain_strings(col.values, nrows)
+
+        def decimal_places(col):
+            decplaces = plain[id(col.values)][1]
+            if decplaces is None:
+                return col.decimal_places()
+            return decplaces
+
+        chunk_names, units, flagged_format_parameter_values = \
+            get_flagged_format_parameter_values(chunk, decimal_places)
+        if names is None:
+            names = chunk_names
+            formats = [ffpv[:2] for ffpv in flagged_format_parameter_values]
+            fileobj.write(','.join(names) + '\n')
+            fileobj.write(','.join(units) + '\n')
+        elif chunk_names != names:
+            raise ValueError(
+                u'Expected every chunk to have the columns {0!r}. Got '
+                '{1!r}'.format(names, chunk_names))
+        else:
+            for ffpv, format_limit in zip(
+                    flagged_format_parameter_values, formats):
+                ffpv[:2] = format_limit
+        _write_rows(fileobj, nrows, flagged_format_parameter_values, plain)
 
     fileobj.write(END_DATA + '\n')
@@ -3,10 +3,18 @@
 This module deals with how data files are named (with extensions) and how they
 are mapped to read/write modules.
 
+Finding the format modules means importing all of them, which in turn imports
+their dependencies. What was found is kept in a manifest on disk so that
+all_formats and file_extensions can be queried without importing any format
+module. A format module is only imported when it is looked up in all_formats.
+
 """
+import os
 import os.path
 import sys
+import json
 from collections import OrderedDict
+from importlib import import_module
 from pkgutil import walk_packages, iter_modules
 from logging import getLogger
 
@@ -14,6 +22,8 @@ from logging import getLogger
 log = getLogger(__name__)
 
 
+from libcchdo import config
+from libcchdo.timing import stage, count_rows
 import libcchdo.formats
 
 
@@ -56,26 +66,215 @@ def short_name(module):
     return trimmed_name
 
 
-class ShieldedDict(OrderedDict):
-    _overridden_names = [
-        '__getitem__', 'items', 'keys', 'values', '__str__', '__repr__']
+# Bump when the layout of the manifest changes.
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path():
+    """Return the path of the on-disk format manifest.
+
+    The path may be set with [formats] manifest in the configuration file or
+    the environment variable LIBCCHDO_FORMATS_MANIFEST.
+
+    """
+    try:
+        return config.get_option('formats', 'manifest')
+    except config.ConfigError:
+        return os.path.join(config.get_config_dir(), 'formats_manifest.json')
+
+
+def _source_mtimes(root):
+    """Return the modification times of the modules in the root package.
+
+    Adding, removing or editing a module changes the result.
+
+    """
+    mtimes = {}
+    for path in root.__path__:
+        for dirpath, dirnames, fnames in os.walk(path):
+            for fname in fnames:
+                if not fname.endswith('.py'):
+                    continue
+                fpath = os.path.join(dirpath, fname)
+                mtimes[os.path.relpath(fpath, path)] = os.path.getmtime(fpath)
+    return mtimes
+
+
+def _sys_path_mtimes():
+    """Return the modification times of the directories on sys.path.
+
+    Installing a package changes the modification time of the directory it is
+    installed into.
+
+    """
+    mtimes = {}
+    for path in sys.path:
+        try:
+            mtimes[path] = os.path.getmtime(path or os.curdir)
+        except OSError:
+            pass
+    return mtimes
+
+
+def _manifest_key(root, failed):
+    """Return what a manifest must match to be reused.
+
+    When some format modules could not be imported, the manifest also depends
+    on sys.path so that they are retried once their dependencies have been
+    installed.
+
+    """
+    key = {
+        'version': MANIFEST_VERSION,
+        'python': list(sys.version_info[:2]),
+        'root': root.__name__,
+        'mtimes': _source_mtimes(root),
+    }
+    if failed:
+        key['sys_path'] = _sys_path_mtimes()
+    return key
+
+
+def _scan_module(name):
+    """Return the manifest entry for a format module.
+
+    Returns:
+        None if name is not a format module.
+
+    Raises:
+        ImportError - the module could not be imported.
+
+    """
+    module = import_module(name)
+    readable = hasattr(module, 'read')
+    writable = hasattr(module, 'write')
+    # A fully defined format module must have either a read or write
+    if not (readable or writable):
+        return None
+    try:
+        module.get_filename
+        module.is_filename_recognized
+        module.is_file_recognized
+        extensions = list(module._fname_extensions)
+    except AttributeError:
+        extensions = None
+    return {
+        'short_name': short_name(module),
+        'module': name,
+        'extensions': extensions,
+        'read': readable,
+        'write': writable,
+    }
+
+
+def build_manifest(root=None):
+    """Scan the root package for format modules and return a manifest.
+
+    Every module in the package is imported.
+
+    """
+    if root is None:
+        root = libcchdo.formats
+    formats = []
+    failed = []
+    prefix = root.__name__ + '.'
+    for loader, name, ispkg in walk_packages(root.__path__, prefix=prefix):
+        # Don't load this same module during the scan
+        if name == __name__:
+            continue
+        try:
+            entry = _scan_module(name)
+        except ImportError, err:
+            log.error(u'Unable to load format module {0}:\n{1!r}'.format(
+                name, err))
+            failed.append(name)
+            continue
+        if entry:
+            formats.append(entry)
+    return {
+        'key': _manifest_key(root, failed),
+        'formats': formats,
+        'failed': failed,
+    }
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as fff:
+            return json.load(fff)
+    except (IOError, OSError, ValueError), err:
+        log.debug(u'Unable to read format manifest {0}: {1!r}'.format(
+            path, err))
+        return None
+
+
+def _write_manifest(path, manifest):
+    try:
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(path, 'w') as fff:
+            json.dump(manifest, fff, indent=1)
+    except (IOError, OSError), err:
+        log.debug(u'Unable to write format manifest {0}: {1!r}'.format(
+            path, err))
+
+
+def load_manifest(root=None, path=None):
+    """Return the format manifest for the root package.
+
+    The manifest is cached on disk at path. It is rebuilt when a module in the
+    package has been added, removed or modified since it was written.
+
+    """
+    if root is None:
+        root = libcchdo.formats
+    if path is None:
+        path = get_manifest_path()
+    manifest = _read_manifest(path)
+    if manifest:
+        key = _manifest_key(root, manifest.get('failed'))
+        if manifest.get('key') == key:
+            return manifest
+    log.debug(u'Rebuilding format manifest {0}'.format(path))
+    manifest = build_manifest(root)
+    _write_manifest(path, manifest)
+    return manifest
+
+
+class ManifestDict(OrderedDict):
+    """An OrderedDict that is filled from the format manifest on first use."""
 
     def __init__(self, parent, *args):
-        super(ShieldedDict, self).__init__(*args)
+        # OrderedDict.__setitem__ checks membership so don't load while the
+        # initial items are being set.
+        self._parent = None
+        super(ManifestDict, self).__init__(*args)
         self._parent = parent
-        self._unshielded = False
 
-    def __getattribute__(self, name):
-        if name not in OrderedDict.__getattribute__(self, '_overridden_names'):
-            return OrderedDict.__getattribute__(self, name)
-        def _missing(*args, **kwargs):
-            if not self._unshielded:
-                self._unshield()
-            return OrderedDict.__getattribute__(self, name)()
-        return _missing
+    def _load(self):
+        if self._parent is not None:
+            self._parent._scan_if_needed()
+
+    def __getitem__(self, key):
+        self._load()
+        return super(ManifestDict, self).__getitem__(key)
+
+    def __contains__(self, key):
+        self._load()
+        return super(ManifestDict, self).__contains__(key)
 
-    def _unshield(self):
-        self._parent._scan_if_needed()
+    def __iter__(self):
+        self._load()
+        return super(ManifestDict, self).__iter__()
+
+    def __len__(self):
+        self._load()
+        return super(ManifestDict, self).__len__()
+
+    def keys(self):
+        self._load()
+        return super(ManifestDict, self).keys()
 
 
 class FormatScanner(object):
@@ -105,52 +304,51 @@ class FormatScanner(object):
             self._scan_for_formats(libcchdo.formats)
 
     def _scan_for_formats(self, root):
-        """Scan sub-package for format modules."""
-        prefix = root.__name__ + '.'
-        for loader, name, ispkg in walk_packages(root.__path__, prefix=prefix):
-            # Don't load this same module during the scan
-            if name == 'libcchdo.formats.formats':
-                continue
-
-            modname = '.'.join(name.split('.')[:-1])
-            basename = name.split('.')[-1]
-
-            module = loader.find_module(name)
-            if not module:
-                # Error! couldn't find the module to load
-                print 'No module found for', name
-                continue
-            try:
-                loaded_module = module.load_module(name)
-            except ImportError, err:
-                log.error(u'Unable to load format module {0}:\n{1!r}'.format(
-                    name, err))
-                continue
-            sys.modules[name] = loaded_module
-            sys.modules[modname].__setattr__(basename, loaded_module)
-            loaded_module.__name__ = name
-            shortname = short_name(loaded_module)
-            try:
-                loaded_module.get_filename
-                loaded_module.is_filename_recognized
-                loaded_module.is_file_recognized
-
-                self.file_extensions[shortname] = loaded_module._fname_extensions
-            except AttributeError, err:
-                #log.info('Not a format module {0}: {1!r}'.format(name, err))
-                pass
-
-            # A fully defined format module must have either a read or write
-            if (    hasattr(loaded_module, 'read') or
-                    hasattr(loaded_module, 'write')):
-                self.all_formats[shortname] = loaded_module
-
-
-class FileExtensions(ShieldedDict):
+        """Fill the registries from the format manifest of root.
+
+        No format module is imported until it is looked up in all_formats.
+
+        """
+        for entry in load_manifest(root)['formats']:
+            # JSON strings are unicode
+            shortname = str(entry['short_name'])
+            if entry['extensions'] is not None:
+                self.file_extensions[shortname] = map(str, entry['extensions'])
+            self.all_formats.set_format(
+                shortname, str(entry['module']), entry['read'], entry['write'])
+
+
+class FileExtensions(ManifestDict):
     pass
 
 
-class FileTypeModule(ShieldedDict):
+class FileTypeModule(ManifestDict):
+    """Map format short names to their modules.
+
+    Modules are imported when they are looked up.
+
+    """
+
+    def __init__(self, parent, *args):
+        super(FileTypeModule, self).__init__(parent, *args)
+        self._readable = set()
+        self._writable = set()
+
+    def set_format(self, shortname, module, readable, writable):
+        self[shortname] = module
+        if readable:
+            self._readable.add(shortname)
+        if writable:
+            self._writable.add(shortname)
+
+    def readers(self):
+        """Return the short names of formats that can be read."""
+        return [key for key in self.keys() if key in self._readable]
+
+    def writers(self):
+        """Return the short names of formats that can be written."""
+        return [key for key in self.keys() if key in self._writable]
+
     def __getitem__(self, key):
         if type(key) is not str:
             log.debug(repr(key))
@@ -159,9 +357,10 @@ class FileTypeModule(ShieldedDict):
         if type(module) is not str:
             return module
         try:
-            __import__(module)
-            return sys.modules[module]
-        except ImportError:
+            return import_module(module)
+        except ImportError, err:
+            log.error(u'Unable to load format module {0}:\n{1!r}'.format(
+                module, err))
             return None
 
 
@@ -169,7 +368,7 @@ _formats = FormatScanner()
 
 
 file_extensions = _formats.file_extensions
-    
+
 
 all_formats = _formats.all_formats
 
@@ -246,7 +445,9 @@ def read_arbitrary(handle, file_type=None, file_name=None):
        Returns:
            a DataFile(Collection) or *SummaryFile that matches the file type.
     '''
-    _, dfile, format_module = guess_ftype_dftype_format(
-        handle, file_type, file_name)
-    format_module.read(dfile, handle)
+    with stage('read_arbitrary') as record:
+        _, dfile, format_module = guess_ftype_dftype_format(
+            handle, file_type, file_name)
+        format_module.read(dfile, handle)
+        record.rows = count_rows(dfile)
     return dfile
@@ -2,7 +2,7 @@
 
 
 import tempfile
-from contextlib import contextmanager, closing
+from contextlib import contextmanager
 import datetime
 from logging import getLogger
 
@@ -11,16 +11,21 @@ log = getLogger(__name__)
 
 
 try:
+    import netCDF4
     from netCDF4 import Dataset
 except ImportError, e:
     raise ImportError('%s\n%s' % (e,
         ("Please install netCDF4. (pip install netCDF4)")))
+import numpy as np
 
 from libcchdo import fns
 from libcchdo.fns import Decimal
+from libcchdo.model.storage import masked
 from libcchdo.formats import woce
-from libcchdo.formats.exchange import parse_type_and_stamp_line
+from libcchdo.formats.exchange import (
+    parse_type_and_stamp_line)
 from libcchdo.formats.stamped import read_stamp
+from libcchdo.formats.zip import temporary_copy
 
 
 QC_SUFFIX = '_QC'
@@ -44,6 +49,15 @@ UNSPECIFIED_UNITS = 'unspecified'
 STRLEN = 40
 
 
+# Whether the netCDF library can create datasets in memory.
+CREATE_IN_MEMORY = getattr(netCDF4, '__has_nc_create_mem__', False)
+
+
+# Initial size of in memory datasets. The library grows the buffer as needed
+# and the buffer that is returned is exactly the size of the dataset.
+_MEMORY_INITIAL_SIZE = 1
+
+
 def read_type_and_stamp(fileobj):
     """Only get the file type and stamp line.
 
@@ -52,9 +66,7 @@ def read_type_and_stamp(fileobj):
 
     """
     def reader(fobj):
-        with closing(tempfile.NamedTemporaryFile()) as fff:
-            fff.write(fobj.read())
-            fff.flush()
+        with temporary_copy(fobj) as fff:
             nc_file = Dataset(fff.name, 'r')
             try:
                 first_line = nc_file.ORIGINAL_HEADER.split('\n', 1)[0]
@@ -89,11 +101,34 @@ def _pad_station_cast(x):
 
 
 @contextmanager
-def nc_dataset_to_stream(stream, *args, **kwargs):
-    """Creates a DataSet and writes it out to the stream when closed."""
-    # netcdf library wants to write its own files.
+def _dataset_for_stream(stream, mode, *args, **kwargs):
+    """Create a Dataset and write it out to the stream when closed.
+
+    If stream is a path the Dataset is written there directly. Otherwise new
+    Datasets are kept in memory if the netCDF library allows it. As a last
+    resort, the Dataset is buffered in a temporary file because the netCDF
+    library wants to write its own files.
+
+    """
+    if isinstance(stream, basestring):
+        nc_file = Dataset(stream, mode, *args, **kwargs)
+        try:
+            yield nc_file
+        finally:
+            nc_file.close()
+        return
+
+    if mode == 'w' and CREATE_IN_MEMORY:
+        nc_file = Dataset(
+            'memory.nc', mode, *args, memory=_MEMORY_INITIAL_SIZE, **kwargs)
+        try:
+            yield nc_file
+        finally:
+            stream.write(nc_file.close().tobytes())
+        return
+
     tmp = tempfile.NamedTemporaryFile()
-    nc_file = Dataset(tmp.name, 'w', *args, **kwargs)
+    nc_file = Dataset(tmp.name, mode, *args, **kwargs)
     try:
         yield nc_file
     finally:
@@ -102,6 +137,17 @@ def nc_dataset_to_stream(stream, *args, **kwargs):
         tmp.close()
 
 
+@contextmanager
+def nc_dataset_to_stream(stream, *args, **kwargs):
+    """Creates a DataSet and writes it out to the stream when closed.
+
+    stream may also be a path to write the Dataset to.
+
+    """
+    with _dataset_for_stream(stream, 'w', *args, **kwargs) as nc_file:
+        yield nc_file
+
+
 def get_filename(expocode, station, cast, extension):
     if extension not in ['hy1', 'ctd']:
         log.warn(u'File extension is not recognized.')
@@ -136,7 +182,15 @@ def check_variable_ranges(nc_file):
                 max = Decimal(str(variable.valid_max))
             except AttributeError:
                 continue
-        for y in variable[:]:
+        values = variable[:]
+        if values.dtype.kind in 'fiu':
+            # Only values that are not inside the range as floats need the
+            # exact check.
+            data = np.ma.getdata(values).ravel()
+            with np.errstate(invalid='ignore'):
+                inside = (data > float(min)) & (data < float(max))
+            values = data[~(inside | np.ma.getmaskarray(values).ravel())]
+        for y in values:
             if fns.isnan(y):
                 continue
             x = Decimal(str(y))
@@ -241,6 +295,55 @@ def create_common_variables(nc_file, latitude, longitude, woce_datetime,
     var_cast[:] = simplest_str(castno).ljust(len(var_cast))
 
 
+def missing_mask(values, out_of_band=False):
+    """Return a boolean array that is True where netCDF values are missing.
+
+    Values are missing where netCDF4 masked them or they are NaN. With
+    out_of_band, values that fns.out_of_band considers fill values are missing
+    as well.
+
+    """
+    mask = np.ma.getmaskarray(values)
+    data = np.ma.getdata(values)
+    if data.dtype.kind != 'f':
+        return mask
+    with np.errstate(invalid='ignore'):
+        mask = mask | np.isnan(data)
+        if out_of_band:
+            mask = mask | fns.out_of_band_array(data, data)
+    return mask
+
+
+def column_sequence(column, values, mask, flags=False):
+    """Return netCDF values in the form kept by the column's storage.
+
+    Columns with array storage get a ValueArray or FlagArray made directly from
+    the arrays. Otherwise a list with None where values are missing is
+    returned.
+
+    """
+    data = np.ma.getdata(values)
+    if column.storage == 'array':
+        from libcchdo.model.storage import ValueArray, FlagArray
+        seqtype = FlagArray if flags else ValueArray
+        return seqtype.from_arrays(np.where(mask, 0, data), mask)
+    lll = data.tolist()
+    for iii in np.flatnonzero(mask).tolist():
+        lll[iii] = None
+    return lll
+
+
+def column_data_range(values):
+    """Return the (data_min, data_max) of a float64 masked array.
+
+    Columns without data have a range of (-inf, inf).
+
+    """
+    if values.count():
+        return (float(values.min()), float(values.max()))
+    return (float('-inf'), float('inf'))
+
+
 def create_and_fill_data_variables(df, nc_file):
     """Add variables to the netcdf file object that correspond to data."""
     for column in df.sorted_columns():
@@ -281,13 +384,8 @@ def create_and_fill_data_variables(df, nc_file):
         units = ascii(units)
         var.units = units
 
-        compact_column = filter(None, column)
-        if compact_column:
-            var.data_min = float(min(compact_column))
-            var.data_max = float(max(compact_column))
-        else:
-            var.data_min = float('-inf')
-            var.data_max = float('inf')
+        values = masked(column.values)
+        var.data_min, var.data_max = column_data_range(values)
 
         if parameter.format:
             var.C_format = ascii(parameter.format)
@@ -303,7 +401,8 @@ def create_and_fill_data_variables(df, nc_file):
                 'segfault.'.format(parameter.name))
             var.C_format = '%f'
         var.WHPO_Variable_Name = parameter_name
-        var[:] = column.values
+        # Missing values are written as NaN.
+        var[:] = np.ma.filled(values, np.nan)
 
         if column.is_flagged_woce():
             qc_name = pname + QC_SUFFIX
@@ -317,15 +416,9 @@ def create_and_fill_data_variables(df, nc_file):
 
 @contextmanager
 def buffered_netcdf(handle, *args, **kwargs):
-    """Buffer netcdf writing to a temporary file before writing it to handle.
+    """Buffer netcdf writing to memory or a temporary file before writing it to
+    handle.
 
     """
-    tmp = tempfile.NamedTemporaryFile()
-    nc_file = Dataset(tmp.name, *args, **kwargs)
-
-    try:
+    with _dataset_for_stream(handle, *args, **kwargs) as nc_file:
         yield nc_file
-    finally:
-        nc_file.close()
-        handle.write(tmp.read())
-        tmp.close()
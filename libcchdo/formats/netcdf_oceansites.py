@@ -18,6 +18,7 @@ log = getLogger(__name__)
 import numpy as np
 
 from libcchdo.fns import strftime_iso
+from libcchdo.model.storage import masked
 from libcchdo.util import memoize
 from libcchdo.model.datafile import (
     PRESSURE_VARIABLES, BTL_SALINITY_VARIABLES, SALINITY_VARIABLES,
@@ -27,7 +28,8 @@ from libcchdo.model.datafile import (
 
 __all__ = [
     'OCEANSITES_VERSIONS', 'OCEANSITES_PREFIX', 'TIMESERIES_INFO',
-    'OCEANSITES_TIMESERIES', 'create_oceansites_nc', 'write_columns',
+    'OCEANSITES_TIMESERIES', 'create_oceansites_nc', 'define_oceansites_nc',
+    'write_columns',
     'write_timeseries_info_title_and_id',
 ]
 
@@ -412,6 +414,12 @@ def _sanitize_os_version(version):
 
 def create_oceansites_nc(df, filename, data_type, version=None):
     from libcchdo.formats import netcdf as nc
+    nc_file = nc.Dataset(filename, 'w', format='NETCDF3_CLASSIC')
+    return define_oceansites_nc(df, nc_file, data_type, version)
+
+
+def define_oceansites_nc(df, nc_file, data_type, version=None):
+    """Define the OceanSITES attributes and dimensions in nc_file."""
     info = {
         'date_start': df.globals['_DATETIME'],
         'lat': df.globals['LATITUDE'],
@@ -421,7 +429,6 @@ def create_oceansites_nc(df, filename, data_type, version=None):
     }
 
     version = _sanitize_os_version(version)
-    nc_file = nc.Dataset(filename, 'w', format='NETCDF3_CLASSIC')
     nc_file.data_type = 'OceanSITES time-series {data_type} data'.format(
         data_type=data_type)
     nc_file.format_version = version
@@ -568,10 +575,16 @@ def _calculate_depth(self, nc_file):
 
 
 def _pad_data_for_ncvar(data, targetlen, fill_value):
-    short = targetlen - len(data)
-    if short:
-        return data + [fill_value] * short
-    return data
+    """Return data as an array of targetlen padded with fill_value.
+
+    Missing values in data are also replaced with fill_value.
+
+    """
+    data = np.ma.filled(data, fill_value)
+    padded = np.empty(targetlen, data.dtype)
+    padded[:len(data)] = data
+    padded[len(data):] = fill_value
+    return padded
 
 
 def write_columns(self, nc_file, converter=None):
@@ -633,8 +646,8 @@ def write_columns(self, nc_file, converter=None):
         var.uncertainty = variable.uncertainty
         var.cell_methods = OS_TEXT['CELL_METHODS']
         var.DM_indicator = 'D'
-        data = [variable.fill_value if x is None else x for x in column.values]
-        var[:] = _pad_data_for_ncvar(data, len(self), variable.fill_value)
+        var[:] = _pad_data_for_ncvar(
+            masked(column.values), len(self), variable.fill_value)
         # Write QC variable
         if column.is_flagged_woce():
             qc_var_name = name + nc.QC_SUFFIX
@@ -648,9 +661,10 @@ def write_columns(self, nc_file, converter=None):
             flag.flag_values = list(range(10))
             flag.flag_meanings = OS_TEXT['FLAG_MEANINGS']
             try:
-                flag[:] = _pad_data_for_ncvar(
+                flags = np.array(
                     [WOCE_to_OceanSITES_flag[f] for f in column.flags_woce],
-                    len(self), -128)
+                    np.int8)
+                flag[:] = _pad_data_for_ncvar(flags, len(self), -128)
             except IndexError, err:
                 log.error(u'Not enough flags in {0}'.format(column))
                 raise
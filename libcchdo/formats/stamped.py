@@ -10,19 +10,20 @@ from logging import getLogger
 log = getLogger(__name__)
 
 
-from libcchdo.formats.zip import generate_files as zip_gen_files
+from libcchdo.formats.zip import generate_streams as zip_gen_streams
 
 
 def read_stamp(fileobj, reader):
     """Only get the file type and stamp line.
 
     For zipfiles, return the most common stamp and warn if there is more than
-    one.
+    one. Each member is given to the reader as a stream so that only as much as
+    the reader reads, usually the first line, is decompressed.
 
     """
     if is_zipfile(fileobj):
         all_stamps = {}
-        for member in zip_gen_files(fileobj):
+        for member in zip_gen_streams(fileobj):
             key = tuple(reader(member))
             try:
                 all_stamps[key] += 1
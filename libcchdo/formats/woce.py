@@ -11,10 +11,11 @@ log = getLogger(__name__)
 
 
 from libcchdo.util import get_library_abspath
+from libcchdo.db.model.std import copy_parameter
 from libcchdo.model.datafile import Column
 from libcchdo.fns import (
     Decimal, InvalidOperation, _decimal, in_band_or_none, IncreasedPrecision,
-    strip_all, uniquify)
+    out_of_band_mask, strip_all, uniquify)
 
 
 # Where no data is known
@@ -372,6 +373,24 @@ def read_data_egee(self, handle, parameters_line, units_line, asterisk_line):
             self, iii, unpacked, num_quality_words, parameters, asterisks)
 
 
+def _read_cell(parameter, raw):
+    """Convert a stripped data cell to a value."""
+    datum = in_band_or_none(raw, FILL_VALUE)
+    if datum is not None and parameter not in CHARACTER_PARAMETERS:
+        try:
+            datum = _decimal(datum)
+        except Exception, e:
+            log.warning(
+                u'Expected numeric data for parameter %r, got %r' % (
+                parameter, datum))
+    return datum
+
+
+def _is_flagged(asterisk):
+    # TODO should use better detection for asterisks
+    return "**" in asterisk.strip()
+
+
 def _build_columns_for_row(self, iii, row, num_quality_words, parameters,
                            asterisks):
     # QUALT1 takes precedence
@@ -380,20 +399,10 @@ def _build_columns_for_row(self, iii, row, num_quality_words, parameters,
     # Build up the columns for the line
     flag_i = 0
     for j, parameter in enumerate(parameters):
-        datum = row[j].strip()
-        datum = in_band_or_none(datum, -9)
-
-        if parameter not in CHARACTER_PARAMETERS:
-            try:
-                datum = _decimal(datum)
-            except Exception, e:
-                log.warning(
-                    u'Expected numeric data for parameter %r, got %r' % (
-                    parameter, datum))
+        datum = _read_cell(parameter, row[j].strip())
 
         # Only assign flag if column is flagged.
-        if "**" in asterisks[j].strip():
-            # TODO should use better detection for asterisks
+        if _is_flagged(asterisks[j]):
             try:
                 woce_flag = int(quality_flags[0][flag_i])
             except ValueError, e:
@@ -407,7 +416,69 @@ def _build_columns_for_row(self, iii, row, num_quality_words, parameters,
             self[parameter].set(iii, datum)
 
 
-def read_data(self, handle, parameters_line, units_line, asterisk_line):
+def _convert_value_cells(column, parameter, stripped):
+    """Convert a column of stripped data cells to values.
+
+    This gives the same values as _read_cell for every cell. Numeric columns
+    are converted all at once with fill values detected on the whole column.
+
+    Returns:
+        a list of values or, for Columns with array storage, a ValueArray
+
+    """
+    if parameter in CHARACTER_PARAMETERS:
+        # Cells that are not numbers are never fill values.
+        floats = []
+        for raw in stripped:
+            try:
+                floats.append(float(raw))
+            except ValueError:
+                floats.append(float('nan'))
+        return [None if fill else raw for raw, fill in zip(
+            stripped, out_of_band_mask(floats, stripped, FILL_VALUE))]
+
+    if getattr(column, 'storage', None) == 'array':
+        try:
+            from libcchdo.model.storage import ValueArray
+            return ValueArray.from_data_cells(stripped, FILL_VALUE)
+        except (ValueError, OverflowError):
+            pass
+    try:
+        floats = map(float, stripped)
+    except ValueError:
+        return [_read_cell(parameter, raw) for raw in stripped]
+    return [None if fill else Decimal(raw) for raw, fill in zip(
+        stripped, out_of_band_mask(floats, stripped, FILL_VALUE))]
+
+
+def _convert_flag_cells(parameter, quality_words, flag_i):
+    """Convert the flag_i-th character of each quality word to a flag."""
+    try:
+        return [int(word[flag_i]) for word in quality_words]
+    except ValueError:
+        for iii, word in enumerate(quality_words):
+            try:
+                int(word[flag_i])
+            except ValueError, e:
+                log.error(
+                    u'Received bad flag "{}" for {} on record {}'.format(
+                    word[flag_i], parameter, iii))
+                raise e
+
+
+def _data_layout(handle, parameters_line, units_line, asterisk_line):
+    """Work out the layout of the data records from the header records.
+
+    The first data record is used to detect extra space between the data and
+    the quality words. The handle is left at the first data record.
+
+    Returns:
+        (parameters, units, asterisks, bad_cols, data_struct,
+         num_quality_words)
+        bad_cols are the characters to remove from each data record before it
+        is unpacked with data_struct.
+
+    """
     # num_quality_flags = the number of asterisk-marked columns
     num_quality_flags = len(re.findall('\*{7,8}', asterisk_line))
     num_quality_words = len(parameters_line.split('QUALT'))-1
@@ -442,18 +513,6 @@ def read_data(self, handle, parameters_line, units_line, asterisk_line):
     units, _ = _unpack_line(unpack_str, units_line, num_param_columns)
     asterisks, _ = _unpack_line(unpack_str, asterisk_line, num_param_columns)
 
-    # Warn if the header lines break 8 character column rules
-    _warn_broke_character_column_rule("Parameter", parameters)
-    _warn_broke_character_column_rule("Unit", units)
-    _warn_broke_character_column_rule("Asterisks", asterisks)
-
-    # Die if parameters are not unique
-    if not parameters == uniquify(parameters):
-        raise ValueError(('There were duplicate parameters in the file; '
-                          'cannot continue without data corruption.'))
-
-    self.create_columns(parameters, units)
-
     # Get each data line
     unpack_data_str = unpack_str
 
@@ -473,43 +532,134 @@ def read_data(self, handle, parameters_line, units_line, asterisk_line):
     determined_num_columns = False
     tries = 0
     while tries < 5:
-        try:
-            unpacked = struct.unpack(unpack_str, line)
+        if struct.calcsize(unpack_str) == len(line):
             determined_num_columns = True
             break
-        except struct.error, e:
-            expected_len = struct.calcsize(unpack_str)
-            log.warn(
-                'Data record 0 has length %d (expected %d).' % (
-                    len(line), expected_len))
-            log.info('There is likely extra columns of space between data '
-                     'and flags. Detecting whether this is the case.')
-            quality_word_spacing += 1
-            tries += 1
-            unpack_str = unpack_data_str + \
-                ('%sx%ss' % (quality_word_spacing, num_quality_flags)
-                ) * num_quality_words
+        expected_len = struct.calcsize(unpack_str)
+        log.warn(
+            'Data record 0 has length %d (expected %d).' % (
+                len(line), expected_len))
+        log.info('There is likely extra columns of space between data '
+                 'and flags. Detecting whether this is the case.')
+        quality_word_spacing += 1
+        tries += 1
+        unpack_str = unpack_data_str + \
+            ('%sx%ss' % (quality_word_spacing, num_quality_flags)
+            ) * num_quality_words
     if not determined_num_columns:
         unpack_str = original_unpack_str
     handle.seek(savepoint)
     log.debug(u'Settled on unpack format: {0!r}'.format(unpack_str))
 
+    return (parameters, units, asterisks, bad_cols, struct.Struct(unpack_str),
+            num_quality_words)
+
+
+def _data_records(handle, bad_cols, data_struct):
+    """Return the data records that are left in handle.
+
+    Raises:
+        ValueError - there is an empty record
+        struct.error - a record does not fit data_struct
+
+    """
+    lines = handle.read().split('\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    records = []
+    for iii, line in enumerate(lines):
+        line = line.rstrip()
+        if bad_cols:
+            line = _remove_char_columns(bad_cols, line)[0]
+        if not line:
+            raise ValueError('Empty lines are not allowed in the data section '
+                             'of a WOCE file')
+        if len(line) != data_struct.size:
+            log.warn('Data record %d has length %d (expected %d).' % (
+                iii, len(line), data_struct.size))
+            raise struct.error(
+                'unpack requires a string argument of length %d' % \
+                data_struct.size)
+        records.append(line)
+    return records
+
+
+def _read_data_rowwise(self, handle, parameters, asterisks, bad_cols,
+                       data_struct, num_quality_words):
+    """Read data records one row and one cell at a time."""
     for iii, line in enumerate(handle):
         line = _remove_char_columns(bad_cols, line.rstrip())[0]
         if not line:
             raise ValueError('Empty lines are not allowed in the data section '
                              'of a WOCE file')
         try:
-            unpacked = struct.unpack(unpack_str, line)
+            unpacked = data_struct.unpack(line)
         except struct.error, e:
-            expected_len = struct.calcsize(unpack_str)
             log.warn('Data record %d has length %d (expected %d).' % (
-                iii, len(line), expected_len))
+                iii, len(line), data_struct.size))
             raise e
 
         _build_columns_for_row(
             self, iii, unpacked, num_quality_words, parameters, asterisks)
 
+
+def _read_data_columnwise(self, handle, parameters, asterisks, bad_cols,
+                          data_struct, num_quality_words):
+    """Read all data records at once and convert them column by column."""
+    records = _data_records(handle, bad_cols, data_struct)
+    if not records:
+        return
+    # Unpack the whole data section at once.
+    cells = struct.Struct(data_struct.format * len(records)).unpack(
+        ''.join(records))
+    num_fields = len(cells) / len(records)
+
+    # QUALT1 takes precedence
+    quality_words = cells[num_fields - num_quality_words::num_fields]
+
+    flag_i = 0
+    for j, parameter in enumerate(parameters):
+        column = self[parameter]
+        column.values = _convert_value_cells(
+            column, parameter, [raw.strip() for raw in cells[j::num_fields]])
+        # Only assign flag if column is flagged.
+        if _is_flagged(asterisks[j]):
+            column.flags_woce = _convert_flag_cells(
+                parameter, quality_words, flag_i)
+            flag_i += 1
+
+
+def read_data(self, handle, parameters_line, units_line, asterisk_line,
+              bulk=True):
+    """Read the data section of a WOCE file.
+
+    bulk - read all data records at once and convert them column by column.
+        Otherwise, read and convert one record at a time.
+
+    """
+    (parameters, units, asterisks, bad_cols, data_struct,
+     num_quality_words) = _data_layout(
+        handle, parameters_line, units_line, asterisk_line)
+
+    # Warn if the header lines break 8 character column rules
+    _warn_broke_character_column_rule("Parameter", parameters)
+    _warn_broke_character_column_rule("Unit", units)
+    _warn_broke_character_column_rule("Asterisks", asterisks)
+
+    # Die if parameters are not unique
+    if not parameters == uniquify(parameters):
+        raise ValueError(('There were duplicate parameters in the file; '
+                          'cannot continue without data corruption.'))
+
+    self.create_columns(parameters, units)
+
+    if bulk:
+        read = _read_data_columnwise
+    else:
+        read = _read_data_rowwise
+    read(self, handle, parameters, asterisks, bad_cols, data_struct,
+         num_quality_words)
+
     # Expand globals into columns TODO?
 
 
@@ -591,6 +741,8 @@ def writeable_columns(dfile):
         if key not in _EXWOCE_PARAMS:
             continue
         info = _EXWOCE_PARAMS[key]
+        # The registry's parameters are shared so change a copy
+        col.parameter = copy_parameter(col.parameter)
         fmt = info['format']
         if fmt:
             col.parameter.format = fmt
@@ -631,8 +783,8 @@ def truncate_row(lll):
     return truncated
 
 
-def write_data(self, handle, columns, base_format):
-    """Write WOCE data in fixed width columns.
+def write_data_headers(handle, columns, base_format):
+    """Write the parameter, units and asterisk records of WOCE data.
 
     columns and base_format should be obtained from 
     columns_and_base_format()
@@ -662,6 +814,16 @@ def write_data(self, handle, columns, base_format):
     handle.write(base_format.format(*truncate_row(all_units)))
     handle.write(base_format.format(*truncate_row(all_asters)))
 
+
+def write_data_rows(self, handle, columns, base_format, row_offset=0):
+    """Write WOCE data records in fixed width columns.
+
+    columns and base_format should be obtained from 
+    columns_and_base_format()
+
+    row_offset - the number of data rows written before, for messages
+
+    """
     for i in range(len(self)):
         values = []
         flags = []
@@ -688,7 +850,8 @@ def write_data(self, handle, columns, base_format):
                     formatted_value = formatted_value[:-extra]
                     log.warn(u'Truncated {0!r} to {1} for {2} '
                              'row {3}'.format(old_value, formatted_value,
-                                              column.parameter.name, i))
+                                              column.parameter.name,
+                                              row_offset + i))
 
             values.append(formatted_value)
             if column.is_flagged_woce():
@@ -698,6 +861,17 @@ def write_data(self, handle, columns, base_format):
         handle.write(base_format.format(*values))
 
 
+def write_data(self, handle, columns, base_format):
+    """Write WOCE data in fixed width columns.
+
+    columns and base_format should be obtained from 
+    columns_and_base_format()
+
+    """
+    write_data_headers(handle, columns, base_format)
+    write_data_rows(self, handle, columns, base_format)
+
+
 def fuse_datetime_globals(file):
     """Fuse a file's "DATE" and "TIME" globals into a "_DATETIME" global.
 
@@ -3,6 +3,9 @@
 """
 import zipfile
 from datetime import datetime
+from contextlib import contextmanager, closing
+from io import BytesIO
+from shutil import copyfileobj
 from tempfile import SpooledTemporaryFile, NamedTemporaryFile
 from traceback import format_exc
 from logging import getLogger
@@ -12,8 +15,46 @@ log = getLogger(__name__)
 
 
 from libcchdo import StringIO
+from libcchdo.db.model.std import parameter_registry
 from libcchdo.model.datafile import DataFile, DataFileCollection
 from libcchdo.model.convert.datafile_to_datafilecollection import split_on_cast
+from libcchdo.parallel import check_jobs, fork_imap
+from libcchdo.timing import stage, count_rows
+
+
+_jobs = 1
+
+
+def get_jobs():
+    """Return the number of worker processes used to read and write members.
+
+    """
+    return _jobs
+
+
+def set_jobs(jobs):
+    """Set the number of worker processes used to read and write members.
+
+    jobs - 1 reads and writes members one after another in this process. None
+        or 0 uses one worker per CPU.
+
+    """
+    global _jobs
+    _jobs = check_jobs(jobs)
+
+
+@contextmanager
+def jobs(jobs):
+    """Read and write zip members with the given number of workers inside the
+    context.
+
+    """
+    saved = get_jobs()
+    set_jobs(jobs)
+    try:
+        yield
+    finally:
+        set_jobs(saved)
 
 
 class MemZipFile(zipfile.ZipFile):
@@ -143,18 +184,14 @@ def createZipInfo(filename, dtime=None, permissions=0644):
     return info
 
 
-def generate_files(fileobj, is_fname_ok=None):
-    """Generic zip file reader for zip files."""
+def generate_members(fileobj, is_fname_ok=None):
+    """Generate the name and contents of each wanted member of a zip file."""
     zfile = ZeroCommentZipFile(fileobj, 'r')
     try:
         for fname in zfile.namelist():
             if is_fname_ok and not is_fname_ok(fname):
                 continue
-            with NamedTemporaryFile() as tempfile:
-                tempfile.write(zfile.read(fname))
-                tempfile.flush()
-                tempfile.seek(0)
-                yield tempfile
+            yield fname, zfile.read(fname)
     except Exception, err:
         log.error(u'Unable to read {0} in {1}:\n{2}'.format(
             fname, fileobj, format_exc(err)))
@@ -162,46 +199,161 @@ def generate_files(fileobj, is_fname_ok=None):
         zfile.close()
 
 
+class MemberFile(BytesIO):
+    """The contents of a zip member in memory.
+
+    This has the member's name and the file interface that readers use so that
+    members can be read without being written out to temporary files.
+
+    """
+    def __init__(self, contents, name):
+        BytesIO.__init__(self, contents)
+        self.name = name
+
+
+def generate_files(fileobj, is_fname_ok=None):
+    """Generic zip file reader for zip files.
+
+    Generates a MemberFile for each wanted member.
+
+    """
+    for fname, contents in generate_members(fileobj, is_fname_ok):
+        yield MemberFile(contents, fname)
+
+
+def generate_streams(fileobj):
+    """Generate a stream for each member of a zip file.
+
+    Members are only decompressed as far as they are read.
+
+    """
+    zfile = ZeroCommentZipFile(fileobj, 'r')
+    try:
+        for info in zfile.infolist():
+            with closing(zfile.open(info)) as stream:
+                yield stream
+    except Exception, err:
+        log.error(u'Unable to read {0} in {1}:\n{2}'.format(
+            info.filename, fileobj, format_exc(err)))
+    finally:
+        zfile.close()
+
+
+@contextmanager
+def temporary_copy(fileobj):
+    """Copy fileobj to a named temporary file and yield that instead.
+
+    This is for readers such as netCDF4.Dataset that need a real path.
+
+    """
+    with NamedTemporaryFile() as tempfile:
+        copyfileobj(fileobj, tempfile)
+        tempfile.flush()
+        tempfile.seek(0)
+        yield tempfile
+
+
+def _parallel_jobs():
+    """Return the number of jobs to work on members with.
+
+    Before there is more than one, the parameter registry is loaded so that the
+    workers share it instead of each querying the database.
+
+    """
+    jobs = get_jobs()
+    if jobs > 1:
+        parameter_registry()
+    return jobs
+
+
 def read(self, fileobj, is_fname_ok, reader, *args, **kwargs):
-    """Generic zip file reader for zip files with multiple datafiles inside."""
-    for tempfile in generate_files(fileobj, is_fname_ok):
+    """Generic zip file reader for zip files with multiple datafiles inside.
+
+    With more than one job (see set_jobs()), members are read by a pool of
+    worker processes. Their DataFiles are appended in member order. Either way,
+    the error of the first member that fails to read is raised.
+
+    """
+    def read_member(member):
+        fname, contents = member
         dfile = DataFile()
-        reader(dfile, tempfile, *args, **kwargs)
-        self.append(dfile)
+        reader(dfile, MemberFile(contents, fname), *args, **kwargs)
+        return dfile
+
+    with stage('zip.read') as record:
+        members = generate_members(fileobj, is_fname_ok)
+        with closing(fork_imap(read_member, members, _parallel_jobs())) as \
+                dfiles:
+            for dfile in dfiles:
+                self.append(dfile)
+        record.rows = count_rows(self)
+
+
+def _write_dfile(dfile, writer, **kwargs):
+    """Return the contents of dfile written by writer."""
+    with SpooledTemporaryFile(max_size=2 ** 13) as tempfile:
+        # Temporarily hide the _FILENAME global from the header
+        try:
+            fname = dfile.globals['_FILENAME']
+            del dfile.globals['_FILENAME']
+        except KeyError:
+            pass
+        writer.write(dfile, tempfile, **kwargs)
+        tempfile.flush()
+        tempfile.seek(0)
+        try:
+            dfile.globals['_FILENAME'] = fname
+        except NameError:
+            pass
+        return tempfile.read()
+
+
+def _generate_contents(dfiles, writer, **kwargs):
+    """Generate the DataFiles and their written contents in order.
+
+    The error of the first DataFile that fails to write is raised.
+
+    """
+    def write_dfile(i):
+        return _write_dfile(dfiles[i], writer, **kwargs)
+
+    with closing(fork_imap(
+            write_dfile, xrange(len(dfiles)), _parallel_jobs())) as results:
+        for i, contents in enumerate(results):
+            yield dfiles[i], contents
 
 
 def write(self, handle, writer, get_filename, **kwargs):
-    """Common write functionality for zip files."""
+    """Common write functionality for zip files.
+
+    With more than one job (see set_jobs()), the DataFiles are written by a
+    pool of worker processes. Members are still added in order. Any changes the
+    writer makes to the DataFiles stay in the workers. Either way, the error of
+    the first DataFile that fails to write is raised.
+
+    """
+    with stage('zip.write') as record:
+        _write(self, handle, writer, get_filename, **kwargs)
+        record.rows = count_rows(self)
+
+
+def _write(self, handle, writer, get_filename, **kwargs):
     fnames = set()
     zfile = create(handle)
     if type(self) != DataFileCollection:
         log.warn(u'Should not write a single DataFile to a zip collection. '
                  'Splitting the data into a collection by cast.')
         self = split_on_cast(self)
-    for dfile in self:
-        with SpooledTemporaryFile(max_size=2 ** 13) as tempfile:
-            # Temporarily hide the _FILENAME global from the header
-            try:
-                fname = dfile.globals['_FILENAME']
-                del dfile.globals['_FILENAME']
-            except KeyError:
-                pass
-            writer.write(dfile, tempfile, **kwargs)
-            tempfile.flush()
-            tempfile.seek(0)
-            try:
-                dfile.globals['_FILENAME'] = fname
-            except NameError:
-                pass
-
-            filename = get_filename(dfile)
-            if filename in fnames:
-                log.warn(
-                    u'{0!r} is already present in zip file'.format(filename))
-            else:
-                fnames.add(filename)
-            try:
-                zfile.writestr(createZipInfo(filename), tempfile.read())
-            except Exception, err:
-                log.error(u'Unable to write {0}: {1!r}'.format(filename, err))
+    for dfile, contents in _generate_contents(self.files, writer, **kwargs):
+        filename = get_filename(dfile)
+        if filename in fnames:
+            log.warn(
+                u'{0!r} is already present in zip file'.format(filename))
+        else:
+            fnames.add(filename)
+        try:
+            with stage('zip.writestr'):
+                zfile.writestr(createZipInfo(filename), contents)
+        except Exception, err:
+            log.error(u'Unable to write {0}: {1!r}'.format(filename, err))
     zfile.close()
@@ -7,10 +7,18 @@ from libcchdo.formats.zip import read as zip_read
 
 
 def read(self, handle, reader):
-    """Generic reader for netCDF files in zip."""
+    """Generic reader for netCDF files in zip.
+
+    netCDF4 can only open paths so each member is copied to a temporary file.
+
+    """
     def is_fname_ok(fname):
         return fname.endswith('.nc')
-    zip_read(self, handle, is_fname_ok, reader.read)
+
+    def read_member(dfile, fileobj):
+        with Zip.temporary_copy(fileobj) as tempfile:
+            reader.read(dfile, tempfile)
+    zip_read(self, handle, is_fname_ok, read_member)
 
 
 def get_identifier_btl(dfile):
@@ -22,14 +22,20 @@ style flags or '_FLAG_I' suffix for IGOSS style flags or another similar style.
 """
 from copy import copy
 from collections import OrderedDict
+from itertools import izip
 from logging import getLogger
 
+try:
+    import numpy as np
+except ImportError, e:
+    raise ImportError('%s\n%s' % (e,
+        ("Please install numpy to merge. (pip install numpy)")))
+
 from libcchdo.formats import woce
 from libcchdo.formats.exchange import (
     END_DATA, FILL_VALUE, FLAG_ENDING_WOCE, FLAG_ENDING_IGOSS)
 from libcchdo.fns import equal_with_epsilon, set_list
 from libcchdo.recipes.orderedset import OrderedSet
-from libcchdo.recipes.defaultordereddict import DefaultOrderedDict
 from libcchdo.model.datafile import (
     DataFile, DataFileCollection, Column, PRESSURE_PARAMETERS)
 
@@ -191,6 +197,23 @@ def different_columns(origin, deriv, keys, row_map=None):
         list(common))
 
 
+def _take(seq, indices):
+    """Return a sequence of the items of seq at indices."""
+    try:
+        return seq.take(indices)
+    except AttributeError:
+        return [seq[i] for i in indices.tolist()]
+
+
+def _put(seq, indices, values):
+    """Set the items of seq at indices to values."""
+    try:
+        seq.put(indices, values)
+    except AttributeError:
+        for i, value in izip(indices.tolist(), values):
+            seq[i] = value
+
+
 def overwrite_list(origin_col, derivative_col, keymap):
     """Return a copy of origin list overwritten by the derivative's values.
 
@@ -198,15 +221,26 @@ def overwrite_list(origin_col, derivative_col, keymap):
     given by keymap.
 
     """
-    for ocoli, dcoli, key in keymap:
-        try:
-            dval = derivative_col[dcoli]
-            try:
-                origin_col[ocoli] = dval
-            except IndexError:
-                set_list(origin_col, ocoli, dval)
-        except IndexError:
-            pass
+    try:
+        orows = keymap.origin_rows
+        drows = keymap.deriv_rows
+    except AttributeError:
+        orows = np.array([ocoli for ocoli, dcoli, key in keymap], np.intp)
+        drows = np.array([dcoli for ocoli, dcoli, key in keymap], np.intp)
+
+    # Rows past the end of the derivative have nothing to give
+    in_deriv = drows < len(derivative_col)
+    orows = orows[in_deriv]
+    drows = drows[in_deriv]
+    if not len(orows):
+        return origin_col
+
+    # Extend the origin to fit
+    last = int(orows.max())
+    if last >= len(origin_col):
+        set_list(origin_col, last, None)
+
+    _put(origin_col, orows, _take(derivative_col, drows))
     return origin_col
 
 
@@ -238,11 +272,63 @@ def filter_params_to_merge(diffcols, not_in_orig_cols, not_in_deriv_cols,
     return params_to_merge
 
 
+class KeyMap(list):
+    """A map of rows in origin to rows in derivative.
+
+    The map is a list of (origin row, derivative row, key) that also keeps the
+    origin and derivative rows as arrays in origin_rows and deriv_rows.
+
+    """
+    def __init__(self, origin_rows=(), deriv_rows=(), keys=()):
+        self.origin_rows = np.asarray(origin_rows, np.intp)
+        self.deriv_rows = np.asarray(deriv_rows, np.intp)
+        super(KeyMap, self).__init__(
+            zip(self.origin_rows.tolist(), self.deriv_rows.tolist(), keys))
+
+
+def _key_tuples(cols, length):
+    """Return the keys for each row of key columns.
+
+    Rows past the end of a column have None for that column.
+
+    """
+    lists = []
+    for col in cols:
+        values = list(col.values)[:length]
+        values.extend([None] * (length - len(values)))
+        lists.append(values)
+    return zip(*lists)
+
+
+def _grouped_rows(keys_by_code, codes, rows):
+    """Return an OrderedDict of key to rows for rows ordered by code."""
+    grouped = OrderedDict()
+    for code, row in izip(codes.tolist(), rows.tolist()):
+        try:
+            grouped[keys_by_code[code]].append(row)
+        except KeyError:
+            grouped[keys_by_code[code]] = [row]
+    return grouped
+
+
+def _warn_key_rows(message, grouped):
+    """Warn about all the keys and their rows in one message."""
+    if not grouped:
+        return
+    log.warn(u'\n'.join(
+        [message.format(key, rows) for key, rows in grouped.items()]))
+
+
 def map_keys(origin, deriv, keys):
-    """Return a map of rows in origin to rows in deriv based on key columns."""
+    """Return a map of rows in origin to rows in deriv based on key columns.
+
+    Each origin row is mapped to the first derivative row with the same key.
+    The map is ordered by key in order of appearance in origin.
+
+    """
     if not keys:
         log.error(u'No keys provided to map on.')
-        return []
+        return KeyMap()
 
     # Map the deriv's rows onto the origin's rows based on the keys while
     # warning about missing keys in origin.
@@ -256,57 +342,60 @@ def map_keys(origin, deriv, keys):
     deriv_collen = deriv_collens[0]
     if sum(deriv_collens) / len(derivcols) != deriv_collen:
         raise ValueError(u'Key columns are of differing lengths: {0!r}'.format(
-            zip(derivcols, collens)))
-
-    # TODO similar to map_collections
-    originkeys = DefaultOrderedDict(list)
-    derivkeys = DefaultOrderedDict(list)
-    for i in range(origin_collen):
-        key = tuple([col[i] for col in origincols])
-        originkeys[key].append(i)
-    for i in range(deriv_collen):
-        key = tuple([col[i] for col in derivcols])
-        derivkeys[key].append(i)
-
-    keymap = []
+            zip(derivcols, deriv_collens)))
+
+    # Encode each distinct key as an integer code in order of appearance,
+    # first in origin then in derivative.
+    codes = {}
+    origin_codes = np.array([
+        codes.setdefault(key, len(codes)) for key in
+        _key_tuples(origincols, origin_collen)], np.intp)
+    deriv_codes = np.array([
+        codes.setdefault(key, len(codes)) for key in
+        _key_tuples(derivcols, deriv_collen)], np.intp)
+    keys_by_code = [None] * len(codes)
+    for key, code in codes.iteritems():
+        keys_by_code[code] = key
+
+    # First derivative row for each code
+    deriv_first = np.empty(len(codes), np.intp)
+    deriv_first.fill(-1)
+    unique_codes, first_rows = np.unique(deriv_codes, return_index=True)
+    deriv_first[unique_codes] = first_rows
+    deriv_counts = np.bincount(deriv_codes, minlength=len(codes))
+    origin_counts = np.bincount(origin_codes, minlength=len(codes))
+
     # Map the origin rows to the derivative rows by key (these are the only ones
     # that will be overwritten so we only need to warn about unmatched
     # derivative keys.)
-    non_unique_keys = OrderedSet()
-    missing_in_derivative = DefaultOrderedDict(list)
-    for key in originkeys:
-        for iorigin in originkeys[key]:
-            try:
-                iderivs = derivkeys[key]
-                # Map to the first origin key that matches
-                if iderivs:
-                    if len(iderivs) > 1:
-                        non_unique_keys.add(key)
-                    ideriv = iderivs[0]
-                    keymap.append((iorigin, ideriv, key))
-                else:
-                    raise KeyError()
-            except KeyError:
-                missing_in_derivative[key].append(iorigin)
-    if non_unique_keys:
+    origin_rows = np.argsort(origin_codes, kind='mergesort')
+    origin_codes = origin_codes[origin_rows]
+    deriv_rows = deriv_first[origin_codes]
+    matched = deriv_rows >= 0
+
+    matched_codes = origin_codes[matched]
+    non_unique_codes = matched_codes[deriv_counts[matched_codes] > 1]
+    if len(non_unique_codes):
+        non_unique_keys = OrderedSet(
+            [keys_by_code[code] for code in non_unique_codes.tolist()])
         log.warn(u'Picked the first row of occurrence in derivative data for '
                  'non unique keys: {0!r}'.format(non_unique_keys))
-    for key, rows in missing_in_derivative.items():
-        log.warn(u'Key {0!r} does not exist in derivative from origin rows '
-                 '{1!r}'.format(key, rows))
-    missing_in_origin = DefaultOrderedDict(list)
-    for key in derivkeys:
-        for ideriv in derivkeys[key]:
-            try:
-                iorigins = originkeys[key]
-                if not iorigins:
-                    raise KeyError()
-            except KeyError:
-                missing_in_origin[key].append(ideriv)
-    for key, rows in missing_in_origin.items():
-        log.warn(u'Key {0!r} does not exist in origin from derivative rows '
-                 '{1!r}'.format(key, rows))
-
+    _warn_key_rows(
+        u'Key {0!r} does not exist in derivative from origin rows {1!r}',
+        _grouped_rows(
+            keys_by_code, origin_codes[~matched], origin_rows[~matched]))
+
+    deriv_order = np.argsort(deriv_codes, kind='mergesort')
+    missing = origin_counts[deriv_codes[deriv_order]] == 0
+    _warn_key_rows(
+        u'Key {0!r} does not exist in origin from derivative rows {1!r}',
+        _grouped_rows(
+            keys_by_code, deriv_codes[deriv_order][missing],
+            deriv_order[missing]))
+
+    keymap = KeyMap(
+        origin_rows[matched], deriv_rows[matched],
+        [keys_by_code[code] for code in matched_codes.tolist()])
     if not keymap:
         log.error(u'No keys matched in origin and derivative files.')
 
@@ -1,163 +1,428 @@
+"""Load bottle DataFiles into the std database.
+
+Cruises, projects, casts, locations and bottles that are already in the
+database are reused so loading the same file again leaves the database as it
+was. Everything is looked up and inserted in batches inside one transaction.
+
+"""
+from datetime import datetime, date, time as dtime_time
+from time import time
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
 import sqlalchemy as S
-import sys
 
-from libcchdo.util import memoize
 from libcchdo.db.model import std
 
-@memoize
-def find_or_create_project(session, project):
-    print 'FINDORCREATE PROJECT', project
-    project = session.query(std.Project).filter(
-        std.Project.name==project).first()
 
-    if not project:
-        project = std.Project(project)
+# Number of rows to give each executemany() and the most variables in an IN ()
+CHUNK_SIZE = 500
+
+
+METADATA_PARAMETERS = set([
+    'EXPOCODE', 'SECT_ID', 'STNNBR', 'CASTNO', 'LATITUDE', 'LONGITUDE',
+    'DEPTH', '_DATETIME', 'SAMPNO', 'BTLNBR', ])
+
+
+class LoadReport(object):
+    """What was loaded and how fast."""
+
+    def __init__(self, rows=0, bottles=0, new_bottles=0, values=0,
+                 seconds=0.0):
+        self.rows = rows
+        self.bottles = bottles
+        self.new_bottles = new_bottles
+        self.values = values
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        if not self.seconds:
+            return float(self.rows)
+        return self.rows / self.seconds
+
+    def __repr__(self):
+        return "<LoadReport(%r rows, %r bottles, %r new, %r values, %.2fs)>" % \
+            (self.rows, self.bottles, self.new_bottles, self.values,
+             self.seconds)
+
+
+def _chunks(seq, size):
+    for iii in xrange(0, len(seq), size):
+        yield seq[iii:iii + size]
+
+
+def _column(datafile, key):
+    """Return the values of a column or Nones if it is not present."""
+    try:
+        return list(datafile[key].values)
+    except KeyError:
+        return [None] * len(datafile)
+
+
+def _flags(column, flagged):
+    if not flagged:
+        return [None] * len(column.values)
+    return list(flagged)
+
+
+def _take(seq, rows):
+    if len(rows) == len(seq):
+        return list(seq)
+    return [seq[iii] for iii in rows]
+
+
+def _str(value):
+    if value is None:
+        return None
+    return str(value)
+
+
+def _float(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def _int(value):
+    if value is None:
+        return None
+    return int(value)
+
+
+def _select_in(conn, columns, key_column, keys, chunk_size, *where):
+    """Return the rows of columns whose key_column is in keys."""
+    rows = []
+    keys = list(keys)
+    for chunk in _chunks(keys, chunk_size):
+        rows.extend(conn.execute(
+            S.select(columns).where(S.and_(key_column.in_(chunk), *where))))
+    return rows
+
 
-    return project
+def _insert(conn, table, rows, chunk_size):
+    for chunk in _chunks(rows, chunk_size):
+        conn.execute(table.insert(), chunk)
 
 
-@memoize
-def find_or_create_cruise(session, expocode):
-    print 'FINDORCREATE CRUISE', expocode
-    cruise = session.query(std.Cruise).filter(
-        std.Cruise.expocode==expocode).first()
+def _find_or_create_named(conn, table, names, chunk_size):
+    """Return a dict of name to id for rows of table in names.
 
-    if not cruise:
-        cruise = std.Cruise(expocode)
-        session.add(cruise)
-
-    return cruise
-
-
-@memoize
-def find_or_create_cast(session, cruise, castno, station):
-    print 'FINDORCREATE CAST', castno, station
-    cast = cruise.casts.filter(
-        S.and_(std.Cast.name==str(castno),
-               std.Cast.station==str(station))).first()
-
-    if not cast:
-        cast = std.Cast(cruise, castno, station)
-
-    if cast not in cruise.casts:
-        cruise.casts.append(cast)
-
-    return cast
-
-
-@memoize
-def find_or_create_location(session, latitude, longitude, bottom_depth, datetime):
-    print 'FINDORCREATE LOCATION', latitude, longitude, bottom_depth, datetime
-    location = session.query(std.Location).filter(
-        S.and_(std.Location.latitude == latitude,
-               std.Location.longitude == longitude,
-               std.Location.bottom_depth == bottom_depth,
-               std.Location.datetime == datetime)).first()
-
-    if not location:
-        location = std.Location(
-            datetime, latitude, longitude, bottom_depth)
-
-    return location
-
-
-def convert(datafile):
-    '''Return an array of cruises in the datafile with the data represented 
-       in objects as a bottle.'''
-
-    # TODO use the std parameters?
-    print [(x.parameter, x.parameter.id) for x in datafile.columns.values()]
-
-    cruises = {}
-    session = std.session()
-
-    columns = datafile.sorted_columns()
-    data = datafile.columns
-
-    parameters = map(lambda x: x.parameter.name, columns)
-    metadata_parameters = set(('EXPOCODE', 'SECT_ID', 'STNNBR', 'CASTNO',
-                               'LATITUDE', 'LONGITUDE', 'DEPTH', '_DATETIME',
-                               'SAMPNO', 'BTLNBR', ))
-    data_parameters = [x for x in parameters if x not in metadata_parameters]
-    data_columns = [data[x] for x in parameters]
-    data_flagged_woce = [x.is_flagged_woce() for x in data_columns]
-    data_flagged_igoss = [x.is_flagged_igoss() for x in data_columns]
-    data_data = zip(data_parameters, data_columns,
-                    data_flagged_woce, data_flagged_igoss)
-
-    expocode_col = data['EXPOCODE']
-    sectid_col = data['SECT_ID']
-    stnnbr_col = data['STNNBR']
-    castno_col = data['CASTNO']
-    latitude_col = data['LATITUDE']
-    longitude_col = data['LONGITUDE']
-    depth_col = data['DEPTH']
-    datetime_col = data['_DATETIME']
-    sampno_col = data['SAMPNO']
-    btl_col = data['BTLNBR']
-
-    for i in range(len(datafile)):
-        expocode = expocode_col[i]
-        try:
-            cruise = cruises[expocode]
-        except:
-            cruise = find_or_create_cruise(session, expocode)
-            cruises[expocode] = cruise
-
-        project = find_or_create_project(session, sectid_col[i])
-        if project not in cruise.projects:
-            cruise.projects.append(project)
-
-        cast = find_or_create_cast(session, cruise, castno_col[i], stnnbr_col[i])
-
-        location = find_or_create_location(
-            session, latitude_col[i], longitude_col[i], depth_col[i],
-            datetime_col[i])
-
-        # Find or create Bottle (most likely create because bottle files
-        # are bottle per line)
-
-        try:
-            sampno = sampno_col[i]
-        except:
-            sampno = None
-        btlnbr = btl_col[i]
-        btl_flag_woce = None
-        btl_flag_igoss = None
-        if btl_col.is_flagged_woce():
-            btl_flag_woce = btl_col.flags_woce[i]
-        if btl_col.is_flagged_igoss():
-            btl_flag_igoss = btl_col.flags_igoss[i]
-
-        bottle = cast.bottles.filter(
-            S.and_(std.Bottle.location_id == location.id,
-                   std.Bottle.name == str(btlnbr))).first()
-
-        if not bottle:
-            bottle = std.Bottle(cast, location, btlnbr, sampno,
-                                btl_flag_woce, btl_flag_igoss)
-            cast.bottles.append(bottle)
-
-        print >> sys.stderr, '_',
-        data_bottles = []
-        for param, column, flagged_woce, flagged_igoss in data_data:
-            data_bottles.append({
-                'bottle_id': bottle.id,
-                'parameter_id': column.parameter.id,
-                'value': column.values[i],
-                'flag_woce': column.flags_woce[i] if flagged_woce else None,
-                'flag_igoss': column.flags_woce[i] if flagged_igoss else None
-            })
-        session.execute(std.DataBottle.__table__.insert(), data_bottles)
-#            std.DataBottle(bottle, column.parameter, column.values[i],
-#                           column.flags_woce[i] if flagged_woce else None,
-#                           column.flags_woce[i] if flagged_igoss else None)
-        print >> sys.stderr, '.',
-
-        if i % 30 == 0:
-            print i 
-
-    session.commit()
-
-    return cruises
+    Names that are not yet in the table are inserted.
 
+    """
+    names = set(name for name in names if name is not None)
+    ids = dict(
+        (name, id) for id, name in _select_in(
+            conn, [table.c.id, table.c.name], table.c.name, names,
+            chunk_size))
+    missing = sorted(names - set(ids))
+    if missing:
+        _insert(conn, table, [{'name': name} for name in missing], chunk_size)
+        ids.update(dict(
+            (name, id) for id, name in _select_in(
+                conn, [table.c.id, table.c.name], table.c.name, missing,
+                chunk_size)))
+    return ids
+
+
+def _find_or_create_cruises(conn, expocodes, chunk_size):
+    table = std.Cruise.__table__
+    expocodes = set(expocode for expocode in expocodes if expocode is not None)
+
+    def select(keys):
+        return dict(
+            (expocode, id) for id, expocode in _select_in(
+                conn, [table.c.id, table.c.expocode], table.c.expocode, keys,
+                chunk_size))
+
+    ids = select(expocodes)
+    missing = sorted(expocodes - set(ids))
+    if missing:
+        _insert(conn, table, [{'expocode': expocode} for expocode in missing],
+                chunk_size)
+        ids.update(select(missing))
+    return ids
+
+
+def _link_cruises_projects(conn, pairs, chunk_size):
+    table = std.cruises_projects
+    pairs = set(pairs)
+    existing = set(
+        tuple(row) for row in _select_in(
+            conn, [table.c.cruise_id, table.c.project_id], table.c.cruise_id,
+            set(cruise_id for cruise_id, _ in pairs), chunk_size))
+    missing = sorted(pairs - existing)
+    _insert(conn, table,
+            [{'cruise_id': cruise_id, 'project_id': project_id}
+             for cruise_id, project_id in missing], chunk_size)
+
+
+def _find_or_create_casts(conn, casts, chunk_size):
+    """Return a dict of (cruise_id, name, station) to cast id."""
+    table = std.Cast.__table__
+    casts = set(casts)
+
+    def select(cruise_ids):
+        return dict(
+            ((cruise_id, name, station), id)
+            for id, cruise_id, name, station in _select_in(
+                conn, [table.c.id, table.c.cruise_id, table.c.name,
+                       table.c.station], table.c.cruise_id, cruise_ids,
+                chunk_size))
+
+    cruise_ids = set(key[0] for key in casts)
+    ids = select(cruise_ids)
+    missing = sorted(casts - set(ids))
+    if missing:
+        _insert(conn, table,
+                [{'cruise_id': cruise_id, 'name': name, 'station': station}
+                 for cruise_id, name, station in missing], chunk_size)
+        ids = select(cruise_ids)
+    return ids
+
+
+def _datetime(value):
+    """Return dates as datetimes at midnight."""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, dtime_time())
+    return value
+
+
+def _location_key(dtime, latitude, longitude, bottom_depth):
+    return (_datetime(dtime), _float(latitude), _float(longitude),
+            _int(bottom_depth))
+
+
+def _find_or_create_locations(conn, locations, chunk_size):
+    """Return a dict of location keys to location ids.
+
+    Existing locations are looked up in the time span of the locations.
+
+    """
+    table = std.Location.__table__
+    locations = set(locations)
+    columns = [table.c.id, table.c.datetime, table.c.latitude,
+               table.c.longitude, table.c.bottom_depth]
+
+    def select():
+        dtimes = [key[0] for key in locations if key[0] is not None]
+        clauses = []
+        if dtimes:
+            clauses.append(table.c.datetime.between(min(dtimes), max(dtimes)))
+        if len(dtimes) < len(locations):
+            clauses.append(table.c.datetime == None)
+        if not clauses:
+            return {}
+        return dict(
+            (_location_key(*row[1:]), row[0])
+            for row in conn.execute(S.select(columns).where(S.or_(*clauses))))
+
+    ids = select()
+    missing = sorted(locations - set(ids))
+    if missing:
+        _insert(conn, table,
+                [{'datetime': dtime, 'latitude': latitude,
+                  'longitude': longitude, 'bottom_depth': bottom_depth}
+                 for dtime, latitude, longitude, bottom_depth in missing],
+                chunk_size)
+        ids = select()
+    return ids
+
+
+def _find_or_create_bottles(conn, bottles, chunk_size):
+    """Return a dict of (cast_id, location_id, name, sample) to bottle id and
+    the set of bottle ids that already existed.
+
+    bottles - a dict of (cast_id, location_id, name, sample) to (flag_woce,
+        flag_igoss)
+
+    """
+    table = std.Bottle.__table__
+    cast_ids = set(key[0] for key in bottles)
+
+    def select():
+        return dict(
+            (tuple(row[1:]), row[0]) for row in _select_in(
+                conn, [table.c.id, table.c.cast_id, table.c.location_id,
+                       table.c.name, table.c.sample], table.c.cast_id,
+                cast_ids, chunk_size))
+
+    ids = select()
+    existing = set(ids.values())
+    missing = sorted(set(bottles) - set(ids))
+    if missing:
+        rows = []
+        for key in missing:
+            flag_woce, flag_igoss = bottles[key]
+            rows.append({
+                'cast_id': key[0], 'location_id': key[1], 'name': key[2],
+                'sample': key[3], 'flag_woce': flag_woce,
+                'flag_igoss': flag_igoss})
+        _insert(conn, table, rows, chunk_size)
+        ids = select()
+    return ids, existing
+
+
+def load(datafile, session=None, chunk_size=CHUNK_SIZE):
+    """Load a bottle DataFile into the std database.
+
+    Cruises, projects, casts, locations and bottles are matched to the ones
+    already in the database and created when they are missing. Data values of
+    bottles that were already loaded are replaced so loading a file again
+    does not change the database. Values that are missing and unflagged are
+    not stored.
+
+    Everything happens in one transaction that is committed at the end.
+
+    Args:
+        datafile - a bottle DataFile
+        session - a std session (default: std.session())
+        chunk_size - number of rows per executemany()
+
+    Returns:
+        a LoadReport
+
+    """
+    start = time()
+    if session is None:
+        session = std.session()
+    conn = session.connection()
+
+    nrows = len(datafile)
+    expocodes = _column(datafile, 'EXPOCODE')
+    sect_ids = _column(datafile, 'SECT_ID')
+    stnnbrs = _column(datafile, 'STNNBR')
+    castnos = _column(datafile, 'CASTNO')
+    latitudes = _column(datafile, 'LATITUDE')
+    longitudes = _column(datafile, 'LONGITUDE')
+    depths = _column(datafile, 'DEPTH')
+    dtimes = _column(datafile, '_DATETIME')
+    sampnos = _column(datafile, 'SAMPNO')
+    btlnbrs = _column(datafile, 'BTLNBR')
+    try:
+        btl_col = datafile['BTLNBR']
+        btl_flags_woce = _flags(btl_col, btl_col.flags_woce)
+        btl_flags_igoss = _flags(btl_col, btl_col.flags_igoss)
+    except KeyError:
+        btl_flags_woce = btl_flags_igoss = [None] * nrows
+
+    if None in expocodes:
+        raise ValueError(u'Every row must have an EXPOCODE to be loaded.')
+
+    try:
+        cruise_ids = _find_or_create_cruises(conn, expocodes, chunk_size)
+        project_ids = _find_or_create_named(
+            conn, std.Project.__table__, sect_ids, chunk_size)
+        _link_cruises_projects(
+            conn, [(cruise_ids[expocode], project_ids[sect_id])
+                   for expocode, sect_id in zip(expocodes, sect_ids)
+                   if expocode is not None and sect_id is not None],
+            chunk_size)
+
+        row_casts = [
+            (cruise_ids[expocode], _str(castno), _str(stnnbr))
+            for expocode, castno, stnnbr in zip(expocodes, castnos, stnnbrs)]
+        cast_ids = _find_or_create_casts(conn, row_casts, chunk_size)
+
+        row_locations = [
+            _location_key(*loc)
+            for loc in zip(dtimes, latitudes, longitudes, depths)]
+        location_ids = _find_or_create_locations(
+            conn, row_locations, chunk_size)
+
+        row_bottles = [
+            (cast_ids[cast], location_ids[loc], _str(btlnbr), _str(sampno))
+            for cast, loc, btlnbr, sampno in zip(
+                row_casts, row_locations, btlnbrs, sampnos)]
+        bottles = {}
+        for key, flag_woce, flag_igoss in zip(
+                row_bottles, btl_flags_woce, btl_flags_igoss):
+            bottles.setdefault(key, (flag_woce, flag_igoss))
+        if len(bottles) < nrows:
+            log.warn(u'{0} rows repeat a bottle and will not be loaded.'.format(
+                nrows - len(bottles)))
+        bottle_ids, existing = _find_or_create_bottles(
+            conn, bottles, chunk_size)
+
+        # Only the first row of each bottle is loaded.
+        rows = []
+        row_bottle_ids = []
+        file_bottle_ids = set()
+        for iii, key in enumerate(row_bottles):
+            bottle_id = bottle_ids[key]
+            if bottle_id in file_bottle_ids:
+                continue
+            rows.append(iii)
+            row_bottle_ids.append(bottle_id)
+            file_bottle_ids.add(bottle_id)
+
+        data_columns = []
+        for column in datafile.sorted_columns():
+            param = column.parameter
+            if param is None or param.name in METADATA_PARAMETERS:
+                continue
+            if param.id is None:
+                log.warn(u'{0} is not in the database and will not be '
+                         'loaded.'.format(param.name))
+                continue
+            data_columns.append((
+                param.id, _take(column.values, rows),
+                _take(_flags(column, column.flags_woce), rows),
+                _take(_flags(column, column.flags_igoss), rows)))
+
+        table = std.DataBottle.__table__
+        parameter_ids = [param_id for param_id, _, _, _ in data_columns]
+        reloaded = sorted(existing & file_bottle_ids)
+        for chunk in _chunks(reloaded, chunk_size):
+            conn.execute(table.delete().where(S.and_(
+                table.c.bottle_id.in_(chunk),
+                table.c.parameter_id.in_(parameter_ids))))
+
+        values = []
+        nvalues = 0
+        for param_id, vals, flags_woce, flags_igoss in data_columns:
+            for bottle_id, value, flag_woce, flag_igoss in zip(
+                    row_bottle_ids, vals, flags_woce, flags_igoss):
+                if value is None and flag_woce is None and flag_igoss is None:
+                    continue
+                values.append({
+                    'bottle_id': bottle_id, 'parameter_id': param_id,
+                    'value': value, 'flag_woce': flag_woce,
+                    'flag_igoss': flag_igoss})
+                if len(values) >= chunk_size:
+                    conn.execute(table.insert(), values)
+                    nvalues += len(values)
+                    values = []
+        if values:
+            conn.execute(table.insert(), values)
+            nvalues += len(values)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+
+    report = LoadReport(
+        nrows, len(file_bottle_ids), len(file_bottle_ids - existing), nvalues,
+        time() - start)
+    log.info(
+        u'Loaded {0} rows ({1} bottles, {2} new, {3} values) in {4:.2f} s '
+        '({5:.0f} rows/s)'.format(
+            report.rows, report.bottles, report.new_bottles, report.values,
+            report.seconds, report.rows_per_second))
+    return report
+
+
+def convert(datafile, session=None, chunk_size=CHUNK_SIZE):
+    '''Load the datafile into the std database and return a dict of the
+       cruises in it keyed by expocode.'''
+    if session is None:
+        session = std.session()
+    load(datafile, session, chunk_size)
+    expocodes = set(_column(datafile, 'EXPOCODE')) - set([None])
+    return dict(
+        (cruise.expocode, cruise) for cruise in session.query(std.Cruise).filter(
+            std.Cruise.expocode.in_(sorted(expocodes))))
@@ -1,7 +1,43 @@
 from copy import copy
 
 
-from libcchdo.model.datafile import DataFileCollection
+from libcchdo.model.datafile import DataFileCollection, DataFile, Column
+
+
+def _cast_bounds(dfile):
+    """Return the start and end rows of each cast in a DataFile.
+
+    A cast is a run of rows with the same expocode, station and cast.
+
+    """
+    length = len(dfile)
+    keys = []
+    for param in ('EXPOCODE', 'STNNBR', 'CASTNO'):
+        values = list(dfile[param].values)[:length]
+        keys.append(values + [None] * (length - len(values)))
+    keys = zip(*keys)
+
+    bounds = []
+    start = 0
+    for i in xrange(1, length):
+        if keys[i] != keys[i - 1]:
+            bounds.append((start, i))
+            start = i
+    bounds.append((start, length))
+    return bounds
+
+
+def _rows(seq, start, end):
+    """Return the items of seq from start to end.
+
+    Items past the end of seq are not included.
+
+    """
+    end = min(end, len(seq))
+    try:
+        return seq.take(range(start, end))
+    except AttributeError:
+        return seq[start:end]
 
 
 def split_on_cast(dfile):
@@ -12,44 +48,26 @@ def split_on_cast(dfile):
     """
     coll = DataFileCollection()
 
-    file_parameters = dfile.parameter_mnemonics_woce()
-
-    current_file = copy(dfile)
-
-    expocodes = dfile['EXPOCODE']
-    stations = dfile['STNNBR']
-    casts = dfile['CASTNO']
-
-    expocode = expocodes[0]
-    station = stations[0]
-    cast = casts[0]
-    for i in range(len(dfile)):
-        # Check if this row is a new measurement location
-        if expocodes[i] != expocode or \
-           stations[i] != station or \
-           casts[i] != cast:
-            current_file.check_and_replace_parameters()
-            coll.append(current_file)
-            current_file = copy(dfile)
-        expocode = expocodes[i]
-        station = stations[i]
-        cast = casts[i]
-
-        # Put the current row in the current dfile
-        for p in file_parameters:
-            source_col = dfile[p]
-            value = source_col[i]
-            try:
-                flag_woce = source_col.flags_woce[i]
-            except IndexError:
-                flag_woce = None
-            try:
-                flag_igoss = source_col.flags_igoss[i]
-            except IndexError:
-                flag_igoss = None
-            current_file[p].append(value, flag_woce, flag_igoss)
-
-    current_file.check_and_replace_parameters()
-    coll.append(current_file)
+    # All the casts have the same parameters so only check them once.
+    template = copy(dfile)
+    source_keys = dict(
+        [(id(col), key) for key, col in template.columns.items()])
+    template.check_and_replace_parameters()
+    columns = [
+        (key, col.parameter, dfile[source_keys[id(col)]])
+        for key, col in template.columns.items()]
+
+    for start, end in _cast_bounds(dfile):
+        current_file = DataFile()
+        current_file.globals = dfile.globals.copy()
+        for key, parameter, source_col in columns:
+            column = current_file[key] = Column(parameter)
+            values = _rows(source_col.values, start, end)
+            if len(values) < end - start:
+                values = list(values) + [None] * (end - start - len(values))
+            column.values = values
+            column.flags_woce = _rows(source_col.flags_woce, start, end)
+            column.flags_igoss = _rows(source_col.flags_igoss, start, end)
+        coll.append(current_file)
 
     return coll
@@ -1,12 +1,14 @@
 from operator import itemgetter
 from datetime import timedelta
 from collections import OrderedDict
+from contextlib import contextmanager
 from logging import getLogger
 
 
 log = getLogger(__name__)
 
 
+from libcchdo import config
 from libcchdo.fns import (
     InvalidOperation,
     decimal_to_str, _decimal, set_list, uniquify, equal_with_epsilon,
@@ -14,7 +16,8 @@ from libcchdo.fns import (
 from libcchdo.ui import TERMCOLOR
 from libcchdo.util import memoize
 from libcchdo.db.model import std
-from libcchdo.algorithms import depth
+from libcchdo.algorithms import depth, get_eos_engine
+from libcchdo.timing import stage
 
 
 PRESSURE_VARIABLES = ['CTDPRS', 'CTDRAW', 'REVPRS', 'DWNPRS']
@@ -35,11 +38,106 @@ OXYGEN_VARIABLES = ['CTDOXY', 'DWNOXY', 'OXYGEN', ]
 TEMPERATURE_VARIABLES = ['CTDTMP', 'REVTMP', 'SBE35', ]
 
 
+# Storage backends for Column values and flags.
+# list - Python lists
+# array - NumPy arrays with a missing value mask (see libcchdo.model.storage)
+COLUMN_STORAGES = ['list', 'array']
+
+
+def _array_storage_types():
+    from libcchdo.model.storage import ValueArray, FlagArray
+    return ValueArray, FlagArray
+
+
+def _check_column_storage(storage):
+    if storage not in COLUMN_STORAGES:
+        raise ValueError(
+            u'Unknown column storage {0!r}. Expected one of {1!r}'.format(
+            storage, COLUMN_STORAGES))
+    if storage == 'array':
+        _array_storage_types()
+
+
+def _configured_column_storage():
+    """Return the column storage given in the configuration.
+
+    The storage may be set with [model] column_storage in the configuration file
+    or the environment variable LIBCCHDO_MODEL_COLUMN_STORAGE.
+
+    """
+    try:
+        storage = config.get_option('model', 'column_storage')
+    except config.ConfigError:
+        return 'list'
+    try:
+        _check_column_storage(storage)
+    except (ValueError, ImportError), err:
+        log.error(u'Using list column storage. {0}'.format(err))
+        return 'list'
+    return storage
+
+
+_column_storage = _configured_column_storage()
+
+
+def get_column_storage():
+    """Return the storage used for new Columns."""
+    return _column_storage
+
+
+def set_column_storage(storage):
+    """Set the storage used for new Columns.
+
+    Raises:
+        ValueError - storage is not one of COLUMN_STORAGES
+        ImportError - array storage was requested without numpy
+
+    """
+    global _column_storage
+    _check_column_storage(storage)
+    _column_storage = storage
+
+
+@contextmanager
+def column_storage(storage):
+    """Create new Columns with the given storage inside the context."""
+    saved = get_column_storage()
+    set_column_storage(storage)
+    try:
+        yield
+    finally:
+        set_column_storage(saved)
+
+
+def _take(seq, indices):
+    """Return a sequence of the items of seq at indices."""
+    try:
+        return seq.take(indices)
+    except AttributeError:
+        return [seq[i] for i in indices]
+
+
+def _set_rows(seq, start, values):
+    """Set the items of seq from start on to values.
+
+    seq is extended with None up to start first.
+
+    """
+    if len(seq) < start:
+        seq.extend([None] * (start - len(seq)))
+    if len(seq) == start:
+        seq.extend(values)
+    else:
+        seq[start:start + len(values)] = values
+
+
 class Column(object):
 
-    def __init__(self, parameter, units=None):
+    def __init__(self, parameter, units=None, storage=None):
         """Create a Column given a string parameter name or Parameter instance.
 
+        storage - one of COLUMN_STORAGES. Defaults to get_column_storage().
+
         """
         if not type(parameter) is str and not type(parameter) is unicode:
             self.parameter = parameter
@@ -48,10 +146,53 @@ class Column(object):
                    parameter = parameter.encode('ascii', 'replace')
             self.parameter = std.make_contrived_parameter(parameter,
                                                           units=units)
+        if storage is None:
+            storage = get_column_storage()
+        else:
+            _check_column_storage(storage)
+        self.storage = storage
         self.values = []
         self.flags_woce = []
         self.flags_igoss = []
 
+    def _store(self, seq, flags=False):
+        """Return seq in the form kept by this Column's storage.
+
+        Array storage shares sequences that are already arrays the same way list
+        assignment shares lists.
+
+        """
+        if self.storage == 'list' or seq is None:
+            return seq
+        array_type = _array_storage_types()[1 if flags else 0]
+        if isinstance(seq, array_type):
+            return seq
+        return array_type(seq)
+
+    def _get_values(self):
+        return self._values
+
+    def _set_values(self, values):
+        self._values = self._store(values)
+
+    values = property(_get_values, _set_values)
+
+    def _get_flags_woce(self):
+        return self._flags_woce
+
+    def _set_flags_woce(self, flags):
+        self._flags_woce = self._store(flags, flags=True)
+
+    flags_woce = property(_get_flags_woce, _set_flags_woce)
+
+    def _get_flags_igoss(self):
+        return self._flags_igoss
+
+    def _set_flags_igoss(self, flags):
+        self._flags_igoss = self._store(flags, flags=True)
+
+    flags_igoss = property(_get_flags_igoss, _set_flags_igoss)
+
     def get(self, index):
         if index >= len(self.values):
             return None
@@ -121,6 +262,21 @@ class Column(object):
             fill_length = length - len(self.flags_igoss)
             self.flags_igoss += [9] * fill_length
 
+    def take(self, indices):
+        """Return a new Column with the values and flags at indices.
+
+        Raises:
+            IndexError - an index is past the end of the values or flags
+
+        """
+        column = Column(self.parameter, storage=self.storage)
+        column.values = _take(self.values, indices)
+        if self.is_flagged_woce():
+            column.flags_woce = _take(self.flags_woce, indices)
+        if self.is_flagged_igoss():
+            column.flags_igoss = _take(self.flags_igoss, indices)
+        return column
+
     def __getitem__(self, key):
         return self.get(key)
 
@@ -155,6 +311,13 @@ class Column(object):
 
     def decimal_places(self):
         """Return maximum decimal_places available in the column's values."""
+        try:
+            decplaces = self.values.decimal_places()
+        except AttributeError:
+            decplaces = None
+        if decplaces is not None:
+            return decplaces
+
         def get_decplaces(dec):
             try:
                 return dec.as_tuple().exponent
@@ -216,7 +379,8 @@ class Column(object):
         from_to = (given_units, expected_units)
 
         if not convert:
-            self.parameter = std_parameter
+            # The registry's parameters are shared so change a copy
+            self.parameter = std.copy_parameter(std_parameter)
             if parameter.units and not parameter.units.id:
                 units = std.Unit.find_by_name(parameter.units.name)
                 if not units:
@@ -285,7 +449,8 @@ class DiffColumn(Column):
 
     """
     def __init__(self, parameter, units=None):
-        super(DiffColumn, self).__init__('_DIFF_' + parameter, units=units)
+        super(DiffColumn, self).__init__(
+            '_DIFF_' + parameter, units=units, storage='list')
         self._is_diff = False
         self._is_diff_parameter = False
         self._is_diff_units = False
@@ -329,20 +494,16 @@ class DiffColumn(Column):
 
         """
         if row_map:
-            zipped = []
             if len(lll) == 0:
-                return zipped
-            for iii, jjj, kkk in row_map:
-                try:
-                    lval = lll[iii]
-                except IndexError:
-                    lval = float('nan')
-                try:
-                    mval = mmm[jjj]
-                except IndexError:
-                    mval = float('nan')
-                zipped.append((lval, mval))
-            return zipped
+                return []
+            lll = list(lll)
+            mmm = list(mmm)
+            llen = len(lll)
+            mlen = len(mmm)
+            nan = float('nan')
+            return [(lll[iii] if iii < llen else nan,
+                     mmm[jjj] if jjj < mlen else nan)
+                    for iii, jjj, kkk in row_map]
         else:
             return zip(lll, mmm)
 
@@ -470,7 +631,10 @@ class File(object):
             func(column, self, *args, **kwargs)
 
     def check_and_replace_parameters(self, convert=True):
-        self.each_column(Column.check_and_replace_parameter, convert=convert)
+        with stage('check_and_replace_parameters') as record:
+            self.each_column(
+                Column.check_and_replace_parameter, convert=convert)
+            record.rows = len(self)
 
     def __contains__(self, key):
         return key in self.columns
@@ -665,6 +829,51 @@ class DataFile(File):
                         parameter, expected_units, given_unit))
         return columns
 
+    def take(self, indices):
+        """Return a new DataFile with the rows at indices.
+
+        The new DataFile shares Parameters with this one and has a shallow copy
+        of the globals. Columns without values stay empty.
+
+        """
+        dfile = DataFile(self.allow_contrived)
+        dfile.globals = self.globals.copy()
+        taken = {}
+        for key, column in self.columns.items():
+            if len(column):
+                column = column.take(indices)
+            else:
+                column = Column(column.parameter, storage=column.storage)
+            taken[id(self.columns[key])] = dfile.columns[key] = column
+        dfile.ordered_columns = [
+            taken[id(column)] for column in self.ordered_columns
+            if id(column) in taken]
+        return dfile
+
+    def permute_rows(self, perm):
+        """Reorder the rows so that row i becomes the row at perm[i].
+
+        Columns without values are left empty.
+
+        Raises:
+            ValueError - perm is not a permutation of the rows
+
+        """
+        perm = list(perm)
+        if sorted(perm) != range(len(self)):
+            raise ValueError(
+                u'Row permutation must contain each of the {0} rows '
+                'once'.format(len(self)))
+        for column in self.columns.values():
+            if not len(column):
+                continue
+            permuted = column.take(perm)
+            column.values = permuted.values
+            if column.is_flagged_woce():
+                column.flags_woce = permuted.flags_woce
+            if column.is_flagged_igoss():
+                column.flags_igoss = permuted.flags_igoss
+
     def swap_rows(self, a, b):
         """Swaps two rows in the file."""
         for c in self.columns.values():
@@ -676,9 +885,13 @@ class DataFile(File):
                 c.flags_igoss[a], c.flags_igoss[b] = \
                     c.flags_igoss[b], c.flags_igoss[a]
 
-    def sort_file_range(self, start, end, pres_ascending=True,
-                        bot_ascending=False):
-        """Sort the rows from indexes start to end by pressure and bottle."""
+    def _pressure_bottle_order(self, pres_ascending, bot_ascending):
+        """Return a function that orders ranges of rows by pressure and bottle.
+
+        The function takes start and end indexes and returns the indexes in
+        order. Returns None if there is no pressure column.
+
+        """
         pressure_col = None
         for p in PRESSURE_PARAMETERS:
             try:
@@ -686,61 +899,56 @@ class DataFile(File):
             except KeyError:
                 pass
         if pressure_col is None:
-            return
+            return None
+        pressures = list(pressure_col.values)
 
-        bottle_col = None
         try:
-            bottle_col = self['BTLNBR'].values
+            bottles = list(self['BTLNBR'].values)
         except KeyError:
-            bottle_col = [None] * len(pressure_col)
-
-        pb_orders = zip(
-            pressure_col.values[start:end], bottle_col[start:end],
-            range(start, end))
-        order = [i for p, b, i in pb_orders]
-        # Sort first by bottle order
-        reversed_pb_orders = sorted(
-            pb_orders, key=itemgetter(1), reverse=(not bot_ascending))
-        # Sort second by pressure
-        sorted_pb_orders = sorted(
-            reversed_pb_orders, key=itemgetter(0),
-            reverse=(not pres_ascending))
-        sorted_order = [i for p, b, i in sorted_pb_orders]
-
-        # Don't keep swapping after just past the halfway point or things will
-        # become out of order.
-        for i in range(len(sorted_order) / 2 + 1):
-            s = sorted_order[i]
-            o = order[i]
-            if s != o:
-                k = order.index(s)
-                self.swap_rows(s, o)
-                order[i], order[k] = order[k], order[i]
+            bottles = [None] * len(pressures)
+
+        def order(start, end):
+            rows = range(start, end)
+            # Sort first by bottle order
+            rows.sort(key=bottles.__getitem__, reverse=(not bot_ascending))
+            # Sort second by pressure
+            rows.sort(key=pressures.__getitem__, reverse=(not pres_ascending))
+            return rows
+        return order
+
+    def sort_file_range(self, start, end, pres_ascending=True,
+                        bot_ascending=False):
+        """Sort the rows from indexes start to end by pressure and bottle."""
+        order = self._pressure_bottle_order(pres_ascending, bot_ascending)
+        if order is None:
+            return
+        perm = range(len(self))
+        perm[start:end] = order(start, end)
+        self.permute_rows(perm)
 
     def reorder_file_pressure(self, pres_ascending=True, bot_ascending=False):
         """Reorders a file's rows by pressure then bottle number.
 
         This defaults to non-decreasing pressure and non-ascending bottle
-        number order.
+        number order. Each run of rows from the same station and cast is
+        ordered on its own.
 
         """
         if len(self) > 0:
-            stations = self['STNNBR'].values
-            casts = self['CASTNO'].values
-            station = stations[0]
-            cast = casts[0]
+            order = self._pressure_bottle_order(pres_ascending, bot_ascending)
+            if order is None:
+                return
+            stations = list(self['STNNBR'].values)
+            casts = list(self['CASTNO'].values)
+            perm = []
             last_i = 0
             for i in range(1, len(self)):
-                station_i = stations[i]
-                cast_i = casts[i]
-                if station_i != station or cast_i != cast:
-                    station = station_i
-                    cast = cast_i
-                    self.sort_file_range(
-                        last_i, i, pres_ascending, bot_ascending)
+                if (stations[i] != stations[last_i] or
+                        casts[i] != casts[last_i]):
+                    perm.extend(order(last_i, i))
                     last_i = i
-            self.sort_file_range(
-                last_i, len(self), pres_ascending, bot_ascending)
+            perm.extend(order(last_i, len(self)))
+            self.permute_rows(perm)
 
     def find_first(self, parameters):
         for col in self.sorted_columns():
@@ -786,6 +994,9 @@ class DataFile(File):
         else:
             lat = self.globals['LATITUDE']
 
+        if get_eos_engine() == 'array':
+            return self._calculate_depths_array(lat, pres, salt, temp)
+
         try:
             localgrav = depth.grav_ocean_surface_wrt_latitude(lat)
         except OverflowError, err:
@@ -809,6 +1020,34 @@ class DataFile(File):
         except AttributeError:
             raise ValueError(u'Cannot convert non-existant pressures to depths.')
 
+    def _calculate_depths_array(self, lat, pres, salt, temp):
+        """Calculate depths with the array equation of state.
+
+        See calculate_depths.
+
+        """
+        from libcchdo.algorithms import eos
+
+        localgrav = eos.grav_ocean_surface_wrt_latitude(lat)
+        try: 
+            if not len(pres) or not len(salt) == len(temp) == len(pres):
+                raise ValueError(
+                    u'Cannot perform depth integration over unequal series')
+            density_series = eos.density(salt.values, temp.values, pres.values)
+            if density_series.mask.any():
+                raise ValueError(
+                    u'Cannot perform depth integration with missing data points')
+            depths = eos.depth(localgrav, pres.values, density_series)
+            return ('sverdrup', eos.to_decimals(depths))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        try:
+            log.info(u'Falling back from depth integration to Unesco method.')
+            depths = eos.depth_unesco(pres.values, lat)
+            return ('unesco1983', eos.to_decimals(depths))
+        except AttributeError:
+            raise ValueError(u'Cannot convert non-existant pressures to depths.')
+
 
 class DataFileCollection(object):
     """Stores a collection of DataFiles
@@ -828,35 +1067,43 @@ class DataFileCollection(object):
         self.files.append(x)
 
     def to_data_file(self):
+        """Concatenate the files into one DataFile.
+
+        Globals of each file become columns with the global repeated for each
+        of the file's rows.
+
+        """
         df = DataFile()
         length = 0
         for file in self.files:
             num_rows = len(file)
-            for row in range(num_rows):
-                rowi = length + row
-                # Insert globals
-                for g, v in file.globals.items():
-                    try:
-                        df[g]
-                    except KeyError:
-                        df[g] = Column(g)
-                        df[g].check_and_replace_parameter(df)
-                    df[g].set(rowi, v)
-                for c in file.sorted_columns():
-                    mnemonic = c.parameter.mnemonic_woce()
-                    try:
-                        df[mnemonic]
-                    except KeyError:
-                        df[mnemonic] = Column(c.parameter)
-                    try:
-                        flag_woce = c.flags_woce[row]
-                    except IndexError:
-                        flag_woce = None
-                    try:
-                        flag_igoss = c.flags_igoss[row]
-                    except IndexError:
-                        flag_igoss = None
-                    df[mnemonic].set(rowi, c[row], flag_woce, flag_igoss)
+            if not num_rows:
+                continue
+            # Insert globals
+            for g, v in file.globals.items():
+                try:
+                    column = df[g]
+                except KeyError:
+                    column = df[g] = Column(g)
+                    column.check_and_replace_parameter(df)
+                _set_rows(column.values, length, [v] * num_rows)
+            for c in file.sorted_columns():
+                mnemonic = c.parameter.mnemonic_woce()
+                try:
+                    column = df[mnemonic]
+                except KeyError:
+                    column = df[mnemonic] = Column(c.parameter)
+                values = c.values
+                if len(values) < num_rows:
+                    values = list(values) + [None] * (num_rows - len(values))
+                _set_rows(column.values, length, values)
+                for flags, cflags in (
+                        (column.flags_woce, c.flags_woce),
+                        (column.flags_igoss, c.flags_igoss)):
+                    if len(cflags) > num_rows:
+                        cflags = cflags[:num_rows]
+                    if cflags:
+                        _set_rows(flags, length, cflags)
             length += num_rows
         return df
 
@@ -0,0 +1,468 @@
+"""Persistent index of station headers in CTD and bottle archives.
+
+Getting the station metadata of an archive means reading every member of it.
+The index keeps, for each member of an archive, its EXPOCODE, STNNBR, CASTNO,
+LATITUDE, LONGITUDE, _DATETIME, DEPTH, number of rows and parameters in an
+SQLite database so that stations can be looked up without opening the archive
+again.
+
+Archives are keyed by their path, modification time and size. An archive is
+only read again when it has changed.
+
+The database is kept in the configuration directory unless [index] path in the
+configuration file or the environment variable LIBCCHDO_INDEX_PATH says
+otherwise.
+
+Example::
+
+    with closing(HeaderIndex()) as index:
+        index.update(['33RR20070204_ct1.zip'])
+        for station in index.query(bbox=(-180, -90, -170, -60),
+                                   parameters=['CTDOXY']):
+            print station.expocode, station.stnnbr, station.castno
+
+"""
+import os
+import os.path
+import sqlite3
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime
+from io import BytesIO
+from zipfile import ZipFile
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+from libcchdo import config
+from libcchdo.fns import Decimal
+from libcchdo.model.datafile import DataFile, DataFileCollection
+
+
+# Bump when the schema changes. Indices with another version are rebuilt.
+SCHEMA_VERSION = 1
+
+
+_SCHEMA = """\
+CREATE TABLE archives (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    format TEXT NOT NULL
+);
+CREATE TABLE stations (
+    id INTEGER PRIMARY KEY,
+    archive_id INTEGER NOT NULL REFERENCES archives(id),
+    member TEXT,
+    expocode TEXT,
+    stnnbr TEXT,
+    castno TEXT,
+    latitude REAL,
+    longitude REAL,
+    datetime TEXT,
+    depth TEXT,
+    rows INTEGER
+);
+CREATE INDEX stations_archive ON stations (archive_id);
+CREATE INDEX stations_position ON stations (latitude, longitude);
+CREATE INDEX stations_datetime ON stations (datetime);
+CREATE TABLE parameters (
+    station_id INTEGER NOT NULL REFERENCES stations(id),
+    parameter TEXT NOT NULL
+);
+CREATE INDEX parameters_station ON parameters (station_id);
+CREATE INDEX parameters_parameter ON parameters (parameter);
+"""
+
+
+StationHeader = namedtuple('StationHeader', [
+    'path', 'member', 'expocode', 'stnnbr', 'castno', 'latitude',
+    'longitude', 'datetime', 'depth', 'rows', 'parameters'])
+
+
+def get_index_path():
+    """Return the path of the header index database."""
+    try:
+        return config.get_option('index', 'path')
+    except config.ConfigError:
+        return os.path.join(config.get_config_dir(), 'header_index.db')
+
+
+def _isoformat(dtime):
+    """Return an ISO 8601 string for a datetime or date.
+
+    The strings sort in time order. Dates sort before any time on that day.
+
+    """
+    if dtime is None:
+        return None
+    if isinstance(dtime, datetime):
+        return dtime.strftime('%Y-%m-%dT%H:%M:%S')
+    return dtime.strftime('%Y-%m-%d')
+
+
+def _parse_isoformat(iso):
+    if iso is None:
+        return None
+    if 'T' in iso:
+        return datetime.strptime(iso, '%Y-%m-%dT%H:%M:%S')
+    return datetime.strptime(iso, '%Y-%m-%d').date()
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimal(value):
+    if value is None:
+        return None
+    return Decimal(repr(value))
+
+
+def _data_parameters(names):
+    """Return the parameter names without flag or internal columns."""
+    return [
+        name for name in names
+        if name and '_FLAG_' not in name and not name.startswith('_')]
+
+
+def _header_values(dfile, member, rows, parameters):
+    return {
+        'member': member,
+        'expocode': dfile.globals.get('EXPOCODE'),
+        'stnnbr': dfile.globals.get('STNNBR'),
+        'castno': dfile.globals.get('CASTNO'),
+        'latitude': _float(dfile.globals.get('LATITUDE')),
+        'longitude': _float(dfile.globals.get('LONGITUDE')),
+        'datetime': _isoformat(dfile.globals.get('_DATETIME')),
+        'depth': dfile.globals.get('DEPTH'),
+        'rows': rows,
+        'parameters': parameters,
+    }
+
+
+def scan_ctd_exchange(fileobj, member=None):
+    """Return the header values of a CTD Exchange file.
+
+    Only the headers are parsed. Data rows are counted but not read.
+
+    """
+    from libcchdo.formats.ctd import exchange as ctdex
+
+    dfile = DataFile()
+    ctdex.read(dfile, fileobj, header_only=True)
+    parameters = [
+        name.strip() for name in fileobj.readline().strip().split(',')]
+    # units
+    fileobj.readline()
+    rows = 0
+    for line in fileobj:
+        line = line.strip()
+        if line == 'END_DATA':
+            break
+        if line:
+            rows += 1
+    return _header_values(dfile, member, rows, _data_parameters(parameters))
+
+
+def scan_ctd_zip_exchange(fileobj):
+    """Return the header values of each CTD Exchange file in a ZIP."""
+    headers = []
+    zfile = ZipFile(fileobj, 'r')
+    with closing(zfile):
+        for name in zfile.namelist():
+            if '.csv' not in name:
+                continue
+            with closing(BytesIO(zfile.read(name))) as member:
+                headers.append(scan_ctd_exchange(member, name))
+    return headers
+
+
+def _column_value(dfile, key, index):
+    try:
+        return dfile[key].values[index]
+    except (KeyError, IndexError):
+        return None
+
+
+def scan_bottle_exchange(fileobj):
+    """Return the header values of each cast in a Bottle Exchange file.
+
+    The whole file is read.
+
+    """
+    from libcchdo.formats.bottle import exchange as botex
+    from libcchdo.model.convert.datafile_to_datafilecollection import (
+        _cast_bounds)
+
+    dfile = DataFile()
+    botex.read(dfile, fileobj)
+    parameters = _data_parameters(dfile.parameter_mnemonics_woce())
+    headers = []
+    for start, end in _cast_bounds(dfile):
+        cast = DataFile()
+        for key in ['EXPOCODE', 'STNNBR', 'CASTNO', 'LATITUDE', 'LONGITUDE',
+                    '_DATETIME', 'DEPTH']:
+            cast.globals[key] = _column_value(dfile, key, start)
+        headers.append(_header_values(cast, None, end - start, parameters))
+    return headers
+
+
+# How to scan each format that can be indexed.
+_SCANNERS = {
+    'ctd.zip.ex': scan_ctd_zip_exchange,
+    'ctd.ex': lambda fileobj: [scan_ctd_exchange(fileobj)],
+    'btl.ex': scan_bottle_exchange,
+}
+
+
+INDEXED_FORMATS = sorted(_SCANNERS.keys())
+
+
+def _archive_format(path, file_type=None):
+    from libcchdo.formats.formats import guess_file_type
+
+    file_type = guess_file_type(path, file_type)
+    if file_type not in _SCANNERS:
+        raise ValueError(
+            u'Unable to index {0!r}. Indexed formats are {1!r}'.format(
+                path, INDEXED_FORMATS))
+    return file_type
+
+
+class HeaderIndex(object):
+    """An SQLite index of the station headers in archives."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = get_index_path()
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        if version != 0:
+            log.info(u'Rebuilding header index {0}'.format(self.path))
+        with self._conn:
+            for table in ['parameters', 'stations', 'archives']:
+                self._conn.execute('DROP TABLE IF EXISTS {0}'.format(table))
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(
+                'PRAGMA user_version = {0:d}'.format(SCHEMA_VERSION))
+
+    def close(self):
+        self._conn.close()
+
+    def _archive(self, path):
+        return self._conn.execute(
+            'SELECT id, mtime, size FROM archives WHERE path = ?',
+            (path, )).fetchone()
+
+    def _remove_archive(self, archive_id):
+        self._conn.execute(
+            'DELETE FROM parameters WHERE station_id IN '
+            '(SELECT id FROM stations WHERE archive_id = ?)', (archive_id, ))
+        self._conn.execute(
+            'DELETE FROM stations WHERE archive_id = ?', (archive_id, ))
+        self._conn.execute('DELETE FROM archives WHERE id = ?', (archive_id, ))
+
+    def update_archive(self, path, file_type=None):
+        """Index the archive at path if it is not indexed or has changed.
+
+        Returns:
+            whether the archive was read.
+
+        Raises:
+            ValueError - the archive is not in one of INDEXED_FORMATS
+
+        """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        archive = self._archive(path)
+        if archive and archive[1] == stat.st_mtime and \
+                archive[2] == stat.st_size:
+            return False
+
+        file_type = _archive_format(path, file_type)
+        with open(path, 'rb') as fileobj:
+            headers = _SCANNERS[file_type](fileobj)
+
+        with self._conn:
+            if archive:
+                self._remove_archive(archive[0])
+            archive_id = self._conn.execute(
+                'INSERT INTO archives (path, mtime, size, format) '
+                'VALUES (?, ?, ?, ?)',
+                (path, stat.st_mtime, stat.st_size, file_type)).lastrowid
+            for header in headers:
+                station_id = self._conn.execute(
+                    'INSERT INTO stations (archive_id, member, expocode, '
+                    'stnnbr, castno, latitude, longitude, datetime, depth, '
+                    'rows) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (archive_id, header['member'], header['expocode'],
+                     header['stnnbr'], header['castno'], header['latitude'],
+                     header['longitude'], header['datetime'], header['depth'],
+                     header['rows'])).lastrowid
+                self._conn.executemany(
+                    'INSERT INTO parameters (station_id, parameter) '
+                    'VALUES (?, ?)',
+                    [(station_id, param) for param in header['parameters']])
+        log.debug(u'Indexed {0} stations in {1}'.format(len(headers), path))
+        return True
+
+    def update(self, paths, file_type=None):
+        """Index the archives at paths that are not indexed or have changed.
+
+        Archives that cannot be read are logged and skipped.
+
+        Returns:
+            the number of archives that were read.
+
+        """
+        updated = 0
+        for path in paths:
+            try:
+                if self.update_archive(path, file_type):
+                    updated += 1
+            except (IOError, OSError, ValueError), err:
+                log.error(u'Unable to index {0}: {1}'.format(path, err))
+        return updated
+
+    def prune(self):
+        """Remove archives that no longer exist from the index.
+
+        Returns:
+            the number of archives removed.
+
+        """
+        removed = 0
+        with self._conn:
+            for archive_id, path in self._conn.execute(
+                    'SELECT id, path FROM archives').fetchall():
+                if not os.path.exists(path):
+                    self._remove_archive(archive_id)
+                    removed += 1
+        return removed
+
+    def query(self, paths=None, bbox=None, start=None, end=None,
+              parameters=None, expocode=None):
+        """Return the StationHeaders that match all the given criteria.
+
+        No archive is opened. Use update() first to make sure the index is
+        current.
+
+        Args:
+            paths - only stations in these archives
+            bbox - (west, south, east, north) in degrees. If west is greater
+                than east the box crosses the antimeridian.
+            start - only stations at or after this date or datetime
+            end - only stations at or before this date or datetime. Dates
+                include the whole day.
+            parameters - only stations that have all of these parameters
+            expocode - only stations with this EXPOCODE
+
+        """
+        where = []
+        args = []
+        if paths is not None:
+            paths = [os.path.realpath(path) for path in paths]
+            where.append('archives.path IN ({0})'.format(
+                ', '.join('?' * len(paths))))
+            args.extend(paths)
+        if bbox is not None:
+            west, south, east, north = map(float, bbox)
+            where.append('stations.latitude BETWEEN ? AND ?')
+            args.extend([south, north])
+            if west <= east:
+                where.append('stations.longitude BETWEEN ? AND ?')
+            else:
+                where.append(
+                    '(stations.longitude >= ? OR stations.longitude <= ?)')
+            args.extend([west, east])
+        if start is not None:
+            where.append('stations.datetime >= ?')
+            args.append(_isoformat(start))
+        if end is not None:
+            if not isinstance(end, datetime):
+                # Times sort after their date so include the whole day.
+                where.append('stations.datetime < ?')
+                args.append(_isoformat(end) + 'U')
+            else:
+                where.append('stations.datetime <= ?')
+                args.append(_isoformat(end))
+        if expocode is not None:
+            where.append('stations.expocode = ?')
+            args.append(expocode)
+        for param in parameters or []:
+            where.append(
+                'EXISTS (SELECT 1 FROM parameters WHERE '
+                'parameters.station_id = stations.id AND '
+                'parameters.parameter = ?)')
+            args.append(param)
+
+        sql = (
+            'SELECT stations.id, archives.path, stations.member, '
+            'stations.expocode, stations.stnnbr, stations.castno, '
+            'stations.latitude, stations.longitude, stations.datetime, '
+            'stations.depth, stations.rows FROM stations '
+            'JOIN archives ON stations.archive_id = archives.id')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY archives.path, stations.id'
+
+        rows = self._conn.execute(sql, args).fetchall()
+        station_params = self._parameters([row[0] for row in rows])
+        return [
+            StationHeader(
+                row[1], row[2], row[3], row[4], row[5], _decimal(row[6]),
+                _decimal(row[7]), _parse_isoformat(row[8]), row[9], row[10],
+                station_params.get(row[0], []))
+            for row in rows]
+
+    def _parameters(self, station_ids):
+        params = {}
+        # Stay under SQLite's limit of variables in a statement.
+        for iii in xrange(0, len(station_ids), 500):
+            chunk = station_ids[iii:iii + 500]
+            for station_id, param in self._conn.execute(
+                    'SELECT station_id, parameter FROM parameters WHERE '
+                    'station_id IN ({0}) ORDER BY rowid'.format(
+                        ', '.join('?' * len(chunk))), chunk):
+                params.setdefault(station_id, []).append(param)
+        return params
+
+    def read_headers(self, path, file_type=None):
+        """Return a DataFileCollection with the station headers of an archive.
+
+        Each DataFile has the header globals but no data. The archive is only
+        read if it is not indexed or has changed.
+
+        """
+        self.update_archive(path, file_type)
+        dfc = DataFileCollection()
+        for station in self.query(paths=[path]):
+            dfile = DataFile()
+            dfile.globals['EXPOCODE'] = station.expocode
+            dfile.globals['STNNBR'] = station.stnnbr
+            dfile.globals['CASTNO'] = station.castno
+            dfile.globals['LATITUDE'] = station.latitude
+            dfile.globals['LONGITUDE'] = station.longitude
+            dfile.globals['_DATETIME'] = station.datetime
+            dfile.globals['DEPTH'] = station.depth
+            if station.member is not None:
+                dfile.globals['_FILENAME'] = station.member
+            dfc.append(dfile)
+        return dfc
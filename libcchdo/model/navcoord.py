@@ -150,8 +150,7 @@ def iter_coords(self, navcoordcls, callback):
     elif isinstance(self, DataFileCollection):
         for dfile in self:
             coords = [
-                [dfile.globals['LONGITUDE'],
-                 dfile.globals['LATITUDE']] for file in self]
+                [dfile.globals['LONGITUDE'], dfile.globals['LATITUDE']]]
             try:
                 expocode_coords[dfile.globals['EXPOCODE']].extend(coords)
             except KeyError:
@@ -0,0 +1,707 @@
+"""Array backed storage for Column values and flags.
+
+Columns keep their values and flags in Python lists of Decimals by default. For a
+full cruise collection that is millions of objects and every operation runs at
+per-object speed. The sequences in this module have the same list interface but
+keep their contents in NumPy arrays:
+
+* Decimal values are kept as int64 coefficients scaled by their number of
+  decimal places. The decimal places are kept for every value in an int8 array
+  so that Decimals, including trailing zeros, come back exactly as they went in
+  and Exchange output keeps its precision.
+* int and float values are kept in int64 and float64 arrays.
+* flags are kept in int8 arrays.
+* missing values (None) are kept in a separate boolean mask.
+
+Appends grow the arrays geometrically so they are amortized constant time.
+
+Anything that does not fit the compact form (strings, datetimes, mixed types,
+numbers too large for int64) makes the sequence fall back to a plain list so
+nothing is ever lost.
+
+Select the storage for new Columns with
+libcchdo.model.datafile.set_column_storage('array').
+
+"""
+from collections import MutableSequence
+from itertools import izip
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+try:
+    import numpy as np
+except ImportError, e:
+    raise ImportError('%s\n%s' % (e,
+        ("Please install numpy to use array column storage. "
+         "(pip install numpy)")))
+
+from libcchdo.fns import Decimal, out_of_band_array
+
+
+KIND_NONE = None
+KIND_DECIMAL = 'decimal'
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_OBJECT = 'object'
+
+
+_MIN_CAPACITY = 16
+
+
+_MAX_PLACES = np.iinfo(np.int8).max
+
+
+_MAX_INT64_DIGITS = 18
+
+
+class _Unfit(Exception):
+    """The value does not fit the compact representation."""
+
+
+def _to_decimal(coefficient, places):
+    return Decimal(coefficient).scaleb(-places)
+
+
+def _decimal_coefficient(value):
+    """Return the integer coefficient and decimal places of a Decimal.
+
+    Raises:
+        _Unfit - the Decimal is not finite, has a positive exponent, is a
+            negative zero or has too many places
+
+    """
+    sign, digits, exponent = value.as_tuple()
+    if type(exponent) is not int or exponent > 0 or -exponent > _MAX_PLACES:
+        raise _Unfit()
+    coefficient = int(''.join(map(str, digits)))
+    if sign:
+        if not coefficient:
+            raise _Unfit()
+        coefficient = -coefficient
+    return coefficient, -exponent
+
+
+class ArrayList(MutableSequence):
+    """A list-like sequence that keeps its contents in NumPy arrays.
+
+    """
+    kinds = (KIND_DECIMAL, KIND_INT, KIND_FLOAT)
+    int_dtype = np.int64
+
+    def __init__(self, iterable=()):
+        self._reset()
+        self.extend(iterable)
+
+    def _reset(self):
+        self._kind = KIND_NONE
+        self._len = 0
+        self._data = None
+        self._places = None
+        self._mask = None
+        self._bounds = None
+        self._list = None
+
+    @property
+    def kind(self):
+        """The kind of data held: None, 'decimal', 'int', 'float' or 'object'.
+
+        """
+        return self._kind
+
+    def is_compact(self):
+        """Return whether the contents are held in arrays."""
+        return self._kind != KIND_OBJECT
+
+    def _kind_of(self, value):
+        vtype = type(value)
+        if vtype is bool:
+            return KIND_OBJECT
+        if isinstance(value, Decimal):
+            kind = KIND_DECIMAL
+        elif isinstance(value, (int, long, np.integer)):
+            kind = KIND_INT
+        elif isinstance(value, (float, np.floating)):
+            kind = KIND_FLOAT
+        else:
+            return KIND_OBJECT
+        if kind not in self.kinds:
+            return KIND_OBJECT
+        return kind
+
+    def _dtype(self, kind):
+        if kind == KIND_DECIMAL:
+            return np.int64
+        elif kind == KIND_INT:
+            return self.int_dtype
+        return np.float64
+
+    def _allocate(self, kind, capacity):
+        self._kind = kind
+        dtype = self._dtype(kind)
+        self._data = np.zeros(capacity, dtype)
+        self._mask = np.ones(capacity, bool)
+        if kind != KIND_FLOAT:
+            info = np.iinfo(dtype)
+            self._bounds = (info.min, info.max)
+        if kind == KIND_DECIMAL:
+            self._places = np.zeros(capacity, np.int8)
+
+    def _reserve(self, length):
+        """Make room for length elements, growing geometrically."""
+        capacity = len(self._data)
+        if length <= capacity:
+            return
+        new_capacity = max(_MIN_CAPACITY, capacity * 2, length)
+        for name, fill in (('_data', 0), ('_places', 0), ('_mask', True)):
+            arr = getattr(self, name)
+            if arr is None:
+                continue
+            grown = np.empty(new_capacity, arr.dtype)
+            grown[:capacity] = arr
+            grown[capacity:] = fill
+            setattr(self, name, grown)
+
+    def _fallback(self):
+        """Give up on compact storage and keep a plain list instead."""
+        if self._kind != KIND_NONE:
+            log.debug(u'Falling back to list storage from {0}'.format(
+                self._kind))
+        self._list = self.tolist()
+        self._kind = KIND_OBJECT
+        self._data = self._places = self._mask = self._bounds = None
+
+    def _encode(self, value):
+        """Return the array data and decimal places for value.
+
+        Raises:
+            _Unfit - value cannot be stored in the current kind
+
+        """
+        kind = self._kind
+        if self._kind_of(value) != kind:
+            raise _Unfit()
+        if kind == KIND_DECIMAL:
+            data, places = _decimal_coefficient(value)
+        elif kind == KIND_INT:
+            data, places = int(value), 0
+        else:
+            return float(value), 0
+        if data < self._bounds[0] or data > self._bounds[1]:
+            raise _Unfit()
+        return data, places
+
+    def _set(self, i, value):
+        """Set the value at index i where 0 <= i < len."""
+        if self._kind == KIND_OBJECT:
+            self._list[i] = value
+            return
+        if value is None:
+            if self._mask is not None:
+                self._mask[i] = True
+            return
+        if self._kind == KIND_NONE:
+            kind = self._kind_of(value)
+            if kind == KIND_OBJECT:
+                self._fallback()
+                self._list[i] = value
+                return
+            self._allocate(kind, max(_MIN_CAPACITY, self._len))
+        try:
+            data, places = self._encode(value)
+        except _Unfit:
+            self._fallback()
+            self._list[i] = value
+            return
+        self._data[i] = data
+        if self._places is not None:
+            self._places[i] = places
+        self._mask[i] = False
+
+    def _get(self, i):
+        """Get the value at index i where 0 <= i < len."""
+        if self._kind == KIND_NONE or self._mask[i]:
+            return None
+        if self._kind == KIND_DECIMAL:
+            return _to_decimal(int(self._data[i]), int(self._places[i]))
+        return self._data[i].item()
+
+    def _index(self, index):
+        if index < 0:
+            index += self._len
+        if index < 0 or index >= self._len:
+            raise IndexError('list index out of range')
+        return index
+
+    def _rebuild(self, lll):
+        self._reset()
+        self.extend(lll)
+
+    def __len__(self):
+        if self._kind == KIND_OBJECT:
+            return len(self._list)
+        return self._len
+
+    def __getitem__(self, index):
+        if self._kind == KIND_OBJECT:
+            return self._list[index]
+        if isinstance(index, slice):
+            return [self._get(i) for i in xrange(*index.indices(self._len))]
+        return self._get(self._index(index))
+
+    def __setitem__(self, index, value):
+        if self._kind == KIND_OBJECT:
+            self._list[index] = value
+            return
+        if isinstance(index, slice):
+            value = list(value)
+            indices = xrange(*index.indices(self._len))
+            if index.step not in (None, 1) or len(indices) != len(value):
+                lll = self.tolist()
+                lll[index] = value
+                self._rebuild(lll)
+                return
+            for i, vvv in izip(indices, value):
+                self._set(i, vvv)
+            return
+        self._set(self._index(index), value)
+
+    def __delitem__(self, index):
+        lll = self.tolist()
+        del lll[index]
+        self._rebuild(lll)
+
+    def insert(self, index, value):
+        lll = self.tolist()
+        lll.insert(index, value)
+        self._rebuild(lll)
+
+    def append(self, value):
+        if self._kind == KIND_OBJECT:
+            self._list.append(value)
+            return
+        i = self._len
+        if self._data is not None:
+            self._reserve(i + 1)
+        self._len = i + 1
+        self._set(i, value)
+
+    def extend(self, iterable):
+        if self._kind == KIND_OBJECT:
+            self._list.extend(iterable)
+            return
+        if (isinstance(iterable, ArrayList) and
+                iterable._kind != KIND_OBJECT and
+                (iterable._kind == KIND_NONE or
+                 self._kind in (KIND_NONE, iterable._kind)) and
+                iterable.int_dtype == self.int_dtype):
+            self._extend_arrays(iterable)
+            return
+        if iterable is self:
+            iterable = self.tolist()
+        elif isinstance(iterable, list) and len(iterable) > _MIN_CAPACITY:
+            other = self._from_number_list(iterable)
+            if other is not None:
+                self._extend_arrays(other)
+                return
+        for value in iterable:
+            self.append(value)
+
+    def _from_number_list(self, lll):
+        """Return a compact sequence of a list of only ints or only floats.
+
+        Missing values are allowed. Returns None if the list holds anything
+        else so that the caller can append value by value.
+
+        """
+        types = set(map(type, lll))
+        types.discard(type(None))
+        if types == set([int]) and KIND_INT in self.kinds:
+            kind = KIND_INT
+        elif types == set([float]) and KIND_FLOAT in self.kinds:
+            kind = KIND_FLOAT
+        else:
+            return None
+        if self._kind not in (KIND_NONE, kind):
+            return None
+        mask = np.array([vvv is None for vvv in lll], bool)
+        if mask.any():
+            fill = 0 if kind == KIND_INT else 0.0
+            lll = [fill if vvv is None else vvv for vvv in lll]
+        other = type(self).from_arrays(np.array(lll), mask)
+        if other._kind != kind:
+            return None
+        return other
+
+    def _extend_arrays(self, other):
+        """Concatenate another compact sequence of the same kind."""
+        start = self._len
+        length = start + other._len
+        if other._kind == KIND_NONE:
+            if self._data is not None:
+                self._reserve(length)
+                self._mask[start:length] = True
+            self._len = length
+            return
+        if self._kind == KIND_NONE:
+            self._allocate(other._kind, max(_MIN_CAPACITY, length))
+        self._reserve(length)
+        self._data[start:length] = other._data[:other._len]
+        self._mask[start:length] = other._mask[:other._len]
+        if self._places is not None:
+            self._places[start:length] = other._places[:other._len]
+        self._len = length
+
+    def __iter__(self):
+        if self._kind == KIND_OBJECT:
+            return iter(self._list)
+        return iter(self.tolist())
+
+    def __contains__(self, value):
+        return value in self.tolist()
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ArrayList)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.tolist()
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __copy__(self):
+        copy = type(self)()
+        copy.extend(self)
+        return copy
+
+    def copy(self):
+        return self.__copy__()
+
+    def tolist(self):
+        """Return the contents as a new list."""
+        if self._kind == KIND_OBJECT:
+            return list(self._list)
+        length = self._len
+        if self._kind == KIND_NONE:
+            return [None] * length
+        mask = self._mask[:length].tolist()
+        data = self._data[:length].tolist()
+        if self._kind == KIND_DECIMAL:
+            places = self._places[:length].tolist()
+            return [None if mmm else _to_decimal(ddd, ppp)
+                    for ddd, ppp, mmm in izip(data, places, mask)]
+        return [None if mmm else ddd for ddd, mmm in izip(data, mask)]
+
+    # Bulk array access
+
+    def put(self, indices, values):
+        """Set the values at indices to the corresponding values.
+
+        Values from a compact sequence of the same kind are copied array to
+        array.
+
+        Raises:
+            IndexError - an index is out of range
+
+        """
+        indices = np.asarray(indices, np.intp)
+        length = len(self)
+        if len(indices) != len(values):
+            raise ValueError(u'Expected {0} values to put, got {1}'.format(
+                len(indices), len(values)))
+        if len(indices) and (indices.min() < -length or
+                             indices.max() >= length):
+            raise IndexError('list index out of range')
+        indices = np.where(indices < 0, indices + length, indices)
+        if (isinstance(values, ArrayList) and
+                values._kind not in (KIND_NONE, KIND_OBJECT) and
+                self._kind in (KIND_NONE, values._kind) and
+                values.int_dtype == self.int_dtype):
+            if self._kind == KIND_NONE:
+                self._allocate(values._kind, max(_MIN_CAPACITY, self._len))
+            count = len(indices)
+            for name in ('_data', '_places', '_mask'):
+                arr = getattr(self, name)
+                if arr is not None:
+                    arr[indices] = getattr(values, name)[:count]
+            return
+        for i, value in izip(indices.tolist(), values):
+            self._set(i, value)
+
+    def take(self, indices):
+        """Return a new sequence of the values at indices.
+
+        Raises:
+            IndexError - an index is out of range
+
+        """
+        indices = np.asarray(indices, np.intp)
+        length = len(self)
+        if len(indices) and (indices.min() < -length or
+                             indices.max() >= length):
+            raise IndexError('list index out of range')
+        seq = type(self)()
+        if self._kind == KIND_OBJECT:
+            seq._kind = KIND_OBJECT
+            seq._list = [self._list[i] for i in indices.tolist()]
+            return seq
+        indices = np.where(indices < 0, indices + length, indices)
+        if self._kind != KIND_NONE:
+            seq._allocate(self._kind, max(_MIN_CAPACITY, len(indices)))
+            for name in ('_data', '_places', '_mask'):
+                arr = getattr(self, name)
+                if arr is not None:
+                    getattr(seq, name)[:len(indices)] = arr[indices]
+        seq._len = len(indices)
+        return seq
+
+    def mask(self):
+        """Return a boolean array that is True where values are missing."""
+        if self._kind == KIND_OBJECT:
+            return np.array([vvv is None for vvv in self._list], bool)
+        if self._kind == KIND_NONE:
+            return np.ones(self._len, bool)
+        return self._mask[:self._len].copy()
+
+    def places(self):
+        """Return an int8 array of the decimal places of each value."""
+        if self._kind == KIND_DECIMAL:
+            return self._places[:self._len].copy()
+        return np.zeros(len(self), np.int8)
+
+    def to_float64(self):
+        """Return the values as a float64 array with NaN where missing.
+
+        Raises:
+            ValueError, TypeError - the values are not numeric
+
+        """
+        if self._kind == KIND_OBJECT:
+            return np.array(
+                [np.nan if vvv is None else float(vvv) for vvv in self._list],
+                np.float64)
+        length = self._len
+        if self._kind == KIND_NONE:
+            return np.full(length, np.nan)
+        values = self._data[:length].astype(np.float64)
+        if self._kind == KIND_DECIMAL:
+            values /= np.power(10.0, self._places[:length])
+        values[self._mask[:length]] = np.nan
+        return values
+
+    def decimal_places(self):
+        """Return the maximum decimal places of the non-zero Decimal values.
+
+        Returns None if the contents are not all Decimals; the caller should
+        examine the values itself.
+
+        """
+        if self._kind == KIND_NONE:
+            return 0
+        if self._kind != KIND_DECIMAL:
+            return None
+        length = self._len
+        present = ~self._mask[:length] & (self._data[:length] != 0)
+        if not present.any():
+            return 0
+        return int(self._places[:length][present].max())
+
+    def to_strings(self):
+        """Return the values as plain decimal strings with None where missing.
+
+        The strings are the same as libcchdo.fns.decimal_to_str gives for each
+        value, i.e. Decimals keep all their decimal places and are never in
+        exponent notation.
+
+        Returns None if the contents are not all Decimals or ints; the caller
+        should format the values itself.
+
+        """
+        if self._kind == KIND_NONE:
+            return [None] * self._len
+        if self._kind not in (KIND_DECIMAL, KIND_INT):
+            return None
+        length = self._len
+        data = self._data[:length]
+        mask = self._mask[:length].tolist()
+        if self._kind == KIND_INT:
+            return [None if mmm else str(ddd)
+                    for ddd, mmm in izip(data.tolist(), mask)]
+        places = self._places[:length]
+        if length and (places.max() > _MAX_INT64_DIGITS or
+                       data.min() == np.iinfo(np.int64).min):
+            return None
+        signs = np.where(data < 0, '-', '').tolist()
+        whole, frac = np.divmod(
+            np.abs(data), np.power(10, places, dtype=np.int64))
+        return [
+            None if mmm else
+            '%s%d.%0*d' % (sss, www, ppp, fff) if ppp else '%s%d' % (sss, www)
+            for sss, www, fff, ppp, mmm in izip(
+                signs, whole.tolist(), frac.tolist(), places.tolist(), mask)]
+
+    @classmethod
+    def from_arrays(cls, data, mask=None, places=None):
+        """Create a sequence directly from arrays.
+
+        data - integer or float array. If places is given, data are the int64
+            coefficients of Decimals scaled by 10 ** places.
+        mask - boolean array that is True where values are missing
+        places - scalar or array of decimal places
+
+        """
+        data = np.asarray(data)
+        length = len(data)
+        if places is not None:
+            kind = KIND_DECIMAL
+        elif np.issubdtype(data.dtype, np.integer):
+            kind = KIND_INT
+        elif np.issubdtype(data.dtype, np.floating):
+            kind = KIND_FLOAT
+        else:
+            kind = KIND_OBJECT
+        seq = cls()
+        fits = kind in seq.kinds
+        if fits and kind != KIND_FLOAT and length:
+            info = np.iinfo(seq._dtype(kind))
+            fits = info.min <= data.min() and data.max() <= info.max
+        if not fits:
+            for vvv in data.tolist():
+                seq.append(vvv)
+            if mask is not None:
+                for i in np.flatnonzero(mask):
+                    seq[i] = None
+            return seq
+        seq._allocate(kind, max(_MIN_CAPACITY, length))
+        seq._data[:length] = data
+        if places is not None:
+            seq._places[:length] = places
+        if mask is None:
+            seq._mask[:length] = False
+        else:
+            seq._mask[:length] = mask
+        seq._len = length
+        return seq
+
+    @classmethod
+    def from_decimal_strings(cls, strings, mask=None):
+        """Create a Decimal sequence from strings of plain decimal numbers.
+
+        This gives the same values as Decimal(string) without creating any
+        Decimals.
+
+        strings - sequence of stripped strings such as '-12.340'
+        mask - boolean array that is True where values are missing
+
+        Raises:
+            ValueError, OverflowError - the strings are not all plain decimal
+                numbers that fit in int64 coefficients
+
+        """
+        strings = np.asarray(strings, str)
+        if mask is None:
+            mask = np.zeros(strings.shape, bool)
+        else:
+            mask = np.asarray(mask, bool)
+        if not len(strings):
+            return cls()
+        if (np.char.str_len(np.char.translate(
+                strings, None, '0123456789.+-')).any() or
+                (np.char.count(strings, '.') > 1).any()):
+            raise ValueError(u'Not plain decimal numbers')
+        dots = np.char.find(strings, '.')
+        places = np.where(
+            dots >= 0, np.char.str_len(strings) - dots - 1, 0)
+        if places.max() > _MAX_PLACES:
+            raise ValueError(u'Too many decimal places')
+        coefficients = np.char.replace(strings, '.', '').astype(np.int64)
+        if (np.char.startswith(strings, '-') & (coefficients == 0) &
+                ~mask).any():
+            raise ValueError(u'Negative zero is not compact')
+        return cls.from_arrays(coefficients, mask, places)
+
+    @classmethod
+    def from_data_cells(cls, stripped, fill_value):
+        """Create a Decimal sequence from stripped numeric data cells.
+
+        Cells that are out of band of fill_value (see fns.out_of_band) are
+        missing.
+
+        Raises:
+            ValueError, OverflowError - the cells are not all plain decimal
+                numbers (see from_decimal_strings)
+
+        """
+        strings = np.array(stripped)
+        floats = strings.astype(np.float64)
+        return cls.from_decimal_strings(
+            strings, out_of_band_array(floats, stripped, fill_value))
+
+    @classmethod
+    def from_float64(cls, values, places, mask=None):
+        """Create a Decimal sequence from floats rounded to places.
+
+        values - float array
+        places - scalar or array of decimal places
+        mask - boolean array that is True where values are missing. NaNs are
+            always considered missing.
+
+        """
+        values = np.asarray(values, np.float64)
+        missing = np.isnan(values)
+        if mask is not None:
+            missing |= np.asarray(mask, bool)
+        places = np.broadcast_to(np.asarray(places, np.int8), values.shape)
+        coefficients = np.zeros(values.shape, np.int64)
+        present = ~missing
+        coefficients[present] = np.round(
+            values[present] * np.power(10.0, places[present]))
+        return cls.from_arrays(coefficients, missing, places)
+
+
+class ValueArray(ArrayList):
+    """Storage for Column values."""
+
+
+class FlagArray(ArrayList):
+    """Storage for Column WOCE and IGOSS flags."""
+    kinds = (KIND_INT, )
+    int_dtype = np.int8
+
+
+def float64(values):
+    """Return values as a float64 array with NaN where missing."""
+    try:
+        return values.to_float64()
+    except AttributeError:
+        pass
+    if isinstance(values, np.ndarray):
+        return np.ma.filled(values.astype(np.float64), np.nan)
+    try:
+        iter(values)
+    except TypeError:
+        if values is None:
+            return np.float64(np.nan)
+        return np.float64(values)
+    return np.array(
+        [np.nan if vvv is None else float(vvv) for vvv in values], np.float64)
+
+
+def masked(values):
+    """Return values as a float64 masked array that is masked where missing."""
+    return np.ma.masked_invalid(float64(values), copy=False)
@@ -0,0 +1,126 @@
+"""Map over items with a pool of forked worker processes.
+
+The function that is mapped is handed to the workers by forking them after it
+is set, so it may be a closure over DataFiles, readers or figures that cannot
+be pickled. Only the items and the results are sent between processes.
+
+Errors in a worker are sent back with their traceback, which is logged, and
+the first one is raised in the calling process as it would be if the items had
+been worked on there.
+
+Example::
+
+    with closing(fork_imap(read_member, members(), jobs)) as dfiles:
+        for dfile in dfiles:
+            dfc.append(dfile)
+
+"""
+import cPickle as pickle
+from contextlib import closing
+from multiprocessing import Pool, cpu_count
+from traceback import format_exc
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+def check_jobs(jobs):
+    """Return the number of processes to use for jobs.
+
+    jobs - 1 works in this process. None or 0 uses one process per CPU.
+
+    Raises:
+        ValueError - jobs is negative
+
+    """
+    if not jobs:
+        return cpu_count()
+    if jobs < 1:
+        raise ValueError(u'Number of jobs must be positive: {0}'.format(jobs))
+    return jobs
+
+
+# What the worker processes call. Workers are forked after this is set so they
+# inherit it.
+_worker_func = None
+
+
+def _worker_error(err):
+    """Return what a worker sends back for an error it caught.
+
+    Returns:
+        (exception, formatted traceback). The exception is err unless err
+        cannot be sent between processes, in which case it is a RuntimeError
+        with the traceback.
+
+    """
+    trace = format_exc(err)
+    try:
+        pickle.loads(pickle.dumps(err, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        err = RuntimeError(trace)
+    return err, trace
+
+
+def _call(item):
+    """Call the inherited function on an item in a worker.
+
+    Returns:
+        (result, None) or (None, (exception, formatted traceback))
+
+    """
+    try:
+        return _worker_func(item), None
+    except Exception, err:
+        return None, _worker_error(err)
+
+
+def fork_imap(func, items, jobs=1):
+    """Generate func(item) for each of the items, in order.
+
+    With more than one job, the items are worked on by a pool of that many
+    forked processes and may be a generator that is read as the workers need
+    more. Close the generator when stopping early so that the pool is stopped
+    as well.
+
+    Raises:
+        ValueError - jobs is negative
+        the error of the first item that failed
+
+    """
+    processes = check_jobs(jobs)
+    if processes == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    global _worker_func
+    _worker_func = func
+    try:
+        pool = Pool(processes)
+    finally:
+        _worker_func = None
+    try:
+        for result, error in pool.imap(_call, items):
+            if error:
+                err, trace = error
+                log.error(u'Error in a worker process:\n{0}'.format(trace))
+                raise err
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def fork_map(func, items, jobs=1):
+    """Return a list of func(item) for each of the items, in order.
+
+    See fork_imap().
+
+    """
+    with closing(fork_imap(func, items, jobs)) as results:
+        return list(results)
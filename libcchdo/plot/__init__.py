@@ -6,6 +6,8 @@ Miscellaneous useful matplotlib.basemap functions
 from copy import copy
 from argparse import Namespace
 
+from libcchdo.parallel import check_jobs, fork_map
+
 
 def sqdist(a, b):
     """ Squared distance to avoid square root overhead when calculating distances
@@ -106,3 +108,41 @@ def presets_goship(gmt_color, dot_size=None, args=None, draft=False):
               draw_graticules_kwargs=draw_graticules_kwargs)
     bm.hide_axes_borders()
     return args, bm, gmt_style
+
+
+def _close_fonts():
+    """Forget the font files matplotlib has open.
+
+    Forked processes share the offsets of open files, so workers reading
+    glyphs from fonts opened before the fork would read each other's.
+
+    """
+    try:
+        from matplotlib.font_manager import _get_font
+    except ImportError:
+        return
+    try:
+        _get_font.cache_clear()
+    except AttributeError:
+        pass
+
+
+def render_frames(render, frames, jobs=1):
+    """Return render(frame) for each of the frames, in order.
+
+    jobs - the number of processes to render frames with. 1 renders them one
+        after another in this process. None or 0 uses one per CPU.
+
+    Workers are forked with render and the frames and are sent frame numbers,
+    so neither needs to be picklable but the results do. render should draw
+    each frame on its own figure so that the result does not depend on which
+    process drew which frames before it.
+
+    Raises:
+        ValueError - jobs is negative
+
+    """
+    jobs = min(check_jobs(jobs), max(1, len(frames)))
+    if jobs > 1:
+        _close_fonts()
+    return fork_map(lambda i: render(frames[i]), range(len(frames)), jobs)
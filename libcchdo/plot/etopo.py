@@ -35,11 +35,13 @@ from matplotlib.colors import LinearSegmentedColormap
 from matplotlib.patches import Rectangle, Circle, Arc, Polygon
 
 from mpl_toolkits.basemap import (
-    Basemap, shiftgrid, _pseudocyl, _cylproj, 
+    Basemap, _pseudocyl, _cylproj, 
     )
 
 from libcchdo import config
 from libcchdo.plot.interpolation import BicubicConvolution
+from libcchdo.plot.layer_cache import LayerCache, layer_key
+from libcchdo.plot.etopo_store import EtopoStore, LEVELS as STORE_LEVELS
 
 
 etopo_root = 'http://www.ngdc.noaa.gov/mgg/global'
@@ -51,6 +53,11 @@ etopo1_root = etopo_root + '/relief/ETOPO1/data'
 etopo_dir = os.path.join(config.get_config_dir(), 'etopos')
 
 
+# offset bumps the level just above sea level to below so as to err on
+# the side of less land shown
+etopo_offset = 0.
+
+
 def is_proj_cylindrical(proj):
     return proj in _cylproj
 
@@ -121,8 +128,10 @@ def mask_proj_bounds(self, img, lons, lats, nx, ny, tx, ty):
     # treat pseudo-cyl projections such as mollweide, robinson and sinusoidal.
     elif is_proj_pseudocylindrical(self.projection):
         lon_0 = self.projparams['lon_0']
-        lonright = lon_0 + 180.
-        lonleft = lon_0 - 180.
+        # Just inside the edges; newer versions of proj wrap the antimeridian
+        # itself to the other side of the map.
+        lonright = lon_0 + 180. - 1e-6
+        lonleft = lon_0 - 180. + 1e-6
         x1 = np.array(ny * [0.5 * (self.xmax + self.xmin)], np.float)
         y1 = np.linspace(self.ymin, self.ymax, ny)
         lons1, lats1 = self(x1, y1, inverse=True)
@@ -151,7 +160,7 @@ def mask_proj_bounds(self, img, lons, lats, nx, ny, tx, ty):
     return newimg
 
 
-def downsample(scale, xs, ys, zs):
+def downsample(scale, xs, ys, zs, method='fast'):
     """ Downsample ETOPO data to the given scale
 
         scale - percentage of points to keep
@@ -162,6 +171,9 @@ def downsample(scale, xs, ys, zs):
             1          | ETOPO1
             0.5        | ETOPO2
             0.1        | ETOPO5
+        method - 'fast' or 'bicubic'. Bicubic convolution shows slightly better
+            coastline resolution around areas such as N Australia and N Siberia
+            but takes longer.
 
     """
     log.info('Downsampling to %f' % scale)
@@ -173,10 +185,11 @@ def downsample(scale, xs, ys, zs):
     #fzs = RectBivariateSpline(ys, xs, zs)
     #newzs = fzs(newxs, newys).T
 
-    # This shows slightly better coastline resolution around areas such as N
-    # Australia and N Siberia
-    #fzs = BicubicConvolution(xs, ys, zs)
-    #newzs = np.array(fzs(newxs, newys))
+    if method == 'bicubic':
+        fzs = BicubicConvolution(xs, ys, zs)
+        return newxs, newys, fzs(newxs, newys)
+    elif method != 'fast':
+        raise ValueError(u'Unknown downsample method {0!r}'.format(method))
 
     # Extremely fast way to downsample
     newzs = map_coordinates(
@@ -331,7 +344,30 @@ def read_etopo(etopo_path):
     return lons, lats, topo
 
 
-def etopo(arcmins=1, version='ice', force_resample=False, cache_allowed=True):
+def etopo_store_dir(version='ice'):
+    return os.path.join(
+        etopo_dir, 'ETOPO_{0}_tiles'.format(version.capitalize()))
+
+
+def etopo_store(version='ice', force_rebuild=False):
+    """Return the tiled EtopoStore of version, building it if needed.
+
+    The store is built from ETOPO1, which is downloaded if it is not in the
+    etopo directory.
+
+    """
+    store = EtopoStore(etopo_store_dir(version))
+    if force_rebuild or not store.is_built():
+        etopo_path = os.path.join(etopo_dir, etopo_filename(version=version))
+        if not os.path.isfile(etopo_path):
+            download_etopo1(etopo_path, version)
+        log.info('Building tiled etopo store {0}'.format(store.directory))
+        store.build(etopo_path)
+    return store
+
+
+def etopo(arcmins=1, version='ice', force_resample=False, cache_allowed=True,
+          bounds=None):
     """ Read and normalize etopo data from a netCDF file.
 
         ETOPO1 can be downloaded from here:
@@ -339,15 +375,27 @@ def etopo(arcmins=1, version='ice', force_resample=False, cache_allowed=True):
 
         Please pick from the grid registered files for GMT.
 
+        Resolutions that the tiled etopo store has are read from it. Otherwise
+        the whole grid is read and downsampled from ETOPO1.
+
         Args:
             arcmins - the number of arc-minutes between each tick of the grid
             version - whether to use ice surface (ice) or bedrock (bed) relief
+            bounds - (lon_min, lon_max, lat_min, lat_max) to only read the
+                region of the store that covers them
 
         Returns:
             a tuple with (elevation data, lons, lats,
                           offset_from_ground_to_consider_underwater)
 
     """
+    if arcmins in STORE_LEVELS and cache_allowed:
+        store = etopo_store(version, force_resample)
+        lons, lats, topo = store.region(arcmins, *(bounds or ()))
+        log.info('lons: %s' % (lons.shape))
+        log.info('lats: %s' % (lats.shape))
+        return (topo, lons, lats, etopo_offset)
+
     etopo_path = os.path.join(etopo_dir, etopo_filename(arcmins, version))
 
     log.debug('reading {0}'.format(etopo_path))
@@ -372,10 +420,7 @@ def etopo(arcmins=1, version='ice', force_resample=False, cache_allowed=True):
     log.info('lats: %s' % (lats.shape))
     log.info('topo: %s %s' % (topo.shape, topo))
 
-    # offset bumps the level just above sea level to below so as to err on
-    # the side of less land shown
-    offset = 0.
-    return (topo, lons, lats, offset)
+    return (topo, lons, lats, etopo_offset)
 
 
 def etopo_ground_point(topo, etopo_offset=0):
@@ -561,6 +606,11 @@ class ETOPOBasemap(Basemap):
 
     GMT_STYLE_LINE = dict(c='k', linewidth=1, antialiased=True, zorder=300)
 
+    # How draw_from_argparser draws etopo
+    ARGPARSER_ETOPO_CUT = 3
+
+    ARGPARSER_ETOPO_VERSION = 'ice'
+
     def __init__(self, **kwargs):
         super(ETOPOBasemap, self).__init__(**kwargs)
         self.hide_axes_borders()
@@ -680,8 +730,71 @@ class ETOPOBasemap(Basemap):
             xoffset = 0
         return (xoffset, yoffset)
 
+    def etopo_layer_key(self, etopo_scale, cut, version='ice'):
+        """Return the layer cache key of the projected etopo layer.
+
+        The key covers everything the layer depends on: the projection and its
+        bounds, the etopo data and how it is cut.
+
+        """
+        return layer_key(
+            layer='etopo',
+            projection=self.projection,
+            projparams=self.projparams,
+            corners=[self.llcrnrlon, self.llcrnrlat,
+                     self.urcrnrlon, self.urcrnrlat],
+            extent=[self.xmin, self.xmax, self.ymin, self.ymax],
+            etopo_scale=etopo_scale,
+            cut=cut,
+            version=version,
+            source=EtopoStore(etopo_store_dir(version)).identity(),
+        )
+
+    def etopo_bounds(self, margin=0):
+        """Return the (lon_min, lon_max, lat_min, lat_max) that the map covers.
+
+        Longitudes of cylindrical maps follow the corners. Other maps that cross
+        the antimeridian or contain a pole cover all longitudes from -180 to
+        180 because their projections give longitudes in that range.
+
+        Args:
+            margin - degrees to extend the bounds by
+
+        """
+        if self.is_proj_cylindrical:
+            lon_min, lon_max = self.llcrnrlon, self.urcrnrlon
+            lat_min, lat_max = self.llcrnrlat, self.urcrnrlat
+        else:
+            xs, ys = np.meshgrid(np.linspace(self.xmin, self.xmax, 64),
+                                 np.linspace(self.ymin, self.ymax, 64))
+            lons, lats = self(xs, ys, inverse=True)
+            # Points off the limb of the projection are huge
+            on_map = np.logical_and(
+                np.abs(lons) <= 360, np.abs(lats) <= 90)
+            if not on_map.any():
+                return (-180, 180, -90, 90)
+            lons = lons[on_map]
+            lats = lats[on_map]
+            lon_min, lon_max = lons.min(), lons.max()
+            lat_min, lat_max = lats.min(), lats.max()
+            for pole in (-90, 90):
+                x, y = self(0., pole)
+                if self.xmin <= x <= self.xmax and self.ymin <= y <= self.ymax:
+                    lat_min = min(lat_min, pole)
+                    lat_max = max(lat_max, pole)
+                    lon_min, lon_max = -180, 180
+            if lon_max - lon_min > 180:
+                lon_min, lon_max = -180, 180
+
+        if lon_max - lon_min + 2 * margin >= 360:
+            lon_max = lon_min + 360
+        else:
+            lon_min -= margin
+            lon_max += margin
+        return (lon_min, lon_max, lat_min - margin, lat_max + margin)
+
     def draw_etopo(self, etopo_scale, cut, cmtopo=colormap_cberys,
-                   version='ice', force_resample=False):
+                   version='ice', force_resample=False, cache=True):
         """Draw an etopo bathymetry overlay on the Basemap.
 
         Arguments:
@@ -690,24 +803,64 @@ class ETOPOBasemap(Basemap):
                 averaging of the etopo will occur. Values over 10 will generally
                 result in a poor map and values under 3 will result in a very
                 long transform time.
+            cache - whether to reuse the projected layer from the layer cache
+                (see libcchdo.plot.layer_cache). Resampling always projects
+                the layer again.
 
         """
-        topo, lons, lats, etopo_offset = etopo(
-            etopo_scale, version, force_resample)
+        topo = self.etopo_layer(
+            etopo_scale, cut, version, force_resample, cache)
+        self.imshow(topo, cmap=cmtopo(topo, etopo_offset))
 
+    def etopo_layer(self, etopo_scale, cut, version='ice',
+                    force_resample=False, cache=True):
+        """Return the etopo bathymetry that draw_etopo would draw."""
         if cut is None:
             if etopo_scale == 1:
                 cut = 6
             else:
                 cut = 4
 
+        topo = None
+        if cache:
+            layers = LayerCache()
+            if not force_resample:
+                topo = layers.get(
+                    self.etopo_layer_key(etopo_scale, cut, version))
+                if topo is not None:
+                    log.info('Using cached etopo layer')
+        if topo is None:
+            topo = self.project_etopo(etopo_scale, cut, version, force_resample)
+            if cache:
+                # The etopo data may only have been made by projecting.
+                layers.put(
+                    self.etopo_layer_key(etopo_scale, cut, version), topo)
+        return topo
+
+    def project_etopo(self, etopo_scale, cut, version='ice',
+                      force_resample=False):
+        """Return the etopo bathymetry transformed onto the Basemap.
+
+        The map gets as many points as etopo_scale data cut by cut would give
+        it. Only the tiles of the etopo store that cover the map are read, from
+        the coarsest level that is at least as fine as those points.
+
+        Areas outside the projection are masked.
+
+        """
+        store = etopo_store(version, force_resample)
+
         log.debug('Cut ratio %d' % cut)
-        nx, ny = get_nx_ny(self, lons, cut_ratio=cut)
+        nx, ny = get_nx_ny(
+            self, np.linspace(-180., 180., 360 * 60 // etopo_scale + 1),
+            cut_ratio=cut)
         log.debug('nx: %d, ny: %d' % (nx, ny))
 
-        if lons.min() < self.llcrnrlon and self.is_proj_cylindrical:
-            log.info('Shifting grid')
-            topo, lons = shiftgrid(self.llcrnrlon, topo, lons)
+        level = store.level_for(etopo_scale * cut)
+        # Leave room around the map for interpolation
+        bounds = self.etopo_bounds(margin=max(1., 2. * level / 60.))
+        log.info('Reading %d arc-minute etopo for %s' % (level, bounds))
+        lons, lats, topo = store.region(level, *bounds)
 
         log.info('Transforming grid')
         #log.debug('lons: %s lats: %s nx: %d ny: %d' % (lons, lats, nx, ny))
@@ -715,9 +868,11 @@ class ETOPOBasemap(Basemap):
             topo, lons, lats, nx, ny, returnxy=True)
 
         log.info('Masking projection bounds')
-        topo = mask_proj_bounds(self, topo, lons, lats, nx, ny, tx, ty)
-
-        self.imshow(topo, cmap=cmtopo(topo, etopo_offset))
+        masked = mask_proj_bounds(self, topo, lons, lats, nx, ny, tx, ty)
+        # Nothing is outside a whole world cylindrical projection.
+        if masked is None:
+            return topo
+        return masked
 
     def draw_from_argparser(self, args):
         """Draw based on argparser arguments."""
@@ -729,12 +884,11 @@ class ETOPOBasemap(Basemap):
                 args.cmap))
             cmtopofn = colormap_cberys
 
-        etopo_cut = 3
-        etopo_version = 'ice'
         fillcontinents_kwargs = {'color': 'k'}
         if not args.no_etopo:
             self.draw_etopo(
-                args.minutes, etopo_cut, version=etopo_version, cmtopo=cmtopofn)
+                args.minutes, self.ARGPARSER_ETOPO_CUT,
+                version=self.ARGPARSER_ETOPO_VERSION, cmtopo=cmtopofn)
 
         if args.fill_continents:
             self.fillcontinents(fillcontinents_kwargs)
@@ -828,13 +982,13 @@ class ETOPOBasemap(Basemap):
         xoffset, yoffset = self.gmt_label_offsets
         artists = {}
         artists['parallels'] = self.drawparallels(
-            parallel_ticks, label_font_color, line_width, dashes=line_dashes, 
-            latmax=latmax,
+            parallel_ticks, color=label_font_color, linewidth=line_width,
+            dashes=line_dashes, latmax=latmax,
             fmt=gmt_label_fmt, xoffset=xoffset, yoffset=yoffset,
             labels=label_parallels, fontsize=label_font_size)
         artists['meridians'] = self.drawmeridians(
-            meridian_ticks, label_font_color, line_width, dashes=line_dashes,
-            latmax=latmax, 
+            meridian_ticks, color=label_font_color, linewidth=line_width,
+            dashes=line_dashes, latmax=latmax,
             fmt=gmt_label_fmt, xoffset=xoffset, yoffset=yoffset,
             labels=label_meridians, fontsize=label_font_size)
 
@@ -0,0 +1,290 @@
+"""Tiled, memory mapped store of ETOPO relief at several resolutions.
+
+Reading a global ETOPO1 grid from netCDF loads all of it even when a map only
+covers a small region. An EtopoStore is built once from the global grid. It
+keeps a pyramid of levels, by default at 1, 2, 5 and 10 arc-minutes, and each
+level is a .npy file of square tiles that is memory mapped when read. Reading a
+region only touches the tiles that cover it.
+
+A level of n arc-minutes keeps every nth node of the source grid. Each node is
+the mean of the source nodes within n / 2 nodes of it. Longitudes wrap around
+the globe and latitudes are clamped at the poles.
+
+The store directory has an index.json, written last so that a store whose build
+was interrupted is not used, and a <n>min.npy file for each level. Heights are
+kept as 16 bit integers, which holds all of ETOPO1's metres.
+
+"""
+import os
+import os.path
+import json
+from math import floor, ceil
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+import numpy as np
+from netCDF4 import Dataset
+
+
+# Bump when the layout or the way levels are made changes.
+STORE_VERSION = 1
+
+
+LEVELS = (1, 2, 5, 10)
+
+
+TILE_SIZE = 256
+
+
+# Source nodes read at once while building levels
+_BUILD_ROWS = 512
+
+
+def _box_indices(size, factor, wrap):
+    """Return the source indices averaged for each node of a level.
+
+    Returns:
+        a tuple of (indices, window) where each output node is the mean of
+        window consecutive entries of indices starting at factor times its
+        number.
+
+    """
+    half = factor // 2
+    nout = (size - 1) // factor + 1
+    indices = np.arange(-half, (nout - 1) * factor + half + 1)
+    if wrap:
+        # The last node of a global grid repeats the first.
+        indices %= size - 1
+    else:
+        indices = np.clip(indices, 0, size - 1)
+    return indices, 2 * half + 1
+
+
+def _box_mean(values, factor, window, axis):
+    """Average windows of values along axis that start every factor entries."""
+    sums = np.cumsum(values, axis=axis, dtype=np.float64)
+    zeros = np.zeros_like(sums.take([0], axis=axis))
+    sums = np.concatenate([zeros, sums], axis=axis)
+    starts = np.arange(0, values.shape[axis] - window + 1, factor)
+    return (sums.take(starts + window, axis=axis) -
+            sums.take(starts, axis=axis)) / window
+
+
+class EtopoStore(object):
+    """The pyramid of tiled relief levels kept in directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._index = None
+        self._tiles = {}
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def level_path(self, level):
+        return os.path.join(self.directory, '{0:d}min.npy'.format(level))
+
+    @property
+    def index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as fff:
+                    index = json.load(fff)
+            except (IOError, ValueError):
+                return None
+            if index.get('version') != STORE_VERSION:
+                return None
+            self._index = index
+        return self._index
+
+    def is_built(self):
+        return self.index is not None
+
+    def identity(self):
+        """Identify the data in the store.
+
+        Returns:
+            a list of the store version, the name, size and modification time
+            of the source and the levels or None if the store is not built
+
+        """
+        if not self.is_built():
+            return None
+        return [STORE_VERSION] + self.index['source'] + [self.levels]
+
+    @property
+    def levels(self):
+        return sorted(int(level) for level in self.index['levels'])
+
+    def level_for(self, arcmins):
+        """Return the coarsest level with nodes at most arcmins apart.
+
+        The finest level is returned if none are that fine.
+
+        """
+        levels = self.levels
+        fine_enough = [level for level in levels if level <= arcmins]
+        if fine_enough:
+            return fine_enough[-1]
+        return levels[0]
+
+    def shape(self, level):
+        """Return the (lats, lons) shape of the grid of level."""
+        return tuple(self.index['levels'][str(level)])
+
+    def tiles(self, level):
+        try:
+            return self._tiles[level]
+        except KeyError:
+            tiles = np.load(self.level_path(level), mmap_mode='r')
+            self._tiles[level] = tiles
+            return tiles
+
+    def build(self, source_path, levels=LEVELS, tile_size=TILE_SIZE):
+        """Build the store from a global, grid registered ETOPO netCDF file.
+
+        Raises:
+            ValueError if the source is not a global grid or a level is not a
+            multiple of its spacing
+
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        self._index = None
+        self._tiles = {}
+
+        source = Dataset(source_path, 'r')
+        try:
+            lons = source.variables['x'][:]
+            lats = source.variables['y'][:]
+            if (not np.allclose([lons[0], lons[-1]], [-180, 180]) or
+                    not np.allclose([lats[0], lats[-1]], [-90, 90])):
+                raise ValueError(
+                    u'{0} is not a global, grid registered grid'.format(
+                        source_path))
+            source_arcmins = 360. * 60 / (lons.size - 1)
+            shapes = {}
+            for level in levels:
+                factor = level / source_arcmins
+                if abs(factor - round(factor)) > 1e-6:
+                    raise ValueError(
+                        u'Level {0} is not a multiple of the {1} arc-minute '
+                        'source'.format(level, source_arcmins))
+                log.info(u'Building {0} arc-minute ETOPO tiles'.format(level))
+                shapes[str(level)] = self._build_level(
+                    source.variables['z'], self.level_path(level),
+                    int(round(factor)), tile_size)
+        finally:
+            source.close()
+
+        stat = os.stat(source_path)
+        index = {
+            'version': STORE_VERSION,
+            'source': [os.path.basename(source_path), stat.st_size,
+                       stat.st_mtime],
+            'source_arcmins': source_arcmins,
+            'tile_size': tile_size,
+            'levels': shapes,
+        }
+        with open(self.index_path, 'w') as fff:
+            json.dump(index, fff)
+
+    def _build_level(self, zvar, path, factor, tile_size):
+        nlats, nlons = zvar.shape
+        lat_indices, window = _box_indices(nlats, factor, wrap=False)
+        lon_indices, _ = _box_indices(nlons, factor, wrap=True)
+        shape = ((nlats - 1) // factor + 1, (nlons - 1) // factor + 1)
+        tiles = np.lib.format.open_memmap(
+            path, mode='w+', dtype=np.int16,
+            shape=(-(-shape[0] // tile_size), -(-shape[1] // tile_size),
+                   tile_size, tile_size))
+
+        band = max(1, _BUILD_ROWS // factor)
+        for row in range(0, shape[0], band):
+            nrows = min(band, shape[0] - row)
+            indices = lat_indices[
+                row * factor:(row + nrows - 1) * factor + window]
+            first = indices.min()
+            rows = zvar[first:indices.max() + 1][indices - first]
+            rows = np.asarray(rows)[:, lon_indices]
+            rows = _box_mean(rows, factor, window, axis=0)
+            rows = _box_mean(rows, factor, window, axis=1)
+            rows = np.clip(np.rint(rows), -2 ** 15, 2 ** 15 - 1)
+            self._put_rows(tiles, row, rows.astype(np.int16))
+        tiles.flush()
+        del tiles
+        return shape
+
+    def _put_rows(self, tiles, row, rows):
+        """Write whole rows of a level starting at row into its tiles."""
+        tile_size = tiles.shape[2]
+        end = row + rows.shape[0]
+        for ty in range(row // tile_size, (end - 1) // tile_size + 1):
+            top = ty * tile_size
+            r0 = max(row, top)
+            r1 = min(end, top + tile_size)
+            for tx in range(tiles.shape[1]):
+                cols = rows[r0 - row:r1 - row,
+                            tx * tile_size:(tx + 1) * tile_size]
+                tiles[ty, tx, r0 - top:r1 - top, :cols.shape[1]] = cols
+
+    def _window(self, level, row0, row1, col0, col1):
+        """Return the nodes of level in rows [row0, row1) and [col0, col1)."""
+        tiles = self.tiles(level)
+        tile_size = tiles.shape[2]
+        window = np.empty((row1 - row0, col1 - col0), dtype=tiles.dtype)
+        for ty in range(row0 // tile_size, (row1 - 1) // tile_size + 1):
+            top = ty * tile_size
+            r0 = max(row0, top)
+            r1 = min(row1, top + tile_size)
+            for tx in range(col0 // tile_size, (col1 - 1) // tile_size + 1):
+                left = tx * tile_size
+                c0 = max(col0, left)
+                c1 = min(col1, left + tile_size)
+                window[r0 - row0:r1 - row0, c0 - col0:c1 - col0] = \
+                    tiles[ty, tx, r0 - top:r1 - top, c0 - left:c1 - left]
+        return window
+
+    def region(self, level, lon_min=-180, lon_max=180, lat_min=-90,
+               lat_max=90):
+        """Read the nodes of level that cover the bounds.
+
+        Longitudes may be outside [-180, 180] to cross the antimeridian. The
+        longitudes returned increase from lon_min and cover at most 360
+        degrees.
+
+        Returns:
+            a tuple of (lons, lats, topo) with topo indexed by lat then lon
+
+        """
+        nlats, nlons = self.shape(level)
+        dlon = 360. / (nlons - 1)
+        dlat = 180. / (nlats - 1)
+
+        lon0 = int(floor((lon_min + 180) / dlon + 1e-9))
+        lon1 = int(ceil((lon_max + 180) / dlon - 1e-9))
+        lon1 = max(lon0, min(lon1, lon0 + nlons - 1))
+        lat0 = max(0, int(floor((lat_min + 90) / dlat + 1e-9)))
+        lat1 = min(nlats - 1, int(ceil((lat_max + 90) / dlat - 1e-9)))
+        lat1 = max(lat0, lat1)
+
+        # Read each stretch of columns that does not wrap
+        pieces = []
+        col = lon0
+        while col <= lon1:
+            start = col % (nlons - 1)
+            count = min(lon1 - col + 1, nlons - 1 - start)
+            pieces.append(
+                self._window(level, lat0, lat1 + 1, start, start + count))
+            col += count
+        topo = np.hstack(pieces)
+
+        lons = -180. + np.arange(lon0, lon1 + 1) * dlon
+        lats = -90. + np.arange(lat0, lat1 + 1) * dlat
+        return lons, lats, topo
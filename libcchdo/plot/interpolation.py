@@ -5,10 +5,6 @@ from logging import getLogger
 log = getLogger(__name__)
 
 
-from libcchdo.util import memoize
-from libcchdo.recipes.lru import lru_cache
-
-
 class BicubicConvolution:
     """ Evaluates a bicubic spline interpolation implemented as a convolution
 
@@ -18,18 +14,24 @@ class BicubicConvolution:
         This should be handy for large datasets where pre-calculating splines is
         very expensive.
 
-        WARNING: This implementation is currently very magically bound with
-        etopo plotting. It may not work with generic applications.
+        Whole output grids are evaluated at once in blocks of rows with at most
+        block_points points so that memory use stays bounded.
+
+        Data is wrapped left and right of the grid and reflected above and
+        below it, as suits global etopo grids.
 
     """
+    # Output points evaluated at once
+    block_points = 2 ** 20
+
     def __init__(self, xs, ys, zs):
         """
             xs, ys - 1D arrays indexing into zs
             zs     - 2D matrix of values to be interpolated
         """
-        self.xs = xs
-        self.ys = ys
-        self.zs = zs
+        self.xs = np.asarray(xs)
+        self.ys = np.asarray(ys)
+        self.zs = np.asarray(zs)
 
     #bicubic_matrix = np.matrix([
     #    [0, 2, 0, 0],
@@ -39,6 +41,11 @@ class BicubicConvolution:
     #])
 
     def interp_cubic(self, p, x):
+        """ Interpolate between p[1] and p[2] at x in [0, 1]
+
+            p and x may be sequences of arrays and arrays.
+
+        """
         return p[1] + 0.5 * x * (
             p[2] - p[0] + x * (
                 2. * p[0] - 5. * p[1] + 4. * p[2] - p[3] + x * (
@@ -46,66 +53,65 @@ class BicubicConvolution:
         #return (0.5 * np.matrix([1, x, x ** 2, x ** 3]) * \
         #    self.bicubic_matrix * np.matrix(p).T)[0,0]
 
-    def interp_bicubic(self, ps, x, y):
-        interp_cubic = self.interp_cubic
-        return interp_cubic([interp_cubic(p, y) for p in ps], x)
-
-    @memoize
     def size(self):
-        return len(self.zs[0]), len(self.zs)
-
-    def get_ni_nj(self, sizex, sizey, ni, nj):
-        """ Get one cell of the submatrix around x, y while accounting for data
-            wrapping at edges
+        return self.zs.shape[1], self.zs.shape[0]
 
-        """
-        # Anything above or below the matrix is reflected back into the data
-        if nj < 0:
-            nj *= -1
-        if nj >= sizey:
-            nj = sizey - 2 - (nj % sizey)
-
-        # Anything left or right of the matrix is wrapped back into the data
-        ni %= sizex
-
-        # zs passed in are y, x
-        return self.zs[nj][ni]
-
-    @lru_cache(720)
-    def get_submatrix(self, x, y):
-        sizex, sizey = self.size()
-
-        # The submatrix starts at x - 2, y - 2
-        base_x = x - 2
-        base_y = y - 2
+    def cells(self, grid, coords):
+        """ Get the neighborhood of each coordinate in the grid
 
-        # If the submatrix will be entirely inside the data, just get it
-        if ((0 < base_x and base_x < sizex - 4) and 
-            (0 < base_y and base_y < sizey - 4)):
-            return self.zs[base_y:base_y + 4, base_x:base_x + 4].tolist()
+            Returns:
+                a tuple of (indices, offsets) where indices has the four grid
+                indices around each coordinate, two on each side, and offsets
+                are how far each coordinate is between the middle two as a
+                fraction of their spacing
 
-        r = range(4)
-        return [
-            [self.get_ni_nj(sizex, sizey, base_x + i, base_y + j) for j in r]
-            for i in r
-        ]
+        """
+        coords = np.asarray(coords, dtype=float)
+        upper = np.clip(np.searchsorted(grid, coords), 1, len(grid) - 1)
+        lower = grid[upper - 1]
+        offsets = (coords - lower) / (grid[upper] - lower)
+        indices = upper[:, np.newaxis] + np.arange(-2, 2)[np.newaxis, :]
+        return indices, offsets
+
+    def wrap_x(self, indices):
+        """ Wrap indices left or right of the matrix back into the data """
+        return indices % self.size()[0]
+
+    def reflect_y(self, indices):
+        """ Reflect indices above or below the matrix back into the data """
+        sizey = self.size()[1]
+        indices = np.abs(indices)
+        return np.where(
+            indices >= sizey, 2 * (sizey - 1) - indices, indices)
 
     def get_value(self, x, y):
-        ix = np.searchsorted(self.xs, x)
-        iy = np.searchsorted(self.ys, y)
-
-        # nearest value available in given coordinates
-        ax = self.xs[ix]
-        ay = self.ys[iy]
-
-        return self.interp_bicubic(self.get_submatrix(ix, iy), 1 - ax + x, 1 - ay + y)
+        return self([x], [y])[0, 0]
 
     def __call__(self, xs, ys):
         """ Interpolates the given grid at the newly given coordinates
 
+            Returns:
+                a 2D array indexed by y then x
+
         """
-        zs = []
-        for y in ys:
-            log.debug('interp y: %f' % y)
-            zs.append([self.get_value(x, y) for x in xs])
+        ixs, txs = self.cells(self.xs, xs)
+        iys, tys = self.cells(self.ys, ys)
+        ixs = self.wrap_x(ixs)
+        iys = self.reflect_y(iys)
+
+        zs = np.empty((len(tys), len(txs)))
+        block = max(1, self.block_points // max(1, len(txs)))
+        for start in range(0, len(tys), block):
+            log.debug('interp rows %d to %d' % (start, start + block))
+            rows = iys[start:start + block]
+            # Interpolate each of the four rows around the points along x and
+            # then those along y.
+            along_x = []
+            for k in range(4):
+                row = rows[:, k, np.newaxis]
+                along_x.append(self.interp_cubic(
+                    [self.zs[row, ixs[:, m]].astype(float) for m in range(4)],
+                    txs))
+            zs[start:start + block] = self.interp_cubic(
+                along_x, tys[start:start + block, np.newaxis])
         return zs
@@ -0,0 +1,180 @@
+"""On disk cache of projected map layers.
+
+Projecting ETOPO bathymetry onto a Basemap takes much longer than drawing it.
+A LayerCache keeps projected layers as .npy files keyed by a hash of everything
+that went into making them so that maps with the same geometry can share them.
+Layers are read back memory mapped.
+
+The cache is kept under a size limit by removing the least recently used
+layers. It is kept in the configuration directory unless [plot] layer_cache in
+the configuration file or the environment variable LIBCCHDO_PLOT_LAYER_CACHE
+says otherwise. The limit in megabytes is [plot] layer_cache_mb.
+
+"""
+import os
+import os.path
+import json
+from hashlib import sha1
+from tempfile import NamedTemporaryFile
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+
+import numpy as np
+from numpy import ma
+
+from libcchdo import config
+
+
+# Bump when the way layers are made changes. Layers of other versions are not
+# used again and are eventually evicted.
+LAYER_VERSION = 1
+
+
+DEFAULT_SIZE_MB = 512
+
+
+_DATA_SUFFIX = '.npy'
+
+
+_MASK_SUFFIX = '.mask.npy'
+
+
+def get_layer_cache_dir():
+    """Return the directory of the layer cache."""
+    try:
+        return config.get_option('plot', 'layer_cache')
+    except config.ConfigError:
+        return os.path.join(config.get_config_dir(), 'layer_cache')
+
+
+def get_layer_cache_size():
+    """Return the size limit of the layer cache in bytes."""
+    try:
+        size_mb = float(config.get_option('plot', 'layer_cache_mb'))
+    except config.ConfigError:
+        size_mb = DEFAULT_SIZE_MB
+    except ValueError, err:
+        log.error(u'Using a {0} MB layer cache. {1}'.format(
+            DEFAULT_SIZE_MB, err))
+        size_mb = DEFAULT_SIZE_MB
+    return int(size_mb * 2 ** 20)
+
+
+def layer_key(**params):
+    """Return the cache key for a layer made from params.
+
+    Values that are not JSON are keyed by their repr.
+
+    """
+    params['_layer_version'] = LAYER_VERSION
+    return sha1(json.dumps(params, sort_keys=True, default=repr)).hexdigest()
+
+
+class LayerCache(object):
+    """Least recently used layers in a directory, up to max_bytes in all."""
+
+    def __init__(self, directory=None, max_bytes=None):
+        if directory is None:
+            directory = get_layer_cache_dir()
+        if max_bytes is None:
+            max_bytes = get_layer_cache_size()
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key, suffix=_DATA_SUFFIX):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        """Return the memory mapped layer for key or None.
+
+        Masked layers are returned as masked arrays.
+
+        """
+        path = self._path(key)
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (IOError, OSError):
+            return None
+        except ValueError, err:
+            log.warn(u'Ignoring unreadable cached layer {0}: {1}'.format(
+                path, err))
+            return None
+        # Remember when the layer was last used for eviction.
+        os.utime(path, None)
+        mask_path = self._path(key, _MASK_SUFFIX)
+        if os.path.exists(mask_path):
+            return ma.masked_array(data, mask=np.load(mask_path, mmap_mode='r'))
+        return data
+
+    def _save(self, path, array):
+        """Save array to path so that it never appears partly written."""
+        with NamedTemporaryFile(
+                dir=self.directory, suffix='.tmp', delete=False) as fff:
+            np.save(fff, np.ascontiguousarray(array))
+        os.rename(fff.name, path)
+
+    def put(self, key, layer):
+        """Store the layer for key and evict layers over the size limit."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        layer = ma.asanyarray(layer)
+        mask = ma.getmask(layer)
+        mask_path = self._path(key, _MASK_SUFFIX)
+        if mask is ma.nomask:
+            if os.path.exists(mask_path):
+                os.remove(mask_path)
+        else:
+            self._save(mask_path, mask)
+        # The data is written last because get looks for it first.
+        self._save(self._path(key), ma.getdata(layer))
+        self.evict()
+
+    def entries(self):
+        """Return (last used, bytes, key) for each layer, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(_DATA_SUFFIX) or name.endswith(_MASK_SUFFIX):
+                continue
+            key = name[:-len(_DATA_SUFFIX)]
+            try:
+                stat = os.stat(self._path(key))
+                size = stat.st_size
+                if os.path.exists(self._path(key, _MASK_SUFFIX)):
+                    size += os.path.getsize(self._path(key, _MASK_SUFFIX))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, size, key))
+        return sorted(entries)
+
+    def remove(self, key):
+        for suffix in (_DATA_SUFFIX, _MASK_SUFFIX):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove the least recently used layers until under the size limit.
+
+        Returns:
+            the number of layers removed
+
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            log.debug(u'Evicting cached layer {0}'.format(key))
+            self.remove(key)
+            total -= size
+            removed += 1
+        return removed
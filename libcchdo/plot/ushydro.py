@@ -2,7 +2,9 @@ import os
 import geojson
 import numpy as np
 from math import atan2, pi, sin, cos
-from libcchdo.plot.etopo import ETOPOBasemap, np, colormap_ushydro
+from libcchdo.plot import render_frames
+from libcchdo.plot.etopo import (
+    ETOPOBasemap, np, colormap_ushydro, etopo_offset)
 # the import of pyplot into the namepsace must be done after etopo
 import matplotlib.pyplot as plt
 from matplotlib.offsetbox import (AnnotationBbox, TextArea, DrawingArea,
@@ -154,92 +156,142 @@ lines = []
 outlines = []
 b_outlines = []
 filenames = []
-def gen_plots(f, save_dir):
 
-    g = load_geojson(f)
-    
-    for i in range(len(g["features"]) + 2):
-        bm = ETOPOBasemap(projection='merc',llcrnrlat=-80,urcrnrlat=80,\
-                        llcrnrlon=20,urcrnrlon=380,lat_ts=20,resolution='c')
-        bm.draw_gmt_fancy_border(10)
-        bm.draw_etopo(5,5, cmtopo=colormap_ushydro)
-    
-        fig = plt.gcf()
-        ax = bm.axes
-        fig.set_dpi(180)
-        fig.set_size_inches(1024.0/180, 900.0/180)
-        fig.set_tight_layout(True)
-    
-        dates = []
-        for line in g["features"]:
-            l = style_text(line["properties"]["title"], font_style["line"])
-            years = []
-            for s in line["properties"]["completed"]:
-                years.append(style_text(s, font_style["complete"]))
-                dates.append(s)
-            for s in line["properties"]["pending"]:
-                years.append(style_text(s, font_style["pending"]))
-                dates.append(s)
-            y_max = max(dates)
-            y_min = min(dates)
-        
-            box1 = HPacker(children=years, align="center", pad=0, sep=2)
-            box = VPacker(children=[l,box1], align="center", pad=0, sep=2)
-        
-            lon, lat = line["properties"]["box"]
-            lonp, latp = bm(lon, lat)
-            
-            l = np.array(line["geometry"]["coordinates"])
-            lons, lats = [x + 360 if x < 20 else x for x in l[:, 0]], l[:, 1]
-            xs, ys = bm(lons, lats)
-    
-            if i < len(g["features"]) and g["features"][i] != line:
-                anchored_box = AnnotationBbox( box, (lonp,latp), fontsize=5,
-                    bboxprops=dict(alpha=0.5))
-                bm.plot(xs,ys,'k-', lw=2, solid_capstyle='round', alpha=0.5)
-    
-            elif i < len(g["features"]) or i == len(g["features"]):
-                anchored_box = AnnotationBbox( box, (lonp,latp), fontsize=5,
-                    bboxprops=dict(alpha=1.0))
-                bm.plot(xs,ys,'k-', lw=2, solid_capstyle='round', alpha=1.0)
-    
-            elif i == (len(g["features"]) + 1):
-                anchored_box = AnnotationBbox( box, (lonp,latp), fontsize=5,
-                    bboxprops=dict(alpha=0.5))
-                bm.plot(xs,ys,'k-', lw=2, solid_capstyle='round', alpha=0.5)
-        
-        
-            ax.add_artist(anchored_box)
-            if len(g["features"]) > len(outlines):
-                # There are magic numbers here, specifically the 1.21 - 124 and the
-                # 900. The 900 is the image height that needs to be reversed. The
-                # linear equation present was derived emperically, it may need to
-                # be changed in the future if the imagemaps seem to have an offset
-    
-                img_map = ax.transData.transform(zip(xs,ys))
-                outlines.append(outline(zip(img_map[:,0] * 1.21 - 124, 900 - img_map[:,1])))
+
+def projection():
+    return ETOPOBasemap(projection='merc',llcrnrlat=-80,urcrnrlat=80,\
+                    llcrnrlon=20,urcrnrlon=380,lat_ts=20,resolution='c')
+
+
+def base_map():
+    """Return the bathymetry that every frame shares."""
+    topo = projection().etopo_layer(5, 5)
+    # Frames are drawn on figures of their own
+    plt.close('all')
+    return topo
+
+
+def frame_filename(g, i):
+    ft = '.png'
+    if i < len(g["features"]):
+        return "ushydro_black_" + g['features'][i]['properties']['line'].split("/")[0] + ft
+    elif i == len(g["features"]):
+        return "ushydro_black" + ft
+    elif i == (len(g["features"]) + 1):
+        return "ushydro_grey" + ft
+
+
+def render_frame(g, i, topo, save_dir):
+    """Draw frame i of the maps on a figure of its own and save it.
+
+    Frames before len(g["features"]) highlight that feature, the next
+    highlights all of them and the last none.
+
+    Returns:
+        a tuple of the file name and a list of (line, outline, box outline)
+        for the image map
+
+    """
+    fig = plt.figure()
+    # A map of its own so that no axes state is shared between frames
+    bm = projection()
+    bm.hide_axes_borders()
+    bm.draw_gmt_fancy_border(10)
+    bm.imshow(topo, cmap=colormap_ushydro(topo, etopo_offset))
+
+    ax = bm.axes
+    fig.set_dpi(180)
+    fig.set_size_inches(1024.0/180, 900.0/180)
+    fig.set_tight_layout(True)
+
+    areas = []
+    dates = []
+    for line in g["features"]:
+        l = style_text(line["properties"]["title"], font_style["line"])
+        years = []
+        for s in line["properties"]["completed"]:
+            years.append(style_text(s, font_style["complete"]))
+            dates.append(s)
+        for s in line["properties"]["pending"]:
+            years.append(style_text(s, font_style["pending"]))
+            dates.append(s)
+        y_max = max(dates)
+        y_min = min(dates)
     
-                box = ax.transData.transform((lonp, latp))
-                b_outlines.append(box_outline((box[0] * 1.21 -124, 900 - box[1]), len(years)))
+        box1 = HPacker(children=years, align="center", pad=0, sep=2)
+        box = VPacker(children=[l,box1], align="center", pad=0, sep=2)
     
-                lines.append(line['properties']['line'])
+        lon, lat = line["properties"]["box"]
+        lonp, latp = bm(lon, lat)
         
-        t = generate_title(y_min, y_max, ax)
+        l = np.array(line["geometry"]["coordinates"])
+        lons, lats = [x + 360 if x < 20 else x for x in l[:, 0]], l[:, 1]
+        xs, ys = bm(lons, lats)
+
+        if i < len(g["features"]) and g["features"][i] != line:
+            anchored_box = AnnotationBbox( box, (lonp,latp), fontsize=5,
+                bboxprops=dict(alpha=0.5))
+            bm.plot(xs,ys,'k-', lw=2, solid_capstyle='round', alpha=0.5)
+
+        elif i < len(g["features"]) or i == len(g["features"]):
+            anchored_box = AnnotationBbox( box, (lonp,latp), fontsize=5,
+                bboxprops=dict(alpha=1.0))
+            bm.plot(xs,ys,'k-', lw=2, solid_capstyle='round', alpha=1.0)
+
+        elif i == (len(g["features"]) + 1):
+            anchored_box = AnnotationBbox( box, (lonp,latp), fontsize=5,
+                bboxprops=dict(alpha=0.5))
+            bm.plot(xs,ys,'k-', lw=2, solid_capstyle='round', alpha=0.5)
     
-        ax.add_artist(t)
     
-        ft = '.png'
-        if i < len(g["features"]):
-            filename = "ushydro_black_" + g['features'][i]['properties']['line'].split("/")[0] + ft
-        elif i == len(g["features"]):
-            filename = "ushydro_black" + ft
-        elif i == (len(g["features"]) + 1):
-            filename = "ushydro_grey" + ft
+        ax.add_artist(anchored_box)
+
+        # There are magic numbers here, specifically the 1.21 - 124 and the
+        # 900. The 900 is the image height that needs to be reversed. The
+        # linear equation present was derived emperically, it may need to
+        # be changed in the future if the imagemaps seem to have an offset
+
+        img_map = ax.transData.transform(zip(xs,ys))
+        box = ax.transData.transform((lonp, latp))
+        areas.append((
+            line['properties']['line'],
+            outline(zip(img_map[:,0] * 1.21 - 124, 900 - img_map[:,1])),
+            box_outline((box[0] * 1.21 -124, 900 - box[1]), len(years))))
     
-        filenames.append(filename)
-        plt.savefig(os.path.join(save_dir, filename), dpi=180, bbox="tight",
-                bbox_extra_artists=[t])
-        plt.clf()
+    t = generate_title(y_min, y_max, ax)
+
+    ax.add_artist(t)
+
+    filename = frame_filename(g, i)
+    fig.savefig(os.path.join(save_dir, filename), dpi=180, bbox="tight",
+            bbox_extra_artists=[t])
+    plt.close(fig)
+    return filename, areas
+
+
+def gen_plots(f, save_dir, jobs=1):
+    """Draw every frame of the maps into save_dir.
+
+    The bathymetry is made once and the frames are drawn by jobs
+    processes (see libcchdo.plot.render_frames). The image map outlines are
+    kept for gen_html.
+
+    """
+    g = load_geojson(f)
+    topo = base_map()
+
+    def render(i):
+        return render_frame(g, i, topo, save_dir)
+
+    results = render_frames(render, range(len(g["features"]) + 2), jobs)
+
+    del lines[:], outlines[:], b_outlines[:], filenames[:]
+    filenames.extend(filename for filename, _ in results)
+    # Every frame has the same outlines
+    for line, line_outline, b_outline in results[0][1]:
+        lines.append(line)
+        outlines.append(line_outline)
+        b_outlines.append(b_outline)
 
 def gen_html(base_url):
     print '''<body>'''
@@ -315,7 +367,7 @@ def gen_html(base_url):
     print '''</body>'''
 
 def genfrom_args(args, f):
-    gen_plots(f, args.save_dir)
+    gen_plots(f, args.save_dir, args.jobs)
     gen_html(args.html_prefix)
 
 if __name__ == "__main__":
@@ -8,7 +8,8 @@ available sub entry points, run
 $ hydro commands
 
 """
-from argparse import ArgumentParser, RawTextHelpFormatter, FileType
+from argparse import (
+    ArgumentParser, RawTextHelpFormatter, FileType, ArgumentTypeError)
 from datetime import datetime, date, timedelta
 from contextlib import closing, contextmanager
 from copy import copy
@@ -26,7 +27,10 @@ import libcchdo
 from libcchdo.log import setup as setup_logging
 setup_logging()
 from libcchdo.formats.formats import all_formats, read_arbitrary
+# Taken from the format manifest without importing any format module.
 known_formats = all_formats.keys()
+readable_formats = all_formats.readers()
+writable_formats = all_formats.writers()
 
 
 class NiceUsageArgumentParser(ArgumentParser):
@@ -95,22 +99,69 @@ def _qualify_oceansites_type(args):
             u'Printing a {0} OceanSITES NetCDF Zip'.format(args.timeseries))
 
 
+class LazyChoicesOceansitesVersions(LazyChoices):
+    """Lazy-load OceanSITES versions for better startup performance."""
+    def load(self):
+        """lazy load formats.netcdf_oceansites.OCEANSITES_VERSIONS."""
+        from libcchdo.formats.netcdf_oceansites import OCEANSITES_VERSIONS
+        return OCEANSITES_VERSIONS
+
+
+class LazyChoicesOceansitesTimeseries(LazyChoices):
+    """Lazy-load OceanSITES timeseries for better startup performance."""
+    def load(self):
+        """lazy load formats.netcdf_oceansites.OCEANSITES_TIMESERIES."""
+        from libcchdo.formats.netcdf_oceansites import OCEANSITES_TIMESERIES
+        return OCEANSITES_TIMESERIES
+
+
 def _add_oceansites_arguments(parser, allow_ts_select=True):
-    from libcchdo.formats.netcdf_oceansites import (
-        OCEANSITES_VERSIONS, OCEANSITES_TIMESERIES)
     with lazy_choices(parser):
-        default = OCEANSITES_VERSIONS[-1]
+        # The writers use the latest version when none is given.
         parser.add_argument(
-            '--os-version', choices=OCEANSITES_VERSIONS,
-            default=default,
-            help='OceanSITES version number (default: {0})'.format(default))
+            '--os-version', choices=LazyChoicesOceansitesVersions(),
+            default=None,
+            help='OceanSITES version number (default: latest)')
         if allow_ts_select:
             parser.add_argument(
                 'timeseries', type=str, nargs='?', default=None,
-                choices=OCEANSITES_TIMESERIES,
+                choices=LazyChoicesOceansitesTimeseries(),
                 help='timeseries location (default: None)')
 
 
+def _jobs(string):
+    """Parse a number of processes for --jobs."""
+    from libcchdo.parallel import check_jobs
+    try:
+        return check_jobs(int(string))
+    except ValueError, err:
+        raise ArgumentTypeError(unicode(err))
+
+
+def _add_jobs_option(parser, purpose):
+    """Add a --jobs argument for the number of processes to purpose with."""
+    parser.add_argument(
+        '-j', '--jobs', type=_jobs, default=1,
+        help='number of processes to {0}. 0 uses one per CPU '
+             '(default: 1)'.format(purpose))
+
+
+def _add_jobs_argument(parser):
+    """Add a --jobs argument for the number of processes for zip members.
+
+    The parser's main is wrapped to use that many processes.
+
+    """
+    _add_jobs_option(parser, 'read and write zip members with')
+    main = parser.get_default('main')
+
+    def main_with_jobs(args):
+        from libcchdo.formats.zip import jobs
+        with jobs(args.jobs):
+            return main(args)
+    parser.set_defaults(main=main_with_jobs)
+
+
 @contextmanager
 def subcommand(superparser, name, func):
     """Add a subcommand to the superparser and yield it."""
@@ -122,6 +173,14 @@ def subcommand(superparser, name, func):
 hydro_parser = NiceUsageArgumentParser(
     description='libcchdo tools',
     formatter_class=RawTextHelpFormatter)
+hydro_parser.add_argument(
+    '--profile', metavar='FILE', default=None,
+    help='profile the subcommand with cProfile and write the statistics to '
+         'FILE or, if FILE is -, print the slowest calls to stderr')
+hydro_parser.add_argument(
+    '--stage-times', metavar='FILE', default=None,
+    help='time the stages of reading and writing and write them as JSON to '
+         'FILE or, if FILE is -, print them as a table to stderr')
 
 
 hydro_subparsers = hydro_parser.add_subparsers(
@@ -136,124 +195,37 @@ check_parsers = check_parser.add_subparsers(
 
 def check_any(args):
     """Check the format for any recognized CCHDO file."""
-    import collections
-    from libcchdo.formats import woce
+    from libcchdo.check import check_files
+    from libcchdo.formats.zip import get_jobs
 
-    with closing(args.cchdo_file) as in_file:
-        try:
-            file = read_arbitrary(in_file, args.input_type)
-        except Exception, e:
-            log.error('Unable to read file {0}:\n{1}'.format(
-                args.cchdo_file, format_exc(e)))
-            hydro_parser.exit(1) 
-
-    # Water Quality flags that require fill value
-    flags_fill = [1, 5, 9]
-    not_water_parameters = ['BTLNBR']
-
-    def check_fill_value_has_flag_w_9(df):
-        for c in df.columns.values():
-            if not c.flags_woce:
-                continue
-            if c.parameter.name in not_water_parameters:
-                continue
-
-            if len(c.flags_woce) != len(c.values):
-                log.error(u'column {0} has different number of values ({1}) '
-                    'and flags ({2})'.format(
-                        c.parameter.name, len(c.values), len(c.flags_woce)))
-
-            for i in range(len(df)):
-                value = c[i]
-                flag = c.flags_woce[i]
-                is_fill_value = value is None
-                require_fill_value = flag in flags_fill
-                if require_fill_value and not is_fill_value:
-                    log.warn(
-                        (u'column {0} row {1} has data {2!r} but expected '
-                         'fill value for flag {3}: {4!r}').format(
-                            c.parameter.name, i, value, flag,
-                            woce.WATER_SAMPLE_FLAGS[flag]))
-                elif is_fill_value and not require_fill_value:
-                    log.warn(
-                        (u'column {0} row {1} has unexpected fill value for '
-                         'flag {2}: {3!r}').format(
-                            c.parameter.name, i, flag,
-                            woce.WATER_SAMPLE_FLAGS.get(flag, 'Unknown flag')))
-
-    def check_empty_columns(dfile):
-        for c in dfile.columns.values():
-            if c.values and c.values[0] is None and c.is_global():
-                log.info(u'column {0} is empty (only has fill values)'.format(
-                    c.parameter.name))
-
-    def check_blank_values(dfile):
-        for c in dfile.columns.values():
-            blanks = [(i, True) for i,v in enumerate(c) if v == ""]
-            if any(blanks):
-                rows = ",".join([str(b[0]) for b in blanks])
-                log.error((u'column {0} is has blank values on row(s) {1}'
-                        u', conversions may fail').format(
-                    c.parameter.name, rows))
-
-
-    def check_flag_0(dfile):
-        """Data should not have flag 0."""
-        for col in dfile.columns.values():
-            try:
-                index = col.flags_woce.index(0)
-                log.warn(u'column {0} has flag 0 at row {1}'.format(
-                    col.parameter.name, index))
-            except ValueError:
-                pass
-
-    def check_datafile(df):
-        log.info(u'Checking datafile format')
-        df.check_and_replace_parameters(convert=False)
-        check_fill_value_has_flag_w_9(df)
-        check_empty_columns(df)
-        check_flag_0(df)
-        check_blank_values(df)
-        if args.verify_unique:
-            check_cols = []
-            for col in args.verify_unique:
-                check_cols.append(df.columns[col].values)
-            check_cols = zip(*check_cols)
-            unique_pairs = set(check_cols)
-            # the integers can be large and will not satisfy 'is' conditions
-            # because they will not be the same object
-            if len(check_cols) != len(unique_pairs):
-                log.warn("Non unique values for columns ({0})".format(
-                                ",".join(args.verify_unique)
-                                ))
-                non_unique = [x for x, y in
-                        collections.Counter(check_cols).items()
-                        if y > 1]
-                log.warn("The following are duplicated")
-                for item in non_unique:
-                    item = zip(args.verify_unique, item)
-                    log.warn(", ".join(["{0}: {1}".format(*i) for i in item]))
+    try:
+        report = check_files(
+            args.cchdo_file, args.input_type, args.verify_unique, get_jobs())
+    finally:
+        for in_file in args.cchdo_file:
+            in_file.close()
 
-    with closing(args.output) as out_file:
-        try:
-            for f in file.files:
-                check_datafile(f)
-        except AttributeError:
-            check_datafile(file)
+    report.log_summary()
+    if args.json:
+        with closing(args.json) as out_file:
+            report.write_json(out_file)
+    if report.errors():
+        hydro_parser.exit(1)
 
 
 with subcommand(check_parsers, 'any', check_any) as p:
-    p.add_argument('-i', '--input-type', choices=known_formats,
+    p.add_argument('-i', '--input-type', choices=readable_formats,
         help='force the input file to be read as the specified type')
     p.add_argument(
-        'cchdo_file', type=FileType('r'),
-         help='any recognized CCHDO file')
+        'cchdo_file', type=FileType('r'), nargs='+',
+         help='any recognized CCHDO files')
     p.add_argument(
-        'output', type=FileType('w'), nargs='?', default=sys.stdout,
-         help='output file (default: stdout)')
+        '--json', type=FileType('w'), default=None,
+         help='write a JSON report of the problems to this file')
     p.add_argument(
         '--verify_unique', nargs='*',
         help='list of columns used to form unique key')
+    _add_jobs_argument(p)
 
 
 converter_parser = hydro_subparsers.add_parser(
@@ -298,9 +270,9 @@ def any_to_type(args):
 
 with subcommand(any_converter_parsers, 'type', any_to_type) as p:
     p.add_argument('-t', '--output-type', '--type',
-        choices=['str', 'dict', 'google_wire', 'nav', ] + known_formats,
+        choices=['str', 'dict', 'google_wire', 'nav', ] + writable_formats,
         default='str', help='output types (default: str)')
-    p.add_argument('-i', '--input-type', choices=known_formats,
+    p.add_argument('-i', '--input-type', choices=readable_formats,
         help='force the input file to be read as the specified type')
     p.add_argument('-j', '--json', action='store_true',
         help='only applies to output type google_wire. Forces the google_wire '
@@ -313,11 +285,49 @@ with subcommand(any_converter_parsers, 'type', any_to_type) as p:
          help='output file (default: stdout)')
 
 
+def _read_station_headers(in_file, file_type=None, use_index=False):
+    """Read a file for its station headers.
+
+    With use_index, the station headers of CTD ZIP Exchange files on disk come
+    from the header index. If the index cannot be opened or written, or for
+    any other file, the file is read whole.
+
+    """
+    if not use_index:
+        return read_arbitrary(in_file, file_type)
+
+    import sqlite3
+    from libcchdo.formats.formats import guess_file_type_from_file
+
+    try:
+        file_type = guess_file_type_from_file(in_file, file_type)
+        path = in_file.name
+    except (ValueError, AttributeError):
+        return read_arbitrary(in_file, file_type)
+    if file_type == 'ctd.zip.ex' and os.path.isfile(path):
+        from libcchdo.model.header_index import HeaderIndex
+        try:
+            with closing(HeaderIndex()) as index:
+                return index.read_headers(path, file_type)
+        except (OSError, IOError, sqlite3.Error), e:
+            log.warn(u'Unable to use the header index: {0}'.format(e))
+    return read_arbitrary(in_file, file_type)
+
+
+def _add_header_index_argument(parser):
+    parser.add_argument(
+        '--header-index', action='store_true',
+        help='take the station headers of CTD ZIP Exchange files from the '
+             'header index, indexing them if needed (see hydro misc '
+             'header_index)')
+
+
 def any_to_kml(args):
     from libcchdo.kml import any_to_kml
 
     with closing(args.cchdo_file) as in_file:
-        file = read_arbitrary(in_file, args.input_type)
+        file = _read_station_headers(
+            in_file, args.input_type, args.header_index)
 
     with closing(args.output) as out_file:
         any_to_kml(file, out_file)
@@ -327,8 +337,9 @@ with subcommand(any_converter_parsers, 'kml', any_to_kml) as p:
     p.add_argument(
         'cchdo_file', type=FileType('r'),
         help='any recognized CCHDO file')
-    p.add_argument('-i', '--input-type', choices=known_formats,
+    p.add_argument('-i', '--input-type', choices=readable_formats,
         help='force the input file to be read as the specified type')
+    _add_header_index_argument(p)
     p.add_argument(
         'output', type=FileType('w'), nargs='?', default=sys.stdout,
         help='output file (default: stdout)')
@@ -428,12 +439,11 @@ def btlex_to_btlwoce(args):
     dfile = DataFile()
 
     with closing(args.input_btlex) as in_file:
-        btlex.read(dfile, in_file)
-
-    dfile.globals['stamp'] = stamp()
+        chunks = btlex.read_chunks(dfile, in_file)
+        dfile.globals['stamp'] = stamp()
 
-    with closing(args.output_btlwoce) as out_file:
-        btlwoce.write(dfile, out_file)
+        with closing(args.output_btlwoce) as out_file:
+            btlwoce.write_chunks(dfile, out_file, chunks)
 
 
 with subcommand(bot_converter_parsers, 'exchange_to_woce',
@@ -471,6 +481,7 @@ with subcommand(bot_converter_parsers, 'exchange_to_zip_netcdf',
         'output_botzipnc', type=FileType('w'), nargs='?',
         default=sys.stdout,
         help='output Bottle ZIP NetCDF file (default: stdout)')
+    _add_jobs_argument(p)
 
 
 def bottle_woce_and_summary_woce_to_bottle_exchange(args):
@@ -592,6 +603,7 @@ with subcommand(ctd_converter_parsers, 'pangea_to_ctdzipex',
         'ctdzip_exchange', type=FileType('wb'), nargs='?',
         default=sys.stdout,
         help='output CTD ZIP Exchange file')
+    _add_jobs_argument(p)
 
 
 def ctd_polarstern_to_ctd_exchange(args):
@@ -739,6 +751,7 @@ with subcommand(ctd_converter_parsers, 'zip_andrex_to_zip_exchange',
         'ctdzipex', type=FileType('w'), nargs='?',
         default=sys.stdout,
         help='output CTD ZIP Exchange file')
+    _add_jobs_argument(p)
 
 
 def ctdzip_exchange_to_ctdzip_netcdf(args):
@@ -767,6 +780,7 @@ with subcommand(ctd_converter_parsers, 'zip_exchange_to_zip_netcdf',
         'ctdzipnc', type=FileType('w'), nargs='?',
         default=sys.stdout,
         help='output CTD ZIP NetCDF file')
+    _add_jobs_argument(p)
 
 
 def ctdzip_exchange_to_ctdzip_netcdf_oceansites(args):
@@ -794,6 +808,7 @@ with subcommand(ctd_converter_parsers, 'zip_exchange_to_zip_netcdf_oceansites',
     p.add_argument(
         'ctdzipnc_os', type=FileType('w'), nargs='?', default=sys.stdout,
         help='output CTD ZIP NetCDF OceanSITES file')
+    _add_jobs_argument(p)
 
 
 def ctdzip_netcdf_to_ctdzip_netcdf_oceansites(args):
@@ -821,6 +836,7 @@ with subcommand(ctd_converter_parsers, 'zip_netcdf_to_zip_netcdf_oceansites',
     p.add_argument(
         'ctdzipnc_os', type=FileType('w'), nargs='?', default=sys.stdout,
         help='output CTD ZIP NetCDF OceanSITES file')
+    _add_jobs_argument(p)
 
 
 def ctdzip_woce_and_summary_woce_to_ctdzip_exchange(args):
@@ -858,6 +874,7 @@ with subcommand(ctd_converter_parsers,
     p.add_argument(
         'ctdzipex', type=FileType('w'), nargs='?', default=sys.stdout,
         help='output CTD ZIP Exchange file')
+    _add_jobs_argument(p)
 
 
 sum_converter_parser = converter_parsers.add_parser(
@@ -950,7 +967,7 @@ def explore_any(args):
 
 
 with subcommand(misc_converter_parsers, 'explore_any', explore_any) as p:
-    p.add_argument('-i', '--input-type', choices=known_formats,
+    p.add_argument('-i', '--input-type', choices=readable_formats,
         help='force the input file to be read as the specified type')
     p.add_argument(
         'cchdo_files', type=FileType('r'), nargs='+',
@@ -1450,8 +1467,13 @@ def plot_battery(args):
 
     Used when matching style to GMT.
 
+    Plots are drawn by --jobs processes. The etopo layer of each map is
+    projected once into the layer cache before the plots that share it are
+    drawn.
+
     """
-    from libcchdo.plot.etopo import plt
+    from libcchdo.plot import render_frames
+    from libcchdo.plot.etopo import plt, ETOPOBasemap
     root = 'etopo_battery'
     try:
         os.mkdir(root)
@@ -1460,22 +1482,23 @@ def plot_battery(args):
     projections = ['merc', 'robin', 'spstere', 'npstere']
     cmaps = ['gray', 'cberys']
 
+    frames = []
     for proj in projections:
-        iargs = copy(args)
-        iargs.projection = proj
+        pargs = copy(args)
+        pargs.projection = proj
         if proj == 'merc':
-            iargs.bounds_cylindrical = [25, -80, 385, 80]
+            pargs.bounds_cylindrical = [25, -80, 385, 80]
         elif proj == 'spstere':
-            iargs.minutes = 5
+            pargs.minutes = 5
         elif proj == 'npstere':
-            iargs.minutes = 2
+            pargs.minutes = 2
 
         for cmap in cmaps:
+            iargs = copy(pargs)
             iargs.cmap = cmap
             iargs.output_filename = os.path.join(
                 root, '{0}_{1}.png'.format(proj, cmap[0]))
-            plot_etopo(iargs)
-            plt.clf()
+            frames.append(iargs)
 
     iargs = copy(args)
     iargs.projection = 'merc'
@@ -1484,8 +1507,7 @@ def plot_battery(args):
     iargs.width = 480
     iargs.bounds_cylindrical = [110, -10, 160, 40]
     iargs.minutes = 2
-    plot_etopo(iargs)
-    plt.clf()
+    frames.append(iargs)
 
     iargs = copy(args)
     iargs.projection = 'merc'
@@ -1494,11 +1516,33 @@ def plot_battery(args):
     iargs.width = 720
     iargs.bounds_cylindrical = [130, 30, 150, 45]
     iargs.minutes = 2
-    plot_etopo(iargs)
+    frames.append(iargs)
+
+    def project(iargs):
+        ETOPOBasemap.new_from_projection(iargs.projection, iargs).etopo_layer(
+            iargs.minutes, ETOPOBasemap.ARGPARSER_ETOPO_CUT,
+            ETOPOBasemap.ARGPARSER_ETOPO_VERSION)
+        plt.close('all')
+
+    def render(iargs):
+        plt.figure()
+        plot_etopo(iargs)
+        plt.close('all')
+
+    if not args.no_etopo:
+        maps = {}
+        for iargs in frames:
+            geometry = repr((
+                iargs.projection, iargs.bounds_cylindrical,
+                iargs.bounds_elliptical, iargs.minutes))
+            maps.setdefault(geometry, iargs)
+        render_frames(project, maps.values(), args.jobs)
+    render_frames(render, frames, args.jobs)
 
 
 with subcommand(plot_parsers, 'battery', plot_battery) as p:
     _add_plot_etopo_arguments(p)
+    _add_jobs_option(p, 'draw plots with')
 
 
 def plot_cruise_json(args):
@@ -1616,6 +1660,7 @@ with subcommand(plot_parsers, 'ushydro', plot_ushydro) as p:
             '--html-prefix',
             default="/images/map_images/", help=("Define the location the maps will"
             "exist on the server, this modifies the html output"),)
+    _add_jobs_option(p, 'draw plots with')
 
 
 def plot_data_holdings_around(args):
@@ -1807,13 +1852,95 @@ def get_bounds(args):
     """Take any readable file and output the bounding box"""
     from libcchdo.model.navcoord import iter_coords, NavCoords, print_bounds
 
-    df = read_arbitrary(args.cchdo_file)
+    with closing(args.cchdo_file) as in_file:
+        df = _read_station_headers(in_file, use_index=args.header_index)
     iter_coords(df, NavCoords, print_bounds)
 
 
 with subcommand(misc_parsers, "get_bounds", get_bounds) as p:
     p.add_argument('cchdo_file', type=FileType('r'),
             help='any recognized CCHDO file')
+    _add_header_index_argument(p)
+
+
+def _parse_datetime(string):
+    """Parse a date YYYY-MM-DD or datetime YYYY-MM-DDTHH:MM."""
+    for fmt, is_date in [('%Y-%m-%d', True), ('%Y-%m-%dT%H:%M', False),
+                         ('%Y-%m-%dT%H:%M:%S', False)]:
+        try:
+            dtime = datetime.strptime(string, fmt)
+        except ValueError:
+            continue
+        if is_date:
+            return dtime.date()
+        return dtime
+    raise ValueError(u'Expected YYYY-MM-DD or YYYY-MM-DDTHH:MM')
+
+
+def header_index(args):
+    """Query the station headers of CTD and bottle archives.
+
+    The given archives are indexed if they are not indexed yet or have changed.
+    Queries are answered from the index without opening the archives.
+
+    """
+    from libcchdo.model.header_index import HeaderIndex
+
+    with closing(HeaderIndex(args.index)) as index:
+        if args.prune:
+            index.prune()
+        index.update(args.archives, args.input_type)
+        paths = args.archives or None
+        stations = index.query(
+            paths=paths, bbox=args.bbox, start=args.start, end=args.end,
+            parameters=args.parameters, expocode=args.expocode)
+
+    with closing(args.output) as out_file:
+        for station in stations:
+            path = station.path
+            if station.member is not None:
+                path += '#' + station.member
+            values = [
+                path, station.expocode, station.stnnbr, station.castno,
+                station.latitude, station.longitude, station.datetime,
+                station.depth, station.rows]
+            out_file.write(u'\t'.join(
+                [u'' if val is None else unicode(val) for val in values]))
+            out_file.write(u'\n')
+
+
+with subcommand(misc_parsers, 'header_index', header_index) as p:
+    p.add_argument(
+        '--index', default=None,
+        help='header index database (default: header_index.db in the '
+             'configuration directory)')
+    p.add_argument(
+        '-i', '--input-type', choices=['ctd.zip.ex', 'ctd.ex', 'btl.ex'],
+        help='force the archives to be read as the specified type')
+    p.add_argument(
+        '--bbox', type=float, nargs=4, metavar=('W', 'S', 'E', 'N'),
+        help='only stations in the bounding box')
+    p.add_argument(
+        '--start', type=_parse_datetime,
+        help='only stations at or after YYYY-MM-DD[THH:MM]')
+    p.add_argument(
+        '--end', type=_parse_datetime,
+        help='only stations at or before YYYY-MM-DD[THH:MM]')
+    p.add_argument(
+        '-p', '--parameter', dest='parameters', action='append',
+        help='only stations that have the parameter. May be repeated.')
+    p.add_argument(
+        '--expocode', help='only stations with the EXPOCODE')
+    p.add_argument(
+        '--prune', action='store_true',
+        help='remove archives that no longer exist from the index')
+    p.add_argument(
+        '-o', '--output', type=FileType('w'), default=sys.stdout,
+        help='output file (default: stdout)')
+    p.add_argument(
+        'archives', nargs='*',
+        help='archives to index and query (default: query all indexed '
+             'archives)')
 
 
 def regen_db_cache(args):
@@ -1877,7 +2004,7 @@ def canon(args):
 
 with subcommand(misc_parsers, 'canon', canon) as p:
     p.add_argument('-i', '--input-type',
-        choices=known_formats,
+        choices=readable_formats,
         help='force the input file to be read as the specified type')
     p.add_argument(
         'input_file', type=FileType('r'),
@@ -1927,7 +2054,7 @@ def reorder_columns(args):
 
 with subcommand(misc_parsers, 'reorder_columns', reorder_columns) as p:
     p.add_argument('-i', '--input-type',
-        choices=known_formats,
+        choices=readable_formats,
         help='force the input file to be read as the specified type')
     p.add_argument('-o', '--order', default=None,
         help='comma separated list of parameter mnemonics in order they should '
@@ -2030,6 +2157,78 @@ with subcommand(misc_parsers, 'reorder_surface_to_bottom',
         help='Order by non-descending bottle number (default: False)')
 
 
+def bench(args):
+    """Time reading, writing and processing synthetic cruise data.
+
+    The timings are written as JSON that can be given to --compare on another
+    commit.
+
+    """
+    from libcchdo.bench import (
+        Scale, select, run, write_results, load_results, compare)
+
+    if args.list:
+        for name in select(args.benchmarks):
+            print name
+        return
+
+    baseline = None
+    if args.compare:
+        with closing(args.compare) as in_file:
+            baseline = load_results(in_file)
+
+    scale = Scale(args.casts, args.bottles, args.levels, args.parameters)
+    results = run(args.benchmarks, scale, args.repeat, args.seed)
+
+    for name, result in results['benchmarks'].items():
+        if 'skipped' in result:
+            print u'{0:<48} skipped: {1}'.format(name, result['skipped'])
+        else:
+            print u'{0:<48} {1:10.4f}s'.format(name, result['min'])
+    if baseline:
+        print
+        for name, before, after, ratio, change in compare(baseline, results):
+            print u'{0:<48} {1:10.4f}s {2:10.4f}s {3:6.2f}x {4}'.format(
+                name, before, after, ratio, change)
+    if args.output:
+        with closing(args.output) as out_file:
+            write_results(results, out_file)
+
+
+with subcommand(misc_parsers, 'bench', bench) as p:
+    p.add_argument(
+        '-o', '--output', type=FileType('w'), default=None,
+        help='write the results as JSON to this file')
+    p.add_argument(
+        '--compare', type=FileType('r'), default=None,
+        help='compare with the JSON results of an earlier run')
+    p.add_argument(
+        '--list', action='store_true',
+        help='list the benchmarks instead of running them')
+    p.add_argument(
+        '--casts', type=int, default=20,
+        help='number of casts (default: 20)')
+    p.add_argument(
+        '--bottles', type=int, default=36,
+        help='number of bottles on each cast (default: 36)')
+    p.add_argument(
+        '--levels', type=int, default=1000,
+        help='number of CTD levels on each cast (default: 1000)')
+    p.add_argument(
+        '--parameters', type=int, default=12,
+        help='number of measured bottle parameters (default: 12)')
+    p.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of times to run each benchmark (default: 3)')
+    p.add_argument(
+        '--seed', type=int, default=0,
+        help='seed for the synthetic data (default: 0)')
+    p.add_argument(
+        'benchmarks', nargs='*',
+        help='glob patterns of the benchmarks to run, e.g. read/* '
+             '(default: all)')
+
+
 def shell(args):
     """Load libcchdo and drop into a REPL."""
     import libcchdo
@@ -2211,13 +2410,48 @@ except ImportError:
     pass
     
 
+def _run_profiled(args):
+    """Run the subcommand with cProfile."""
+    from cProfile import Profile
+    from pstats import Stats
+
+    profiler = Profile()
+    try:
+        return profiler.runcall(args.main, args)
+    finally:
+        if args.profile == '-':
+            stats = Stats(profiler, stream=sys.stderr)
+            stats.sort_stats('cumulative').print_stats(40)
+        else:
+            profiler.dump_stats(args.profile)
+
+
+def _write_stage_times(timer, path):
+    if path == '-':
+        sys.stderr.write(timer.format_table())
+    else:
+        with open(path, 'w') as out_file:
+            timer.write_json(out_file)
+
+
 def main():
     """The main program that wraps all subcommands."""
     from libcchdo.db.model import ignore_sa_warnings
+    from libcchdo import timing
 
     args = hydro_parser.parse_args()
+    if args.stage_times:
+        timing.enable()
     with ignore_sa_warnings():
         try:
-            hydro_parser.exit(args.main(args))
+            try:
+                if args.profile:
+                    status = _run_profiled(args)
+                else:
+                    status = args.main(args)
+            finally:
+                if args.stage_times:
+                    _write_stage_times(timing.disable(), args.stage_times)
+            hydro_parser.exit(status)
         except Exception, err:
             log.critical(format_exc(err))
@@ -2,7 +2,7 @@
 
 from unittest import TestCase
 
-from libcchdo.algorithms import depth
+from libcchdo.algorithms import depth, eos, volume
 from libcchdo.fns import _decimal
 
 class TestAlgorithmsDepth(TestCase):
@@ -33,3 +33,45 @@ class TestAlgorithmsDepth(TestCase):
     def test_depth_unesco(self):
         print depth.depth_unesco(1, 0)
         # TODO
+
+
+class TestAlgorithmsEOS(TestCase):
+
+    def test_grav_ocean_surface_wrt_latitude(self):
+        self.assertAlmostEqual(
+            9.80738775, eos.grav_ocean_surface_wrt_latitude(-60.4987683333))
+
+    def test_depth(self):
+        """Integration is the same as the Decimal reference."""
+        pres = [1, 2, 3, 4, 5]
+        rho = [5, 4, 3, 2, 1]
+        for aaa, bbb in zip(depth.depth(9.8, pres, rho),
+                            eos.depth(9.8, pres, rho)):
+            self.assertAlmostEqual(float(aaa), bbb, 9)
+        self.assertEqual([0], eos.depth(9.8, [16], [2]).tolist())
+        self.assertRaises(AssertionError, eos.depth, 9.8, [1, 2], [1])
+
+    def test_missing(self):
+        """Missing inputs are masked in the result."""
+        densities = eos.density([35, None, 35], [25, 25, 25], [0, 0, 0])
+        self.assertEqual([False, True, False], densities.mask.tolist())
+        self.assertEqual([_decimal('1023.3430584772268'), None,
+                          _decimal('1023.3430584772268')],
+                         eos.to_decimals(densities))
+        self.assertEqual(None, eos.to_decimals(eos.depth_unesco([None], 30))[0])
+
+    def test_same_as_decimal(self):
+        """The array engine agrees with the Decimal reference."""
+        for sss, ttt, ppp in [(34.5, 2.5, 4000), (35.1, 20.1, 1), (0, 5, 0)]:
+            self.assertAlmostEqual(
+                float(depth.density(sss, ttt, ppp)),
+                eos.density(sss, ttt, ppp), 9)
+            self.assertAlmostEqual(
+                float(depth.secant_bulk_modulus(sss, ttt, ppp)),
+                eos.secant_bulk_modulus(sss, ttt, ppp), 7)
+            self.assertAlmostEqual(
+                float(depth.depth_unesco(_decimal(ppp or 1), _decimal(-30))),
+                eos.depth_unesco(ppp or 1, -30), 9)
+            self.assertAlmostEqual(
+                float(volume.sigma_r(0, 0, _decimal(ttt), _decimal(sss))),
+                eos.sigma_r(0, 0, ttt, sss), 9)
@@ -0,0 +1,116 @@
+"""Test the benchmark harness and synthetic data."""
+
+from collections import OrderedDict
+from StringIO import StringIO
+
+from libcchdo import bench
+from libcchdo.bench import synthetic
+
+from libcchdo.tests import BaseTestCase
+
+
+class TestSynthetic(BaseTestCase):
+
+    def setUp(self):
+        super(TestSynthetic, self).setUp()
+        self.scale = synthetic.Scale(casts=2, bottles=4, levels=5, parameters=6)
+
+    def test_deterministic(self):
+        """The same seed gives the same data and another seed does not."""
+        dfile = synthetic.bottle_file(self.scale, seed=1)
+        same = synthetic.bottle_file(self.scale, seed=1)
+        other = synthetic.bottle_file(self.scale, seed=2)
+        self.assertEqual(len(dfile), 8)
+        for name in ['CTDPRS', 'OXYGEN', 'SILCAT']:
+            self.assertEqual(
+                list(dfile[name].values), list(same[name].values))
+            self.assertEqual(
+                list(dfile[name].flags_woce), list(same[name].flags_woce))
+        self.assertNotEqual(
+            list(dfile['OXYGEN'].values), list(other['OXYGEN'].values))
+
+    def test_scale(self):
+        """Files have the requested casts, rows and parameters."""
+        dfile = synthetic.bottle_file(self.scale)
+        self.assertEqual(
+            dfile.columns.keys()[-6:],
+            [name for name, _, _, _, _ in synthetic.BOTTLE_PARAMETERS[:6]])
+        self.assertEqual(sorted(set(dfile['STNNBR'].values)), ['1', '2'])
+
+        dfc = synthetic.ctd_collection(self.scale)
+        self.assertEqual(len(dfc.files), 2)
+        self.assertEqual([len(dfile) for dfile in dfc.files], [5, 5])
+        self.assertEqual(
+            dfc.files[0].columns.keys(),
+            ['CTDPRS', 'CTDTMP', 'CTDSAL', 'CTDOXY'])
+
+        self.assertEqual(len(synthetic.summary_file(self.scale)), 4)
+        self.assertRaises(ValueError, synthetic.Scale, parameters=0)
+
+    def test_fill(self):
+        """Missing values are flagged 9."""
+        dfile = synthetic.bottle_file(synthetic.Scale(casts=5))
+        column = dfile['OXYGEN']
+        flags = [flag for value, flag in zip(column.values, column.flags_woce)
+                 if value is None]
+        self.assertTrue(flags)
+        self.assertEqual(set(flags), set([9]))
+
+
+class TestBench(BaseTestCase):
+
+    def test_select(self):
+        """Benchmarks are selected by glob patterns."""
+        self.assertEqual(
+            bench.select(['read/btl.*']),
+            ['read/btl.ex', 'read/btl.woce', 'read/btl.zip.nc'])
+        self.assertEqual(bench.select(['nothing']), [])
+        self.assertTrue(len(bench.select()) > 10)
+
+    def test_run(self):
+        """Selected benchmarks are timed on tiny inputs."""
+        scale = synthetic.Scale(casts=2, bottles=3, levels=4, parameters=6)
+        results = bench.run(
+            ['read/btl.ex', 'write/ctd.zip.ex', 'units/*'], scale, repeat=2)
+        self.assertEqual(results['scale'], scale.to_dict())
+        self.assertEqual(
+            results['benchmarks'].keys(),
+            ['read/btl.ex', 'write/ctd.zip.ex',
+             'units/milliliter_per_liter_to_umol_per_kg',
+             'units/mol_per_liter_to_mol_per_kg'])
+        for result in results['benchmarks'].values():
+            self.assertEqual(len(result['times']), 2)
+            self.assertEqual(result['min'], min(result['times']))
+
+    def test_skip(self):
+        """Benchmarks that need parameters the inputs lack are skipped."""
+        scale = synthetic.Scale(casts=1, bottles=2, levels=2, parameters=2)
+        results = bench.run(['units/*'], scale, repeat=1)
+        for result in results['benchmarks'].values():
+            self.assertTrue('skipped' in result)
+
+    def test_results_compare(self):
+        """Results are written as JSON and compared by minimum time."""
+        def results(times):
+            return OrderedDict([
+                ('version', bench.RESULTS_VERSION),
+                ('scale', synthetic.Scale().to_dict()),
+                ('seed', 0),
+                ('benchmarks', OrderedDict(
+                    (name, {'min': time}) for name, time in times)),
+            ])
+        fileobj = StringIO()
+        bench.write_results(
+            results([('a', 1.0), ('b', 1.0), ('c', 1.0), ('gone', 1.0)]),
+            fileobj)
+        fileobj.seek(0)
+        baseline = bench.load_results(fileobj)
+        self.assertEqual(
+            bench.compare(baseline, results(
+                [('a', 2.0), ('b', 0.5), ('c', 1.05), ('new', 1.0)])),
+            [('a', 1.0, 2.0, 2.0, 'slower'),
+             ('b', 1.0, 0.5, 0.5, 'faster'),
+             ('c', 1.0, 1.05, 1.05, '')])
+
+        self.assertRaises(
+            ValueError, bench.load_results, StringIO('{"version": 0}'))
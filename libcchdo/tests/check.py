@@ -0,0 +1,123 @@
+"""Test checking DataFiles."""
+
+import json
+from StringIO import StringIO
+
+from libcchdo.fns import Decimal
+from libcchdo.model.datafile import DataFile, column_storage
+from libcchdo import check
+
+from libcchdo.tests import BaseTestCase, sample_file
+
+
+class TestCheck(BaseTestCase):
+
+    def _dfile(self):
+        dfile = DataFile()
+        dfile.create_columns(['STNNBR', 'CASTNO', 'CTDSAL', 'OXYGEN', 'TDN'])
+        dfile['STNNBR'].values = ['1', '1', '1', '2', '2', '']
+        dfile['CASTNO'].values = [1, 1, 2, 1, 2, 3]
+        dfile['CTDSAL'].values = [
+            Decimal('34.1'), None, Decimal('34.3'), Decimal('34.4'), None,
+            Decimal('34.6')]
+        dfile['CTDSAL'].flags_woce = [2, 2, 9, 9, 9, 0]
+        dfile['OXYGEN'].values = [None, None, Decimal('210.1'), None, None, None]
+        dfile['OXYGEN'].flags_woce = [5, 5, 2, 1, 9, 9]
+        dfile['TDN'].values = [None] * 6
+        return dfile
+
+    def _violations(self, violations):
+        return sorted(
+            (vvv.rule, vvv.column, vvv.flag, vvv.ranges) for vvv in violations)
+
+    def test_row_ranges(self):
+        """Runs of selected rows become inclusive ranges."""
+        self.assertEqual([], check.row_ranges([False, False]))
+        self.assertEqual(
+            [[0, 1], [3, 3], [5, 6]],
+            check.row_ranges([True, True, False, True, False, True, True]))
+        self.assertEqual(
+            '0-1,3 and 1 more',
+            check.format_ranges([[0, 1], [3, 3], [5, 6]], limit=2))
+
+    def test_check_datafile(self):
+        """Each rule gives the ranges of the rows that do not satisfy it."""
+        expected = [
+            ('blank_value', 'STNNBR', None, [[5, 5]]),
+            ('data_with_fill_flag', 'CTDSAL', 9, [[2, 3]]),
+            ('empty_column', 'TDN', None, [[0, 5]]),
+            ('fill_without_fill_flag', 'CTDSAL', 2, [[1, 1]]),
+            ('flag_0', 'CTDSAL', 0, [[5, 5]]),
+        ]
+        for storage in ('list', 'array'):
+            with column_storage(storage):
+                dfile = self._dfile()
+            self.assertEqual(
+                expected, self._violations(check.check_datafile(dfile)))
+
+    def test_check_flag_count(self):
+        """Columns with more values than flags are checked as far as they go.
+
+        """
+        dfile = self._dfile()
+        dfile['CTDSAL'].flags_woce = [2, 2]
+        self.assertEqual(
+            [('fill_without_fill_flag', 'CTDSAL', 2, [[1, 1]]),
+             ('flag_count', 'CTDSAL', None, [])],
+            self._violations(check.check_flag_fill_values(dfile['CTDSAL'])))
+
+    def test_check_unique(self):
+        """Rows with the same key are reported."""
+        dfile = self._dfile()
+        violations = check.check_datafile(dfile, unique=['STNNBR', 'CASTNO'])
+        non_unique = [vvv for vvv in violations if vvv.rule == 'non_unique']
+        self.assertEqual(1, len(non_unique))
+        self.assertEqual([[0, 1]], non_unique[0].ranges)
+        self.assertTrue('STNNBR: 1, CASTNO: 1' in non_unique[0].message)
+
+    def test_report(self):
+        """Reports are summarized in a line for each violation and as JSON."""
+        report = check.Report()
+        report.add('test.csv', check.check_datafile(self._dfile()), 6)
+        report.add('bad.csv', [], error='Traceback')
+        self.assertEqual(['bad.csv'], report.errors())
+        self.assertEqual(2, report.totals()['data_with_fill_flag'])
+
+        report.log_summary()
+        self.assertTrue(self.ensure_lines([
+            ['test.csv: column CTDSAL has data but expected fill value for '
+             'flag 9', 'on 2 row(s) 2-3'],
+            ['Unable to check bad.csv'],
+        ]))
+
+        out = StringIO()
+        report.write_json(out)
+        result = json.loads(out.getvalue())
+        self.assertEqual(['test.csv', 'bad.csv'],
+                         [fff['name'] for fff in result['files']])
+        violation = result['files'][0]['violations'][0]
+        self.assertEqual(
+            ['column', 'flag', 'level', 'message', 'ranges', 'rows', 'rule'],
+            sorted(violation.keys()))
+
+    def test_check_files_parallel(self):
+        """Files checked in parallel give the same report."""
+        paths = [
+            sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv'),
+            sample_file('bottle_exchange', '64PE20050907_hy1.csv'),
+            sample_file('i08s_33RR20070204_ct1.zip'),
+        ]
+        reports = []
+        for jobs in (1, 2):
+            fileobjs = [open(path) for path in paths]
+            try:
+                reports.append(check.check_files(fileobjs, jobs=jobs))
+            finally:
+                for fileobj in fileobjs:
+                    fileobj.close()
+        self.assertEqual(reports[0].to_dict(), reports[1].to_dict())
+        names = [fff['name'] for fff in reports[0].files]
+        self.assertEqual(4, len(names))
+        self.assertTrue(
+            names[2].endswith('i08s_33RR20070204_ct1.zip:00101_ct1.csv'))
+        self.assertEqual([], reports[0].errors())
@@ -1,7 +1,10 @@
 from unittest import TestCase
 
-from libcchdo.model.datafile import DataFile, Column
+from libcchdo.model.datafile import DataFile, DataFileCollection, Column
+from libcchdo.model.convert.datafile_to_datafilecollection import (
+    split_on_cast)
 from libcchdo.fns import _decimal
+from libcchdo.algorithms import eos_engine
 
 
 class TestDataFile(TestCase):
@@ -98,9 +101,70 @@ class TestDataFile(TestCase):
         self.file['CTDSAL'].values = [1]
         self.file['CTDTMP'].values = [1]
 
-        self.assertEqual(
-            ('sverdrup', [_decimal('1.021723814950101286444879340E-8')]),
-            self.file.calculate_depths())
+        with eos_engine('decimal'):
+            self.assertEqual(
+                ('sverdrup', [_decimal('1.021723814950101286444879340E-8')]),
+                self.file.calculate_depths())
+        with eos_engine('array'):
+            method, depths = self.file.calculate_depths()
+        self.assertEqual('sverdrup', method)
+        self.assertAlmostEqual(
+            _decimal('1.021723814950101286444879340E-8'), depths[0], 20)
+
+    def test_calculate_depths_engines(self):
+        """Both equation of state engines give the same depths."""
+        self.file.globals['LATITUDE'] = _decimal('-30.5')
+        self.file.create_columns(['CTDPRS', 'CTDSAL', 'CTDTMP'])
+        self.file['CTDPRS'].values = _decimal(['2', '100.5', '1000', '4000'])
+        self.file['CTDSAL'].values = _decimal(['34.5'] * 4)
+        self.file['CTDTMP'].values = _decimal(['20', '10', '4', '1.5'])
+        for values in (self.file['CTDTMP'].values[:], [None] * 4):
+            self.file['CTDTMP'].values = values
+            with eos_engine('decimal'):
+                expected = self.file.calculate_depths()
+            with eos_engine('array'):
+                result = self.file.calculate_depths()
+            self.assertEqual(expected[0], result[0])
+            for aaa, bbb in zip(expected[1], result[1]):
+                self.assertAlmostEqual(aaa, bbb, 9)
+
+    def test_take(self):
+        self.c.values = ['A', 'B', 'C']
+        self.c.flags_woce = [2, 3, 4]
+        self.file.ordered_columns = [self.c]
+        taken = self.file.take([2, 0])
+        self.assertEqual(['C', 'A'], taken['EXPOCODE'].values)
+        self.assertEqual([4, 2], taken['EXPOCODE'].flags_woce)
+        self.assertEqual([], taken['EXPOCODE'].flags_igoss)
+        self.assertEqual([taken['EXPOCODE']], taken.ordered_columns)
+        self.assertEqual(['A', 'B', 'C'], self.c.values)
+        self.assertRaises(IndexError, self.file.take, [3])
+
+    def test_permute_rows(self):
+        self.c.values = ['A', 'B', 'C']
+        self.c.flags_woce = [2, 3, 4]
+        self.file.permute_rows([1, 2, 0])
+        self.assertEqual(['B', 'C', 'A'], self.c.values)
+        self.assertEqual([3, 4, 2], self.c.flags_woce)
+        self.assertRaises(ValueError, self.file.permute_rows, [0, 0, 1])
+        self.assertRaises(ValueError, self.file.permute_rows, [0, 1])
+
+    def test_reorder_file_pressure(self):
+        """Each station cast is ordered by pressure then bottle number."""
+        self.file.create_columns(['STNNBR', 'CASTNO', 'CTDPRS', 'BTLNBR'])
+        self.file['STNNBR'].values = [1, 1, 1, 1, 2, 2, 2]
+        self.file['CASTNO'].values = [1] * 7
+        self.file['CTDPRS'].values = [5, 1, 5, 3, 2, 9, 1]
+        self.file['CTDPRS'].flags_woce = [2, 3, 4, 6, 2, 3, 4]
+        self.file['BTLNBR'].values = [1, 2, 3, 4, 5, 6, 7]
+        self.file.reorder_file_pressure()
+        self.assertEqual([1, 3, 5, 5, 1, 2, 9], self.file['CTDPRS'].values)
+        self.assertEqual([3, 6, 4, 2, 4, 2, 3], self.file['CTDPRS'].flags_woce)
+        self.assertEqual([2, 4, 3, 1, 7, 5, 6], self.file['BTLNBR'].values)
+
+        self.file.reorder_file_pressure(False, True)
+        self.assertEqual([5, 5, 3, 1, 9, 2, 1], self.file['CTDPRS'].values)
+        self.assertEqual([1, 3, 4, 2, 6, 5, 7], self.file['BTLNBR'].values)
 
     def test_check_and_replace_parameter_contrived(self):
         """Contrived parameters are not checked."""
@@ -108,6 +172,58 @@ class TestDataFile(TestCase):
         col.check_and_replace_parameter(self.file, convert=False)
 
 
+class TestDataFileCollection(TestCase):
+
+    def test_to_data_file(self):
+        """Files are concatenated with globals repeated for each row."""
+        dfc = DataFileCollection()
+        for stnnbr, pressures, flags in (
+                ('1', [1, 2], [2, 3]), ('2', [], []), ('3', [5], [])):
+            dfile = DataFile()
+            dfile.globals['STNNBR'] = stnnbr
+            dfile['CTDPRS'] = Column('CTDPRS')
+            dfile['CTDPRS'].values = pressures
+            dfile['CTDPRS'].flags_woce = flags
+            if stnnbr == '3':
+                dfile['CTDTMP'] = Column('CTDTMP')
+                dfile['CTDTMP'].values = [10]
+                dfile['CTDTMP'].flags_woce = [2]
+            dfc.append(dfile)
+
+        dfile = dfc.to_data_file()
+        self.assertEqual(['1', '1', '3'], dfile['STNNBR'].values)
+        self.assertEqual(['', '', ''], dfile['stamp'].values)
+        self.assertEqual([1, 2, 5], dfile['CTDPRS'].values)
+        self.assertEqual([2, 3], dfile['CTDPRS'].flags_woce)
+        self.assertEqual([None, None, 10], dfile['CTDTMP'].values)
+        self.assertEqual([None, None, 2], dfile['CTDTMP'].flags_woce)
+
+    def test_split_on_cast(self):
+        """Each run of rows with the same station cast becomes a file."""
+        dfile = DataFile()
+        dfile.globals['stamp'] = 'stamp'
+        dfile.create_columns(['EXPOCODE', 'STNNBR', 'CASTNO', 'CTDPRS'])
+        dfile['EXPOCODE'].values = ['A'] * 5
+        dfile['STNNBR'].values = ['1', '1', '2', '2', '1']
+        dfile['CASTNO'].values = [1, 1, 1, 2, 2]
+        dfile['CTDPRS'].values = [1, 2, 3, 4]
+        dfile['CTDPRS'].flags_woce = [2, 3, 4, 6]
+
+        dfc = split_on_cast(dfile)
+        self.assertEqual(4, len(dfc))
+        self.assertEqual([['1', '1'], ['2'], ['2'], ['1']],
+                         [list(ddd['STNNBR'].values) for ddd in dfc])
+        self.assertEqual([[1, 2], [3], [4], [None]],
+                         [list(ddd['CTDPRS'].values) for ddd in dfc])
+        self.assertEqual([[2, 3], [4], [6], []],
+                         [list(ddd['CTDPRS'].flags_woce) for ddd in dfc])
+        self.assertEqual('stamp', dfc.files[3].globals['stamp'])
+        self.assertFalse(dfc.files[0].globals is dfc.files[1].globals)
+        self.assertTrue(
+            dfc.files[0]['CTDPRS'].parameter is
+            dfc.files[1]['CTDPRS'].parameter)
+
+
 class TestColumn(TestCase):
     def test_decimal_places_requires_decimal(self):
         ccc = Column('test')
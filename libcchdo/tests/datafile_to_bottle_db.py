@@ -0,0 +1,96 @@
+"""Test loading bottle DataFiles into the std database."""
+
+from contextlib import closing
+from decimal import Decimal
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+
+from libcchdo.db import connect
+from libcchdo.db.model import std
+from libcchdo.model.datafile import DataFile
+from libcchdo.formats.bottle import exchange as botex
+from libcchdo.model.convert import datafile_to_bottle_db
+
+from libcchdo.tests import sample_file
+
+
+_TABLES = ['cruises', 'projects', 'cruises_projects', 'casts', 'locations',
+           'bottles', 'data_bottles']
+
+
+class TestDataFileToBottleDb(TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        std.Base.metadata.create_all(self.engine)
+        self.session = connect.session(self.engine)
+        self.dfile = DataFile()
+        with open(sample_file(
+                'bottle_exchange', 'a10_33RO20110926_hy1.csv')) as fff:
+            botex.read(self.dfile, fff)
+
+    def tearDown(self):
+        self.session.close()
+
+    def _counts(self):
+        return dict(
+            (table, self.engine.execute(
+                'SELECT COUNT(*) FROM {0}'.format(table)).scalar())
+            for table in _TABLES)
+
+    def test_load(self):
+        """Every row becomes a bottle with its non-empty values."""
+        report = datafile_to_bottle_db.load(self.dfile, self.session)
+        self.assertEqual(report.rows, len(self.dfile))
+        self.assertEqual(report.bottles, len(self.dfile))
+        self.assertEqual(report.new_bottles, len(self.dfile))
+        self.assertTrue(report.rows_per_second > 0)
+
+        counts = self._counts()
+        self.assertEqual(counts['cruises'], 1)
+        self.assertEqual(counts['projects'], 1)
+        self.assertEqual(counts['cruises_projects'], 1)
+        self.assertEqual(counts['casts'], 2)
+        self.assertEqual(counts['locations'], 2)
+        self.assertEqual(counts['bottles'], len(self.dfile))
+        self.assertEqual(counts['data_bottles'], report.values)
+
+        expected = 0
+        for column in self.dfile.columns.values():
+            if column.parameter.name in \
+                    datafile_to_bottle_db.METADATA_PARAMETERS:
+                continue
+            for iii, value in enumerate(column.values):
+                flag = column.flags_woce[iii] if column.flags_woce else None
+                if value is not None or flag is not None:
+                    expected += 1
+        self.assertEqual(report.values, expected)
+
+    def test_load_idempotent(self):
+        """Loading the same file again does not change the database."""
+        datafile_to_bottle_db.load(self.dfile, self.session)
+        counts = self._counts()
+        report = datafile_to_bottle_db.load(
+            self.dfile, self.session, chunk_size=7)
+        self.assertEqual(report.new_bottles, 0)
+        self.assertEqual(self._counts(), counts)
+
+    def test_load_replaces_values(self):
+        """Values of bottles that were loaded before are replaced."""
+        datafile_to_bottle_db.load(self.dfile, self.session)
+        self.dfile['CTDSAL'].values[0] = Decimal('12.3456')
+        datafile_to_bottle_db.load(self.dfile, self.session)
+        table = std.DataBottle.__table__
+        param_id = self.dfile['CTDSAL'].parameter.id
+        values = [row[0] for row in self.engine.execute(
+            table.select().with_only_columns([table.c.value]).where(
+                table.c.parameter_id == param_id))]
+        self.assertEqual(len(values), len(self.dfile))
+        self.assertTrue(Decimal('12.3456') in values)
+
+    def test_convert(self):
+        """convert returns the cruises that were loaded."""
+        cruises = datafile_to_bottle_db.convert(self.dfile, self.session)
+        self.assertEqual(cruises.keys(), ['33RO20110926'])
+        self.assertEqual(cruises['33RO20110926'].casts.count(), 2)
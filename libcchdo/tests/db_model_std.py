@@ -29,6 +29,40 @@ class TestDbModelStd(unittest.TestCase):
         # Test something that needs an alias lookup
         okay(std.find_by_mnemonic(u'TALK'))
 
+    def test_parameter_registry(self):
+        registry = std.parameter_registry()
+        self.assertTrue(registry is std.parameter_registry())
+
+        ctdoxy = registry.find(u'CTDOXY')
+        self.assertTrue(type(ctdoxy) is std.Parameter)
+        self.assertTrue(ctdoxy is std.find_by_mnemonic(u'CTDOXY'))
+        self.assertEqual(None, registry.find(u'NOTAPARAM'))
+        self.assertEqual(None, std.find_by_mnemonic(u'NOTAPARAM'))
+
+        # Detached parameters keep their loaded attributes
+        self.assertEqual(u'CTDOXY', ctdoxy.name)
+        if ctdoxy.units:
+            self.assertTrue(
+                ctdoxy.units is std.Unit.find_by_name(ctdoxy.units.name))
+
+        for alias, param in registry._aliases.items():
+            if registry.is_alias(alias):
+                self.assertTrue(param is registry.find_by_mnemonic(alias))
+
+        std.invalidate_parameter_registry()
+        reloaded = std.parameter_registry()
+        self.assertFalse(registry is reloaded)
+        self.assertEqual(len(registry), len(reloaded))
+
+    def test_copy_parameter(self):
+        param = std.parameter_registry().find(u'CTDOXY')
+        copy = std.copy_parameter(param)
+        copy.units = None
+        self.assertEqual(param, copy)
+        self.assertEqual(param.id, copy.id)
+        self.assertTrue(param is std.find_by_mnemonic(u'CTDOXY'))
+        self.assertNotEqual(None, param.units)
+
     def test_parameter_is_in_range(self):
         p = std.Parameter('_test')
         p.bound_lower = 0.0
@@ -6,6 +6,7 @@ from libcchdo import config
 from libcchdo.model.datafile import DataFile
 from libcchdo.formats.bottle import exchange as btlex
 from libcchdo.fns import _decimal
+from libcchdo.tests import sample_file
 
 
 class TestBottleExchange(unittest.TestCase):
@@ -78,6 +79,21 @@ END_DATA
                 aas[11] = u'METERS'
             self.assertEqual(aas, bbs)
 
+    def test_write_keeps_datetime(self):
+        """Writing splits _DATETIME for the output and fuses it again."""
+        with closing(StringIO(self.sample_basic)) as buff:
+            btlex.read(self.file, buff)
+        self.assertTrue('_DATETIME' in self.file.columns)
+        for i in range(2):
+            with closing(StringIO()) as buff:
+                btlex.write(self.file, buff)
+                output = buff.getvalue()
+            self.assertTrue('_DATETIME' in self.file.columns)
+            self.assertFalse('DATE' in self.file.columns)
+            self.assertFalse('TIME' in self.file.columns)
+        row = [x.strip() for x in output.split('\n')[3].split(',')]
+        self.assertEqual(['20070215', '1442'], row[7:9])
+
     def test_no_stamp_uses_users(self):
         """If the writer is not given a stamp, it will use the config stamp."""
         self.buff = StringIO(TestBottleExchange.sample)
@@ -182,3 +198,39 @@ END_DATA
             # CTDOXY default decplaces is 4 but the data has 2
             self.assertEqual('-999.00', result[3].split(',')[6].lstrip())
 
+
+    def test_read_chunks(self):
+        """Chunks hold the rows of the whole file."""
+        path = sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv')
+        with open(path) as fff:
+            btlex.read(self.file, fff)
+        dfile = DataFile()
+        with open(path) as fff:
+            chunks = btlex.read_chunks(dfile, fff, 7)
+            self.assertEqual(self.file.globals['stamp'], dfile.globals['stamp'])
+            chunks = list(chunks)
+        self.assertEqual([7, 7, 4], map(len, chunks))
+        for chunk in chunks:
+            self.assertEqual(
+                sorted(self.file.columns.keys()), sorted(chunk.columns.keys()))
+        for key, column in self.file.columns.items():
+            self.assertEqual(
+                column.values,
+                sum([list(chunk[key].values) for chunk in chunks], []))
+
+    def test_write_chunks(self):
+        """Writing chunks gives the same file as writing the whole file."""
+        path = sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv')
+        with open(path) as fff:
+            btlex.read(self.file, fff)
+        with closing(StringIO()) as buff:
+            btlex.write(self.file, buff)
+            expected = buff.getvalue()
+        dfile = DataFile()
+        with open(path) as fff, closing(StringIO()) as buff:
+            chunks = list(btlex.read_chunks(dfile, fff, 7))
+            btlex.write_chunks(dfile, buff, iter(chunks))
+            self.assertEqual(expected, buff.getvalue())
+        for chunk in chunks:
+            self.assertTrue('_DATETIME' in chunk.columns)
+            self.assertFalse('DATE' in chunk.columns)
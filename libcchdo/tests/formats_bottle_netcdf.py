@@ -2,7 +2,7 @@ import unittest
 from datetime import datetime
 from tempfile import NamedTemporaryFile
 
-from libcchdo.model.datafile import DataFile, Column
+from libcchdo.model.datafile import DataFile, Column, column_storage
 from libcchdo.formats.bottle import netcdf as botnc
 from libcchdo.tests import sample_file
 
@@ -44,6 +44,22 @@ class TestBottleNetCDF(unittest.TestCase):
         expocodes = ['33RR20070204'] * 16
         self.assertEqual(expocodes, self.file.columns['EXPOCODE'].values)
   
+    def test_read_array_storage(self):
+        """Columns with array storage get the same values and flags."""
+        dfile = DataFile()
+        botnc.read(dfile, self.infile)
+        self.infile.seek(0)
+        with column_storage('array'):
+            dfile_array = DataFile()
+            botnc.read(dfile_array, self.infile)
+        self.assertEqual(dfile_array['NITRIT'].values.kind, 'float')
+        self.assertEqual(dfile_array['NITRIT'].flags_woce.kind, 'int')
+        for name, column in dfile.columns.items():
+            self.assertEqual(
+                list(dfile_array[name].values), list(column.values))
+            self.assertEqual(
+                list(dfile_array[name].flags_woce), list(column.flags_woce))
+
     def test_read_multiple(self):
         self.file = DataFile()
         botnc.read(self.file, self.infile)
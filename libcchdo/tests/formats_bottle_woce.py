@@ -0,0 +1,69 @@
+import unittest
+from StringIO import StringIO
+from contextlib import closing
+
+from libcchdo.model.datafile import DataFile
+from libcchdo.formats import woce
+from libcchdo.formats.bottle import exchange as botex
+from libcchdo.formats.bottle import woce as botwoce
+
+from libcchdo.tests import sample_file
+
+
+class TestBottleWOCE(unittest.TestCase):
+
+    def _read(self, bulk):
+        dfile = DataFile()
+        saved_read_data = woce.read_data
+        def read_data(*args):
+            return saved_read_data(*args, bulk=bulk)
+        woce.read_data = read_data
+        try:
+            with open(sample_file('bottle_woce', 'p01w_1999ahy.txt')) as fff:
+                botwoce.read(dfile, fff)
+        finally:
+            woce.read_data = saved_read_data
+        return dfile
+
+    def test_read_bulk(self):
+        """Whole columns are read the same as one row at a time."""
+        rowwise = self._read(False)
+        bulk = self._read(True)
+        self.assertEqual(len(bulk), 1299)
+        self.assertEqual(rowwise.columns.keys(), bulk.columns.keys())
+        for name, column in rowwise.columns.items():
+            self.assertEqual(bulk[name].values, column.values)
+            self.assertEqual(bulk[name].flags_woce, column.flags_woce)
+        self.assertTrue(isinstance(bulk['STNNBR'].values[0], basestring))
+
+    def test_write_chunks(self):
+        """Writing chunks gives the same file as writing the whole file."""
+        path = sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv')
+        dfile = DataFile()
+        with open(path) as fff:
+            botex.read(dfile, fff)
+        with closing(StringIO()) as buff:
+            botwoce.write(dfile, buff)
+            expected = buff.getvalue()
+
+        dfile = DataFile()
+        with open(path) as fff, closing(StringIO()) as buff:
+            botwoce.write_chunks(dfile, buff, botex.read_chunks(dfile, fff, 7))
+            self.assertEqual(expected, buff.getvalue())
+        self.assertTrue(expected.startswith(
+            'EXPOCODE 33RO20110926 WHP-ID A10 CRUISE DATES 20110928 TO 20110928'))
+
+    def test_read_written(self):
+        """Files written with 8 digit cruise dates can be read."""
+        dfile = DataFile()
+        with open(sample_file(
+                'bottle_exchange', 'a10_33RO20110926_hy1.csv')) as fff:
+            botex.read(dfile, fff)
+        with closing(StringIO()) as buff:
+            botwoce.write(dfile, buff)
+            buff.seek(0)
+            written = DataFile()
+            botwoce.read(written, buff)
+        self.assertEqual(written.globals['EXPOCODE'], '33RO20110926')
+        self.assertEqual(written.globals['_BEGIN_DATE'], '20110928')
+        self.assertEqual(len(written), len(dfile))
@@ -1,7 +1,12 @@
 import unittest
+import os.path
+from shutil import rmtree
+from tempfile import mkdtemp
 from StringIO import StringIO
 
-from libcchdo.model.datafile import DataFile
+import numpy as np
+
+from libcchdo.model.datafile import DataFile, column_storage
 from libcchdo.formats.ctd import netcdf as ctdnc
 
 from libcchdo.tests import sample_file
@@ -28,3 +33,60 @@ class TestCTDNetCDF (unittest.TestCase):
         self.output_buffer.close()
         self.assertTrue(True)
 
+    def test_read_missing(self):
+        """NaN and old salinity fill values are missing."""
+        self.datafile = DataFile()
+        ctdnc.read(self.datafile, self.infile)
+        self.datafile['CTDSAL'].values[0] = None
+        self.datafile['CTDSAL'].values[1] = -9.99
+        tempdir = mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'ctd.nc')
+            ctdnc.write(self.datafile, path)
+            dfile = DataFile()
+            with open(path) as fff:
+                ctdnc.read(dfile, fff)
+            with column_storage('array'):
+                dfile_array = DataFile()
+                with open(path) as fff:
+                    ctdnc.read(dfile_array, fff)
+        finally:
+            rmtree(tempdir)
+        self.assertEqual(dfile['CTDSAL'].values[:3],
+                         [None, None, self.datafile['CTDSAL'].values[2]])
+        self.assertEqual(dfile_array['CTDSAL'].values.kind, 'float')
+        self.assertEqual(
+            list(dfile_array['CTDSAL'].values), dfile['CTDSAL'].values)
+        self.assertEqual(
+            list(dfile_array['CTDSAL'].flags_woce),
+            list(dfile['CTDSAL'].flags_woce))
+
+    def test_write_path(self):
+        """Data variables, their ranges and missing values are written."""
+        self.datafile = DataFile()
+        ctdnc.read(self.datafile, self.infile)
+        self.datafile['CTDOXY'].values[1] = None
+        tempdir = mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'ctd.nc')
+            ctdnc.write(self.datafile, path)
+            dfile = DataFile()
+            with open(path) as fff:
+                ctdnc.read(dfile, fff)
+            nc_file = ctdnc.nc.Dataset(path)
+            try:
+                oxygen = nc_file.variables['oxygen']
+                values = [x for x in self.datafile['CTDOXY'].values
+                          if x is not None]
+                self.assertEqual(oxygen.data_min, float(min(values)))
+                self.assertEqual(oxygen.data_max, float(max(values)))
+                # Missing values are NaN
+                self.assertTrue(np.isnan(oxygen[1]))
+            finally:
+                nc_file.close()
+        finally:
+            rmtree(tempdir)
+        self.assertEqual(len(dfile), len(self.datafile))
+        self.assertEqual(dfile['CTDOXY'].values[1], None)
+        self.assertEqual(
+            dfile['CTDOXY'].values[0], self.datafile['CTDOXY'].values[0])
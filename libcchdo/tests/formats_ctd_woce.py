@@ -1,5 +1,10 @@
+import struct
 import unittest
+from StringIO import StringIO
 
+from libcchdo.fns import Decimal
+from libcchdo.model.datafile import DataFile, column_storage
+from libcchdo.formats import woce
 from libcchdo.formats.ctd import woce as ctdwoce
 
 class TestCTDWOCE(unittest.TestCase):
@@ -18,3 +23,86 @@ class TestCTDWOCE(unittest.TestCase):
     def test_invalid_record3(self):
         # TODO
         pass
+
+
+_RECORDS = """\
+EXPOCODE 99XX19800101   WHP-ID XX00  DATE 010180
+STNNBR 42       CASTNO 42  NO. Records=5 
+INSTRUMENT NO. 0     SAMPLING RATE 42.00  HZ
+  CTDPRS  CTDTMP  CTDSAL  CTDOXY  NUMBER QUALT1
+    DBAR  ITS-90  PSS-78 UMOL/KG    OBS.      *
+ ******* ******* ******* *******              *
+{0}
+"""
+
+
+_DATA = [
+    "     3.0 28.7977 31.8503   209.5      42   {0}2222",
+    "     5.0 28.7978  -9.000   208.6       9   {0}2293",
+    "     7.0 28.7995 32.3976    -9.0      41   {0}2229",
+    "     9.0 28.8014 33.0838   212.1      64   {0}2222",
+]
+
+
+class TestCTDWOCEData(unittest.TestCase):
+
+    def _read(self, data, bulk):
+        dfile = DataFile()
+        saved_read_data = woce.read_data
+        def read_data(*args):
+            return saved_read_data(*args, bulk=bulk)
+        woce.read_data = read_data
+        try:
+            ctdwoce.read(dfile, StringIO(_RECORDS.format('\n'.join(data))))
+        finally:
+            woce.read_data = saved_read_data
+        return dfile
+
+    def _assert_same(self, data):
+        rowwise = self._read(data, False)
+        bulk = self._read(data, True)
+        self.assertEqual(rowwise.columns.keys(), bulk.columns.keys())
+        for name, column in rowwise.columns.items():
+            self.assertEqual(list(bulk[name].values), list(column.values))
+            self.assertEqual(
+                list(bulk[name].flags_woce), list(column.flags_woce))
+        return bulk
+
+    def test_read_data(self):
+        """Whole columns are read the same as one row at a time."""
+        dfile = self._assert_same([line.format('') for line in _DATA])
+        self.assertEqual(
+            dfile['CTDSAL'].values,
+            [Decimal('31.8503'), None, Decimal('32.3976'), Decimal('33.0838')])
+        self.assertEqual(dfile['CTDSAL'].flags_woce, [2, 9, 2, 2])
+        self.assertEqual(dfile['CTDOXY'].values[2], None)
+        self.assertEqual(dfile['CTDOXY'].flags_woce, [2, 3, 9, 2])
+        self.assertEqual(dfile['NUMBER'].values[0], Decimal('42'))
+
+    def test_read_data_quality_spacing(self):
+        """Extra space before the quality words is detected."""
+        dfile = self._assert_same([line.format('  ') for line in _DATA])
+        self.assertEqual(dfile['CTDTMP'].flags_woce, [2, 2, 2, 2])
+
+    def test_read_data_array_storage(self):
+        """Columns with array storage get the same values."""
+        data = [line.format('') for line in _DATA]
+        dfile = self._read(data, True)
+        with column_storage('array'):
+            dfile_array = self._read(data, True)
+        self.assertEqual(dfile_array['CTDSAL'].values.kind, 'decimal')
+        for name, column in dfile.columns.items():
+            self.assertEqual(
+                list(dfile_array[name].values), list(column.values))
+
+    def test_read_data_bad_flag(self):
+        data = [line.format('') for line in _DATA]
+        data[1] = data[1].replace('2293', '2 93')
+        for bulk in (False, True):
+            self.assertRaises(ValueError, self._read, data, bulk)
+
+    def test_read_data_bad_length(self):
+        data = [line.format('') for line in _DATA]
+        data[2] += '2'
+        for bulk in (False, True):
+            self.assertRaises(struct.error, self._read, data, bulk)
@@ -79,3 +79,152 @@ class TestFormatsExchange(BaseTestCase):
         self.assertEqual('012', dfile['BTLNBR'].values[0])
         self.assertEqual('123', dfile['BTLNBR'].values[1])
         self.assertEqual(None, dfile['UNKPARAM'].values[1])
+
+    def _read_data(self, lines, columns, bulk):
+        with closing(StringIO()) as fff:
+            fff.name = 'testfile'
+            fff.write('\n'.join(lines) + '\n')
+            fff.seek(0)
+            dfile = DataFile()
+            dfile.create_columns(columns)
+            exchange.read_data(dfile, fff, columns, bulk=bulk)
+            return dfile
+
+    def test_read_bulk_same_as_rowwise(self):
+        """Reading the data section in bulk gives the same columns."""
+        columns = ['BTLNBR', 'CTDPRS', 'CTDPRS_FLAG_W', 'CTDSAL',
+                   'CTDSAL_FLAG_W', 'UNKPARAM']
+        lines = [
+            '01, 1.0,2, 34.1230,2,-999',
+            'SIO1,-999.0,9,  -999.0000,9,12',
+            ' -999,3.5,a,34.10,2,',
+            '99,4.5,2,34.2,3,x',
+            'END_DATA',
+            '1,2,3',
+        ]
+        rowwise = self._read_data(lines, columns, False)
+        bulk = self._read_data(lines, columns, True)
+        for key, column in rowwise.columns.items():
+            self.assertEqual(column.values, bulk[key].values)
+            self.assertEqual(map(str, column.values),
+                             map(str, bulk[key].values))
+            self.assertEqual(column.flags_woce, bulk[key].flags_woce)
+        self.assertEqual(4, len(bulk))
+        self.assertEqual(['01', 'SIO1', None, '99'], bulk['BTLNBR'].values)
+
+    def test_read_bulk_column_count(self):
+        """Bulk reading raises the same error for mismatched rows."""
+        lines = ['1.0,2', '2.0,2', '3.0']
+        for bulk in (False, True):
+            with self.assertRaisesRegexp(
+                    ValueError, 'Found 2 columns and 1 values at data line 3'):
+                self._read_data(lines, ['CTDPRS', 'CTDPRS_FLAG_W'], bulk)
+
+    def _write_data(self, dfile, bulk):
+        with closing(StringIO()) as fff:
+            exchange.write_data(dfile, fff, bulk=bulk)
+            return fff.getvalue()
+
+    def test_write_bulk_same_as_rowwise(self):
+        """Writing the data section in bulk gives identical output."""
+        dfile = DataFile()
+        dfile.create_columns(
+            ['EXPOCODE', 'BTLNBR', 'CTDPRS', 'CTDSAL', 'CTDOXY', 'OXYGEN'])
+        dfile['EXPOCODE'].values = ['33RR20070204'] * 4
+        dfile['BTLNBR'].values = ['01', 'SIO1', None, '99']
+        dfile['CTDPRS'].values = [
+            Decimal('1.0'), Decimal('-999.0'), None, Decimal('0.0000001')]
+        dfile['CTDPRS'].flags_woce = [2, 9, 9, 2]
+        dfile['CTDSAL'].values = [
+            Decimal('0E-7'), Decimal('-0.00'), Decimal('34.1230'), None]
+        dfile['CTDSAL'].flags_woce = [2, 2, 3, 9]
+        dfile['CTDOXY'].values = [None] * 4
+        # Short columns are filled
+        dfile['OXYGEN'].values = [Decimal('210.12'), Decimal(5)]
+        dfile['OXYGEN'].flags_woce = [2]
+        rowwise = self._write_data(dfile, False)
+        self.assertEqual(rowwise, self._write_data(dfile, True))
+        self.assertTrue(self.ensure_lines([
+            ['Could not get value of', 'OXYGEN', 'at row 2'],
+        ]))
+
+    def test_write_bulk_same_as_rowwise_sample(self):
+        """Writing a whole sample file in bulk gives identical output."""
+        dfile = DataFile()
+        with open(sample_file(
+                'bottle_exchange', 'a10_33RO20110926_hy1.csv')) as fff:
+            exchange.read_identifier_line(dfile, fff, 'BOTTLE')
+            columns = [
+                xxx.strip() for xxx in
+                exchange.read_comments(dfile, fff).split(',')]
+            fff.readline()
+            dfile.create_columns(columns)
+            exchange.read_data(dfile, fff, columns)
+        self.assertEqual(
+            self._write_data(dfile, False), self._write_data(dfile, True))
+
+    def _iter_data(self, lines, columns, chunk_rows, bulk=True):
+        dfile = DataFile()
+        dfile.create_columns(columns)
+        with closing(StringIO('\n'.join(lines) + '\n')) as fff:
+            fff.name = 'testfile'
+            return list(exchange.iter_data(
+                dfile, fff, columns, chunk_rows, bulk=bulk))
+
+    def test_iter_data_chunks(self):
+        """Data rows are read in chunks the same as all at once."""
+        columns = ['BTLNBR', 'CTDPRS', 'CTDPRS_FLAG_W']
+        lines = ['01,1.0,2', 'SIO1,-999.0,9', '03,3.5,a', '04,4.5,2',
+                 '05,5.5,2', 'END_DATA']
+        whole = self._read_data(lines, columns, True)
+        for bulk in (False, True):
+            chunks = self._iter_data(lines, columns, 2, bulk)
+            self.assertEqual([2, 2, 1], map(len, chunks))
+            for key, column in whole.columns.items():
+                self.assertEqual(
+                    column.values,
+                    sum([list(chunk[key].values) for chunk in chunks], []))
+                self.assertEqual(
+                    column.flags_woce,
+                    sum([list(chunk[key].flags_woce) for chunk in chunks], []))
+        self.assertTrue(self.ensure_lines([
+            ['Bad WOCE flag', 'CTDPRS', 'data row 2'],
+        ]))
+
+    def test_iter_data_no_rows(self):
+        """One empty chunk is given when there are no data rows."""
+        columns = ['CTDPRS', 'CTDPRS_FLAG_W']
+        chunks = self._iter_data(['END_DATA'], columns, 2)
+        self.assertEqual(1, len(chunks))
+        self.assertEqual(0, len(chunks[0]))
+        self.assertEqual(['CTDPRS'], chunks[0].columns.keys())
+
+        lines = ['1.0,2', '2.0,2', 'END_DATA']
+        self.assertEqual([2], map(len, self._iter_data(lines, columns, 2)))
+
+    def test_iter_data_column_count(self):
+        """The data line of mismatched rows counts the earlier chunks."""
+        lines = ['1.0,2', '2.0,2', '3.0']
+        with self.assertRaisesRegexp(
+                ValueError, 'Found 2 columns and 1 values at data line 3'):
+            self._iter_data(lines, ['CTDPRS', 'CTDPRS_FLAG_W'], 2)
+
+    def test_write_data_chunks(self):
+        """Chunks are written the same as the whole file."""
+        dfile = DataFile()
+        dfile.create_columns(['BTLNBR', 'CTDPRS', 'CTDSAL'])
+        dfile['BTLNBR'].values = ['01', 'SIO1', None, '99']
+        dfile['CTDPRS'].values = [
+            Decimal('1.0'), Decimal('-999.0'), None, Decimal('4.5')]
+        dfile['CTDPRS'].flags_woce = [2, 9, 9, 2]
+        dfile['CTDSAL'].values = [
+            Decimal('34.123'), None, Decimal('34.1230'), None]
+        chunks = [dfile.take([0, 1]), dfile.take([2, 3])]
+        with closing(StringIO()) as fff:
+            exchange.write_data_chunks(chunks, fff)
+            self.assertEqual(self._write_data(dfile, True), fff.getvalue())
+
+        chunks[1].create_columns(['CTDOXY'])
+        with closing(StringIO()) as fff:
+            with self.assertRaises(ValueError):
+                exchange.write_data_chunks(chunks, fff)
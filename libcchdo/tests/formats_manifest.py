@@ -0,0 +1,178 @@
+"""Test the format manifest and hydro startup."""
+
+import sys
+import os
+import os.path
+from shutil import rmtree
+from subprocess import Popen, PIPE
+from tempfile import mkdtemp
+from unittest import TestCase
+
+import libcchdo
+from libcchdo.formats import formats
+
+
+_PACKAGE = 'libcchdo_test_manifest'
+
+
+_MODULES = {
+    '__init__.py': '',
+    'formats/__init__.py': '',
+    'formats/readable.py': """\
+_fname_extensions = ['.rd', '_rd.txt']
+def get_filename(basename):
+    return basename + _fname_extensions[0]
+def is_filename_recognized(fname):
+    return False
+def is_file_recognized(fileobj):
+    return False
+def read(self, handle):
+    pass
+""",
+    'formats/writable.py': """\
+def write(self, handle):
+    pass
+""",
+    'formats/helper.py': """\
+HELP = True
+""",
+}
+
+
+class TestFormatManifest(TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+        for path, source in _MODULES.items():
+            path = os.path.join(self.tempdir, _PACKAGE, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fff:
+                fff.write(source)
+        self.manifest_path = os.path.join(self.tempdir, 'manifest.json')
+        sys.path.insert(0, self.tempdir)
+        __import__(_PACKAGE + '.formats')
+        self.root = sys.modules[_PACKAGE + '.formats']
+
+    def tearDown(self):
+        sys.path.remove(self.tempdir)
+        for name in sys.modules.keys():
+            if name.startswith(_PACKAGE):
+                del sys.modules[name]
+        rmtree(self.tempdir)
+
+    def _unload_formats(self):
+        for name in ['readable', 'writable', 'helper']:
+            sys.modules.pop('{0}.formats.{1}'.format(_PACKAGE, name), None)
+
+    def test_build_manifest(self):
+        """Format short names, extensions and capabilities are recorded."""
+        manifest = formats.build_manifest(self.root)
+        entries = dict(
+            [(entry['short_name'], entry) for entry in manifest['formats']])
+        self.assertEqual(sorted(entries.keys()), ['readable', 'writable'])
+        self.assertEqual(entries['readable']['extensions'], ['.rd', '_rd.txt'])
+        self.assertEqual(
+            entries['readable']['module'], _PACKAGE + '.formats.readable')
+        self.assertTrue(entries['readable']['read'])
+        self.assertFalse(entries['readable']['write'])
+        self.assertEqual(entries['writable']['extensions'], None)
+        self.assertFalse(entries['writable']['read'])
+        self.assertTrue(entries['writable']['write'])
+        self.assertEqual(manifest['failed'], [])
+
+    def test_load_manifest_cached(self):
+        """A manifest on disk is used until a format module changes."""
+        manifest = formats.load_manifest(self.root, self.manifest_path)
+        self.assertTrue(os.path.isfile(self.manifest_path))
+
+        self._unload_formats()
+        self.assertEqual(
+            formats.load_manifest(self.root, self.manifest_path), manifest)
+        self.assertFalse(_PACKAGE + '.formats.readable' in sys.modules)
+
+        path = os.path.join(self.tempdir, _PACKAGE, 'formats', 'readable.py')
+        mtime = os.path.getmtime(path)
+        os.utime(path, (mtime + 10, mtime + 10))
+        formats.load_manifest(self.root, self.manifest_path)
+        self.assertTrue(_PACKAGE + '.formats.readable' in sys.modules)
+
+    def test_load_manifest_new_module(self):
+        """Adding a format module rebuilds the manifest."""
+        formats.load_manifest(self.root, self.manifest_path)
+        path = os.path.join(self.tempdir, _PACKAGE, 'formats', 'added.py')
+        with open(path, 'w') as fff:
+            fff.write(_MODULES['formats/writable.py'])
+        manifest = formats.load_manifest(self.root, self.manifest_path)
+        self.assertTrue(
+            'added' in [entry['short_name'] for entry in manifest['formats']])
+
+    def test_registry_imports_on_lookup(self):
+        """Registries answer queries from the manifest without importing."""
+        formats.load_manifest(self.root, self.manifest_path)
+        self._unload_formats()
+
+        scanner = formats.FormatScanner()
+        saved_load_manifest = formats.load_manifest
+        formats.load_manifest = lambda root: saved_load_manifest(
+            self.root, self.manifest_path)
+        try:
+            self.assertTrue('readable' in scanner.all_formats)
+            self.assertEqual(scanner.all_formats.readers(), ['readable'])
+            self.assertEqual(scanner.all_formats.writers(), ['writable'])
+            self.assertEqual(
+                scanner.file_extensions['readable'], ['.rd', '_rd.txt'])
+        finally:
+            formats.load_manifest = saved_load_manifest
+        self.assertFalse(_PACKAGE + '.formats.readable' in sys.modules)
+
+        module = scanner.all_formats['readable']
+        self.assertEqual(module.__name__, _PACKAGE + '.formats.readable')
+
+
+_STARTUP = """\
+import sys
+import libcchdo.scripts
+print '\\n'.join(
+    [name for name, module in sys.modules.items() if module is not None])
+"""
+
+
+class TestStartup(TestCase):
+    """hydro must start without importing format modules.
+
+    Importing every format module also imports NetCDF, NumPy and the database
+    models and made hydro take seconds to start.
+
+    """
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def _startup_modules(self):
+        env = dict(os.environ)
+        env['LIBCCHDO_FORMATS_MANIFEST'] = os.path.join(
+            self.tempdir, 'manifest.json')
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.path.dirname(os.path.dirname(libcchdo.__file__))] +
+            env.get('PYTHONPATH', '').split(os.pathsep))
+        proc = Popen(
+            [sys.executable, '-c', _STARTUP], stdout=PIPE, stderr=PIPE,
+            env=env)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        return out.splitlines()
+
+    def test_import_scripts(self):
+        """Importing scripts with a manifest imports no format module."""
+        # The first start writes the manifest.
+        self._startup_modules()
+        modules = self._startup_modules()
+        self.assertEqual(
+            [name for name in modules if name.startswith('libcchdo.formats.')],
+            ['libcchdo.formats.formats'])
+        self.assertFalse('netCDF4' in modules)
+        self.assertFalse('numpy' in modules)
@@ -1,6 +1,12 @@
 from datetime import timedelta
 import sys
+import os.path
 import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+from StringIO import StringIO
+
+import numpy as np
 
 from libcchdo.formats import netcdf as fnc
 
@@ -51,3 +57,64 @@ class TestFormatsNetCDF(unittest.TestCase):
 
         dtime = None
         self.assertEqual(-9, fnc.minutes_since_epoch(dtime))
+
+    def test_column_data_range(self):
+        values = np.ma.masked_invalid([2.0, np.nan, 0.0, -1.5])
+        self.assertEqual((-1.5, 2.0), fnc.column_data_range(values))
+        values = np.ma.masked_invalid([np.nan, np.nan])
+        self.assertEqual(
+            (float('-inf'), float('inf')), fnc.column_data_range(values))
+
+
+def _write_dataset(nc_file):
+    nc_file.createDimension('pressure', 3)
+    var = nc_file.createVariable('pressure', 'f8', ('pressure', ))
+    var[:] = [1.0, np.nan, 3.0]
+
+
+class TestDatasetToStream(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tempdir)
+
+    def _read(self, path):
+        nc_file = fnc.Dataset(path)
+        try:
+            return nc_file.variables['pressure'][:].tolist()
+        finally:
+            nc_file.close()
+
+    def _write_stream(self, stream):
+        with fnc.nc_dataset_to_stream(
+                stream, format='NETCDF3_CLASSIC') as nc_file:
+            _write_dataset(nc_file)
+        path = os.path.join(self.tempdir, 'stream.nc')
+        with open(path, 'wb') as fff:
+            fff.write(stream.getvalue())
+        return self._read(path)
+
+    def test_stream(self):
+        """Datasets are written to streams."""
+        values = self._write_stream(StringIO())
+        self.assertEqual(values[0], 1.0)
+        self.assertTrue(np.isnan(values[1]))
+
+    def test_stream_temporary_file(self):
+        """Without in memory datasets a temporary file is used."""
+        saved = fnc.CREATE_IN_MEMORY
+        fnc.CREATE_IN_MEMORY = False
+        try:
+            values = self._write_stream(StringIO())
+        finally:
+            fnc.CREATE_IN_MEMORY = saved
+        self.assertEqual(values[2], 3.0)
+
+    def test_path(self):
+        """Datasets are written directly to paths."""
+        path = os.path.join(self.tempdir, 'path.nc')
+        with fnc.nc_dataset_to_stream(path, format='NETCDF3_CLASSIC') as ncf:
+            _write_dataset(ncf)
+        self.assertEqual(self._read(path)[0], 1.0)
@@ -1,6 +1,11 @@
 import unittest
+from StringIO import StringIO
+from zipfile import ZipFile
 
 from libcchdo.model.datafile import DataFileCollection
+from libcchdo.formats import zip as Zip
+from libcchdo.formats.exchange import read_type_and_stamp
+from libcchdo.formats.ctd import exchange as ctdex
 from libcchdo.formats.ctd.zip import exchange as ctdzipex
 from libcchdo.formats.ctd.zip import netcdf as ctdzipnc
 from libcchdo.formats.ctd.zip import woce as ctdzipwoce
@@ -20,6 +25,86 @@ class TestCTDZipExchange(unittest.TestCase):
         ctdzipex.read(self.datafile, self.infile)
         self.assertTrue(True)
 
+    def test_read_members_in_memory(self):
+        """Members are read from memory and keep their names."""
+        dfc = DataFileCollection()
+        ctdzipex.read(dfc, self.infile)
+        self.infile.seek(0)
+        names = [name for name in ZipFile(self.infile).namelist()
+                 if name.endswith('.csv')]
+        self.assertEqual(names, [dfile.globals['_FILENAME'] for dfile in dfc])
+
+    def test_read_stamp(self):
+        """The most common stamp in a zip is read from the members' streams."""
+        buff = StringIO()
+        zfile = ZipFile(buff, 'w')
+        for i, stamp in enumerate(['20070314SIO', '20070314SIO', '2008XYZ']):
+            zfile.writestr('{0}_ct1.csv'.format(i),
+                           'CTD,{0}\n{1}'.format(stamp, 'x' * 100000))
+        zfile.close()
+        buff.seek(0)
+        self.assertEqual(('CTD', '20070314SIO'), read_type_and_stamp(buff))
+
+    def test_parallel(self):
+        """Reading and writing with workers gives the same members in order."""
+        def read():
+            self.infile.seek(0)
+            dfc = DataFileCollection()
+            ctdzipex.read(dfc, self.infile)
+            return dfc
+
+        def write(dfc):
+            out = StringIO()
+            ctdzipex.write(dfc, out)
+            zfile = ZipFile(StringIO(out.getvalue()))
+            return [(name, zfile.read(name)) for name in zfile.namelist()]
+
+        sequential = read()
+        with Zip.jobs(2):
+            parallel = read()
+        self.assertEqual(len(sequential), len(parallel))
+        for seq, par in zip(sequential, parallel):
+            self.assertEqual(seq.globals['STNNBR'], par.globals['STNNBR'])
+            self.assertEqual(seq['CTDPRS'].values, par['CTDPRS'].values)
+
+        expected = write(sequential)
+        with Zip.jobs(2):
+            self.assertEqual(expected, write(sequential))
+        self.assertEqual(1, Zip.get_jobs())
+
+    def test_bad_member(self):
+        """A member that cannot be read raises with any number of jobs."""
+        buff = StringIO()
+        zfile = ZipFile(buff, 'w')
+        source = ZipFile(self.infile)
+        for name in source.namelist():
+            zfile.writestr(name, source.read(name))
+        zfile.writestr('zz_bad_ct1.csv', 'garbage')
+        zfile.close()
+        for jobs in (1, 2):
+            buff.seek(0)
+            with Zip.jobs(jobs):
+                self.assertRaises(
+                    ValueError, ctdzipex.read, DataFileCollection(), buff)
+
+    def test_bad_write(self):
+        """A DataFile that cannot be written raises with any number of jobs.
+        """
+        class Writer(object):
+            @staticmethod
+            def write(dfile, fileobj):
+                if dfile.globals['STNNBR'] == second:
+                    raise ValueError(u'Unable to write')
+                ctdex.write(dfile, fileobj)
+
+        dfc = DataFileCollection()
+        ctdzipex.read(dfc, self.infile)
+        second = dfc.files[1].globals['STNNBR']
+        for jobs in (1, 2):
+            with Zip.jobs(jobs):
+                self.assertRaises(
+                    ValueError, Zip.write, dfc, StringIO(), Writer,
+                    ctdex.get_datafile_filename)
 
 class TestCTDZipNetCDF(unittest.TestCase):
     def setUp(self):
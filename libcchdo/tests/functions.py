@@ -81,6 +81,21 @@ class TestFunctions(unittest.TestCase):
         self.assertFalse(fns.out_of_band(''))
         self.assertTrue(fns.out_of_band(None))
 
+    def test_out_of_band_mask(self):
+        """Whole columns are out of band where each value would be."""
+        import numpy as np
+        raws = ['-999', '-998.9', '-998.91', '-999.0900', '12.5', '-9.0']
+        floats = map(float, raws)
+        expected = [fns.out_of_band(raw) for raw in raws]
+        self.assertEqual(
+            [True, False, True, True, False, False], expected)
+        self.assertEqual(expected, fns.out_of_band_mask(floats, raws))
+        self.assertEqual(
+            expected, fns.out_of_band_array(np.array(floats), raws).tolist())
+        self.assertEqual(
+            [False, False, False, False, False, True],
+            fns.out_of_band_mask(floats, raws, -9))
+
     def test_in_band_or_none(self):
         self.assertTrue(fns.in_band_or_none(0) == 0)
         self.assertTrue(fns.in_band_or_none(-999) is None)
@@ -5,11 +5,13 @@ from tempfile import TemporaryFile, NamedTemporaryFile
 from os import unlink
 
 from libcchdo.fns import _decimal, decimal_to_str
-from libcchdo.model.datafile import DataFile, DataFileCollection
+from libcchdo.model.datafile import (
+    DataFile, DataFileCollection, column_storage)
+from libcchdo.model.storage import ValueArray
 from libcchdo.db.model.std import Unit
 from libcchdo.merge import (
     BOTTLE_KEY_COLS, determine_bottle_keys, different_columns, map_collections,
-    merge_collections, merge_datafiles)
+    merge_collections, merge_datafiles, map_keys, overwrite_list)
 from libcchdo.recipes.orderedset import OrderedSet
 
 from libcchdo.tests import BaseTestCase
@@ -417,6 +419,45 @@ END_DATA
         ]
         self.assertTrue(self.ensure_lines(lines))
 
+    def test_map_keys(self):
+        """Rows are mapped by key and missing keys are warned about at once."""
+        df0 = DataFile()
+        df0.create_columns(['STNNBR', 'SAMPNO'])
+        df0['STNNBR'].values = [1, 2, 1, 3, 3]
+        df0['SAMPNO'].values = ['1', '1', '2', '1', '1']
+        df1 = DataFile()
+        df1.create_columns(['STNNBR', 'SAMPNO'])
+        df1['STNNBR'].values = [2, 1, 4, 1, 4]
+        df1['SAMPNO'].values = ['1', '1', '1', '1', '1']
+
+        keymap = map_keys(df0, df1, ['STNNBR', 'SAMPNO'])
+        self.assertEqual([(0, 1, (1, '1')), (1, 0, (2, '1'))], keymap)
+        self.assertEqual([0, 1], keymap.origin_rows.tolist())
+        self.assertEqual([1, 0], keymap.deriv_rows.tolist())
+
+        lines = [
+            "Picked the first row of occurrence in derivative data for non "
+            "unique keys: OrderedSet([(1, '1')])",
+            "Key (1, '2') does not exist in derivative from origin rows [2]",
+            "Key (3, '1') does not exist in derivative from origin rows [3, 4]",
+            "Key (4, '1') does not exist in origin from derivative rows [2, 4]",
+        ]
+        self.assertTrue(self.ensure_lines(lines))
+
+    def test_overwrite_list(self):
+        """Derivative values are scattered onto origin rows."""
+        keymap = [(0, 1, ('a',)), (3, 0, ('b',)), (1, 5, ('c',))]
+        self.assertEqual(
+            [20, 2, None, 10], overwrite_list([1, 2], [10, 20], keymap))
+        with column_storage('array'):
+            origin = ValueArray([_decimal('1.0'), None, _decimal('3.0')])
+            deriv = ValueArray([_decimal('10.00'), _decimal('20.00')])
+            overwrite_list(origin, deriv, keymap)
+        self.assertEqual(
+            [_decimal('20.00'), None, _decimal('3.0'), _decimal('10.00')],
+            origin)
+        self.assertEqual(['20.00', None, '3.0', '10.00'], origin.to_strings())
+
     def test_diff_decplaces(self):
         """Derivative is still different when decimal places are different."""
         dfo = DataFile()
@@ -0,0 +1,121 @@
+"""Test the station header index."""
+
+import os
+import os.path
+from contextlib import closing
+from datetime import date, datetime
+from shutil import copy, rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from libcchdo.fns import Decimal
+from libcchdo.model.datafile import DataFileCollection
+from libcchdo.model.header_index import HeaderIndex
+from libcchdo.formats.ctd.zip import exchange as ctdzipex
+
+from libcchdo.tests import sample_file
+
+
+class TestHeaderIndex(TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+        self.ctdzip = os.path.join(self.tempdir, 'i08s_33RR20070204_ct1.zip')
+        copy(sample_file('i08s_33RR20070204_ct1.zip'), self.ctdzip)
+        self.index = HeaderIndex(os.path.join(self.tempdir, 'index.db'))
+
+    def tearDown(self):
+        self.index.close()
+        rmtree(self.tempdir)
+
+    def test_update_incremental(self):
+        """Archives are only read again when they change."""
+        self.assertEqual(self.index.update([self.ctdzip]), 1)
+        self.assertEqual(self.index.update([self.ctdzip]), 0)
+
+        stat = os.stat(self.ctdzip)
+        os.utime(self.ctdzip, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(self.index.update([self.ctdzip]), 1)
+        self.assertEqual(len(self.index.query()), 2)
+
+    def test_update_persists(self):
+        """The index is kept on disk."""
+        self.index.update([self.ctdzip])
+        with closing(HeaderIndex(self.index.path)) as index:
+            self.assertFalse(index.update_archive(self.ctdzip))
+            self.assertEqual(len(index.query()), 2)
+
+    def test_query_headers(self):
+        """Member headers, row counts and parameters are indexed."""
+        self.index.update([self.ctdzip])
+        station = self.index.query()[0]
+        self.assertEqual(station.path, os.path.realpath(self.ctdzip))
+        self.assertEqual(station.member, '00101_ct1.csv')
+        self.assertEqual(station.expocode, '33RR20070204')
+        self.assertEqual(station.stnnbr, '1')
+        self.assertEqual(station.castno, '1')
+        self.assertEqual(station.latitude, Decimal('-65.8108'))
+        self.assertEqual(station.longitude, Decimal('84.5501'))
+        self.assertEqual(station.datetime, datetime(2007, 2, 15, 14, 24))
+        self.assertEqual(station.depth, '450')
+        self.assertEqual(station.rows, 221)
+        self.assertEqual(
+            station.parameters,
+            ['CTDPRS', 'CTDTMP', 'CTDSAL', 'CTDOXY', 'CTDNOBS', 'CTDETIME',
+             'TRANSM', 'FLUORM'])
+
+    def test_query(self):
+        """Stations are found by position, time and parameters."""
+        self.index.update([self.ctdzip])
+
+        def stnnbrs(**kwargs):
+            return [station.stnnbr for station in self.index.query(**kwargs)]
+
+        self.assertEqual(stnnbrs(bbox=(84.54, -66, 85, -65)), ['1'])
+        self.assertEqual(stnnbrs(bbox=(0, 0, 10, 10)), [])
+        # Crossing the antimeridian
+        self.assertEqual(stnnbrs(bbox=(170, -90, 84.54, 90)), ['2'])
+        self.assertEqual(stnnbrs(start=datetime(2007, 2, 15, 15)), ['2'])
+        self.assertEqual(stnnbrs(end=date(2007, 2, 15)), ['1', '2'])
+        self.assertEqual(stnnbrs(end=date(2007, 2, 14)), [])
+        self.assertEqual(stnnbrs(parameters=['CTDOXY', 'FLUORM']), ['1', '2'])
+        self.assertEqual(stnnbrs(parameters=['CTDOXY', 'CFC-11']), [])
+        self.assertEqual(stnnbrs(expocode='33RR20070204'), ['1', '2'])
+        self.assertEqual(stnnbrs(paths=[self.ctdzip + '.none']), [])
+
+    def test_read_headers(self):
+        """Headers from the index match a header only read."""
+        headers = self.index.read_headers(self.ctdzip)
+        dfc = DataFileCollection()
+        with open(self.ctdzip) as fff:
+            ctdzipex.read(dfc, fff, header_only=True)
+        self.assertEqual(len(headers), len(dfc))
+        for indexed, dfile in zip(headers, dfc):
+            for key in ['EXPOCODE', 'STNNBR', 'CASTNO', 'LATITUDE',
+                        'LONGITUDE', '_DATETIME', 'DEPTH', '_FILENAME']:
+                self.assertEqual(indexed.globals[key], dfile.globals[key])
+
+    def test_bottle_exchange(self):
+        """Each cast in a bottle file is indexed."""
+        path = sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv')
+        self.index.update([path])
+        stations = self.index.query(paths=[path])
+        self.assertTrue(stations)
+        self.assertTrue(all(station.member is None for station in stations))
+        self.assertTrue(all('CTDPRS' in station.parameters
+                            for station in stations))
+
+    def test_prune(self):
+        """Archives that no longer exist can be removed."""
+        self.index.update([self.ctdzip])
+        os.remove(self.ctdzip)
+        self.assertEqual(self.index.prune(), 1)
+        self.assertEqual(self.index.query(), [])
+
+    def test_unindexable(self):
+        """Archives that can't be indexed are skipped."""
+        path = os.path.join(self.tempdir, 'unknown.txt')
+        with open(path, 'w') as fff:
+            fff.write('nothing')
+        self.assertEqual(self.index.update([path]), 0)
+        self.assertRaises(ValueError, self.index.update_archive, path)
@@ -0,0 +1,177 @@
+""" Test case for ..model.storage """
+
+
+from StringIO import StringIO
+from unittest import TestCase
+
+import numpy as np
+
+from libcchdo.fns import Decimal
+from libcchdo.model.datafile import (
+    DataFile, Column, column_storage, get_column_storage)
+from libcchdo.model.storage import ValueArray, FlagArray, float64, masked
+from libcchdo.formats.bottle import exchange as botex
+from libcchdo.tests import sample_file
+
+
+class TestValueArray(TestCase):
+
+    def test_decimal_round_trip(self):
+        """Decimals keep their precision including trailing zeros."""
+        decs = [Decimal('1.0'), Decimal('-999.0000'), None, Decimal('0.000'),
+                Decimal('12345678.123')]
+        values = ValueArray(decs)
+        self.assertEqual('decimal', values.kind)
+        self.assertEqual(decs, values)
+        self.assertEqual(
+            ['1.0', '-999.0000', 'None', '0.000', '12345678.123'],
+            map(str, values))
+
+    def test_append_grows(self):
+        values = ValueArray()
+        for iii in range(1000):
+            values.append(Decimal(iii))
+        self.assertEqual(1000, len(values))
+        self.assertEqual(Decimal(999), values[-1])
+
+    def test_fallback(self):
+        """Values that are not compact fall back to a list."""
+        values = ValueArray([Decimal('1.2'), None])
+        values.append('SIO1')
+        self.assertEqual('object', values.kind)
+        self.assertEqual([Decimal('1.2'), None, 'SIO1'], values)
+
+        values = ValueArray([Decimal('1.2')])
+        values.append(3)
+        self.assertEqual('object', values.kind)
+        self.assertEqual([Decimal('1.2'), 3], values)
+
+    def test_slices(self):
+        values = ValueArray([Decimal(1), Decimal(2), Decimal(3)])
+        self.assertEqual([Decimal(2), Decimal(3)], values[1:])
+        values[0:2] = [None, Decimal('4.5')]
+        self.assertEqual([None, Decimal('4.5'), Decimal(3)], values)
+        # Assigning past the end extends like a list
+        values[3:5] = [Decimal(6), Decimal(7)]
+        self.assertEqual(5, len(values))
+        del values[0]
+        self.assertEqual(Decimal('4.5'), values[0])
+
+    def test_arrays(self):
+        values = ValueArray([Decimal('1.25'), None, Decimal('-2')])
+        self.assertEqual([False, True, False], values.mask().tolist())
+        floats = values.to_float64()
+        self.assertEqual(1.25, floats[0])
+        self.assertTrue(np.isnan(floats[1]))
+        self.assertEqual(2, values.decimal_places())
+
+        values = ValueArray.from_float64([1.2344, np.nan, -999.0], 3)
+        self.assertEqual(
+            [Decimal('1.234'), None, Decimal('-999.000')], values)
+
+    def test_float64(self):
+        """Lists, ValueArrays and arrays become float64 with NaN missing."""
+        expected = [1.25, np.nan, -2.0]
+        for values in (
+                [Decimal('1.25'), None, Decimal('-2')],
+                ValueArray([Decimal('1.25'), None, Decimal('-2')]),
+                np.ma.masked_invalid(expected)):
+            floats = float64(values)
+            self.assertEqual(np.float64, floats.dtype)
+            self.assertTrue(np.array_equal(
+                np.isnan(floats), np.isnan(expected)))
+            self.assertEqual([1.25, -2.0], floats[[0, 2]].tolist())
+            mask = np.ma.getmaskarray(masked(values))
+            self.assertEqual([False, True, False], mask.tolist())
+        self.assertTrue(np.isnan(float64(None)))
+        self.assertEqual(np.float64(3), float64(Decimal(3)))
+
+    def test_take(self):
+        values = ValueArray([Decimal('1.0'), None, Decimal('-2.50')])
+        taken = values.take([2, 0, 1, -1])
+        self.assertTrue(isinstance(taken, ValueArray))
+        self.assertEqual(
+            [Decimal('-2.50'), Decimal('1.0'), None, Decimal('-2.50')], taken)
+        self.assertEqual(['-2.50', '1.0', None, '-2.50'], taken.to_strings())
+        self.assertEqual([], values.take([]))
+        self.assertEqual(['b', 'a'], ValueArray(['a', 'b']).take([1, 0]))
+        self.assertEqual([None], ValueArray([None, None]).take([1]))
+        self.assertEqual([9, 2], FlagArray([2, 9]).take([1, 0]))
+        with self.assertRaises(IndexError):
+            values.take([3])
+
+    def test_put(self):
+        values = ValueArray([None, None, Decimal('3.0')])
+        values.put([2, 0], ValueArray([Decimal('1.25'), Decimal('-2')]))
+        self.assertEqual([Decimal('-2'), None, Decimal('1.25')], values)
+        values.put([1], [Decimal('0.5')])
+        self.assertEqual(Decimal('0.5'), values[1])
+        values.put([0], ['SIO1'])
+        self.assertEqual('object', values.kind)
+        self.assertEqual(['SIO1', Decimal('0.5'), Decimal('1.25')], values)
+
+        empty = ValueArray([None, None])
+        empty.put([1], ValueArray([Decimal('1.0')]))
+        self.assertEqual([None, Decimal('1.0')], empty)
+        with self.assertRaises(IndexError):
+            empty.put([2], [None])
+
+    def test_flags(self):
+        flags = FlagArray([2, None, 9])
+        self.assertEqual('int', flags.kind)
+        flags += [3] * 2
+        self.assertEqual([2, None, 9, 3, 3], flags)
+        flags.append('a')
+        self.assertEqual('object', flags.kind)
+
+    def test_to_strings(self):
+        values = ValueArray([Decimal('1.250'), None, Decimal('-0.01'),
+                             Decimal('0E-7'), Decimal('-12'), Decimal(0)])
+        self.assertEqual(
+            ['1.250', None, '-0.01', '0.0000000', '-12', '0'],
+            values.to_strings())
+        self.assertEqual([None, '2', '-3'], FlagArray([None, 2, -3]).to_strings())
+        self.assertEqual(None, ValueArray([1.5]).to_strings())
+
+
+class TestArrayColumn(TestCase):
+
+    def test_storage_context(self):
+        saved = get_column_storage()
+        with column_storage('array'):
+            column = Column('CTDSAL')
+        self.assertEqual(saved, get_column_storage())
+        self.assertEqual('array', column.storage)
+        self.assertTrue(isinstance(column.values, ValueArray))
+        self.assertTrue(isinstance(column.flags_woce, FlagArray))
+        with self.assertRaises(ValueError):
+            Column('CTDSAL', storage='tape')
+
+    def test_column_api(self):
+        column = Column('CTDSAL', storage='array')
+        column.set(2, Decimal('34.1'), 2)
+        self.assertEqual([None, None, Decimal('34.1')], column.values)
+        self.assertEqual([None, None, 2], column.flags_woce)
+        column.append(Decimal('34.20'), 3)
+        column.set_length(6)
+        self.assertEqual(6, len(column))
+        self.assertEqual([None, None, 2, 3, 9, 9], column.flags_woce)
+        self.assertEqual(2, column.decimal_places())
+        column.values = [Decimal('1'), Decimal('2')]
+        self.assertTrue(isinstance(column.values, ValueArray))
+
+    def test_exchange_identical(self):
+        """Reading and writing with array storage gives the same output."""
+        def round_trip():
+            dfile = DataFile()
+            with open(sample_file(
+                    'bottle_exchange', '64PE20050907_hy1.csv')) as fff:
+                botex.read(dfile, fff)
+            out = StringIO()
+            botex.write(dfile, out)
+            return out.getvalue()
+
+        with column_storage('list'):
+            expected = round_trip()
+        with column_storage('array'):
+            self.assertEqual(expected, round_trip())
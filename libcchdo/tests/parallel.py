@@ -0,0 +1,59 @@
+"""Test mapping over items with forked workers."""
+
+import os
+from contextlib import closing
+from unittest import TestCase
+
+from libcchdo.parallel import check_jobs, fork_imap, fork_map
+
+
+class Unpicklable(Exception):
+    """An exception that cannot be sent between processes."""
+    def __init__(self, value):
+        Exception.__init__(self)
+        self.value = lambda: value
+
+
+class TestParallel(TestCase):
+
+    def test_check_jobs(self):
+        self.assertEqual(check_jobs(3), 3)
+        self.assertTrue(check_jobs(0) >= 1)
+        self.assertTrue(check_jobs(None) >= 1)
+        self.assertRaises(ValueError, check_jobs, -1)
+
+    def test_order(self):
+        """Results are in item order with or without workers."""
+        # Closures cannot be pickled; workers inherit them instead.
+        offset = 10
+        func = lambda item: (item + offset, os.getpid())
+        items = (i for i in range(9))
+        results = fork_map(func, items, 3)
+        self.assertEqual([result for result, _ in results], range(10, 19))
+        self.assertFalse(os.getpid() in set(pid for _, pid in results))
+
+        results = fork_map(func, range(9))
+        self.assertEqual(set(pid for _, pid in results), set([os.getpid()]))
+
+    def test_errors(self):
+        """The first error is raised with or without workers."""
+        def func(item):
+            if item >= 2:
+                raise KeyError(item)
+            return item
+        for jobs in (1, 2):
+            with closing(fork_imap(func, range(5), jobs)) as results:
+                self.assertEqual(results.next(), 0)
+                self.assertEqual(results.next(), 1)
+                try:
+                    results.next()
+                    self.fail('Expected KeyError')
+                except KeyError, err:
+                    self.assertEqual(err.args, (2, ))
+
+    def test_unpicklable_error(self):
+        """Errors that cannot be sent back are raised as RuntimeErrors."""
+        def func(item):
+            raise Unpicklable(item)
+        self.assertRaises(Unpicklable, fork_map, func, range(2), 1)
+        self.assertRaises(RuntimeError, fork_map, func, range(2), 2)
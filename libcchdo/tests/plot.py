@@ -0,0 +1,35 @@
+"""Test plotting helpers that do not need matplotlib."""
+
+import os
+from unittest import TestCase
+
+from libcchdo.plot import render_frames
+
+
+class TestRenderFrames(TestCase):
+
+    def test_order(self):
+        """Frames are rendered in order with or without workers."""
+        # Closures cannot be pickled; workers inherit them instead.
+        offset = 10
+        render = lambda frame: (frame + offset, os.getpid())
+        frames = range(7)
+        sequential = render_frames(render, frames)
+        self.assertEqual(
+            [result for result, _ in sequential], range(10, 17))
+        self.assertEqual(set(pid for _, pid in sequential), set([os.getpid()]))
+
+        parallel = render_frames(render, frames, jobs=2)
+        self.assertEqual([result for result, _ in parallel], range(10, 17))
+        self.assertFalse(os.getpid() in set(pid for _, pid in parallel))
+
+    def test_errors(self):
+        """Errors in workers are raised."""
+        def render(frame):
+            if frame == 2:
+                raise ValueError(frame)
+            return frame
+        self.assertRaises(ValueError, render_frames, render, range(4), 2)
+
+    def test_negative_jobs(self):
+        self.assertRaises(ValueError, render_frames, lambda x: x, range(3), -1)
@@ -0,0 +1,84 @@
+"""Test the tiled ETOPO store."""
+
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+import numpy as np
+from netCDF4 import Dataset
+
+from libcchdo.plot.etopo_store import EtopoStore
+
+
+class TestEtopoStore(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp(prefix='libcchdo_etopo')
+        self.source = os.path.join(self.directory, 'source.grd')
+        # A one degree global grid with heights that increase with latitude
+        # and longitude so that box means of interior nodes are exact.
+        lons = np.linspace(-180, 180, 361)
+        lats = np.linspace(-90, 90, 181)
+        self.topo = (np.arange(181)[:, np.newaxis] * 100 +
+                     np.arange(361)[np.newaxis, :] % 360 - 9000)
+        toponc = Dataset(self.source, 'w')
+        try:
+            toponc.createDimension('x', lons.size)
+            toponc.createDimension('y', lats.size)
+            toponc.createVariable('x', 'f8', ('x', ))[:] = lons
+            toponc.createVariable('y', 'f8', ('y', ))[:] = lats
+            toponc.createVariable('z', 'i4', ('y', 'x', ))[:] = self.topo
+        finally:
+            toponc.close()
+        self.store = EtopoStore(os.path.join(self.directory, 'store'))
+        self.store.build(self.source, levels=(60, 120, 300), tile_size=16)
+
+    def tearDown(self):
+        rmtree(self.directory, ignore_errors=True)
+
+    def test_levels(self):
+        """Levels are built at each resolution and chosen by node spacing."""
+        self.assertTrue(self.store.is_built())
+        self.assertEqual(self.store.levels, [60, 120, 300])
+        self.assertEqual(self.store.shape(60), (181, 361))
+        self.assertEqual(self.store.shape(120), (91, 181))
+        self.assertEqual(self.store.shape(300), (37, 73))
+        self.assertEqual(self.store.level_for(30), 60)
+        self.assertEqual(self.store.level_for(150), 120)
+        self.assertEqual(self.store.level_for(1000), 300)
+
+        lons, lats, topo = self.store.region(60)
+        self.assertEqual(topo.shape, (181, 361))
+        self.assertTrue(np.array_equal(topo, self.topo))
+
+        # Interior nodes of coarser levels are the means around them.
+        lons, lats, topo = self.store.region(300, 0, 50, 0, 50)
+        self.assertEqual(list(lons), [0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50])
+        self.assertEqual(topo[0, 0], self.topo[90, 180])
+        self.assertEqual(topo[2, 3], self.topo[100, 195])
+
+    def test_region(self):
+        """Regions cover their bounds and wrap around the antimeridian."""
+        lons, lats, topo = self.store.region(60, -30.5, -20.2, 10.7, 15)
+        self.assertEqual(lons[0], -31)
+        self.assertEqual(lons[-1], -20)
+        self.assertEqual(lats[0], 10)
+        self.assertEqual(lats[-1], 15)
+        self.assertTrue(np.array_equal(topo, self.topo[100:106, 149:161]))
+
+        lons, lats, topo = self.store.region(60, 170, 190, -90, -80)
+        self.assertEqual(list(lons), range(170, 191))
+        self.assertTrue(np.array_equal(topo[:, :10], self.topo[:11, 350:360]))
+        self.assertTrue(np.array_equal(topo[:, 10:], self.topo[:11, 0:11]))
+
+        lons, lats, topo = self.store.region(120, -400, 400)
+        self.assertEqual(topo.shape, (91, 181))
+        self.assertEqual(lons[-1] - lons[0], 360)
+
+    def test_rebuild(self):
+        """A store whose index is gone is not used."""
+        os.remove(self.store.index_path)
+        self.assertFalse(EtopoStore(self.store.directory).is_built())
+        self.assertRaises(
+            ValueError, self.store.build, self.source, levels=(90, ))
@@ -0,0 +1,54 @@
+"""Test bicubic convolution interpolation."""
+
+from unittest import TestCase
+
+import numpy as np
+
+from libcchdo.plot.interpolation import BicubicConvolution
+
+
+class TestBicubicConvolution(TestCase):
+
+    def setUp(self):
+        self.xs = np.linspace(-180, 180, 37)
+        self.ys = np.linspace(-90, 90, 19)
+        # Linear along each axis so that the interpolation is exact inside
+        self.zs = (np.arange(19)[:, np.newaxis] * 50. +
+                   np.arange(37)[np.newaxis, :] * 2.)
+        self.fzs = BicubicConvolution(self.xs, self.ys, self.zs)
+
+    def expected(self, xs, ys):
+        return ((np.asarray(ys)[:, np.newaxis] + 90) / 10. * 50. +
+                (np.asarray(xs)[np.newaxis, :] + 180) / 10. * 2.)
+
+    def test_nodes(self):
+        """The grid nodes are reproduced."""
+        zs = self.fzs(self.xs, self.ys)
+        self.assertEqual(zs.shape, (19, 37))
+        self.assertTrue(np.allclose(zs, self.zs))
+
+    def test_between(self):
+        """Points between nodes are interpolated in both directions."""
+        xs = np.linspace(-155, 155, 50)
+        ys = np.linspace(-75, 75, 20)
+        zs = self.fzs(xs, ys)
+        self.assertEqual(zs.shape, (20, 50))
+        self.assertTrue(np.allclose(zs, self.expected(xs, ys)))
+        self.assertAlmostEqual(
+            self.fzs.get_value(5, -5), self.expected([5], [-5])[0, 0])
+
+    def test_edges(self):
+        """Data is wrapped left and right and reflected above and below."""
+        self.assertTrue(np.array_equal(
+            self.fzs.wrap_x(np.array([-1, 0, 37, 38])), [36, 0, 0, 1]))
+        self.assertTrue(np.array_equal(
+            self.fzs.reflect_y(np.array([-2, -1, 0, 18, 19, 20])),
+            [2, 1, 0, 18, 17, 16]))
+
+    def test_blocks(self):
+        """Evaluating in blocks of rows does not change the result."""
+        xs = np.linspace(-180, 180, 101)
+        ys = np.linspace(-90, 90, 41)
+        whole = self.fzs(xs, ys)
+        self.fzs.block_points = 300
+        self.assertTrue(np.array_equal(self.fzs(xs, ys), whole))
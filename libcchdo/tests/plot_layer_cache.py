@@ -0,0 +1,68 @@
+"""Test the cache of projected map layers."""
+
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+import numpy as np
+from numpy import ma
+
+from libcchdo.plot.layer_cache import LayerCache, layer_key
+
+
+class TestLayerCache(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp(prefix='libcchdo_layers')
+        self.cache = LayerCache(os.path.join(self.directory, 'layers'))
+
+    def tearDown(self):
+        rmtree(self.directory, ignore_errors=True)
+
+    def test_key(self):
+        """Keys depend on the values of the parameters, not their order."""
+        key = layer_key(projection='merc', corners=[-80, -60, 20, 60], cut=4)
+        self.assertEqual(
+            key, layer_key(cut=4, corners=[-80, -60, 20, 60], projection='merc'))
+        self.assertNotEqual(
+            key, layer_key(projection='merc', corners=[-80, -60, 20, 60], cut=5))
+        self.assertEqual(
+            layer_key(scale=np.float64(1.5)), layer_key(scale=np.float64(1.5)))
+
+    def test_get_put(self):
+        """Layers are stored with their masks and read back memory mapped."""
+        self.assertTrue(self.cache.get('missing') is None)
+
+        layer = ma.masked_array(
+            np.arange(12, dtype=float).reshape(3, 4),
+            mask=np.arange(12).reshape(3, 4) % 5 == 0)
+        self.cache.put('masked', layer)
+        cached = self.cache.get('masked')
+        self.assertTrue(isinstance(cached.data, np.memmap))
+        self.assertTrue(np.array_equal(cached.data, layer.data))
+        self.assertTrue(np.array_equal(cached.mask, layer.mask))
+
+        self.cache.put('masked', np.ones((2, 2)))
+        cached = self.cache.get('masked')
+        self.assertFalse(ma.isMaskedArray(cached))
+        self.assertTrue(np.array_equal(cached, np.ones((2, 2))))
+
+    def test_evict(self):
+        """The least recently used layers are evicted over the size limit."""
+        layer = np.zeros((16, 16))
+        self.cache.put('a', layer)
+        size = self.cache.entries()[0][1]
+        self.cache.max_bytes = size * 2
+        self.cache.put('b', layer)
+        # Use a so that b is the least recently used.
+        path_a = os.path.join(self.cache.directory, 'a.npy')
+        path_b = os.path.join(self.cache.directory, 'b.npy')
+        os.utime(path_b, (1, 1))
+        os.utime(path_a, (2, 2))
+        self.assertTrue(self.cache.get('a') is not None)
+        self.cache.put('c', layer)
+        self.assertTrue(self.cache.get('b') is None)
+        self.assertTrue(self.cache.get('a') is not None)
+        self.assertTrue(self.cache.get('c') is not None)
+        self.assertEqual(len(self.cache.entries()), 2)
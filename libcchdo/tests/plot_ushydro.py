@@ -0,0 +1,108 @@
+"""Test that maps drawn in parallel are the maps drawn one after another."""
+
+import os
+import json
+import shutil
+from hashlib import md5
+from StringIO import StringIO
+from tempfile import mkdtemp
+from unittest import TestCase, skipIf
+
+import numpy as np
+
+try:
+    from netCDF4 import Dataset
+    from libcchdo.plot import etopo, ushydro
+    from libcchdo.plot.etopo_store import EtopoStore
+except ImportError:
+    etopo = None
+
+from libcchdo.tests import sample_file
+from libcchdo.util import get_library_abspath
+
+
+@skipIf(etopo is None, 'matplotlib and basemap are needed to draw maps')
+class TestParallelFrames(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp(prefix='libcchdo_frames')
+        self.saved_etopo_dir = etopo.etopo_dir
+        self.saved_cache = os.environ.get('LIBCCHDO_PLOT_LAYER_CACHE')
+        self.saved_cwd = os.getcwd()
+        etopo.etopo_dir = self.directory
+        os.environ['LIBCCHDO_PLOT_LAYER_CACHE'] = os.path.join(
+            self.directory, 'layers')
+
+        # A half degree world with land and sea on every map instead of
+        # downloading ETOPO1.
+        lons = np.linspace(-180, 180, 721)
+        lats = np.linspace(-90, 90, 361)
+        topo = (np.cos(np.radians(lats * 10))[:, np.newaxis] *
+                np.sin(np.radians(lons * 10))[np.newaxis, :] * 4000 - 1000)
+        source = os.path.join(self.directory, 'source.grd')
+        toponc = Dataset(source, 'w')
+        try:
+            toponc.createDimension('x', lons.size)
+            toponc.createDimension('y', lats.size)
+            toponc.createVariable('x', 'f8', ('x', ))[:] = lons
+            toponc.createVariable('y', 'f8', ('y', ))[:] = lats
+            toponc.createVariable('z', 'i4', ('y', 'x', ))[:] = topo
+        finally:
+            toponc.close()
+        EtopoStore(etopo.etopo_store_dir('ice')).build(source, levels=(30, 60))
+
+    def tearDown(self):
+        os.chdir(self.saved_cwd)
+        etopo.etopo_dir = self.saved_etopo_dir
+        if self.saved_cache is None:
+            del os.environ['LIBCCHDO_PLOT_LAYER_CACHE']
+        else:
+            os.environ['LIBCCHDO_PLOT_LAYER_CACHE'] = self.saved_cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _digests(self, directory):
+        digests = {}
+        for fname in os.listdir(directory):
+            with open(os.path.join(directory, fname), 'rb') as fff:
+                digests[fname] = md5(fff.read()).hexdigest()
+        return digests
+
+    def test_ushydro(self):
+        """The frames and image map outlines do not depend on the jobs."""
+        with open(os.path.join(
+                get_library_abspath(), 'resources', 'ushydro.json')) as fff:
+            lines = json.load(fff)
+        lines['features'] = lines['features'][:3]
+
+        results = []
+        for jobs in (1, 2):
+            save_dir = os.path.join(self.directory, 'ushydro{0}'.format(jobs))
+            os.mkdir(save_dir)
+            ushydro.gen_plots(StringIO(json.dumps(lines)), save_dir, jobs)
+            results.append((
+                list(ushydro.filenames), list(ushydro.lines),
+                list(ushydro.outlines), list(ushydro.b_outlines),
+                self._digests(save_dir)))
+        self.assertEqual(len(results[0][0]), 5)
+        self.assertEqual(len(results[0][2]), 3)
+        self.assertEqual(results[0], results[1])
+
+    def test_battery(self):
+        """The battery of plots does not depend on the jobs."""
+        from libcchdo.scripts import hydro_parser
+
+        digests = []
+        for jobs in (1, 2):
+            run_dir = os.path.join(self.directory, 'battery{0}'.format(jobs))
+            os.mkdir(run_dir)
+            os.chdir(run_dir)
+            shutil.copy(
+                sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv'),
+                '49MR0502_hy1.csv')
+            args = hydro_parser.parse_args([
+                'plot', 'battery', '--width', '240', '30',
+                '--jobs', str(jobs)])
+            args.main(args)
+            digests.append(self._digests('etopo_battery'))
+        self.assertEqual(len(digests[0]), 10)
+        self.assertEqual(digests[0], digests[1])
@@ -1,6 +1,7 @@
 """Test scripts entry point for hydro."""
 
 import sys
+import json
 from contextlib import closing
 from StringIO import StringIO
 from tempfile import mkstemp
@@ -46,6 +47,51 @@ class TestScripts(TestCase):
         except SystemExit:
             pass
 
+    def _main(self, argv):
+        """Run hydro with argv and ignore what it prints."""
+        saved_argv, saved_stderr = sys.argv, sys.stderr
+        sys.argv = ['hydro'] + argv
+        sys.stderr = NullDevice()
+        try:
+            scripts.main()
+        except SystemExit:
+            pass
+        finally:
+            sys.argv, sys.stderr = saved_argv, saved_stderr
+
+    def test_stage_times(self):
+        """--stage-times writes the time of each stage as JSON."""
+        from libcchdo.tests import sample_file
+        fd, path = mkstemp()
+        os.close(fd)
+        try:
+            self._main([
+                '--stage-times', path, 'check', 'any',
+                sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv')])
+            with open(path) as fff:
+                stages = json.load(fff)['stages']
+        finally:
+            os.unlink(path)
+        self.assertEqual(stages[0]['stage'], 'read_arbitrary')
+        self.assertEqual(stages[0]['rows'], 18)
+        self.assertTrue(
+            'read_arbitrary/btl.ex.read' in
+            [stg['stage'] for stg in stages])
+
+    def test_profile(self):
+        """--profile writes cProfile statistics."""
+        from pstats import Stats
+        from libcchdo.tests import sample_file
+        fd, path = mkstemp()
+        os.close(fd)
+        try:
+            self._main([
+                '--profile', path, 'check', 'any',
+                sample_file('bottle_exchange', 'a10_33RO20110926_hy1.csv')])
+            self.assertTrue(Stats(path).total_calls > 0)
+        finally:
+            os.unlink(path)
+
     def test_reorder_columns(self):
         """Ensure columns reorder correctly."""
         with closing(StringIO()) as fff:
@@ -75,3 +121,27 @@ class TestScripts(TestCase):
                     self.assertEqual(lines[2].split(','), answer)
             finally:
                 os.unlink(path)
+
+    def test_read_station_headers_index_unavailable(self):
+        """Station headers are read whole when the index cannot be opened."""
+        from libcchdo.tests import sample_file
+        path = sample_file('i08s_33RR20070204_ct1.zip')
+        saved = os.environ.get('LIBCCHDO_INDEX_PATH')
+        os.environ['LIBCCHDO_INDEX_PATH'] = '/proc/nonexistent/index.db'
+        try:
+            with open(path) as fff:
+                dfc = scripts._read_station_headers(fff, use_index=True)
+        finally:
+            if saved is None:
+                del os.environ['LIBCCHDO_INDEX_PATH']
+            else:
+                os.environ['LIBCCHDO_INDEX_PATH'] = saved
+        self.assertEqual(len(dfc), 2)
+        self.assertFalse(os.path.exists('/proc/nonexistent'))
+
+    def test_jobs(self):
+        """--jobs is checked the same way for every subcommand."""
+        from argparse import ArgumentTypeError
+        self.assertEqual(scripts._jobs('2'), 2)
+        self.assertTrue(scripts._jobs('0') >= 1)
+        self.assertRaises(ArgumentTypeError, scripts._jobs, '-1')
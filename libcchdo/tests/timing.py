@@ -0,0 +1,99 @@
+"""Test timing stages."""
+
+import json
+from StringIO import StringIO
+from unittest import TestCase
+
+from libcchdo import timing
+from libcchdo.model.datafile import DataFile, DataFileCollection
+
+
+class TestTiming(TestCase):
+
+    def tearDown(self):
+        timing.disable()
+
+    def _dfile(self, rows):
+        dfile = DataFile()
+        dfile.create_columns(['CTDPRS'])
+        dfile['CTDPRS'].values = range(rows)
+        return dfile
+
+    def test_disabled(self):
+        """Nothing is recorded until a timer is enabled."""
+        self.assertEqual(timing.get_timer(), None)
+        with timing.stage('read') as record:
+            record.rows = 3
+        timer = timing.enable()
+        self.assertEqual(timer.stages.keys(), [])
+        self.assertTrue(timing.disable() is timer)
+
+    def test_stage(self):
+        """Stages are recorded under the stages they are in."""
+        timer = timing.enable()
+        for _ in range(2):
+            with timing.stage('read') as record:
+                with timing.stage('parse') as inner:
+                    inner.rows = 5
+                record.rows = 10
+        with timing.stage('write'):
+            pass
+        self.assertEqual(
+            timer.stages.keys(), ['read', 'read/parse', 'write'])
+        self.assertEqual(timer.stages['read'].calls, 2)
+        self.assertEqual(timer.stages['read'].rows, 20)
+        self.assertEqual(timer.stages['read/parse'].rows, 10)
+        self.assertEqual(timer.stages['write'].rows, None)
+        self.assertTrue(
+            timer.stages['read'].seconds >= timer.stages['read/parse'].seconds)
+        self.assertTrue(timer.stages['read'].peak_rss > 0)
+
+    def test_stage_error(self):
+        """Stages that raise are still recorded."""
+        timer = timing.enable()
+        try:
+            with timing.stage('read'):
+                raise ValueError()
+        except ValueError:
+            pass
+        with timing.stage('write'):
+            pass
+        self.assertEqual(timer.stages.keys(), ['read', 'write'])
+
+    def test_timed(self):
+        """Decorated functions are timed with the rows of their DataFile."""
+        @timing.timed('fill')
+        def fill(dfile, rows):
+            """Fill."""
+            dfile.create_columns(['CTDPRS'])
+            dfile['CTDPRS'].values = range(rows)
+            return 'filled'
+
+        self.assertEqual(fill.__doc__, 'Fill.')
+        timer = timing.enable()
+        self.assertEqual(fill(DataFile(), 4), 'filled')
+        dfc = DataFileCollection()
+        dfc.append(self._dfile(2))
+        dfc.append(self._dfile(3))
+        self.assertEqual(timing.count_rows(dfc), 5)
+        self.assertEqual(timer.stages['fill'].rows, 4)
+
+    def test_report(self):
+        """Stages are written as a table or JSON."""
+        timer = timing.enable()
+        with timing.stage('read') as record:
+            record.rows = 7
+        lines = timer.format_table().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0].split(),
+                         ['stage', 'calls', 'seconds', 'rows', 'rows/s',
+                          'RSS', 'MB'])
+        self.assertEqual(lines[1].split()[:2], ['read', '1'])
+        self.assertEqual(lines[1].split()[3], '7')
+
+        fileobj = StringIO()
+        timer.write_json(fileobj)
+        stages = json.loads(fileobj.getvalue())['stages']
+        self.assertEqual(
+            [(stg['stage'], stg['calls'], stg['rows']) for stg in stages],
+            [('read', 1, 7)])
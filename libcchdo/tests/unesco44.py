@@ -1,6 +1,6 @@
 import unittest
 
-from libcchdo.algorithms import depth as X
+from libcchdo.algorithms import depth as X, eos
 from libcchdo.fns import Decimal
 
 
@@ -27,3 +27,24 @@ class TestColumn(unittest.TestCase):
         self.assertAlmostEqual(X.density(35, 5,  10000), Decimal('1069.48914'), 5)
         self.assertAlmostEqual(X.density(35, 25,     0), Decimal('1023.34306'), 5)
         self.assertAlmostEqual(X.density(35, 25, 10000), Decimal('1062.53817'), 5)
+
+    def test_density_array(self):
+        """ Test values from UNESCO 44 pg -19- for whole series """
+        densities = eos.density([0, 0, 0, 0, 35, 35, 35, 35],
+                                [5, 5, 25, 25, 5, 5, 25, 25],
+                                [0, 10000, 0, 10000, 0, 10000, 0, 10000])
+        expected = [999.96675, 1044.12802, 997.04796, 1037.90204,
+                    1027.67547, 1069.48914, 1023.34306, 1062.53817]
+        for aaa, bbb in zip(expected, densities):
+            self.assertAlmostEqual(aaa, bbb, 5)
+
+    def test_depth_unesco(self):
+        """ Checkvalue from UNESCO 44 pg -28- """
+        self.assertAlmostEqual(
+            X.depth_unesco(Decimal(10000), Decimal(30)), Decimal('9712.653'), 3)
+        self.assertAlmostEqual(eos.depth_unesco(10000, 30), 9712.653, 3)
+
+    def test_potential_temperature(self):
+        """ Checkvalue from UNESCO 44 pg -44- """
+        self.assertAlmostEqual(
+            eos.potential_temperature(10000, 40, 40, 0), 36.89073, 5)
@@ -0,0 +1,82 @@
+"""Test the per liter to per kilogram unit converters."""
+
+from decimal import Decimal
+from unittest import TestCase
+
+from libcchdo.algorithms import eos_engine
+from libcchdo.db.model.std import Unit
+from libcchdo.model.datafile import DataFile, column_storage
+from libcchdo.units import convert
+
+
+def _decimals(values):
+    return [None if value is None else Decimal(value) for value in values]
+
+
+class TestConvert(TestCase):
+
+    def _file(self, name, values, units='ML/L'):
+        dfile = DataFile()
+        dfile.create_columns([name, 'CTDSAL', 'CTDTMP'])
+        dfile[name].values = _decimals(values)
+        dfile[name].parameter.units = Unit(units)
+        dfile['CTDSAL'].values = _decimals(['34.5', '35.1', None, '34.9', '0'])
+        dfile['CTDTMP'].values = _decimals(['20.5', None, '4.25', '2', '1.5'])
+        return dfile
+
+    def _assert_engines_agree(self, name, values, converter, units='ML/L'):
+        """Both engines agree with both column storages."""
+        with eos_engine('decimal'):
+            dfile = self._file(name, values, units)
+            converter(dfile, dfile[name])
+            expected = dfile[name].values
+        for storage in ('list', 'array'):
+            with column_storage(storage):
+                with eos_engine('array'):
+                    dfile = self._file(name, values, units)
+                    converter(dfile, dfile[name])
+                    result = list(dfile[name].values)
+            self.assertEqual(len(expected), len(result))
+            for aaa, bbb in zip(expected, result):
+                if aaa is None:
+                    self.assertEqual(bbb, None)
+                else:
+                    # Agree to within a unit in the last digit kept
+                    self.assertTrue(len(bbb.as_tuple().digits) <=
+                                    convert.ARRAY_SIGNIFICANT_DIGITS)
+                    last = aaa.adjusted() - convert.ARRAY_SIGNIFICANT_DIGITS + 1
+                    self.assertTrue(abs(aaa - bbb) <= Decimal(10) ** last,
+                                    (aaa, bbb))
+
+    def test_milliliter_per_liter_to_umol_per_kg(self):
+        values = ['5.123', '-9.0', '0.0', '6.5', '4.25']
+        self._assert_engines_agree(
+            'OXYGEN', values,
+            lambda dfile, col: convert.milliliter_per_liter_to_umol_per_kg(
+                dfile, col, True))
+        self._assert_engines_agree(
+            'CTDOXY', values,
+            lambda dfile, col: convert.milliliter_per_liter_to_umol_per_kg(
+                dfile, col, False))
+
+    def test_mol_per_liter_to_mol_per_kg(self):
+        self._assert_engines_agree(
+            'SILCAT', ['12.34', '-9', '101.5', '0.12', '8'],
+            convert.mol_per_liter_to_mol_per_kg, 'UMOL/L')
+
+    def test_warn_once(self):
+        """Missing temperatures are warned about once for the column."""
+        from libcchdo.units.convert import log
+        messages = []
+        log.warn = lambda message, *args: messages.append(message)
+        try:
+            with eos_engine('array'):
+                dfile = self._file(
+                    'OXYGEN', ['5.123', '4.1', '0.0', '6.5', '4.25'])
+                dfile['CTDTMP'].values = [None] * 5
+                convert.milliliter_per_liter_to_umol_per_kg(
+                    dfile, dfile['OXYGEN'], True)
+        finally:
+            del log.warn
+        self.assertEqual(len(messages), 1)
+        self.assertTrue('5 of 5 records' in messages[0])
@@ -0,0 +1,24 @@
+"""Test the oxygen unit functions."""
+
+from unittest import TestCase
+
+import numpy as np
+
+from libcchdo.units import o2
+
+
+class TestO2(TestCase):
+
+    def test_saturation(self):
+        self.assertAlmostEqual(o2.O2Saturation(10., 35.), 6.3185, 4)
+
+    def test_arrays(self):
+        """Arrays give the scalar results and NaN where values are missing."""
+        oxygen = np.array([5.123, np.nan, 6.5])
+        density = np.array([1025.1, 1026.0, np.nan])
+        perkg = o2.O2PerLiterToPerKg(oxygen, density)
+        self.assertAlmostEqual(
+            perkg[0], o2.O2PerLiterToPerKg(5.123, 1025.1))
+        self.assertTrue(np.isnan(perkg[1:]).all())
+        self.assertAlmostEqual(
+            o2.O2PerKgToPerLiter(perkg[0], 1025.1), 5.123)
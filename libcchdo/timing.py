@@ -0,0 +1,207 @@
+"""Time the stages of reading, converting and writing files.
+
+Stages are marked with the stage context manager or the timed decorator. They
+cost next to nothing until a StageTimer is enabled. An enabled timer records,
+for each stage, how many times it ran, its wall time, the rows it processed and
+the peak resident set size of the process when it finished.
+
+Stages inside other stages are recorded under the path of the stages they are
+in, e.g. read_arbitrary/ctd.zip.ex.read/ctd.ex.read, so the time of a stage
+includes that of the stages inside it. Stages run by worker processes (see
+libcchdo.formats.zip.set_jobs) are not recorded.
+
+Example::
+
+    timer = enable()
+    with stage('convert') as record:
+        dfile = read_arbitrary(fileobj)
+        record.rows = count_rows(dfile)
+    disable()
+    print timer.format_table()
+
+"""
+import json
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from timeit import default_timer
+
+
+class Record(object):
+    """What the code in a stage tells the timer about the stage."""
+
+    def __init__(self):
+        self.rows = None
+
+
+class Stage(object):
+    """The totals of the runs of a stage."""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = None
+        self.peak_rss = None
+
+    @property
+    def rows_per_second(self):
+        if not self.rows or not self.seconds:
+            return None
+        return self.rows / self.seconds
+
+    def add(self, seconds, rows, peak_rss):
+        self.calls += 1
+        self.seconds += seconds
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+        if peak_rss is not None:
+            self.peak_rss = max(self.peak_rss, peak_rss)
+
+    def to_dict(self):
+        return OrderedDict([
+            ('stage', self.path),
+            ('calls', self.calls),
+            ('seconds', self.seconds),
+            ('rows', self.rows),
+            ('peak_rss', self.peak_rss),
+        ])
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes.
+
+    None if it cannot be found on this platform.
+
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def count_rows(dfile):
+    """Return the number of rows in a DataFile or DataFileCollection."""
+    try:
+        files = dfile.files
+    except AttributeError:
+        return len(dfile)
+    return sum(len(member) for member in files)
+
+
+class StageTimer(object):
+    """Records the Stages that are run while it is enabled."""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self._path = []
+
+    @contextmanager
+    def stage(self, name):
+        self._path.append(name)
+        path = '/'.join(self._path)
+        # Stages are listed in the order they were first entered.
+        if path not in self.stages:
+            self.stages[path] = Stage(path)
+        record = Record()
+        start = default_timer()
+        try:
+            yield record
+        finally:
+            seconds = default_timer() - start
+            self._path.pop()
+            self.stages[path].add(seconds, record.rows, peak_rss())
+
+    def format_table(self):
+        """Return the Stages as a table for people to read."""
+        width = max([len(path) for path in self.stages] + [len('stage')])
+        lines = [u'{0:<{width}} {1:>6} {2:>10} {3:>10} {4:>10} {5:>8}'.format(
+            'stage', 'calls', 'seconds', 'rows', 'rows/s', 'RSS MB',
+            width=width)]
+        for stg in self.stages.values():
+            cells = [stg.path, stg.calls, '{0:.3f}'.format(stg.seconds)]
+            cells.append('' if stg.rows is None else stg.rows)
+            if stg.rows_per_second is None:
+                cells.append('')
+            else:
+                cells.append('{0:.0f}'.format(stg.rows_per_second))
+            if stg.peak_rss is None:
+                cells.append('')
+            else:
+                cells.append('{0:.1f}'.format(stg.peak_rss / 2.0 ** 20))
+            lines.append(
+                u'{0:<{width}} {1:>6} {2:>10} {3:>10} {4:>10} {5:>8}'.format(
+                    *cells, width=width))
+        return u'\n'.join(lines) + u'\n'
+
+    def to_dict(self):
+        return OrderedDict([
+            ('stages', [stg.to_dict() for stg in self.stages.values()]),
+        ])
+
+    def write_json(self, fileobj):
+        json.dump(self.to_dict(), fileobj, indent=1)
+        fileobj.write('\n')
+
+
+_timer = None
+
+
+def enable():
+    """Start recording stages with a new StageTimer and return it."""
+    global _timer
+    _timer = StageTimer()
+    return _timer
+
+
+def disable():
+    """Stop recording stages and return the StageTimer that recorded them."""
+    global _timer
+    timer, _timer = _timer, None
+    return timer
+
+
+def get_timer():
+    """Return the enabled StageTimer or None."""
+    return _timer
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed code as the stage name.
+
+    Yields a Record whose rows the code may set to the rows it processed.
+
+    """
+    timer = _timer
+    if timer is None:
+        yield Record()
+        return
+    with timer.stage(name) as record:
+        yield record
+
+
+def timed(name):
+    """Decorate a reader or writer to be timed as the stage name.
+
+    The rows are those of the first argument, the DataFile or
+    DataFileCollection read or written, after the call.
+
+    """
+    def decorator(func):
+        @wraps(func)
+        def timed_func(self, *args, **kwargs):
+            if _timer is None:
+                return func(self, *args, **kwargs)
+            with stage(name) as record:
+                result = func(self, *args, **kwargs)
+                record.rows = count_rows(self)
+                return result
+        return timed_func
+    return decorator
@@ -10,7 +10,7 @@ log = getLogger(__name__)
 
 
 from libcchdo.fns import _decimal
-from libcchdo.algorithms import volume
+from libcchdo.algorithms import volume, get_eos_engine
 from libcchdo.db.model import std
 
 
@@ -18,6 +18,12 @@ APPROXIMATION_SALINITY = 34.8
 APPROXIMATION_TEMPERATURE = 25.0
 
 
+# Significant digits kept by the array converters. The Decimal oxygen converter
+# makes its constant from str() of a float, which keeps 12 digits, so the two
+# engines agree to within a unit in the 12th digit and no further.
+ARRAY_SIGNIFICANT_DIGITS = 12
+
+
 def _get_first_value_of_parameters(file, parameters, i):
     for parameter in parameters:
         try:
@@ -27,6 +33,81 @@ def _get_first_value_of_parameters(file, parameters, i):
     return None
 
 
+def _series_of_first_parameter(file, parameters, length):
+    """Return the values of the first column of parameters in file.
+
+    Returns:
+        A float64 array of the given length with NaN where values are missing.
+
+    """
+    import numpy as np
+    from libcchdo.algorithms import eos
+    series = np.empty(length)
+    series.fill(np.nan)
+    for parameter in parameters:
+        try:
+            values = eos.float64(file.columns[parameter].values)[:length]
+        except KeyError:
+            continue
+        series[:len(values)] = values
+        break
+    return series
+
+
+def _warn_records(column, message, records, length):
+    """Warn once about the records of a column instead of once per record."""
+    if not len(records):
+        return
+    log.warn(u'{0}: {1} at {2} of {3} records, the first being record '
+             '{4}'.format(column.parameter.name, message, len(records), length,
+                          records[0]))
+
+
+def _salinity_series(file, column, length):
+    """Return the salinity for each record for converting per liter to per
+    kilogram.
+
+    """
+    import numpy as np
+    salinity = _series_of_first_parameter(file, ('CTDSAL', 'SALNTY'), length)
+    # Salinity sanity check
+    with np.errstate(invalid='ignore'):
+        salinity[~(salinity > 0)] = APPROXIMATION_SALINITY
+    _warn_records(
+        column, u'Salinity is ridiculous',
+        np.flatnonzero((salinity < 20) | (salinity > 60)), length)
+    return salinity
+
+
+def _missing_to_convert(column):
+    """Return a boolean array that is True where column values are missing."""
+    import numpy as np
+    from libcchdo.algorithms import eos
+    values = eos.float64(column.values)
+    with np.errstate(invalid='ignore'):
+        return ~(values >= -3)
+
+
+def _set_converted(column, missing, converted):
+    """Replace the values of column with the converted float64 values.
+
+    The values are kept to ARRAY_SIGNIFICANT_DIGITS without making a Decimal
+    for each one when the column has array storage.
+
+    """
+    import numpy as np
+    from libcchdo.model.storage import ValueArray
+    missing = missing | ~np.isfinite(converted)
+    magnitude = np.zeros(len(converted))
+    present = ~missing & (converted != 0)
+    magnitude[present] = np.floor(np.log10(np.abs(converted[present]))) + 1
+    places = np.clip(ARRAY_SIGNIFICANT_DIGITS - magnitude, 0, 18)
+    values = ValueArray.from_float64(converted, places, missing)
+    if column.storage == 'list':
+        values = values.tolist()
+    column.values = values
+
+
 def equivalent(file, column):
     return column
 
@@ -46,10 +127,39 @@ def oxygen_method_is_whole_not_aliquot():
             print "In truth it probably doesn't matter."
 
 
-def milliliter_per_liter_to_umol_per_kg(file, column, whole_not_aliquot=None):
-    if whole_not_aliquot is None:
-        whole_not_aliquot = oxygen_method_is_whole_not_aliquot()
-
+def _milliliter_per_liter_to_umol_per_kg_array(file, column,
+                                               whole_not_aliquot):
+    import numpy as np
+    from libcchdo.algorithms import eos
+    from libcchdo.units import o2
+    length = len(column)
+    missing = _missing_to_convert(column)
+    if 'OXY' not in column.parameter.mnemonic_woce() and not missing.all():
+        raise ValueError(('Cannot apply conversion for oxygen to '
+                          'non-oxygen parameter.'))
+
+    salinity = _salinity_series(file, column, length)
+    if not whole_not_aliquot and 'CTDOXY' in column.parameter.mnemonic_woce():
+        temperature = np.empty(length)
+        temperature.fill(APPROXIMATION_TEMPERATURE)
+    else:
+        temperature = _series_of_first_parameter(
+            file, ('CTDTMP', 'THETA', 'REVTMP'), length)
+        with np.errstate(invalid='ignore'):
+            temperature_missing = ~(temperature > -3) | (temperature == 0)
+        temperature[temperature_missing] = APPROXIMATION_TEMPERATURE
+        _warn_records(
+            column, u'Temperature is missing. Using {0:f}'.format(
+                APPROXIMATION_TEMPERATURE),
+            np.flatnonzero(temperature_missing & ~missing), length)
+
+    sigt = eos.float64(eos.sigma_r(0.0, 0.0, temperature, salinity))
+    _set_converted(column, missing, o2.O2PerLiterToPerKg(
+        eos.float64(column.values), sigt + 1000.0))
+
+
+def _milliliter_per_liter_to_umol_per_kg_decimal(file, column,
+                                                 whole_not_aliquot):
     for i, value in enumerate(column.values):
         salinity = _get_first_value_of_parameters(
             file, ('CTDSAL', 'SALNTY'), i) or APPROXIMATION_SALINITY
@@ -77,7 +187,7 @@ def milliliter_per_liter_to_umol_per_kg(file, column, whole_not_aliquot=None):
                 log.warn(('Temperature is missing. Using %f at '
                                    'record#%d') % (temperature, i))
             sigt = volume.sigma_r(
-                0.0, 0.0, temperature, salinity)
+                0.0, 0.0, _decimal(temperature), _decimal(salinity))
             o2_atomic_weight = 31.9988
             density_o2 = 1.42905481 # g/l @ 273.15K
             constant = o2_atomic_weight / density_o2 * 0.001
@@ -87,6 +197,18 @@ def milliliter_per_liter_to_umol_per_kg(file, column, whole_not_aliquot=None):
             raise ValueError(('Cannot apply conversion for oxygen to '
                               'non-oxygen parameter.'))
 
+
+def milliliter_per_liter_to_umol_per_kg(file, column, whole_not_aliquot=None):
+    if whole_not_aliquot is None:
+        whole_not_aliquot = oxygen_method_is_whole_not_aliquot()
+
+    if get_eos_engine() == 'array':
+        _milliliter_per_liter_to_umol_per_kg_array(
+            file, column, whole_not_aliquot)
+    else:
+        _milliliter_per_liter_to_umol_per_kg_decimal(
+            file, column, whole_not_aliquot)
+
     # Change the units
     if 'OXY' in column.parameter.units.name:
         column.parameter.unit = std.Unit('UMOL/KG')
@@ -94,10 +216,16 @@ def milliliter_per_liter_to_umol_per_kg(file, column, whole_not_aliquot=None):
     return column
 
 
-def mol_per_liter_to_mol_per_kg(file, column):
-    if 'OXY' in column.parameter.mnemonic_woce():
-        raise ValueError(('Cannot apply mol/liter to mol/kg converter to '
-                          'oxygen.'))
+def _mol_per_liter_to_mol_per_kg_array(file, column):
+    from libcchdo.algorithms import eos
+    missing = _missing_to_convert(column)
+    salinity = _salinity_series(file, column, len(column))
+    sigma = eos.float64(eos.sigma_r(0.0, 0.0, 25.0, salinity))
+    _set_converted(
+        column, missing, eos.float64(column.values) / (sigma / 1.0e3 + 1.0))
+
+
+def _mol_per_liter_to_mol_per_kg_decimal(file, column):
     for i, value in enumerate(column.values):
         salinity = _get_first_value_of_parameters(
             file, ('CTDSAL', 'SALNTY'), i) or APPROXIMATION_SALINITY
@@ -117,7 +245,18 @@ def mol_per_liter_to_mol_per_kg(file, column):
             column.values[i] = None
         else:
             column.values[i] /= (volume.sigma_r(
-                                     0.0, 0.0, 25.0, salinity) / 1.0e3 + 1.0)
+                0.0, 0.0, _decimal(25.0), _decimal(salinity)) / \
+                _decimal(1.0e3) + _decimal(1.0))
+
+
+def mol_per_liter_to_mol_per_kg(file, column):
+    if 'OXY' in column.parameter.mnemonic_woce():
+        raise ValueError(('Cannot apply mol/liter to mol/kg converter to '
+                          'oxygen.'))
+    if get_eos_engine() == 'array':
+        _mol_per_liter_to_mol_per_kg_array(file, column)
+    else:
+        _mol_per_liter_to_mol_per_kg_decimal(file, column)
 
     # Change the units
     prefix = column.parameter.units.name.strip()[:-1]
@@ -18,9 +18,19 @@
 #
 # Hitchman, M.L., "Measurement of Dissolved Oxygen",
 # pg. 30, eqn 2.28,  John Wiley & Sons, Inc., 1978.
+#
+# The functions take scalars or whole NumPy arrays of samples. Missing values
+# should be NaN and come back NaN.
+
 
+try:
+    import numpy as np
+except ImportError, e:
+    raise ImportError('%s\n%s' % (e,
+        ("Please install numpy to use the oxygen functions. "
+         "(pip install numpy)")))
 
-import math
+from libcchdo.algorithms import eos
 
 
 ABS_ZERO = -273.15
@@ -54,8 +64,8 @@ def BunsenO2(s, t):
     b = (-0.034892, 0.015568, -0.0019387)
 
     k100 = Kelvin(t) * 0.01
-    return exp(a[0] + a[1] / k100 + a[2] * math.log(k100) +
-                 s * (b[0] + k100 * (b[1] + b[2] * k100))) * 1000.0
+    return np.exp(a[0] + a[1] / k100 + a[2] * np.log(k100) +
+                  s * (b[0] + k100 * (b[1] + b[2] * k100))) * 1000.0
 
 
 def Poynting(s, t, p):
@@ -68,11 +78,10 @@ def Poynting(s, t, p):
         Return:
             Poynting correction
     '''
-    # double      IESRho()   /* insitu density @ S,T,P */
     # insitu density g/cm**3
-    rhostp = IESRho(s, t, p) * 0.001
-    return math.exp(MOLECULAR_WEIGHT_OF_O2 * (p / rhostp) / 
-                                             (GAS_CONSTANT * Kelvin(t)))
+    rhostp = eos.float64(eos.density(s, t, p)) * 0.001
+    return np.exp(MOLECULAR_WEIGHT_OF_O2 * (p / rhostp) /
+                                          (GAS_CONSTANT * Kelvin(t)))
 
 def O2mlPerLTouMPerL(o2mlpl):
     ''' Convert dissolved O2 concentration (ml/l) to micro-moles/l.
@@ -158,7 +167,7 @@ def O2Saturation(t, s):
     b = (-0.033096, 0.014259, -0.0017000)
 
     k100 = Kelvin(t) * 0.01
-    return (exp(a[0] + a[1] / k100 + a[2] * math.log(k100) + a[3] * k100 + 
+    return (np.exp(a[0] + a[1] / k100 + a[2] * np.log(k100) + a[3] * k100 +
         s * (b[0] + k100 * (b[1] + b[2] * k100))))
 
 